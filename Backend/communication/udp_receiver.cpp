@@ -24,6 +24,20 @@ bool TryParseFiniteDouble(const YAML::Node& node, double& out_value)
     }
 }
 
+bool TryParseUint64(const YAML::Node& node, uint64_t& out_value)
+{
+    if (!node || !node.IsScalar()) {
+        return false;
+    }
+
+    try {
+        out_value = node.as<uint64_t>();
+        return true;
+    } catch (const YAML::Exception&) {
+        return false;
+    }
+}
+
 bool TryParseBool(const YAML::Node& node, bool& out_value)
 {
     if (!node || !node.IsScalar()) {
@@ -126,6 +140,55 @@ void UdpReceiver::HandleReceive(PortListener& listener,
 
             TelemetryData tel{};
 
+            // 增量遥测（Jetson TELEMETRY_DELTA=1）：keyframe: false 的数据报省略了
+            // 未变化的慢变字段，先从该 slot 上一帧继承，再由本帧出现的字段覆盖。
+            // 没有 keyframe 字段的数据报是完整帧，与旧版 Jetson 行为一致。
+            uint64_t telemetry_seq = 0;
+            const bool has_seq = TryParseUint64(root["telemetry_seq"], telemetry_seq);
+            bool keyframe = true;
+            const bool delta = TryParseBool(root["keyframe"], keyframe) && !keyframe;
+            if (has_seq && listener.has_telemetry_seq
+                && telemetry_seq != listener.last_telemetry_seq + 1) {
+                ++listener.telemetry_seq_gaps;
+                if (delta) {
+                    listener.awaiting_keyframe = true;
+                }
+            }
+            if (has_seq) {
+                listener.last_telemetry_seq = telemetry_seq;
+                listener.has_telemetry_seq = true;
+            }
+            if (delta) {
+                if (!listener.has_keyframe) {
+                    // 尚未收到关键帧，慢变字段无从继承，等待下一个关键帧
+                    StartReceive(listener);
+                    return;
+                }
+                if (listener.awaiting_keyframe && !listener.resync_logged) {
+                    spdlog::warn("[UdpReceiver] Slot {} telemetry_seq gap before {}; "
+                                 "slow fields may be stale until the next keyframe",
+                                 listener.slot, telemetry_seq);
+                    listener.resync_logged = true;
+                }
+                const TelemetryData& base = listener.last_telemetry;
+                tel.battery = base.battery;
+                tel.gps_lat = base.gps_lat;
+                tel.gps_lon = base.gps_lon;
+                tel.gps_alt = base.gps_alt;
+                tel.gps_fix = base.gps_fix;
+                tel.arming_state = base.arming_state;
+                tel.nav_state = base.nav_state;
+                tel.control_ack_session_id = base.control_ack_session_id;
+                tel.control_ack_command_id = base.control_ack_command_id;
+                tel.control_ack_sequence = base.control_ack_sequence;
+                tel.control_ack_mode = base.control_ack_mode;
+                tel.control_ack_confirmed_packets = base.control_ack_confirmed_packets;
+            } else {
+                listener.has_keyframe = true;
+                listener.awaiting_keyframe = false;
+                listener.resync_logged = false;
+            }
+
             // timestamp (微秒)
             if (auto ts = root["timestamp"]) {
                 tel.timestamp = ts.as<uint64_t>(0);
@@ -179,6 +242,8 @@ void UdpReceiver::HandleReceive(PortListener& listener,
             const auto gps_lon = root["gps_lon"];
             const auto gps_alt = root["gps_alt"];
             const auto gps_fix = root["gps_fix"];
+            // 增量帧中 GPS 组未变化时整组省略，保留继承值
+            const bool gps_present = gps_lat || gps_lon || gps_alt || gps_fix;
             double parsed_gps_lat = 0.0;
             double parsed_gps_lon = 0.0;
             double parsed_gps_alt = 0.0;
@@ -193,10 +258,12 @@ void UdpReceiver::HandleReceive(PortListener& listener,
                 tel.gps_lon = parsed_gps_lon;
                 tel.gps_alt = parsed_gps_alt;
             }
-            tel.gps_fix = has_gps_fix_flag && parsed_gps_fix
-                && has_complete_gps
-                && tel.gps_lat >= -90.0 && tel.gps_lat <= 90.0
-                && tel.gps_lon >= -180.0 && tel.gps_lon <= 180.0;
+            if (!delta || gps_present) {
+                tel.gps_fix = has_gps_fix_flag && parsed_gps_fix
+                    && has_complete_gps
+                    && tel.gps_lat >= -90.0 && tel.gps_lat <= 90.0
+                    && tel.gps_lon >= -180.0 && tel.gps_lon <= 180.0;
+            }
 
             // VehicleLocalPosition [N, E, D] is the coordinate frame consumed
             // by PX4 TrajectorySetpoint. Do not substitute VehicleOdometry.
@@ -257,6 +324,8 @@ void UdpReceiver::HandleReceive(PortListener& listener,
                          tel.position_ned[0], tel.position_ned[1], tel.position_ned[2],
                          tel.battery, tel.gps_fix);
 
+            listener.last_telemetry = tel;
+
             // 回调通知（线程安全）
             {
                 std::lock_guard<std::mutex> lock(callback_mutex_);
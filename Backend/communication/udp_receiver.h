@@ -45,6 +45,15 @@ private:
         boost::asio::ip::udp::socket socket;
         boost::asio::ip::udp::endpoint remote_endpoint;
         std::array<char, 65535> buffer{};
+
+        // 增量遥测合并状态（仅在该 listener 的接收回调中访问）
+        TelemetryData last_telemetry{};
+        uint64_t last_telemetry_seq = 0;
+        uint64_t telemetry_seq_gaps = 0;
+        bool has_telemetry_seq = false;
+        bool has_keyframe = false;
+        bool awaiting_keyframe = false;
+        bool resync_logged = false;
     };
 
     void StartReceive(PortListener& listener);
@@ -0,0 +1,1774 @@
+#!/usr/bin/env python3
+"""
+benchmark_jetson_bridge.py — jetson_bridge.py 热路径微基准
+
+在 Jetson 上直接运行即可得到该 CPU 上的单包开销；开发机无需 ROS2：
+  python3 benchmark_jetson_bridge.py control-parse
+  python3 benchmark_jetson_bridge.py control-parse --iterations 200000
+  python3 benchmark_jetson_bridge.py telemetry-encode
+  python3 benchmark_jetson_bridge.py offboard-jitter --seconds 10
+  python3 benchmark_jetson_bridge.py setpoint-step
+  python3 benchmark_jetson_bridge.py confirm-latency --loss 0.1
+  python3 benchmark_jetson_bridge.py command-store --commands 50000
+  python3 benchmark_jetson_bridge.py telemetry-latency --sample-hz 50
+  python3 benchmark_jetson_bridge.py telemetry-delta --drones 6
+  python3 benchmark_jetson_bridge.py telemetry-delta --recording flight.jsonl
+  python3 benchmark_jetson_bridge.py pose-channel --sample-hz 100
+  python3 benchmark_jetson_bridge.py metrics-scrape --slots 6 --scrape-hz 20
+  python3 benchmark_jetson_bridge.py flight-recorder --path /tmp/bench.ring
+  python3 benchmark_jetson_bridge.py log-flood --io-delay-ms 0.2
+  python3 benchmark_jetson_bridge.py telemetry-fanout --subscribers 4
+  python3 benchmark_jetson_bridge.py heartbeat-load --load-threads 2 --sched fifo --cpus 3
+  python3 benchmark_jetson_bridge.py trajectory-follow --waypoints 20 --loss 0.1
+  python3 benchmark_jetson_bridge.py repeat-cache --moves 200 --hold-repeats 20
+  python3 benchmark_jetson_bridge.py ingress-flood --flood-pps 20000 --seconds 5
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import selectors
+import socket
+import sys
+import threading
+import time
+import types
+
+import jetson_bridge
+
+
+def _sample_control_message(repeat_index: int = 1) -> dict:
+    """与后端 UdpSender::Send 字段一致的 move 控制包。"""
+    return {
+        "protocol": jetson_bridge.CONTROL_PROTOCOL,
+        "version": jetson_bridge.CONTROL_PROTOCOL_VERSION,
+        "type": "control",
+        "session_id": "backend-1784200000000000-1a2b3c4d",
+        "command_id": "backend-1784200000000000-1a2b3c4d-d1-s1784200000000123",
+        "sequence": 1784200000000123,
+        "drone_id": 1,
+        "slot": 1,
+        "mode": "move",
+        "issued_at_unix_s": 1784200000.125,
+        "sent_at_unix_s": 1784200000.131,
+        "target": {
+            "frame": "NED",
+            "reference": "power_on_origin",
+            "unit": "m",
+            "north": 12.5,
+            "east": -3.25,
+            "down": -8.0,
+        },
+        "delivery": {"repeat_index": repeat_index, "repeat_total": 5},
+    }
+
+
+def _time_per_call(function, argument, iterations: int, rounds: int) -> float:
+    """返回多轮中最快一轮的单次调用耗时（秒），降低调度噪声的影响。"""
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function(argument)
+        best = min(best, time.perf_counter() - started)
+    return best / iterations
+
+
+def bench_control_parse(args) -> None:
+    json_packet = json.dumps(_sample_control_message()).encode("utf-8")
+    binary_packet = jetson_bridge.encode_binary_control_packet(
+        jetson_bridge.parse_control_packet(json_packet)
+    )
+    assert (
+        jetson_bridge.parse_control_packet(binary_packet)
+        == jetson_bridge.parse_control_packet(json_packet)
+    )
+
+    parse = jetson_bridge.parse_control_packet
+    json_cost = _time_per_call(parse, json_packet, args.iterations, args.rounds)
+    binary_cost = _time_per_call(parse, binary_packet, args.iterations, args.rounds)
+    print(
+        f"control-parse on {platform.machine()} / Python {platform.python_version()}"
+    )
+    print(f"  json   {len(json_packet):4d}B  {json_cost * 1e6:8.2f} us/packet")
+    print(f"  binary {len(binary_packet):4d}B  {binary_cost * 1e6:8.2f} us/packet")
+    print(f"  speedup x{json_cost / binary_cost:.2f}")
+
+
+def _repeat_stream(args, binary: bool) -> list:
+    """后端典型流量：每条 move 重发 repeat_total 次，其间穿插持续 hold 心跳。
+
+    hold 为同一 command_id、repeat_index 递增的连续重发（repeat_total=0）。
+    """
+    datagrams = []
+    hold_repeat = 0
+    for index in range(args.moves):
+        sequence = 2 * index + 2
+        for repeat in range(1, args.repeat_total + 1):
+            message = _sample_control_message(repeat)
+            message.update(
+                session_id="bench-session", command_id=f"bench-session-d1-s{sequence}",
+                sequence=sequence, sent_at_unix_s=1784200000.131 + index + repeat * 0.2,
+            )
+            message["delivery"]["repeat_total"] = args.repeat_total
+            datagrams.append(message)
+        for _ in range(args.hold_repeats):
+            hold_repeat += 1
+            message = _sample_control_message(hold_repeat)
+            message.update(
+                session_id="bench-session", command_id=f"bench-session-d1-hold{index}",
+                sequence=sequence + 1, mode="hold",
+                sent_at_unix_s=1784200000.5 + index + hold_repeat * 0.05,
+            )
+            message["delivery"]["repeat_total"] = 0
+            datagrams.append(message)
+    packets = [json.dumps(message).encode("utf-8") for message in datagrams]
+    if binary:
+        packets = [
+            jetson_bridge.encode_binary_control_packet(jetson_bridge.parse_control_packet(packet))
+            for packet in packets
+        ]
+    return packets
+
+
+def bench_repeat_cache(args) -> None:
+    print(
+        f"repeat-cache: {args.moves} moves x {args.repeat_total} repeats + "
+        f"{args.hold_repeats} hold repeats each, cache={jetson_bridge.CONTROL_DIGEST_CACHE_SIZE}"
+    )
+    sender = ("192.168.30.100", 50123)
+    for encoding in ("json", "binary"):
+        packets = _repeat_stream(args, encoding == "binary")
+        costs = {}
+        for capacity in (0, jetson_bridge.CONTROL_DIGEST_CACHE_SIZE):
+            best = float("inf")
+            for _ in range(args.rounds):
+                gate = _control_gate()
+                # 日志与运行时一样交给 writer 线程，这里直接丢弃
+                gate.events.rate_per_sec = 0.0
+                gate.events.writer = types.SimpleNamespace(submit=lambda event: True)
+                gate.digest_cache.capacity = capacity
+                started = time.perf_counter()
+                for packet in packets:
+                    gate.handle_datagram(packet, sender, 1.0)
+                best = min(best, time.perf_counter() - started)
+            costs[capacity] = best / len(packets)
+            assert gate.commands_applied == 2 * args.moves
+        cache = gate.digest_cache
+        print(
+            f"  {encoding:6s} {len(packets)} datagrams: no cache {costs[0] * 1e6:6.2f} us, "
+            f"cache {costs[capacity] * 1e6:6.2f} us/datagram "
+            f"(hits={cache.hits} misses={cache.misses} bypassed={cache.bypassed})"
+        )
+
+
+def _sample_telemetry() -> dict:
+    """字段与 BridgeCore.build_telemetry 在全部话题在线时一致。"""
+    return {
+        "timestamp": 1784200000123456,
+        "position": [12.503, -3.248, -7.991],
+        "q": [0.9998, 0.0012, -0.0031, 0.0175],
+        "velocity": [0.412, -0.057, 0.003],
+        "angular_velocity": [0.0011, -0.0023, 0.0004],
+        "arming_state": 2,
+        "nav_state": 14,
+        "local_position": [12.503, -3.248, -7.991],
+        "local_velocity": [0.412, -0.057, 0.003],
+        "local_position_valid": True,
+        "gps_lat": 30.2741702,
+        "gps_lon": 120.1551442,
+        "gps_alt": 18.63,
+        "gps_fix": True,
+        "battery": 87,
+        "control_ack": {
+            "session_id": "backend-1784200000000000-1a2b3c4d",
+            "command_id": "backend-1784200000000000-1a2b3c4d-d1-s1784200000000123",
+            "sequence": 1784200000000123,
+            "mode": "move",
+            "confirmed_packets": 3,
+            "applied_at_unix_s": 1784200000.25,
+        },
+    }
+
+
+def bench_telemetry_encode(args) -> None:
+    import yaml
+
+    data = _sample_telemetry()
+    reference = yaml.dump(data, sort_keys=False, default_flow_style=None).encode("utf-8")
+    encoded = jetson_bridge.encode_telemetry_yaml(data)
+    assert yaml.safe_load(encoded) == yaml.safe_load(reference)
+
+    def _pyyaml(sample):
+        return yaml.dump(sample, sort_keys=False, default_flow_style=None).encode("utf-8")
+
+    yaml_cost = _time_per_call(_pyyaml, data, args.iterations, args.rounds)
+    fast_cost = _time_per_call(
+        jetson_bridge.encode_telemetry_yaml, data, args.iterations, args.rounds
+    )
+    print(
+        f"telemetry-encode on {platform.machine()} / Python {platform.python_version()}"
+    )
+    print(f"  yaml.dump             {len(reference):4d}B  {yaml_cost * 1e6:8.2f} us/packet")
+    print(f"  encode_telemetry_yaml {len(encoded):4d}B  {fast_cost * 1e6:8.2f} us/packet")
+    print(f"  speedup x{yaml_cost / fast_cost:.2f}")
+
+
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _distribution_text(values_sec) -> str:
+    ordered = sorted(values_sec)
+    return (
+        f"min={ordered[0] * 1e6:7.1f} p50={_percentile(ordered, 0.5) * 1e6:7.1f} "
+        f"p99={_percentile(ordered, 0.99) * 1e6:7.1f} max={ordered[-1] * 1e6:7.1f} us"
+    )
+
+
+class _FakeMessage:
+    """代替 px4_msgs 消息：只承载属性，发布即丢弃。"""
+
+
+class _NullPublisher:
+    def publish(self, _message):
+        pass
+
+
+class _FakeClock:
+    def now(self):
+        return types.SimpleNamespace(nanoseconds=time.monotonic_ns())
+
+
+def _legacy_offboard_tick(bridge) -> None:
+    """旧版心跳：取锁拷贝 dict，并每个 tick 新建两条消息。"""
+    now_us = int(bridge.get_clock().now().nanoseconds / 1000)
+    with bridge._setpoint_lock:
+        sp = dict(bridge._legacy_setpoint) if bridge._legacy_setpoint is not None else None
+    if sp is None:
+        return
+    ocm = _FakeMessage()
+    ocm.timestamp = now_us
+    ocm.position = True
+    ocm.velocity = False
+    ocm.acceleration = False
+    ocm.attitude = False
+    ocm.body_rate = False
+    ocm.thrust_and_torque = False
+    ocm.direct_actuator = False
+    bridge._offboard_pub.publish(ocm)
+    tsp = _FakeMessage()
+    tsp.timestamp = now_us
+    tsp.position = [sp["x"], sp["y"], sp["z"]]
+    tsp.velocity = [float("nan")] * 3
+    tsp.acceleration = [float("nan")] * 3
+    tsp.yaw = float("nan")
+    tsp.yawspeed = float("nan")
+    bridge._traj_pub.publish(tsp)
+    bridge._offboard_publish_count += 1
+
+
+def _heartbeat_harness():
+    bridge = types.SimpleNamespace()
+    bridge._core = jetson_bridge.BridgeCore(1, _NullLogger())
+    bridge._core.last_setpoint = jetson_bridge.Setpoint(1.0, 2.0, -3.0, "move", 1)
+    bridge._setpoint_lock = bridge._core.setpoint_lock
+    bridge._legacy_setpoint = {"x": 1.0, "y": 2.0, "z": -3.0, "mode": "move", "sequence": 1}
+    bridge._ocm_msg = _FakeMessage()
+    bridge._tsp_msg = _FakeMessage()
+    bridge._tsp_msg.position = [float("nan")] * 3
+    bridge._tsp_position = bridge._tsp_msg.position
+    bridge._offboard_pub = _NullPublisher()
+    bridge._traj_pub = _NullPublisher()
+    bridge._offboard_publish_count = 0
+    bridge._heartbeat_monitor = jetson_bridge.HeartbeatMonitor(jetson_bridge.OFFBOARD_INTERVAL)
+    bridge._monotonic = time.monotonic
+    bridge._recorder = None
+    bridge._warmup_count = bridge._warmup_needed = jetson_bridge.OFFBOARD_HZ
+    bridge._arm_triggered = False
+    bridge.slot = 1
+    bridge.get_clock = _FakeClock
+    return bridge
+
+
+def _run_heartbeat(tick, bridge, seconds: float, hold_sec: float):
+    """按 OFFBOARD_INTERVAL 调度 tick，同时另一线程模拟 UDP 线程反复持锁写 setpoint。"""
+    stop = threading.Event()
+
+    def _contender():
+        sequence = 1
+        while not stop.is_set():
+            with bridge._setpoint_lock:
+                sequence += 1
+                deadline = time.perf_counter() + hold_sec
+                while time.perf_counter() < deadline:
+                    pass
+                bridge._legacy_setpoint = {
+                    "x": 1.0, "y": 2.0, "z": -3.0, "mode": "move", "sequence": sequence,
+                }
+                bridge._core.last_setpoint = jetson_bridge.Setpoint(
+                    1.0, 2.0, -3.0, "move", sequence
+                )
+            time.sleep(0.001)
+
+    contender = threading.Thread(target=_contender, daemon=True)
+    contender.start()
+    durations = []
+    intervals = []
+    period = jetson_bridge.OFFBOARD_INTERVAL
+    next_deadline = time.perf_counter() + period
+    last_start = None
+    end = time.perf_counter() + seconds
+    while next_deadline < end:
+        delay = next_deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        started = time.perf_counter()
+        tick(bridge)
+        durations.append(time.perf_counter() - started)
+        if last_start is not None:
+            intervals.append(started - last_start)
+        last_start = started
+        next_deadline += period
+    stop.set()
+    contender.join()
+    return durations, intervals
+
+
+def bench_offboard_jitter(args) -> None:
+    print(
+        f"offboard-jitter on {platform.machine()} / Python {platform.python_version()}: "
+        f"{jetson_bridge.OFFBOARD_HZ}Hz for {args.seconds:.1f}s per variant, "
+        f"UDP-thread lock hold {args.hold_us:.0f}us every ~1ms"
+    )
+    variants = (
+        ("before (lock + new msgs)", _legacy_offboard_tick),
+        ("after  (swap + reuse)   ", jetson_bridge.JetsonBridge._offboard_loop),
+    )
+    for name, tick in variants:
+        durations, intervals = _run_heartbeat(
+            tick, _heartbeat_harness(), args.seconds, args.hold_us / 1e6
+        )
+        print(f"  {name} tick     {_distribution_text(durations)}")
+        print(f"  {name} interval {_distribution_text(intervals)}")
+
+
+def bench_setpoint_step(args) -> None:
+    target = (args.distance, 0.0, 0.0)
+    state = jetson_bridge.MotionState((0.0, 0.0, 0.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+    dt = jetson_bridge.OFFBOARD_INTERVAL
+    ticks = 0
+    peak_speed = 0.0
+    while state.position != target:
+        state = jetson_bridge.step_setpoint_motion(
+            state, target, dt, args.max_velocity, args.max_acceleration
+        )
+        peak_speed = max(peak_speed, abs(state.velocity[0]))
+        ticks += 1
+
+    cruise = jetson_bridge.MotionState((0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+
+    def _step(motion):
+        return jetson_bridge.step_setpoint_motion(
+            motion, (100.0, 20.0, -5.0), dt, args.max_velocity, args.max_acceleration
+        )
+
+    cost = _time_per_call(_step, cruise, args.iterations, args.rounds)
+    print(
+        f"setpoint-step on {platform.machine()} / Python {platform.python_version()}"
+    )
+    print(
+        f"  {args.distance:.1f}m move, v<={args.max_velocity}m/s a<={args.max_acceleration}m/s^2: "
+        f"{ticks} ticks ({ticks * dt:.2f}s), peak speed {peak_speed:.2f}m/s"
+    )
+    print(f"  step_setpoint_motion {cost * 1e6:8.2f} us/tick")
+
+
+class _NullLogger:
+    def info(self, _message):
+        pass
+
+    def warning(self, _message):
+        pass
+
+    def error(self, _message):
+        pass
+
+
+def _control_gate():
+    """已收到有效 VehicleLocalPosition 后处于 hold 状态的 BridgeCore。"""
+    gate = jetson_bridge.BridgeCore(1, _NullLogger())
+    gate.last_setpoint = jetson_bridge.Setpoint(0.0, 0.0, 0.0, "hold", 0)
+    return gate
+
+
+def _simulate_command_stream(key, args, rng):
+    """按后端节奏（每 1/heartbeat_hz 秒一包、每条命令 repeat_total 次）模拟丢包链路。
+
+    返回每条命令从首包发出到 setpoint 写入的模拟耗时；未能应用的命令记为 None。
+    """
+    gate = _control_gate()
+    sender = ("192.168.30.100", 50123)
+    period = 1.0 / args.heartbeat_hz
+    # 模拟时间即两端墙钟，认证路径的 issued_at 新鲜度检查按此计算
+    epoch = _sample_control_message()["issued_at_unix_s"]
+    sent = 0.0
+    gate.wall_clock = lambda: epoch + sent
+    session_key = jetson_bridge.derive_control_session_key(key, "bench-session") if key else None
+    results = []
+    for index in range(args.commands):
+        sequence = index + 1
+        first_sent = index * args.repeat_total * period
+        applied_at = None
+        for repeat in range(1, args.repeat_total + 1):
+            sent = first_sent + (repeat - 1) * period
+            if rng.random() < args.loss:
+                continue
+            message = _sample_control_message(repeat)
+            message.update(
+                session_id="bench-session",
+                command_id=f"bench-session-d1-s{sequence}",
+                sequence=sequence,
+                repeat_total=args.repeat_total,
+                issued_at_unix_s=epoch + first_sent,
+                sent_at_unix_s=epoch + sent,
+            )
+            parsed = jetson_bridge.parse_control_packet(json.dumps(message).encode("utf-8"))
+            if session_key is not None:
+                parsed["auth_mac"] = jetson_bridge.compute_control_mac(session_key, parsed)
+            if not gate._verify_control_auth(parsed, sender):
+                continue
+            if not gate._accept_backend_session(parsed):
+                continue
+            gate.link.observe(parsed, repeat, sent)
+            before = gate.commands_applied
+            gate._stage_control_command(parsed, sender, sent)
+            if gate.commands_applied != before and applied_at is None:
+                applied_at = sent
+        results.append(None if applied_at is None else applied_at - first_sent)
+    return results
+
+
+def bench_confirm_latency(args) -> None:
+    print(
+        f"confirm-latency: {args.commands} commands, {args.heartbeat_hz:.0f}Hz x "
+        f"{args.repeat_total} repeats, loss={args.loss:.0%}, "
+        f"confirm={jetson_bridge.COMMAND_CONFIRM_COUNT}"
+    )
+    variants = (
+        ("confirm gate (unsigned)", b"", False),
+        ("adaptive confirm gate  ", b"", True),
+        ("auth fast path (HMAC)  ", b"benchmark-master-key", False),
+    )
+    for name, key, adaptive in variants:
+        rng = random.Random(args.seed)
+        original = jetson_bridge.CONTROL_AUTH_KEY, jetson_bridge.COMMAND_CONFIRM_ADAPTIVE
+        jetson_bridge.CONTROL_AUTH_KEY = key
+        jetson_bridge.COMMAND_CONFIRM_ADAPTIVE = adaptive
+        try:
+            results = _simulate_command_stream(key, args, rng)
+        finally:
+            jetson_bridge.CONTROL_AUTH_KEY, jetson_bridge.COMMAND_CONFIRM_ADAPTIVE = original
+        applied = sorted(value for value in results if value is not None)
+        dropped = len(results) - len(applied)
+        if applied:
+            detail = (
+                f"p50={_percentile(applied, 0.5) * 1e3:6.0f} "
+                f"p99={_percentile(applied, 0.99) * 1e3:6.0f} "
+                f"max={applied[-1] * 1e3:6.0f} ms"
+            )
+        else:
+            detail = "no command applied"
+        print(f"  {name} first send -> apply {detail}; never applied {dropped}")
+
+    message = _sample_control_message()
+    parsed = jetson_bridge.parse_control_packet(json.dumps(message).encode("utf-8"))
+    session_key = jetson_bridge.derive_control_session_key(b"k", parsed["session_id"])
+    cost = _time_per_call(
+        lambda packet: jetson_bridge.compute_control_mac(session_key, packet),
+        parsed,
+        args.iterations,
+        args.rounds,
+    )
+    print(f"  compute_control_mac {cost * 1e6:8.2f} us/packet")
+
+
+class _LegacyCommandGate:
+    """旧版命令门（CommandStore 之前）：dict/set 存储，应用时全表扫描，退役会话无上限。
+
+    方法体沿用旧实现，日志格式化开销与当前版本一致，只去掉了鉴权/延迟统计分支。
+    """
+
+    def __init__(self):
+        self._active_backend_session = None
+        self._retired_backend_sessions = set()
+        self._highest_applied_sequence = 0
+        self._pending_commands = {}
+        self._applied_command_ids = {}
+        self._commands_applied = 0
+        self._last_applied_command = None
+        self._udp_rx_duplicate = 0
+        self._udp_rx_stale = 0
+        self._udp_rx_invalid = 0
+        self._last_setpoint = jetson_bridge.Setpoint(0.0, 0.0, 0.0, "hold", 0)
+        self._setpoint_lock = threading.Lock()
+
+    get_logger = staticmethod(_NullLogger)
+    _control_fingerprint = staticmethod(jetson_bridge.BridgeCore._control_fingerprint)
+
+    def _accept_backend_session(self, parsed: dict) -> bool:
+        session_id = parsed["session_id"]
+        if self._active_backend_session is None:
+            self._active_backend_session = session_id
+            return True
+        if session_id == self._active_backend_session:
+            return True
+        if session_id in self._retired_backend_sessions:
+            self._udp_rx_stale += 1
+            self.get_logger().warning(
+                f"[SESSION] rejected packet from retired backend session "
+                f"{session_id}; active={self._active_backend_session}"
+            )
+            return False
+        old_session = self._active_backend_session
+        self._retired_backend_sessions.add(old_session)
+        self._active_backend_session = session_id
+        self._highest_applied_sequence = 0
+        self._pending_commands.clear()
+        self._applied_command_ids.clear()
+        self.get_logger().warning(
+            f"[SESSION] backend session changed {old_session} → {session_id}; "
+            f"pending commands cleared and sequence ordering restarted"
+        )
+        return True
+
+    def _stage_control_command(self, parsed: dict, addr, now_monotonic: float):
+        command_id = parsed["command_id"]
+        sequence = parsed["sequence"]
+        if command_id in self._applied_command_ids:
+            self._udp_rx_duplicate += 1
+            return
+        if sequence <= self._highest_applied_sequence:
+            self._udp_rx_stale += 1
+            self.get_logger().warning(
+                f"[COMMAND-STALE] rejected id={command_id} sequence={sequence}; "
+                f"highest_applied={self._highest_applied_sequence}"
+            )
+            return
+        pending = self._pending_commands.get(command_id)
+        fingerprint = self._control_fingerprint(parsed)
+        if pending and pending["fingerprint"] != fingerprint:
+            self._udp_rx_invalid += 1
+            del self._pending_commands[command_id]
+            return
+        if pending and now_monotonic - pending["first_seen"] > jetson_bridge.COMMAND_CONFIRM_WINDOW_SEC:
+            pending = None
+        if pending is None:
+            pending = {
+                "first_seen": now_monotonic,
+                "last_seen": now_monotonic,
+                "repeat_indices": set(),
+                "fingerprint": fingerprint,
+                "packet": parsed,
+                "sender": addr,
+            }
+            self._pending_commands[command_id] = pending
+        repeat_index = parsed["repeat_index"]
+        if repeat_index in pending["repeat_indices"]:
+            self._udp_rx_duplicate += 1
+            return
+        pending["repeat_indices"].add(repeat_index)
+        pending["last_seen"] = now_monotonic
+        confirmed = len(pending["repeat_indices"])
+        self.get_logger().info(
+            f"[COMMAND-PENDING] id={command_id} sequence={sequence} "
+            f"unique={confirmed}/{jetson_bridge.COMMAND_CONFIRM_COUNT} "
+            f"indices={sorted(pending['repeat_indices'])} "
+            f"age={now_monotonic - pending['first_seen']:.3f}s"
+        )
+        if confirmed >= jetson_bridge.COMMAND_CONFIRM_COUNT:
+            self._apply_control_command(parsed, confirmed, now_monotonic)
+
+    def _apply_control_command(self, parsed: dict, confirmed_packets: int, now_monotonic: float):
+        sequence = parsed["sequence"]
+        if sequence <= self._highest_applied_sequence:
+            self._udp_rx_stale += 1
+            return
+        with self._setpoint_lock:
+            self._last_setpoint = jetson_bridge.Setpoint(
+                parsed["x"], parsed["y"], parsed["z"], parsed["mode"], sequence
+            )
+        self._highest_applied_sequence = sequence
+        self._commands_applied += 1
+        self._applied_command_ids[parsed["command_id"]] = now_monotonic
+        self._last_applied_command = {
+            "session_id": parsed["session_id"],
+            "command_id": parsed["command_id"],
+            "sequence": sequence,
+            "mode": parsed["mode"],
+            "confirmed_packets": confirmed_packets,
+            "applied_at_unix_s": time.time(),
+        }
+        for command_id, pending in list(self._pending_commands.items()):
+            if pending["packet"]["sequence"] <= sequence:
+                del self._pending_commands[command_id]
+        self._prune_applied_commands(now_monotonic)
+        self.get_logger().info(
+            f"[COMMAND-EXECUTE] #{self._commands_applied} "
+            f"id={parsed['command_id']} sequence={sequence} mode={parsed['mode']} "
+            f"confirmed={confirmed_packets} NED(m, power_on_origin)="
+            f"({parsed['x']:.3f},{parsed['y']:.3f},{parsed['z']:.3f})"
+        )
+
+    def _prune_applied_commands(self, now_monotonic: float):
+        for command_id, applied_at in list(self._applied_command_ids.items()):
+            if now_monotonic - applied_at > 300.0:
+                del self._applied_command_ids[command_id]
+        while len(self._applied_command_ids) > 256:
+            oldest = next(iter(self._applied_command_ids))
+            del self._applied_command_ids[oldest]
+
+    def _expire_pending(self, now_monotonic: float):
+        for command_id, pending in list(self._pending_commands.items()):
+            if now_monotonic - pending["last_seen"] > jetson_bridge.COMMAND_CONFIRM_WINDOW_SEC * 2:
+                del self._pending_commands[command_id]
+
+
+def _command_store_stream(args, rng):
+    """按块生成控制包：块内 in_flight 条命令的重发包轮转交错，再加有界抖动与重复包。
+
+    轮转交错意味着同一时刻有 in_flight 条命令处于待确认状态，序号较小者先凑满
+    确认数，因此旧实现每次应用都要扫描整个 pending 表。
+    """
+    sequence = 0
+    session_index = 0
+    for chunk_start in range(0, args.commands, args.in_flight):
+        chunk = []
+        for offset in range(min(args.in_flight, args.commands - chunk_start)):
+            if (chunk_start + offset) % args.session_every == 0:
+                session_index += 1
+            sequence += 1
+            session_id = f"backend-{session_index}"
+            chunk.append({
+                "session_id": session_id,
+                "command_id": f"{session_id}-d1-s{sequence}",
+                "sequence": sequence,
+                "drone_id": 1,
+                "slot": 1,
+                "mode": "move",
+                "issued_at": 0.0, "sent_at": 0.0,
+                "x": float(sequence), "y": 0.0, "z": -5.0,
+                "repeat_total": args.repeat_total,
+            })
+        keyed = []
+        position = 0
+        for repeat_index in range(1, args.repeat_total + 1):
+            for base in chunk:
+                packet = dict(base, repeat_index=repeat_index)
+                keyed.append((position + rng.uniform(0.0, args.jitter), packet))
+                while rng.random() < args.duplicate:
+                    keyed.append((position + rng.uniform(0.0, args.jitter), packet))
+                position += 1
+        keyed.sort(key=lambda item: item[0])
+        for _, packet in keyed:
+            yield packet
+
+
+def bench_command_store(args) -> None:
+    sender = ("192.168.30.100", 50123)
+    sessions = (args.commands + args.session_every - 1) // args.session_every
+    print(
+        f"command-store on {platform.machine()} / Python {platform.python_version()}: "
+        f"{args.commands} commands x {args.repeat_total} repeats, "
+        f"{args.in_flight} in flight, jitter {args.jitter:.0f} packets, "
+        f"duplicate p={args.duplicate}, {sessions} backend sessions"
+    )
+
+    def _expire_current(gate, now):
+        gate.commands.expire_pending(now, jetson_bridge.COMMAND_CONFIRM_WINDOW_SEC * 2)
+
+    # 每项：(名称, 构造, 过期清理, (pending, retired) 大小, (applied, stale) 计数)
+    variants = (
+        ("before (dict/set scans)", _LegacyCommandGate, _LegacyCommandGate._expire_pending,
+         lambda gate: (len(gate._pending_commands), len(gate._retired_backend_sessions)),
+         lambda gate: (gate._commands_applied, gate._udp_rx_stale)),
+        ("after  (CommandStore)  ", _control_gate, _expire_current,
+         lambda gate: (len(gate.commands.pending), len(gate.commands.retired_sessions)),
+         lambda gate: (gate.commands_applied, gate.rx_stale)),
+    )
+    for name, factory, expire, sizes, outcome in variants:
+        gate = factory()
+        now = 0.0
+        packets = 0
+        peak_pending = 0
+        stream = _command_store_stream(args, random.Random(args.seed))
+        started = time.perf_counter()
+        for parsed in stream:
+            packets += 1
+            now += 0.0002
+            if gate._accept_backend_session(parsed):
+                gate._stage_control_command(parsed, sender, now)
+            if packets % args.diagnostic_every == 0:
+                expire(gate, now)
+                peak_pending = max(peak_pending, sizes(gate)[0])
+        elapsed = time.perf_counter() - started
+        pending, retired = sizes(gate)
+        applied, stale = outcome(gate)
+        print(
+            f"  {name} {elapsed * 1e6 / packets:7.2f} us/packet  packets={packets} "
+            f"applied={applied} stale={stale} "
+            f"peak_pending~{peak_pending} retired_sessions={retired}"
+        )
+
+
+def _px4_sample_times(args, rng):
+    """模拟 local_position + odometry 到达时刻：同频、odometry 稍后到达，带抖动。"""
+    times = []
+    period = 1.0 / args.sample_hz
+    for index in range(int(args.seconds * args.sample_hz)):
+        arrival = index * period + rng.uniform(0.0, args.jitter_ms / 1e3)
+        times.append(arrival)
+        times.append(arrival + 0.0005)
+    times.sort()
+    return times
+
+
+def _fixed_timer_latencies(sample_times, rate_hz: float, phase: float):
+    latencies = []
+    period = 1.0 / rate_hz
+    index = 0
+    newest = None
+    last_used = None
+    tick = phase
+    while tick < sample_times[-1]:
+        while index < len(sample_times) and sample_times[index] <= tick:
+            newest = sample_times[index]
+            index += 1
+        if newest is not None and newest != last_used:
+            latencies.append(tick - newest)
+            last_used = newest
+        tick += period
+    return latencies
+
+
+def _scheduler_latencies(sample_times, args):
+    scheduler = jetson_bridge.TelemetryScheduler(
+        args.max_hz, args.min_hz, args.coalesce_ms / 1e3
+    )
+    latencies = []
+    sends = 0
+    for arrival in sample_times:
+        # 先处理在本样本到达前已到期的发送（主循环 selector 超时）
+        while scheduler.next_deadline() <= arrival:
+            latency = scheduler.mark_sent(max(0.0, scheduler.next_deadline()))
+            sends += 1
+            if latency is not None:
+                latencies.append(latency)
+        scheduler.note_sample(arrival)
+    return latencies, sends
+
+
+def bench_telemetry_latency(args) -> None:
+    rng = random.Random(args.seed)
+    samples = _px4_sample_times(args, rng)
+    print(
+        f"telemetry-latency: PX4 samples {args.sample_hz:.0f}Hz "
+        f"(+{args.jitter_ms:.1f}ms jitter) for {args.seconds:.0f}s, "
+        f"max {args.max_hz:g}Hz, coalesce {args.coalesce_ms:.1f}ms"
+    )
+    fixed = _fixed_timer_latencies(samples, args.max_hz, rng.uniform(0.0, 1.0 / args.max_hz))
+    print(f"  fixed {args.max_hz:g}Hz timer   sample->send {_distribution_text(fixed)} "
+          f"sends={len(fixed)}")
+    scheduled, sends = _scheduler_latencies(samples, args)
+    print(f"  TelemetryScheduler   sample->send {_distribution_text(scheduled)} "
+          f"sends={sends}")
+
+
+# UDP + IPv4 头部，按数据报计入链路开销
+_UDP_IPV4_OVERHEAD_BYTES = 28
+
+
+def _synthetic_flight(seconds: float, rate_hz: float, rng):
+    """合成一次外场飞行的遥测字段序列：地面待机 → 解锁起飞 → 航点 → 悬停 → 降落。"""
+    origin_lat, origin_lon, origin_alt = 30.2741702, 120.1551442, 18.63
+    waypoints = ((0.0, 0.0, -10.0), (40.0, 0.0, -10.0), (40.0, 30.0, -12.0),
+                 (0.0, 30.0, -12.0), (0.0, 0.0, -10.0))
+    position = [0.0, 0.0, 0.0]
+    dt = 1.0 / rate_hz
+    sequence = 0
+    ack = None
+    frames = []
+    for index in range(int(seconds * rate_hz)):
+        t = index * dt
+        airborne = 10.0 <= t < seconds - 20.0
+        arming_state = 2 if 8.0 <= t < seconds - 5.0 else 1
+        nav_state = 14 if airborne else 4
+        target = position
+        if airborne:
+            leg = min(len(waypoints) - 1, int((t - 10.0) // 40.0))
+            target = list(waypoints[leg])
+            if sequence != leg + 1:
+                sequence = leg + 1
+                ack = {
+                    "session_id": "backend-1784200000000000-1a2b3c4d",
+                    "command_id": f"backend-1784200000000000-1a2b3c4d-d1-s{sequence}",
+                    "sequence": sequence,
+                    "mode": "move",
+                    "confirmed_packets": 3,
+                    "applied_at_unix_s": 1784200000.0 + t,
+                }
+        elif t >= seconds - 20.0:
+            target = [position[0], position[1], 0.0]
+        velocity = []
+        for axis in range(3):
+            error = target[axis] - position[axis]
+            step = max(-2.0 * dt, min(2.0 * dt, error))
+            position[axis] += step
+            velocity.append(step / dt + rng.gauss(0.0, 0.01))
+        noisy = [value + rng.gauss(0.0, 0.005) for value in position]
+        yaw = 0.1 * math.sin(t / 30.0)
+        frame = {
+            "timestamp": int(1784200000000000 + t * 1e6),
+            "position": noisy,
+            "q": [math.cos(yaw / 2), 0.0, 0.0, math.sin(yaw / 2)],
+            "velocity": velocity,
+            "angular_velocity": [rng.gauss(0.0, 0.002) for _ in range(3)],
+            "arming_state": arming_state,
+            "nav_state": nav_state,
+            "local_position": list(noisy),
+            "local_velocity": list(velocity),
+            "local_position_valid": True,
+            "gps_lat": round(origin_lat + noisy[0] / 111320.0, 7),
+            "gps_lon": round(origin_lon + noisy[1] / 96420.0, 7),
+            "gps_alt": round(origin_alt - noisy[2], 2),
+            "gps_fix": True,
+            "battery": int(100 - 40.0 * t / seconds),
+            "sample_latency_ms": round(rng.uniform(2.0, 3.5), 3),
+        }
+        if ack is not None:
+            frame["control_ack"] = dict(ack)
+        frames.append(frame)
+    return frames
+
+
+def _load_recording(path):
+    """读取 JSON Lines 录制：每行一个 _send_telemetry 字段字典。"""
+    frames = []
+    with open(path, encoding="utf-8") as recording:
+        for line in recording:
+            line = line.strip()
+            if line:
+                frames.append(json.loads(line))
+    return frames
+
+
+def _merge_like_receiver(state, data):
+    """按 udp_receiver.cpp 的规则合并：关键帧重置，增量帧只继承慢变字段。"""
+    slow = {name for group in jetson_bridge.TelemetryDeltaEncoder.SLOW_FIELD_GROUPS
+            for name in group}
+    if data.get("keyframe", True):
+        return dict(data)
+    merged = {name: value for name, value in state.items() if name in slow}
+    merged.update(data)
+    return merged
+
+
+def bench_telemetry_delta(args) -> None:
+    rng = random.Random(args.seed)
+    if args.recording:
+        frames = _load_recording(args.recording)
+        source = args.recording
+    else:
+        frames = _synthetic_flight(args.seconds, args.rate_hz, rng)
+        source = f"synthetic {args.seconds:.0f}s flight @ {args.rate_hz:g}Hz"
+    duration = max(1e-6, (frames[-1]["timestamp"] - frames[0]["timestamp"]) / 1e6)
+    print(f"telemetry-delta over {source}: {len(frames)} datagrams, {args.drones} drone(s)")
+
+    slow = [name for group in jetson_bridge.TelemetryDeltaEncoder.SLOW_FIELD_GROUPS
+            for name in group]
+    for name, delta in (("full ", False), ("delta", True)):
+        encoder = jetson_bridge.TelemetryDeltaEncoder(
+            delta, args.keyframe_sec, args.repeat
+        )
+        loss_rng = random.Random(args.seed + 1)
+        payload_bytes = 0
+        receiver = {}
+        stale = 0
+        for frame in frames:
+            data = encoder.encode(dict(frame), frame["timestamp"] / 1e6)
+            payload_bytes += len(jetson_bridge.encode_telemetry_yaml(data))
+            if loss_rng.random() < args.loss:
+                continue
+            receiver = _merge_like_receiver(receiver, data)
+            if any(receiver.get(field) != frame.get(field) for field in slow):
+                stale += 1
+        wire_bytes = payload_bytes + _UDP_IPV4_OVERHEAD_BYTES * len(frames)
+        print(
+            f"  {name} payload {payload_bytes / len(frames):6.1f} B/datagram, "
+            f"{wire_bytes * 8 * args.drones / duration / 1000:7.1f} kbit/s on the link, "
+            f"keyframes={encoder.keyframes}, "
+            f"stale slow fields after {args.loss:.0%} loss: {stale} datagrams"
+        )
+
+
+def bench_pose_channel(args) -> None:
+    per_batch = max(1, int(round(args.sample_hz * args.batch_ms / 1e3)))
+    samples = [
+        jetson_bridge.PoseSample(
+            1784200000000000 + index * 10000, (12.503, -3.248, -7.991),
+            (0.9998, 0.0012, -0.0031, 0.0175), (0.412, -0.057, 0.003),
+        )
+        for index in range(per_batch)
+    ]
+    batch = jetson_bridge.encode_pose_batch(1, 1, 1784200000000000, samples)
+    yaml_bytes = len(jetson_bridge.encode_telemetry_yaml(_sample_telemetry()))
+    batches_per_sec = args.sample_hz / per_batch
+    print(
+        f"pose-channel: {args.sample_hz:g}Hz pose samples, {per_batch} per "
+        f"{args.batch_ms:g}ms batch, max {jetson_bridge.POSE_BATCH_MAX_SAMPLES}/datagram"
+    )
+    for name, datagram_bytes, rate in (
+        ("YAML telemetry per sample", yaml_bytes, args.sample_hz),
+        ("binary pose batches     ", len(batch), batches_per_sec),
+    ):
+        wire = (datagram_bytes + _UDP_IPV4_OVERHEAD_BYTES) * rate
+        print(
+            f"  {name} {rate:6.1f} datagrams/s {datagram_bytes:5d} B each "
+            f"{wire * 8 / 1000:7.1f} kbit/s ({wire / args.sample_hz:6.1f} B/sample on the wire)"
+        )
+    cost = _time_per_call(
+        lambda batch_samples: jetson_bridge.encode_pose_batch(1, 1, 0, batch_samples),
+        samples, args.iterations, args.rounds,
+    )
+    print(f"  encode_pose_batch {cost * 1e6:8.2f} us/batch")
+
+
+def _metrics_harness(slot: int, rng) -> types.SimpleNamespace:
+    """带有典型计数与已填充直方图的 slot 替身，走真实的 collect_metrics。"""
+    bridge = types.SimpleNamespace(slot=slot)
+    core = jetson_bridge.BridgeCore(slot, _NullLogger())
+    for name in (
+        "rx_total", "rx_hold", "rx_move", "rx_invalid", "rx_duplicate", "rx_stale",
+        "commands_applied", "highest_applied_sequence",
+    ):
+        setattr(core, name, rng.randrange(1_000_000))
+    core.last_ctrl_monotonic = time.monotonic()
+    bridge._core = core
+    for name in (
+        "_udp_recv_errors", "_offboard_publish_count",
+        "_command_ack_count", "_telemetry_sent", "_telemetry_send_errors",
+        "_telemetry_heartbeats", "_telemetry_last_bytes",
+    ):
+        setattr(bridge, name, rng.randrange(1_000_000))
+    bridge._pose_port = 8988
+    for name in ("_pose_batches_sent", "_pose_samples_sent",
+                 "_pose_samples_dropped", "_pose_send_errors"):
+        setattr(bridge, name, rng.randrange(1_000_000))
+    bridge._ingress_stats = jetson_bridge.IngressBatchStats()
+    bridge._ingress = jetson_bridge.ControlIngressQueue(bridge._core.digest_cache)
+    bridge._telemetry_delta = jetson_bridge.TelemetryDeltaEncoder(True, 1.0, 3)
+    bridge._telemetry_fanout = jetson_bridge.TelemetryFanout(
+        ("192.168.30.100", 8888), [("192.168.30.101", 9888, 1), ("239.10.0.1", 9900, 5)]
+    )
+    bridge._vehicle_commands = jetson_bridge.VehicleCommandSequencer((
+        jetson_bridge.VehicleCommandStep("ARM", 400, 1.0, 0.0),
+        jetson_bridge.VehicleCommandStep("OFFBOARD", 176, 1.0, 6.0),
+    ))
+    bridge._heartbeat_monitor = jetson_bridge.HeartbeatMonitor(jetson_bridge.OFFBOARD_INTERVAL)
+    topics = jetson_bridge.PX4_SAMPLE_NAMES
+    bridge._ros_rx_counts = {topic: rng.randrange(1_000_000) for topic in topics}
+    core.sample_monotonic = {topic: time.monotonic() for topic in topics}
+    bridge._ros_rx_rates = jetson_bridge.CounterRates()
+    bridge._sample_latency = jetson_bridge.LatencyHistogram()
+    bridge._recorder = None
+    for histogram in (
+        *core.hop_latency.values(), *core.apply_latency.values(), bridge._sample_latency
+    ):
+        for _ in range(200):
+            histogram.record(rng.lognormvariate(-6.0, 2.0))
+    bridge.collect_metrics = types.MethodType(
+        jetson_bridge.JetsonBridge.collect_metrics, bridge
+    )
+    return bridge
+
+
+def _scrape_forever(address, interval: float, stop, sizes):
+    while not stop.is_set():
+        with socket.create_connection(address, timeout=2.0) as client:
+            client.sendall(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            received = 0
+            while chunk := client.recv(65536):
+                received += len(chunk)
+        sizes.append(received)
+        stop.wait(interval)
+
+
+def bench_metrics_scrape(args) -> None:
+    rng = random.Random(args.seed)
+    bridges = [_metrics_harness(slot, rng) for slot in range(1, args.slots + 1)]
+    body = jetson_bridge.render_metrics(bridges, time.monotonic())
+    cost = _time_per_call(
+        lambda items: jetson_bridge.render_metrics(items, time.monotonic()),
+        bridges, args.iterations, args.rounds,
+    )
+    line_count = body.count(b"\n")
+    print(
+        f"metrics-scrape on {platform.machine()} / Python {platform.python_version()}: "
+        f"{args.slots} slot(s), {len(body)} B per scrape, {line_count} lines"
+    )
+    print(f"  render_metrics {cost * 1e6:8.1f} us/scrape")
+
+    # 心跳在独立线程按 50Hz 运行；主线程角色由 selector 线程承担，
+    # 另一线程以 --scrape-hz 通过真实 HTTP 抓取。对比不抓取与抓取时的 tick 间隔。
+    for name, scrape_hz in (
+        ("no scraping", 0.0), (f"{args.scrape_hz:g}Hz scraping", args.scrape_hz)
+    ):
+        selector = selectors.DefaultSelector()
+        server = jetson_bridge.MetricsServer(
+            "127.0.0.1", 0, lambda: jetson_bridge.render_metrics(bridges, time.monotonic()),
+            selector,
+        )
+        stop = threading.Event()
+
+        def _serve():
+            while not stop.is_set():
+                for key, _ in selector.select(timeout=0.05):
+                    key.data()
+
+        threads = [threading.Thread(target=_serve, daemon=True)]
+        sizes = []
+        if scrape_hz > 0:
+            threads.append(threading.Thread(
+                target=_scrape_forever,
+                args=(server.address, 1.0 / scrape_hz, stop, sizes),
+                daemon=True,
+            ))
+        for thread in threads:
+            thread.start()
+        durations, intervals = _run_heartbeat(
+            jetson_bridge.JetsonBridge._offboard_loop, _heartbeat_harness(), args.seconds, 0.0
+        )
+        stop.set()
+        for thread in threads:
+            thread.join()
+        server.close()
+        selector.close()
+        print(f"  {name:<14} tick     {_distribution_text(durations)}")
+        print(
+            f"  {name:<14} interval {_distribution_text(intervals)} "
+            f"scrapes={server.requests}"
+        )
+
+
+def bench_flight_recorder(args) -> None:
+    recorder = jetson_bridge.FlightRecorder(
+        args.path, int(args.size_mb * 1024 * 1024), 1
+    )
+    packet = json.dumps(_sample_control_message()).encode("utf-8")
+    odometry = types.SimpleNamespace(
+        timestamp=1784200000123456, timestamp_sample=1784200000120000,
+        position=[12.5, -3.25, -7.75], q=[0.9998, 0.0012, -0.0031, 0.0175],
+        velocity=[0.41, -0.06, 0.0], angular_velocity=[0.01, 0.02, -0.03],
+    )
+    position = [12.5, -3.25, -7.75]
+    cases = (
+        (f"control_datagram ({len(packet)}B)",
+         lambda _: recorder.record_datagram(packet, ("192.168.30.100", 50123), 1.0, 2.0)),
+        ("odometry", lambda _: recorder.record_odometry(odometry)),
+        ("setpoint_publish", lambda _: recorder.record_setpoint_publish(1, "move", position, 1)),
+    )
+    print(
+        f"flight-recorder on {platform.machine()} / Python {platform.python_version()}: "
+        f"{args.size_mb:g}MiB ring at {args.path}"
+    )
+    try:
+        for name, function in cases:
+            cost = _time_per_call(function, None, args.iterations, args.rounds)
+            print(f"  {name:<26} {cost * 1e6:6.2f} us/record")
+        print(
+            f"  records={recorder.records} blocks={recorder.blocks} "
+            f"dropped={recorder.dropped}"
+        )
+    finally:
+        recorder.close()
+        if not args.keep:
+            os.unlink(args.path)
+
+
+class _SlowLogger:
+    """每条日志额外阻塞 io_delay 秒，模拟串口控制台 / journald 的写入背压。"""
+
+    def __init__(self, io_delay: float):
+        self.io_delay = io_delay
+        self.lines = 0
+
+    def _write(self, _message):
+        self.lines += 1
+        if self.io_delay:
+            time.sleep(self.io_delay)
+
+    info = warning = error = _write
+
+
+def _flood_datagrams(count: int, invalid_ratio: float, rng):
+    """每条命令 5 个重发包的 move 洪泛，按 invalid_ratio 混入无法解析的数据报。"""
+    datagrams = []
+    for index in range(count):
+        if rng.random() < invalid_ratio:
+            datagrams.append(b'{"protocol": "ue5_drone_control", "truncated' + bytes(120))
+            continue
+        message = _sample_control_message(index % 5 + 1)
+        sequence = index // 5 + 1
+        message["sequence"] = sequence
+        message["command_id"] = f"flood-s{sequence}"
+        datagrams.append(json.dumps(message).encode("utf-8"))
+    return datagrams
+
+
+def bench_log_flood(args) -> None:
+    rng = random.Random(args.seed)
+    datagrams = _flood_datagrams(args.datagrams, args.invalid_ratio, rng)
+    sender = ("192.168.30.100", 50123)
+    io_delay = args.io_delay_ms / 1e3
+    print(
+        f"log-flood on {platform.machine()} / Python {platform.python_version()}: "
+        f"{len(datagrams)} datagrams ({args.invalid_ratio:.0%} invalid), "
+        f"log I/O {args.io_delay_ms:g} ms/line"
+    )
+    cases = (
+        ("sync, unlimited", False, 0.0),
+        ("sync, rate-limited", False, jetson_bridge.LOG_RATE_PER_SEC),
+        ("async, rate-limited", True, jetson_bridge.LOG_RATE_PER_SEC),
+    )
+    for name, asynchronous, rate in cases:
+        logger = _SlowLogger(io_delay)
+        writer = jetson_bridge.EventLogWriter() if asynchronous else None
+        events = jetson_bridge.EventLog(logger, writer, rate_per_sec=rate)
+        gate = jetson_bridge.BridgeCore(1, logger, events=events)
+        gate.last_setpoint = jetson_bridge.Setpoint(0.0, 0.0, 0.0, "hold", 0)
+        durations = []
+        started = time.perf_counter()
+        for data in datagrams:
+            before = time.perf_counter()
+            gate.handle_datagram(data, sender, time.monotonic())
+            durations.append(time.perf_counter() - before)
+        elapsed = time.perf_counter() - started
+        if writer is not None:
+            writer.close(timeout=30.0)
+        print(
+            f"  {name:<20} {len(datagrams) / elapsed:9.0f} datagrams/s  "
+            f"{_distribution_text(durations)}"
+        )
+        print(
+            f"  {'':<20} applied={gate.commands_applied} log_lines={logger.lines} "
+            f"suppressed={sum(events.suppressed.values())}"
+            + (f" queue_dropped={writer.dropped}" if writer is not None else "")
+        )
+
+
+def bench_telemetry_fanout(args) -> None:
+    """每帧遥测的发送成本：每个消费者各自编码 + sendto，对比编码一次 + connected 扇出。"""
+    receivers = []
+    for _ in range(1 + args.subscribers):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        receiver.bind(("127.0.0.1", 0))
+        receiver.setblocking(False)
+        receivers.append(receiver)
+    addrs = [receiver.getsockname() for receiver in receivers]
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    fanout = jetson_bridge.TelemetryFanout(addrs[0], [(host, port, 1) for host, port in addrs[1:]])
+    data = _sample_telemetry()
+
+    def drain():
+        for receiver in receivers:
+            while True:
+                try:
+                    receiver.recv(65535)
+                except BlockingIOError:
+                    break
+
+    def per_consumer(telemetry):
+        for addr in addrs:
+            sender.sendto(jetson_bridge.encode_telemetry_yaml(telemetry), addr)
+
+    def fanned_out(telemetry):
+        fanout.send(jetson_bridge.encode_telemetry_yaml(telemetry))
+
+    print(f"telemetry-fanout: primary + {args.subscribers} subscribers on loopback")
+    try:
+        for name, function in (
+            ("encode + sendto per consumer", per_consumer),
+            ("encode once, connected send ", fanned_out),
+        ):
+            best = float("inf")
+            for _ in range(args.rounds):
+                drain()
+                best = min(best, _time_per_call(function, data, args.iterations, 1))
+            print(f"  {name} {best * 1e6:8.2f} us/tick")
+        errors = sum(target.errors + target.refused for target in fanout.targets)
+        print(f"  fan-out send errors: {errors}")
+    finally:
+        fanout.close()
+        sender.close()
+        for receiver in receivers:
+            receiver.close()
+
+
+def bench_heartbeat_load(args) -> None:
+    """专用心跳线程在 Python 负载（YAML 编码 + 控制包解析）下的实际发布间隔。"""
+    telemetry = _sample_telemetry()
+    packet = json.dumps(_sample_control_message()).encode("utf-8")
+    cpus = jetson_bridge.parse_cpu_list(args.cpus)
+    default_switch = sys.getswitchinterval()
+    # 未显式设置 OFFBOARD_SWITCH_INTERVAL_SEC 时按 1ms 对比
+    fast_switch = jetson_bridge.OFFBOARD_SWITCH_INTERVAL_SEC or 0.001
+    print(
+        f"heartbeat-load on {platform.machine()} / Python {platform.python_version()}: "
+        f"{jetson_bridge.OFFBOARD_HZ}Hz for {args.seconds:.1f}s per variant, "
+        f"{args.load_threads} load thread(s), sched={args.sched} priority={args.priority}"
+    )
+    for name, load_threads, switch_interval in (
+        ("idle", 0, default_switch),
+        (f"loaded, switch {default_switch * 1e3:.1f}ms", args.load_threads, default_switch),
+        (f"loaded, switch {fast_switch * 1e3:.1f}ms", args.load_threads, fast_switch),
+    ):
+        bridge = _heartbeat_harness()
+        stop = threading.Event()
+
+        def _load():
+            while not stop.is_set():
+                jetson_bridge.encode_telemetry_yaml(telemetry)
+                jetson_bridge.parse_control_packet(packet)
+
+        loaders = [threading.Thread(target=_load, daemon=True) for _ in range(load_threads)]
+        heartbeat = jetson_bridge.HeartbeatThread(
+            jetson_bridge.OFFBOARD_INTERVAL,
+            lambda: jetson_bridge.JetsonBridge._offboard_loop(bridge),
+            _NullLogger(), policy=args.sched, priority=args.priority, cpus=cpus,
+        )
+        sys.setswitchinterval(switch_interval)
+        try:
+            for loader in loaders:
+                loader.start()
+            heartbeat.start()
+            time.sleep(args.seconds)
+        finally:
+            heartbeat.stop()
+            stop.set()
+            for loader in loaders:
+                loader.join()
+            sys.setswitchinterval(default_switch)
+        print(f"  {name:<22} {bridge._heartbeat_monitor.summary()} skipped={heartbeat.skipped}")
+    print(f"  scheduling: {'; '.join(heartbeat.scheduling) or 'default'}")
+
+
+def _zigzag_path(args) -> list:
+    return [
+        (args.spacing * (index + 1), args.spacing * (index % 2), -5.0)
+        for index in range(args.waypoints)
+    ]
+
+
+def _simulate_path(args, rng, upload: bool) -> dict:
+    """虚拟时钟下飞完一条折线：逐航点 move 命令（upload=False）或整条轨迹上传。
+
+    后端按 heartbeat_hz 重发 repeat_total 次；逐点模式在遥测显示到达当前航点后
+    才下发下一点，ACK 超时（1s）则换新序号重发。机体以 --speed 匀速飞向 setpoint。
+    """
+    now = [100.0]
+    core = jetson_bridge.BridgeCore(
+        1, _NullLogger(), clock=lambda: now[0], wall_clock=lambda: 1000.0 + now[0],
+    )
+    sender = ("192.168.30.100", 50123)
+    vehicle = [0.0, 0.0, -5.0]
+
+    def sample():
+        core.note_sample("local_position", types.SimpleNamespace(
+            x=vehicle[0], y=vehicle[1], z=vehicle[2], vx=0.0, vy=0.0, vz=0.0,
+            xy_valid=True, z_valid=True,
+        ), now[0])
+
+    sample()
+    core.update_safe_hold(core.samples["local_position"])
+    waypoints = _zigzag_path(args)
+    radius = jetson_bridge.TRAJECTORY_ACCEPT_RADIUS_M
+    period = 1.0 / args.heartbeat_hz
+    outbox = []
+    sequence = [0]
+
+    def issue(datagram_factory):
+        sequence[0] += 1
+        command = {
+            "session_id": "bench-session", "command_id": f"bench-s{sequence[0]}",
+            "sequence": sequence[0], "drone_id": 1, "slot": 1,
+            "issued_at": 1000.0 + now[0], "sent_at": 1000.0 + now[0],
+        }
+        for repeat in range(1, args.repeat_total + 1):
+            for datagram in datagram_factory(command, repeat):
+                outbox.append((now[0] + (repeat - 1) * period, datagram))
+        return command["command_id"], now[0]
+
+    def move(index):
+        def factory(command, repeat):
+            message = _sample_control_message(repeat)
+            message.update(
+                session_id=command["session_id"], command_id=command["command_id"],
+                sequence=command["sequence"],
+            )
+            message["delivery"]["repeat_total"] = args.repeat_total
+            north, east, down = waypoints[index]
+            message["target"].update(north=north, east=east, down=down)
+            return [json.dumps(message).encode("utf-8")]
+        return issue(factory)
+
+    def trajectory():
+        return issue(lambda command, repeat: jetson_bridge.encode_trajectory_chunks(
+            command, waypoints, repeat_index=repeat, repeat_total=args.repeat_total,
+        ))
+
+    current = 0
+    pending = trajectory() if upload else move(current)
+    dt = jetson_bridge.OFFBOARD_INTERVAL
+    telemetry_every = max(1, round(1.0 / (jetson_bridge.TELEMETRY_HZ * dt)))
+    started = now[0]
+    stalled = 0.0
+    tick = 0
+    last = len(waypoints) - 1
+    while math.dist(vehicle, waypoints[-1]) > radius or (not upload and current < last):
+        tick += 1
+        now[0] += dt
+        due = [item for item in outbox if item[0] <= now[0]]
+        outbox = [item for item in outbox if item[0] > now[0]]
+        for _, datagram in due:
+            if rng.random() >= args.loss:
+                core.handle_datagram(datagram, sender, now[0])
+        core.step_trajectory(now[0])
+        sp = core.last_setpoint
+        distance = math.dist(vehicle, (sp.x, sp.y, sp.z))
+        step = min(distance, args.speed * dt)
+        if step < 1e-9:
+            stalled += dt
+        else:
+            for axis, goal in enumerate((sp.x, sp.y, sp.z)):
+                vehicle[axis] += (goal - vehicle[axis]) * step / distance
+        sample()
+
+        if tick % telemetry_every:
+            continue
+        acked = (core.last_applied_command or {}).get("command_id") == pending[0]
+        if not acked and now[0] - pending[1] > 1.0:
+            pending = trajectory() if upload else move(current)
+        elif (
+            acked and not upload and current < last
+            and math.dist(vehicle, waypoints[current]) <= radius
+        ):
+            current += 1
+            pending = move(current)
+        if now[0] - started > 600.0:
+            break
+    return {
+        "path_s": now[0] - started,
+        "stalled_s": stalled,
+        "datagrams": core.rx_total,
+    }
+
+
+def bench_trajectory_follow(args) -> None:
+    waypoints = _zigzag_path(args)
+    length = sum(
+        math.dist(a, b) for a, b in zip([(0.0, 0.0, -5.0)] + waypoints, waypoints)
+    )
+    print(
+        f"trajectory-follow: {args.waypoints} waypoints, {length:.0f} m at {args.speed} m/s "
+        f"(ideal {length / args.speed:.1f}s), {args.heartbeat_hz:.0f}Hz x "
+        f"{args.repeat_total} repeats, loss={args.loss:.0%}, "
+        f"confirm={jetson_bridge.COMMAND_CONFIRM_COUNT}"
+    )
+    for name, upload in (("move per waypoint", False), ("trajectory upload", True)):
+        result = _simulate_path(args, random.Random(args.seed), upload)
+        print(
+            f"  {name:18s} path={result['path_s']:6.1f}s "
+            f"stalled={result['stalled_s']:5.1f}s datagrams={result['datagrams']}"
+        )
+
+
+def _flood_holds(address, pps: float, stop) -> None:
+    """独立进程：以 pps 速率从两个源端口交替重放一组旧的 hold 包。
+
+    模拟失控的后端或多个后端同时指向同一 slot：发送方交替变化，每包都走完整
+    的会话 / 发送方处理路径，摘要缓存的重复包短路无法生效。
+    """
+    datagrams = []
+    for index in range(1, 1001):
+        message = _sample_control_message(index)
+        message.update(
+            mode="hold", sequence=1, command_id="bench-session-flood-hold",
+            session_id="bench-session",
+        )
+        message["delivery"]["repeat_total"] = 0
+        datagrams.append(json.dumps(message).encode("utf-8"))
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(2)]
+    burst = 50
+    interval = burst / pps
+    next_burst = time.monotonic()
+    index = 0
+    while not stop.is_set():
+        for _ in range(burst):
+            try:
+                sockets[index % 2].sendto(datagrams[index % len(datagrams)], address)
+            except OSError:
+                pass
+            index += 1
+        next_burst += interval
+        delay = next_burst - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    for sock in sockets:
+        sock.close()
+
+
+def _run_ingress_flood(args, prioritized: bool) -> dict:
+    """真实 socket + 心跳线程：洪泛进程持续发 hold，本进程按后端节奏发 move。"""
+    bridge = _heartbeat_harness()
+    core = bridge._core
+    core.events.writer = types.SimpleNamespace(submit=lambda event: True)
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.setblocking(False)
+    bridge._ctrl_sock = receiver
+    bridge._ctrl_kernel_timestamps = False
+    bridge._ingress_stats = jetson_bridge.IngressBatchStats()
+    bridge._ingress = jetson_bridge.ControlIngressQueue(core.digest_cache)
+    bridge._udp_recv_errors = 0
+    legit = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = receiver.getsockname()
+
+    def drain_fifo():
+        # 入口分级之前的行为：取出的每个数据报都按到达顺序完整处理
+        batch, _ = jetson_bridge.drain_udp_socket(
+            receiver, jetson_bridge.MAX_CONTROL_PACKET_BYTES + 1,
+            jetson_bridge.CONTROL_INGRESS_MAX_BATCH,
+        )
+        for datagram in batch:
+            core.handle_datagram(*datagram)
+
+    drain = (lambda: jetson_bridge.JetsonBridge.drain_control(bridge)) if prioritized else drain_fifo
+    selector = selectors.DefaultSelector()
+    selector.register(receiver, selectors.EVENT_READ)
+    stop = multiprocessing.Event()
+    flooder = multiprocessing.Process(
+        target=_flood_holds, args=(address, args.flood_pps, stop), daemon=True
+    )
+    heartbeat = jetson_bridge.HeartbeatThread(
+        jetson_bridge.OFFBOARD_INTERVAL,
+        lambda: jetson_bridge.JetsonBridge._offboard_loop(bridge), _NullLogger(),
+        policy="other",
+    )
+
+    period = 1.0 / args.heartbeat_hz
+    first_sent = {}
+    latencies = []
+    sequence = 1000
+    repeat = 0
+    applied = core.commands_applied
+    flooder.start()
+    time.sleep(0.2)
+    heartbeat.start()
+    try:
+        start = time.monotonic()
+        end = start + args.seconds
+        next_send = start
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                break
+            if now >= next_send:
+                if repeat == args.repeat_total:
+                    sequence += 1
+                    repeat = 0
+                repeat += 1
+                message = _sample_control_message(repeat)
+                message.update(
+                    session_id="bench-session", command_id=f"bench-session-d1-s{sequence}",
+                    sequence=sequence,
+                )
+                message["delivery"]["repeat_total"] = args.repeat_total
+                first_sent.setdefault(sequence, now)
+                legit.sendto(json.dumps(message).encode("utf-8"), address)
+                next_send += period
+            deadline = min(next_send, end)
+            if prioritized:
+                deadline = min(deadline, bridge._ingress.next_deadline())
+            if selector.select(timeout=max(0.0, deadline - time.monotonic())):
+                drain()
+            if prioritized:
+                jetson_bridge.JetsonBridge.poll_control_ingress(bridge, time.monotonic())
+            if core.commands_applied != applied:
+                applied = core.commands_applied
+                applied_sequence = core.last_applied_command["sequence"]
+                if applied_sequence in first_sent:
+                    latencies.append(time.monotonic() - first_sent[applied_sequence])
+    finally:
+        heartbeat.stop()
+        stop.set()
+        flooder.join()
+        selector.close()
+        receiver.close()
+        legit.close()
+    latencies.sort()
+    return {
+        "commands": len(first_sent),
+        "latencies": latencies,
+        "rx_total": core.rx_total,
+        "heartbeat": bridge._heartbeat_monitor.summary(),
+        "ingress": bridge._ingress,
+    }
+
+
+def bench_ingress_flood(args) -> None:
+    print(
+        f"ingress-flood: {args.flood_pps:.0f} hold datagrams/s from a flooding process, "
+        f"move commands {args.heartbeat_hz:.0f}Hz x {args.repeat_total} repeats, "
+        f"{args.seconds:.1f}s per variant, budget "
+        f"{jetson_bridge.CONTROL_INGRESS_BUDGET_SEC * 1e3:g}ms/"
+        f"{jetson_bridge.OFFBOARD_INTERVAL * 1e3:g}ms"
+    )
+    for name, prioritized in (("fifo (every datagram)", False), ("prioritized ingress ", True)):
+        result = _run_ingress_flood(args, prioritized)
+        latencies = result["latencies"]
+        if latencies:
+            confirm = (
+                f"p50={_percentile(latencies, 0.5) * 1e3:.0f} "
+                f"p99={_percentile(latencies, 0.99) * 1e3:.0f} ms"
+            )
+        else:
+            confirm = "none applied"
+        # 最后一条命令可能还在重发中
+        missing = result["commands"] - len(latencies) - 1
+        print(f"  {name} heartbeat {result['heartbeat']}")
+        print(
+            f"  {'':21s} confirm {confirm}; never applied {max(0, missing)}/"
+            f"{result['commands']}; handled {result['rx_total']} datagrams"
+        )
+        if prioritized:
+            ingress = result["ingress"]
+            shed = ", ".join(f"{reason}={count}" for reason, count in ingress.shed.items())
+            print(
+                f"  {'':21s} admitted command/repeat/hold="
+                f"{'/'.join(map(str, ingress.admitted))}; shed {shed}; "
+                f"budget exhausted in {ingress.exhausted_periods} periods"
+            )
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    control_parse = subparsers.add_parser(
+        "control-parse", help="JSON vs binary parse_control_packet cost"
+    )
+    control_parse.add_argument("--iterations", type=int, default=50000)
+    control_parse.add_argument("--rounds", type=int, default=5)
+    control_parse.set_defaults(handler=bench_control_parse)
+
+    telemetry_encode = subparsers.add_parser(
+        "telemetry-encode", help="yaml.dump vs encode_telemetry_yaml cost"
+    )
+    telemetry_encode.add_argument("--iterations", type=int, default=5000)
+    telemetry_encode.add_argument("--rounds", type=int, default=5)
+    telemetry_encode.set_defaults(handler=bench_telemetry_encode)
+
+    offboard_jitter = subparsers.add_parser(
+        "offboard-jitter",
+        help="50Hz heartbeat tick/interval distribution, legacy vs current",
+    )
+    offboard_jitter.add_argument("--seconds", type=float, default=5.0)
+    offboard_jitter.add_argument("--hold-us", type=float, default=300.0)
+    offboard_jitter.set_defaults(handler=bench_offboard_jitter)
+
+    setpoint_step = subparsers.add_parser(
+        "setpoint-step", help="smoothing generator cost and profile for one move"
+    )
+    setpoint_step.add_argument("--distance", type=float, default=10.0)
+    setpoint_step.add_argument(
+        "--max-velocity", type=float, default=jetson_bridge.SETPOINT_MAX_VELOCITY_MPS
+    )
+    setpoint_step.add_argument(
+        "--max-acceleration", type=float, default=jetson_bridge.SETPOINT_MAX_ACCEL_MPS2
+    )
+    setpoint_step.add_argument("--iterations", type=int, default=100000)
+    setpoint_step.add_argument("--rounds", type=int, default=5)
+    setpoint_step.set_defaults(handler=bench_setpoint_step)
+
+    confirm_latency = subparsers.add_parser(
+        "confirm-latency",
+        help="first-send to apply latency, 3-of-N confirmation vs HMAC fast path",
+    )
+    confirm_latency.add_argument("--commands", type=int, default=2000)
+    confirm_latency.add_argument("--heartbeat-hz", type=float, default=5.0)
+    confirm_latency.add_argument("--repeat-total", type=int, default=5)
+    confirm_latency.add_argument("--loss", type=float, default=0.1)
+    confirm_latency.add_argument("--seed", type=int, default=1)
+    confirm_latency.add_argument("--iterations", type=int, default=20000)
+    confirm_latency.add_argument("--rounds", type=int, default=5)
+    confirm_latency.set_defaults(handler=bench_confirm_latency)
+
+    command_store = subparsers.add_parser(
+        "command-store",
+        help="confirmation gate under heavy duplication, reordering and session churn",
+    )
+    command_store.add_argument("--commands", type=int, default=50000)
+    command_store.add_argument("--repeat-total", type=int, default=5)
+    command_store.add_argument("--in-flight", type=int, default=512)
+    command_store.add_argument("--jitter", type=float, default=16.0)
+    command_store.add_argument("--duplicate", type=float, default=0.5)
+    command_store.add_argument("--session-every", type=int, default=512)
+    command_store.add_argument("--diagnostic-every", type=int, default=100)
+    command_store.add_argument("--seed", type=int, default=1)
+    command_store.set_defaults(handler=bench_command_store)
+
+    telemetry_latency = subparsers.add_parser(
+        "telemetry-latency",
+        help="PX4 sample to telemetry send latency, fixed timer vs TelemetryScheduler",
+    )
+    telemetry_latency.add_argument("--seconds", type=float, default=60.0)
+    telemetry_latency.add_argument("--sample-hz", type=float, default=50.0)
+    telemetry_latency.add_argument("--jitter-ms", type=float, default=2.0)
+    telemetry_latency.add_argument("--max-hz", type=float, default=jetson_bridge.TELEMETRY_HZ)
+    telemetry_latency.add_argument("--min-hz", type=float, default=jetson_bridge.TELEMETRY_MIN_HZ)
+    telemetry_latency.add_argument(
+        "--coalesce-ms", type=float, default=jetson_bridge.TELEMETRY_COALESCE_SEC * 1e3
+    )
+    telemetry_latency.add_argument("--seed", type=int, default=1)
+    telemetry_latency.set_defaults(handler=bench_telemetry_latency)
+
+    telemetry_delta = subparsers.add_parser(
+        "telemetry-delta",
+        help="bytes on the link, full vs delta telemetry over a recorded or synthetic flight",
+    )
+    telemetry_delta.add_argument(
+        "--recording", help="JSON Lines file, one _send_telemetry field dict per line"
+    )
+    telemetry_delta.add_argument("--seconds", type=float, default=300.0)
+    telemetry_delta.add_argument("--rate-hz", type=float, default=jetson_bridge.TELEMETRY_HZ)
+    telemetry_delta.add_argument("--drones", type=int, default=6)
+    telemetry_delta.add_argument(
+        "--keyframe-sec", type=float, default=jetson_bridge.TELEMETRY_KEYFRAME_SEC
+    )
+    telemetry_delta.add_argument("--repeat", type=int, default=jetson_bridge.TELEMETRY_DELTA_REPEAT)
+    telemetry_delta.add_argument("--loss", type=float, default=0.05)
+    telemetry_delta.add_argument("--seed", type=int, default=1)
+    telemetry_delta.set_defaults(handler=bench_telemetry_delta)
+
+    pose_channel = subparsers.add_parser(
+        "pose-channel", help="link cost of full-rate pose, YAML per sample vs binary batches"
+    )
+    pose_channel.add_argument("--sample-hz", type=float, default=100.0)
+    pose_channel.add_argument(
+        "--batch-ms", type=float, default=jetson_bridge.POSE_BATCH_INTERVAL_SEC * 1e3
+    )
+    pose_channel.add_argument("--iterations", type=int, default=50000)
+    pose_channel.add_argument("--rounds", type=int, default=5)
+    pose_channel.set_defaults(handler=bench_pose_channel)
+
+    metrics_scrape = subparsers.add_parser(
+        "metrics-scrape",
+        help="metrics render cost and 50Hz heartbeat jitter while the endpoint is scraped",
+    )
+    metrics_scrape.add_argument("--slots", type=int, default=6)
+    metrics_scrape.add_argument("--scrape-hz", type=float, default=20.0)
+    metrics_scrape.add_argument("--seconds", type=float, default=5.0)
+    metrics_scrape.add_argument("--iterations", type=int, default=200)
+    metrics_scrape.add_argument("--rounds", type=int, default=5)
+    metrics_scrape.add_argument("--seed", type=int, default=1)
+    metrics_scrape.set_defaults(handler=bench_metrics_scrape)
+
+    flight_recorder = subparsers.add_parser(
+        "flight-recorder", help="per-record cost of the mmap flight recorder ring"
+    )
+    flight_recorder.add_argument("--path", default="/tmp/jetson_bridge_bench.ring")
+    flight_recorder.add_argument("--size-mb", type=float, default=32.0)
+    flight_recorder.add_argument("--keep", action="store_true")
+    flight_recorder.add_argument("--iterations", type=int, default=100000)
+    flight_recorder.add_argument("--rounds", type=int, default=5)
+    flight_recorder.set_defaults(handler=bench_flight_recorder)
+
+    log_flood = subparsers.add_parser(
+        "log-flood", help="control receive cost with synchronous vs queued, rate-limited logs"
+    )
+    log_flood.add_argument("--datagrams", type=int, default=20000)
+    log_flood.add_argument("--invalid-ratio", type=float, default=0.2)
+    log_flood.add_argument(
+        "--io-delay-ms", type=float, default=0.05, help="simulated blocking time per log line"
+    )
+    log_flood.add_argument("--seed", type=int, default=1)
+    log_flood.set_defaults(handler=bench_log_flood)
+
+    telemetry_fanout = subparsers.add_parser(
+        "telemetry-fanout", help="per-tick telemetry cost with several consumers"
+    )
+    telemetry_fanout.add_argument("--subscribers", type=int, default=3)
+    telemetry_fanout.add_argument("--iterations", type=int, default=2000)
+    telemetry_fanout.add_argument("--rounds", type=int, default=5)
+    telemetry_fanout.set_defaults(handler=bench_telemetry_fanout)
+
+    heartbeat_load = subparsers.add_parser(
+        "heartbeat-load", help="dedicated heartbeat thread interval under Python load"
+    )
+    heartbeat_load.add_argument("--seconds", type=float, default=5.0)
+    heartbeat_load.add_argument("--load-threads", type=int, default=2)
+    heartbeat_load.add_argument(
+        "--sched", choices=("fifo", "rr", "nice", "other"), default="other"
+    )
+    heartbeat_load.add_argument("--priority", type=int, default=jetson_bridge.OFFBOARD_PRIORITY)
+    heartbeat_load.add_argument("--cpus", default="")
+    heartbeat_load.set_defaults(handler=bench_heartbeat_load)
+
+    trajectory_follow = subparsers.add_parser(
+        "trajectory-follow", help="path time: confirmed move per waypoint vs trajectory upload"
+    )
+    trajectory_follow.add_argument("--waypoints", type=int, default=20)
+    trajectory_follow.add_argument("--spacing", type=float, default=5.0)
+    trajectory_follow.add_argument("--speed", type=float, default=5.0)
+    trajectory_follow.add_argument("--heartbeat-hz", type=float, default=5.0)
+    trajectory_follow.add_argument("--repeat-total", type=int, default=5)
+    trajectory_follow.add_argument("--loss", type=float, default=0.1)
+    trajectory_follow.add_argument("--seed", type=int, default=1)
+    trajectory_follow.set_defaults(handler=bench_trajectory_follow)
+
+    repeat_cache = subparsers.add_parser(
+        "repeat-cache", help="handle_datagram cost on repeat-heavy traffic, with/without cache"
+    )
+    repeat_cache.add_argument("--moves", type=int, default=200)
+    repeat_cache.add_argument("--repeat-total", type=int, default=5)
+    repeat_cache.add_argument("--hold-repeats", type=int, default=20)
+    repeat_cache.add_argument("--rounds", type=int, default=5)
+    repeat_cache.set_defaults(handler=bench_repeat_cache)
+
+    ingress_flood = subparsers.add_parser(
+        "ingress-flood", help="heartbeat and confirm latency under a hold datagram flood"
+    )
+    ingress_flood.add_argument("--flood-pps", type=float, default=20000.0)
+    ingress_flood.add_argument("--seconds", type=float, default=5.0)
+    ingress_flood.add_argument("--heartbeat-hz", type=float, default=20.0)
+    ingress_flood.add_argument("--repeat-total", type=int, default=5)
+    ingress_flood.set_defaults(handler=bench_ingress_flood)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_argument_parser().parse_args(argv)
+    args.handler(args)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
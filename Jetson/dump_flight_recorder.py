@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+dump_flight_recorder.py — 导出 jetson_bridge 飞行记录器环形文件
+
+每条记录输出一行 JSON（JSON Lines），按写入顺序；开发机无需 ROS2：
+  python3 dump_flight_recorder.py /var/log/ue5drone/slot1.ring
+  python3 dump_flight_recorder.py slot1.ring --last-minutes 5
+  python3 dump_flight_recorder.py slot1.ring --kind control_datagram --kind command_applied
+"""
+
+import argparse
+import json
+import sys
+
+import jetson_bridge
+
+
+def _json_fields(fields: dict) -> dict:
+    converted = {}
+    for name, value in fields.items():
+        if isinstance(value, bytes):
+            # 控制数据报可能是 JSON 文本，也可能是定长二进制
+            try:
+                converted[name] = value.decode("utf-8")
+            except UnicodeDecodeError:
+                converted[f"{name}_hex"] = value.hex()
+        else:
+            converted[name] = value
+    return converted
+
+
+def dump(path: str, last_minutes: float | None, kinds, output) -> int:
+    timed = jetson_bridge.flight_record_unix_times(jetson_bridge.read_flight_records(path))
+    if last_minutes is not None and timed:
+        cutoff = timed[-1][0] - last_minutes * 60.0
+        timed = [(unix_time, record) for unix_time, record in timed if unix_time >= cutoff]
+    written = 0
+    for unix_time, record in timed:
+        if kinds and record.kind not in kinds:
+            continue
+        output.write(json.dumps({
+            "unix_time": round(unix_time, 6),
+            "monotonic_s": record.monotonic_ns / 1e9,
+            "kind": record.kind,
+            "record_seq": record.record_seq,
+            "stamp_us": record.stamp_us,
+            **_json_fields(record.fields),
+        }, ensure_ascii=False))
+        output.write("\n")
+        written += 1
+    return written
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="FLIGHT_RECORDER_PATH of the slot")
+    parser.add_argument(
+        "--last-minutes", type=float,
+        help="only records within this many minutes of the newest record",
+    )
+    parser.add_argument(
+        "--kind", action="append", default=[],
+        choices=[name for name, _, _, _ in jetson_bridge.FLIGHT_RECORD_LAYOUTS.values()],
+        help="record kinds to keep (repeatable); default all",
+    )
+    args = parser.parse_args(argv)
+    try:
+        written = dump(args.path, args.last_minutes, set(args.kind), sys.stdout)
+    except (OSError, ValueError) as exc:
+        print(f"dump_flight_recorder: {exc}", file=sys.stderr)
+        return 1
+    print(f"dump_flight_recorder: {written} records", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
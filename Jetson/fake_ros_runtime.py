@@ -0,0 +1,793 @@
+#!/usr/bin/env python3
+"""
+fake_ros_runtime.py — 进程内的 rclpy / px4_msgs / sensor_msgs 替身
+
+在没有 ROS2 的开发机上原样运行 JetsonBridge 与 JetsonVideoStreamNode：
+  import fake_ros_runtime
+  runtime = fake_ros_runtime.install(virtual_clock=True)
+  import jetson_bridge                 # 此后 import 到的是替身模块
+  bridge = jetson_bridge.JetsonBridge(1, config)
+  runtime.run_for(3600.0)              # 虚拟时钟：到期定时器背靠背连续触发
+
+只模拟节点内可见的行为：publish 时复制消息（等同于序列化），按订阅顺序排队，
+由 spin_once / run_for 在调用线程中投递；定时器按周期触发并记录触发延迟与回调
+耗时。真实时钟下 MultiThreadedExecutor 用多个线程执行，并遵守回调组：互斥组内
+同一时刻只执行一个回调。不模拟 QoS、发现与跨进程传输。
+
+虚拟时钟替换 ROS 时钟（get_clock().now()）与定时器；节点内部的单调时钟与墙钟
+需由调用方把 runtime.monotonic / runtime.unix 注入节点（JetsonBridge 的 clock /
+wall_clock 参数），否则仍按真实时间运行。
+"""
+
+import enum
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+import types
+from collections import deque
+
+
+_RUNTIME = None
+
+MODULE_NAMES = (
+    "rclpy", "rclpy.node", "rclpy.qos", "rclpy.executors", "rclpy.parameter",
+    "rclpy.callback_groups",
+    "builtin_interfaces", "builtin_interfaces.msg", "std_msgs", "std_msgs.msg",
+    "px4_msgs", "px4_msgs.msg", "sensor_msgs", "sensor_msgs.msg",
+)
+
+
+# ============================================================
+# 消息类型
+# ============================================================
+class FakeMessage:
+    """rosidl 消息的最小替身：字段即 __slots__，定长数组用 list。"""
+
+    __slots__ = ()
+    _defaults = ()
+
+    def __init__(self, **fields):
+        for name, default in self._defaults:
+            setattr(self, name, fields.pop(name) if name in fields else _fresh(default))
+        if fields:
+            raise TypeError(f"{type(self).__name__} has no fields {sorted(fields)}")
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+def _fresh(value):
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, type) and issubclass(value, FakeMessage):
+        return value()
+    return value
+
+
+def copy_message(msg):
+    """publish 时的快照：列表与嵌套消息逐层复制，发布方随后可原地改写原对象。"""
+    if not isinstance(msg, FakeMessage):
+        return msg
+    clone = object.__new__(type(msg))
+    for name in msg.__slots__:
+        value = getattr(msg, name)
+        if isinstance(value, list):
+            value = list(value)
+        elif isinstance(value, FakeMessage):
+            value = copy_message(value)
+        setattr(clone, name, value)
+    return clone
+
+
+def message_type(name: str, fields, **constants):
+    """按 (字段, 默认值) 列表生成消息类；默认值为消息类时每个实例各建一份。"""
+    namespace = {"__slots__": tuple(field for field, _ in fields), "_defaults": tuple(fields)}
+    namespace.update(constants)
+    return type(name, (FakeMessage,), namespace)
+
+
+_NAN = float("nan")
+
+Time = message_type("Time", [("sec", 0), ("nanosec", 0)])
+Header = message_type("Header", [("stamp", Time), ("frame_id", "")])
+
+OffboardControlMode = message_type("OffboardControlMode", [
+    ("timestamp", 0), ("position", False), ("velocity", False), ("acceleration", False),
+    ("attitude", False), ("body_rate", False), ("thrust_and_torque", False),
+    ("direct_actuator", False),
+])
+TrajectorySetpoint = message_type("TrajectorySetpoint", [
+    ("timestamp", 0), ("position", [_NAN] * 3), ("velocity", [_NAN] * 3),
+    ("acceleration", [_NAN] * 3), ("jerk", [_NAN] * 3), ("yaw", _NAN), ("yawspeed", _NAN),
+])
+VehicleCommand = message_type(
+    "VehicleCommand",
+    [
+        ("timestamp", 0), ("param1", 0.0), ("param2", 0.0), ("param3", 0.0),
+        ("param4", 0.0), ("param5", 0.0), ("param6", 0.0), ("param7", 0.0),
+        ("command", 0), ("target_system", 0), ("target_component", 0),
+        ("source_system", 0), ("source_component", 0), ("confirmation", 0),
+        ("from_external", False),
+    ],
+    VEHICLE_CMD_DO_SET_MODE=176,
+    VEHICLE_CMD_COMPONENT_ARM_DISARM=400,
+)
+VehicleCommandAck = message_type(
+    "VehicleCommandAck",
+    [
+        ("timestamp", 0), ("command", 0), ("result", 0), ("result_param1", 0),
+        ("result_param2", 0), ("target_system", 0), ("target_component", 0),
+        ("from_external", False),
+    ],
+    VEHICLE_CMD_RESULT_ACCEPTED=0,
+    VEHICLE_CMD_RESULT_TEMPORARILY_REJECTED=1,
+    VEHICLE_CMD_RESULT_DENIED=2,
+    VEHICLE_CMD_RESULT_UNSUPPORTED=3,
+    VEHICLE_CMD_RESULT_FAILED=4,
+    VEHICLE_CMD_RESULT_IN_PROGRESS=5,
+)
+VehicleOdometry = message_type(
+    "VehicleOdometry",
+    [
+        ("timestamp", 0), ("timestamp_sample", 0), ("pose_frame", 1),
+        ("position", [_NAN] * 3), ("q", [_NAN] * 4), ("velocity_frame", 1),
+        ("velocity", [_NAN] * 3), ("angular_velocity", [_NAN] * 3),
+        ("position_variance", [_NAN] * 3), ("orientation_variance", [_NAN] * 3),
+        ("velocity_variance", [_NAN] * 3), ("reset_counter", 0), ("quality", 0),
+    ],
+    POSE_FRAME_NED=1,
+    VELOCITY_FRAME_NED=1,
+)
+VehicleStatus = message_type(
+    "VehicleStatus",
+    [("timestamp", 0), ("arming_state", 1), ("nav_state", 0)],
+    ARMING_STATE_DISARMED=1,
+    ARMING_STATE_ARMED=2,
+    NAVIGATION_STATE_MANUAL=0,
+    NAVIGATION_STATE_AUTO_LOITER=4,
+    NAVIGATION_STATE_OFFBOARD=14,
+)
+VehicleLocalPosition = message_type("VehicleLocalPosition", [
+    ("timestamp", 0), ("timestamp_sample", 0), ("xy_valid", False), ("z_valid", False),
+    ("v_xy_valid", False), ("v_z_valid", False), ("x", 0.0), ("y", 0.0), ("z", 0.0),
+    ("vx", 0.0), ("vy", 0.0), ("vz", 0.0), ("heading", 0.0),
+])
+VehicleGlobalPosition = message_type("VehicleGlobalPosition", [
+    ("timestamp", 0), ("timestamp_sample", 0), ("lat", 0.0), ("lon", 0.0), ("alt", 0.0),
+    ("alt_ellipsoid", 0.0), ("eph", 0.0), ("epv", 0.0), ("terrain_alt", _NAN),
+    ("lat_lon_valid", False), ("alt_valid", False), ("terrain_alt_valid", False),
+    ("dead_reckoning", False),
+])
+BatteryStatus = message_type("BatteryStatus", [
+    ("timestamp", 0), ("connected", False), ("voltage_v", 0.0), ("current_a", -1.0),
+    ("remaining", -1.0),
+])
+Image = message_type("Image", [
+    ("header", Header), ("height", 0), ("width", 0), ("encoding", ""),
+    ("is_bigendian", 0), ("step", 0), ("data", b""),
+])
+CameraInfo = message_type("CameraInfo", [
+    ("header", Header), ("height", 0), ("width", 0), ("distortion_model", ""),
+    ("d", []), ("k", [0.0] * 9), ("r", [0.0] * 9), ("p", [0.0] * 12),
+    ("binning_x", 0), ("binning_y", 0),
+])
+
+
+# ============================================================
+# QoS / 参数
+# ============================================================
+class ReliabilityPolicy(enum.Enum):
+    SYSTEM_DEFAULT = 0
+    RELIABLE = 1
+    BEST_EFFORT = 2
+
+
+class DurabilityPolicy(enum.Enum):
+    SYSTEM_DEFAULT = 0
+    TRANSIENT_LOCAL = 1
+    VOLATILE = 2
+
+
+class HistoryPolicy(enum.Enum):
+    SYSTEM_DEFAULT = 0
+    KEEP_LAST = 1
+    KEEP_ALL = 2
+
+
+class QoSProfile:
+    def __init__(self, **settings):
+        self.depth = settings.pop("depth", 10)
+        self.reliability = settings.pop("reliability", ReliabilityPolicy.SYSTEM_DEFAULT)
+        self.durability = settings.pop("durability", DurabilityPolicy.SYSTEM_DEFAULT)
+        self.history = settings.pop("history", HistoryPolicy.SYSTEM_DEFAULT)
+        if settings:
+            raise TypeError(f"unsupported QoS settings: {sorted(settings)}")
+
+
+class Parameter:
+    def __init__(self, name, value=None):
+        self.name = name
+        self.value = value
+
+    def get_parameter_value(self):
+        value = self.value
+        return types.SimpleNamespace(
+            bool_value=bool(value) if isinstance(value, bool) else False,
+            integer_value=value if isinstance(value, int) and not isinstance(value, bool) else 0,
+            double_value=float(value) if isinstance(value, float) else 0.0,
+            string_value=value if isinstance(value, str) else "",
+        )
+
+
+# ============================================================
+# 节点、发布/订阅与定时器
+# ============================================================
+class FakeLogger:
+    """rclpy RcutilsLogger 的替身，转发到标准 logging。"""
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(name)
+
+    def debug(self, message):
+        self._logger.debug(message)
+
+    def info(self, message):
+        self._logger.info(message)
+
+    def warning(self, message):
+        self._logger.warning(message)
+
+    warn = warning
+
+    def error(self, message):
+        self._logger.error(message)
+
+    def fatal(self, message):
+        self._logger.critical(message)
+
+
+class FakeTime:
+    __slots__ = ("nanoseconds",)
+
+    def __init__(self, nanoseconds: int):
+        self.nanoseconds = nanoseconds
+
+    def to_msg(self):
+        return Time(sec=self.nanoseconds // 1_000_000_000, nanosec=self.nanoseconds % 1_000_000_000)
+
+
+class FakeClock:
+    def __init__(self, runtime):
+        self._runtime = runtime
+
+    def now(self):
+        return FakeTime(self._runtime.ros_time_ns())
+
+
+class Publisher:
+    def __init__(self, runtime, msg_type, topic: str):
+        self._runtime = runtime
+        self.msg_type = msg_type
+        self.topic_name = topic
+        self.published = 0
+
+    def publish(self, msg):
+        self.published += 1
+        self._runtime.publish(self.topic_name, msg)
+
+    def get_subscription_count(self) -> int:
+        return len(self._runtime.subscriptions.get(self.topic_name, ()))
+
+
+class CallbackGroup:
+    """回调组：执行器在 beginning/ending_execution 之间视该回调为执行中。"""
+
+    def __init__(self):
+        self.running = 0
+
+    def can_execute(self) -> bool:
+        return True
+
+    def beginning_execution(self):
+        self.running += 1
+
+    def ending_execution(self):
+        self.running -= 1
+
+
+class MutuallyExclusiveCallbackGroup(CallbackGroup):
+    def can_execute(self) -> bool:
+        return self.running == 0
+
+
+class ReentrantCallbackGroup(CallbackGroup):
+    pass
+
+
+class Subscription:
+    def __init__(self, node, msg_type, topic: str, callback, callback_group=None):
+        self.node = node
+        self.msg_type = msg_type
+        self.topic_name = topic
+        self.callback = callback
+        self.callback_group = callback_group or node.default_callback_group
+        self.received = 0
+
+
+class Timer:
+    """周期定时器；due_ns 为下一次应触发的时刻（运行时时基）。"""
+
+    def __init__(self, node, period_sec: float, callback, due_ns: int, callback_group=None):
+        self.node = node
+        self.timer_period_ns = max(1, int(round(period_sec * 1e9)))
+        self.callback = callback
+        self.callback_group = callback_group or node.default_callback_group
+        self.due_ns = due_ns
+        self.calls = 0
+        self._canceled = False
+
+    @property
+    def name(self) -> str:
+        return getattr(self.callback, "__qualname__", repr(self.callback))
+
+    def cancel(self):
+        self._canceled = True
+
+    def reset(self):
+        self._canceled = False
+
+    def is_canceled(self) -> bool:
+        return self._canceled
+
+
+class Node:
+    def __init__(self, node_name: str, **_kwargs):
+        runtime = _require_runtime()
+        self._runtime = runtime
+        self._node_name = node_name
+        self._logger = FakeLogger(node_name)
+        self._clock = FakeClock(runtime)
+        self._parameters = {}
+        self._timers = []
+        self._subscriptions = []
+        # 与 rclpy 一致：未指定回调组的实体共用节点的默认互斥组
+        self.default_callback_group = MutuallyExclusiveCallbackGroup()
+        runtime.nodes.append(self)
+
+    def get_name(self) -> str:
+        return self._node_name
+
+    def get_logger(self):
+        return self._logger
+
+    def get_clock(self):
+        return self._clock
+
+    def create_publisher(self, msg_type, topic: str, qos_profile=None, **_kwargs):
+        return Publisher(self._runtime, msg_type, topic)
+
+    def create_subscription(self, msg_type, topic: str, callback, qos_profile=None,
+                            callback_group=None, **_kwargs):
+        subscription = Subscription(self, msg_type, topic, callback, callback_group)
+        self._subscriptions.append(subscription)
+        self._runtime.add_subscription(subscription)
+        return subscription
+
+    def create_timer(self, timer_period_sec: float, callback, callback_group=None, **_kwargs):
+        timer = self._runtime.add_timer(self, timer_period_sec, callback, callback_group)
+        self._timers.append(timer)
+        return timer
+
+    def destroy_timer(self, timer):
+        timer.cancel()
+
+    def declare_parameter(self, name: str, value=None, *_args, **_kwargs):
+        parameter = Parameter(name, self._parameters.get(name, value))
+        self._parameters[name] = parameter.value
+        return parameter
+
+    def get_parameter(self, name: str):
+        return Parameter(name, self._parameters.get(name))
+
+    def destroy_node(self):
+        for timer in self._timers:
+            timer.cancel()
+        for subscription in self._subscriptions:
+            self._runtime.remove_subscription(subscription)
+        self._subscriptions.clear()
+        if self in self._runtime.nodes:
+            self._runtime.nodes.remove(self)
+
+
+# ============================================================
+# 运行时
+# ============================================================
+class FakeRuntime:
+    """单进程的消息总线 + 定时器调度。
+
+    virtual_clock=True 时时间只由 run_for / run_until 推进，到期定时器按到期
+    先后背靠背触发，回调内看到的 ROS 时间就是该定时器的到期时刻；
+    False 时使用真实时钟，spin_once 最多休眠到下一个定时器到期。
+    timer_observer(timer, lateness_sec, duration_sec) 在每次定时器回调后调用。
+    """
+
+    def __init__(self, virtual_clock: bool = True, start_unix_ns: int | None = None):
+        self.virtual_clock = virtual_clock
+        self._unix_origin_ns = time.time_ns() if start_unix_ns is None else start_unix_ns
+        self._virtual_ns = 0
+        self._monotonic_origin_ns = time.monotonic_ns()
+        self.nodes = []
+        self.subscriptions = {}
+        self.delivered = 0
+        self.timer_observer = None
+        self._pending = deque()
+        self._timers = []
+        self._timer_order = itertools.count()
+        self._lock = threading.Lock()
+        # 多线程执行器在无可执行回调时等待：新消息、新定时器或回调结束时唤醒
+        self._work = threading.Condition(self._lock)
+        self._ok = False
+
+    # -------- 时间 --------
+    def now_ns(self) -> int:
+        """定时器时基：虚拟模式为已推进的虚拟时间，真实模式为单调时钟。"""
+        if self.virtual_clock:
+            return self._virtual_ns
+        return time.monotonic_ns() - self._monotonic_origin_ns
+
+    def ros_time_ns(self) -> int:
+        if self.virtual_clock:
+            return self._unix_origin_ns + self._virtual_ns
+        return time.time_ns()
+
+    def elapsed_sec(self) -> float:
+        return self.now_ns() / 1e9
+
+    def monotonic(self) -> float:
+        """替代 time.monotonic：虚拟模式下随 run_for 推进，真实模式即 time.monotonic()。"""
+        if self.virtual_clock:
+            return (self._monotonic_origin_ns + self._virtual_ns) / 1e9
+        return time.monotonic()
+
+    def unix(self) -> float:
+        """替代 time.time：与 get_clock().now() 一致的墙钟秒数。"""
+        return self.ros_time_ns() / 1e9
+
+    # -------- 生命周期 --------
+    def init(self, args=None, **_kwargs):
+        self._ok = True
+
+    def ok(self) -> bool:
+        return self._ok
+
+    def shutdown(self):
+        self._ok = False
+        with self._work:
+            self._work.notify_all()
+
+    # -------- 话题 --------
+    def add_subscription(self, subscription):
+        with self._lock:
+            self.subscriptions.setdefault(subscription.topic_name, []).append(subscription)
+
+    def remove_subscription(self, subscription):
+        with self._lock:
+            subscribers = self.subscriptions.get(subscription.topic_name, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+
+    def publish(self, topic: str, msg):
+        subscribers = self.subscriptions.get(topic)
+        if not subscribers:
+            return
+        snapshot = copy_message(msg)
+        # 加锁与多线程执行器的按组取消息互斥；主线程（如退出时的 DISARM）也可能发布
+        with self._work:
+            for subscription in subscribers:
+                self._pending.append((subscription, snapshot))
+            self._work.notify()
+
+    def deliver_pending(self) -> int:
+        delivered = 0
+        pending = self._pending
+        while pending:
+            subscription, msg = pending.popleft()
+            subscription.received += 1
+            subscription.callback(msg)
+            delivered += 1
+        self.delivered += delivered
+        return delivered
+
+    # -------- 定时器 --------
+    def add_timer(self, node, period_sec: float, callback, callback_group=None):
+        with self._work:
+            timer = Timer(node, period_sec, callback, 0, callback_group)
+            timer.due_ns = self.now_ns() + timer.timer_period_ns
+            heapq.heappush(self._timers, (timer.due_ns, next(self._timer_order), timer))
+            self._work.notify()
+        return timer
+
+    def next_timer_due_ns(self):
+        with self._lock:
+            while self._timers and self._timers[0][2].is_canceled():
+                heapq.heappop(self._timers)
+            return self._timers[0][0] if self._timers else None
+
+    def _fire_next(self, limit_ns: int) -> bool:
+        """触发一个不晚于 limit_ns 到期的定时器；没有则返回 False。"""
+        with self._lock:
+            while self._timers and self._timers[0][2].is_canceled():
+                heapq.heappop(self._timers)
+            if not self._timers or self._timers[0][0] > limit_ns:
+                return False
+            due_ns, _, timer = heapq.heappop(self._timers)
+        self._run_timer(due_ns, timer)
+        return True
+
+    def _run_timer(self, due_ns: int, timer):
+        if self.virtual_clock:
+            self._virtual_ns = max(self._virtual_ns, due_ns)
+        started = time.perf_counter()
+        lateness = (self.now_ns() - due_ns) / 1e9
+        timer.calls += 1
+        timer.callback()
+        duration = time.perf_counter() - started
+        if not timer.is_canceled():
+            # 与 rcl 一致按周期推进；落后多个周期时跳过错过的触发点
+            next_due = due_ns + timer.timer_period_ns
+            now_ns = self.now_ns()
+            if next_due <= now_ns and not self.virtual_clock:
+                missed = (now_ns - next_due) // timer.timer_period_ns + 1
+                next_due += missed * timer.timer_period_ns
+            timer.due_ns = next_due
+            with self._lock:
+                heapq.heappush(self._timers, (next_due, next(self._timer_order), timer))
+        observer = self.timer_observer
+        if observer is not None:
+            observer(timer, lateness, duration)
+
+    # -------- 多线程执行 --------
+    def _take_ready_locked(self):
+        """取一个所属回调组当前可执行的到期定时器或消息；调用方持有 _lock。"""
+        now_ns = self.now_ns()
+        blocked = []
+        ready = None
+        while self._timers and self._timers[0][0] <= now_ns:
+            entry = heapq.heappop(self._timers)
+            timer = entry[2]
+            if timer.is_canceled():
+                continue
+            if timer.callback_group.can_execute():
+                ready = ("timer", timer, entry[0])
+                break
+            blocked.append(entry)
+        for entry in blocked:
+            heapq.heappush(self._timers, entry)
+        if ready is not None:
+            return ready
+        # 同一订阅的消息属于同一组：组忙时其后续消息一并跳过，组内顺序不变
+        for index, (subscription, msg) in enumerate(self._pending):
+            if subscription.callback_group.can_execute():
+                del self._pending[index]
+                return ("message", subscription, msg)
+        return None
+
+    def execute_ready(self, timeout_sec: float) -> bool:
+        """多线程执行器的单步：执行一个就绪回调；没有则最多等待 timeout_sec。"""
+        with self._work:
+            ready = self._take_ready_locked()
+            if ready is None:
+                # 已到期但组忙的定时器由回调结束时的 notify 唤醒，只按未到期的定时器计时
+                now_ns = self.now_ns()
+                next_due = min((due for due, _, _ in self._timers if due > now_ns), default=None)
+                wait = timeout_sec
+                if next_due is not None:
+                    wait = min(wait, (next_due - now_ns) / 1e9)
+                self._work.wait(wait)
+                return False
+            kind, entity, payload = ready
+            group = entity.callback_group
+            group.beginning_execution()
+        try:
+            if kind == "timer":
+                self._run_timer(payload, entity)
+            else:
+                entity.received += 1
+                entity.callback(payload)
+        finally:
+            with self._work:
+                group.ending_execution()
+                if kind == "message":
+                    self.delivered += 1
+                self._work.notify_all()
+        return True
+
+    # -------- 执行 --------
+    def spin_once(self, timeout_sec: float | None = None):
+        """投递已排队消息并触发全部到期定时器；无事可做时按真实时间等待。"""
+        if self.deliver_pending():
+            return
+        if self._fire_next(self.now_ns()):
+            self.deliver_pending()
+            return
+        if self.virtual_clock:
+            return
+        due_ns = self.next_timer_due_ns()
+        wait = 0.01 if timeout_sec is None else max(0.0, timeout_sec)
+        if due_ns is not None:
+            wait = min(wait, max(0.0, (due_ns - self.now_ns()) / 1e9))
+        time.sleep(min(wait, 0.01))
+
+    def run_until(self, end_ns: int):
+        """虚拟时钟推进到 end_ns：先投递消息，再按到期顺序逐个触发定时器。"""
+        if not self.virtual_clock:
+            raise RuntimeError("run_until requires virtual_clock=True")
+        self.deliver_pending()
+        while self._fire_next(end_ns):
+            self.deliver_pending()
+        self._virtual_ns = max(self._virtual_ns, end_ns)
+        self.deliver_pending()
+
+    def run_for(self, seconds: float):
+        self.run_until(self._virtual_ns + int(round(seconds * 1e9)))
+
+
+class SingleThreadedExecutor:
+    def __init__(self, context=None):
+        self._runtime = _require_runtime()
+        self._nodes = []
+        self._stopped = False
+
+    def add_node(self, node) -> bool:
+        if node not in self._nodes:
+            self._nodes.append(node)
+        return True
+
+    def remove_node(self, node):
+        if node in self._nodes:
+            self._nodes.remove(node)
+
+    def get_nodes(self):
+        return list(self._nodes)
+
+    def spin_once(self, timeout_sec: float | None = None):
+        self._runtime.spin_once(timeout_sec)
+
+    def spin(self):
+        if self._runtime.virtual_clock:
+            # 虚拟时间只能由驱动方显式推进，后台线程 spin 会与之争抢
+            raise RuntimeError("virtual clock is driven by FakeRuntime.run_for/run_until")
+        while self._runtime.ok() and not self._stopped:
+            self._runtime.spin_once(0.1)
+
+    def shutdown(self, timeout_sec: float | None = None) -> bool:
+        self._stopped = True
+        return True
+
+
+class MultiThreadedExecutor(SingleThreadedExecutor):
+    """真实时钟下用 num_threads 个线程执行回调，互斥回调组内串行、组间并行。
+
+    虚拟时钟仍由 run_for / run_until 在调用线程中串行推进，不经过本执行器。
+    """
+
+    def __init__(self, num_threads: int | None = None, context=None):
+        super().__init__(context)
+        self.num_threads = num_threads or 2
+
+    def spin(self):
+        if self._runtime.virtual_clock:
+            raise RuntimeError("virtual clock is driven by FakeRuntime.run_for/run_until")
+        workers = [
+            threading.Thread(target=self._worker, name=f"fake-executor-{index}", daemon=True)
+            for index in range(1, self.num_threads)
+        ]
+        for worker in workers:
+            worker.start()
+        self._worker()
+        for worker in workers:
+            worker.join()
+
+    def _worker(self):
+        runtime = self._runtime
+        while runtime.ok() and not self._stopped:
+            runtime.execute_ready(0.1)
+
+    def shutdown(self, timeout_sec: float | None = None) -> bool:
+        self._stopped = True
+        with self._runtime._work:
+            self._runtime._work.notify_all()
+        return True
+
+
+# ============================================================
+# 安装为 sys.modules 中的替身
+# ============================================================
+def _require_runtime():
+    if _RUNTIME is None:
+        raise RuntimeError("fake_ros_runtime.install() must be called first")
+    return _RUNTIME
+
+
+def build_modules(runtime) -> dict:
+    """返回 {模块名: 模块对象}；调用方可自行放入 sys.modules 或 mock.patch.dict。"""
+    def _module(name, **attrs):
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        return module
+
+    def _create_node(node_name, **kwargs):
+        return Node(node_name, **kwargs)
+
+    def _spin(node, executor=None):
+        executor = executor or SingleThreadedExecutor()
+        executor.add_node(node)
+        executor.spin()
+
+    def _spin_once(node, executor=None, timeout_sec=None):
+        runtime.spin_once(timeout_sec)
+
+    modules = {
+        "rclpy.node": _module("rclpy.node", Node=Node),
+        "rclpy.qos": _module(
+            "rclpy.qos", QoSProfile=QoSProfile, ReliabilityPolicy=ReliabilityPolicy,
+            DurabilityPolicy=DurabilityPolicy, HistoryPolicy=HistoryPolicy,
+        ),
+        "rclpy.executors": _module(
+            "rclpy.executors", SingleThreadedExecutor=SingleThreadedExecutor,
+            MultiThreadedExecutor=MultiThreadedExecutor,
+        ),
+        "rclpy.parameter": _module("rclpy.parameter", Parameter=Parameter),
+        "rclpy.callback_groups": _module(
+            "rclpy.callback_groups", CallbackGroup=CallbackGroup,
+            MutuallyExclusiveCallbackGroup=MutuallyExclusiveCallbackGroup,
+            ReentrantCallbackGroup=ReentrantCallbackGroup,
+        ),
+        "builtin_interfaces.msg": _module("builtin_interfaces.msg", Time=Time),
+        "std_msgs.msg": _module("std_msgs.msg", Header=Header),
+        "px4_msgs.msg": _module(
+            "px4_msgs.msg", OffboardControlMode=OffboardControlMode,
+            TrajectorySetpoint=TrajectorySetpoint, VehicleCommand=VehicleCommand,
+            VehicleCommandAck=VehicleCommandAck, VehicleOdometry=VehicleOdometry,
+            VehicleStatus=VehicleStatus, VehicleLocalPosition=VehicleLocalPosition,
+            VehicleGlobalPosition=VehicleGlobalPosition, BatteryStatus=BatteryStatus,
+        ),
+        "sensor_msgs.msg": _module("sensor_msgs.msg", Image=Image, CameraInfo=CameraInfo),
+    }
+    modules["rclpy"] = _module(
+        "rclpy", init=runtime.init, ok=runtime.ok, shutdown=runtime.shutdown,
+        try_shutdown=runtime.shutdown, create_node=_create_node, spin=_spin,
+        spin_once=_spin_once, node=modules["rclpy.node"], qos=modules["rclpy.qos"],
+        executors=modules["rclpy.executors"], parameter=modules["rclpy.parameter"],
+        callback_groups=modules["rclpy.callback_groups"],
+    )
+    for package in ("builtin_interfaces", "std_msgs", "px4_msgs", "sensor_msgs"):
+        modules[package] = _module(package, msg=modules[f"{package}.msg"])
+    for name, module in modules.items():
+        if "." not in name:
+            module.__path__ = []  # 标记为包，子模块才能 import
+    return modules
+
+
+def install(virtual_clock: bool = True, start_unix_ns: int | None = None,
+            modules=None) -> FakeRuntime:
+    """创建运行时并注册替身模块（默认写入 sys.modules），须在 import 节点模块之前调用。
+
+    传入 dict 作为 modules 时只写入该 dict，便于测试在结束后整体撤销。
+    """
+    global _RUNTIME
+    runtime = FakeRuntime(virtual_clock=virtual_clock, start_unix_ns=start_unix_ns)
+    _RUNTIME = runtime
+    target = sys.modules if modules is None else modules
+    target.update(build_modules(runtime))
+    runtime.modules = {name: target[name] for name in MODULE_NAMES}
+    return runtime
@@ -3,13 +3,14 @@
 jetson_bridge.py — Jetson 端轻量 UDP↔ROS2 透明桥 (PX4 v1.17)
 
 职责：
-  1. UDP 接收 ← 后端 C++ 发来的 JSON 控制数据报
+  1. UDP 接收 ← 后端 C++ 发来的控制数据报（JSON 或定长二进制）
      → 同一 command_id 在时间窗内达到确认阈值后才更新 setpoint
      → 缓存最新 setpoint，由独立 50Hz 定时器持续发布
        ROS2 OffboardControlMode + TrajectorySetpoint
      → 切 Offboard 模式 / 解锁（仅在需要时发一次 VehicleCommand）
   2. ROS2 订阅 odometry/status/battery/GPS 话题
-     → 组合 YAML → UDP 发送 → 后端 C++（10Hz）
+     → 组合 YAML（encode_telemetry_yaml）→ UDP 发送 → 后端 C++
+       （新样本驱动，最高 TELEMETRY_HZ，默认 10Hz；无样本时按 TELEMETRY_MIN_HZ）
 
 PX4 v1.17 话题变更：
   - vehicle_status        → vehicle_status_v1   (VehicleStatusV1)
@@ -17,9 +18,18 @@ PX4 v1.17 话题变更：
                                → lat/lon/alt，valid → lat_lon_valid
 """
 
+import bisect
+import hashlib
+import heapq
+import hmac
+import ipaddress
 import json
-import yaml
+import mmap
+import re
+from collections import OrderedDict, deque, namedtuple
+import selectors
 import socket
+import struct
 import threading
 import time
 import signal
@@ -27,21 +37,43 @@ import sys
 import math
 import os
 
-import rclpy
-import rclpy.parameter
-from rclpy.node import Node
-from rclpy.qos import QoSProfile, ReliabilityPolicy, HistoryPolicy, DurabilityPolicy
-
-from px4_msgs.msg import (
-    OffboardControlMode,
-    TrajectorySetpoint,
-    VehicleCommand,
-    VehicleOdometry,
-    VehicleStatus,
-    VehicleLocalPosition,
-    VehicleGlobalPosition,
-    BatteryStatus,
-)
+# 协议解析等纯函数需要在没有 ROS2 的开发机上也能导入（测试与基准脚本）。
+try:
+    import rclpy
+    import rclpy.parameter
+    from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
+    from rclpy.executors import MultiThreadedExecutor, SingleThreadedExecutor
+    from rclpy.node import Node
+    from rclpy.qos import QoSProfile, ReliabilityPolicy, HistoryPolicy, DurabilityPolicy
+
+    from px4_msgs.msg import (
+        OffboardControlMode,
+        TrajectorySetpoint,
+        VehicleCommand,
+        VehicleOdometry,
+        VehicleStatus,
+        VehicleLocalPosition,
+        VehicleGlobalPosition,
+        BatteryStatus,
+    )
+except ImportError:
+    rclpy = None
+    MutuallyExclusiveCallbackGroup = None
+    MultiThreadedExecutor = None
+    SingleThreadedExecutor = None
+    Node = object
+    QoSProfile = None
+    ReliabilityPolicy = None
+    HistoryPolicy = None
+    DurabilityPolicy = None
+    OffboardControlMode = None
+    TrajectorySetpoint = None
+    VehicleCommand = None
+    VehicleOdometry = None
+    VehicleStatus = None
+    VehicleLocalPosition = None
+    VehicleGlobalPosition = None
+    BatteryStatus = None
 
 # Some deployed PX4/px4_msgs combinations do not provide VehicleCommandAck.
 # It is only used for diagnostics, so it must not prevent the control bridge
@@ -61,7 +93,9 @@ CONTROL_BIND_HOST = os.environ.get("CONTROL_BIND_HOST", "0.0.0.0").strip()
 
 # 默认沿用当前单机实机环境的无前缀 PX4 话题。多机命名空间环境可设置：
 #   ROS_TOPIC_PREFIX=/px4_1
-ROS_TOPIC_PREFIX = os.environ.get("ROS_TOPIC_PREFIX", "").strip().rstrip("/")
+# 单进程多 slot（python3 jetson_bridge.py 1 2 3 或 BRIDGE_SLOTS=1,2,3）时使用
+#   ROS_TOPIC_PREFIX=/px4_{slot}，或逐 slot 设置 ROS_TOPIC_PREFIX_2=... 等；
+# 端口与 MAVLINK_SYSTEM_ID 同样支持 _<slot> 后缀，见 resolve_slot_config。
 
 # 周期诊断日志间隔。外场建议保留默认 5 秒。
 DIAGNOSTIC_INTERVAL_SEC = float(os.environ.get("DIAGNOSTIC_INTERVAL_SEC", "5"))
@@ -72,6 +106,24 @@ COMMAND_CONFIRM_COUNT = int(os.environ.get("COMMAND_CONFIRM_COUNT", "3"))
 COMMAND_CONFIRM_WINDOW_SEC = float(
     os.environ.get("COMMAND_CONFIRM_WINDOW_SEC", "2.5")
 )
+
+# 链路质量：按会话从 repeat_index 缺口估计控制包丢包率，经遥测 link 字段回报，
+# 并附上让 COMMAND_CONFIRM_COUNT 以 COMMAND_CONFIRM_RELIABILITY 概率可达的
+# command_repeat_count 推荐值，供后端调整重发次数。估计覆盖最近约
+# LINK_LOSS_WINDOW_PACKETS 个应到数据报，不足 LINK_LOSS_MIN_SAMPLES 时不给估计。
+# sequence 由后端多机共用一个计数器分配，其缺口只作参考计数，不计入丢包率。
+# COMMAND_CONFIRM_ADAPTIVE=1 时确认门限在 [COMMAND_CONFIRM_MIN, COMMAND_CONFIRM_COUNT]
+# 内随估计调整：丢包率不高于 LINK_LOSS_CLEAN 时取下限（重发几乎必然到齐，多等
+# 只增加延迟）；否则取 repeat_total 次重发内以 COMMAND_CONFIRM_RELIABILITY 概率
+# 可达的最大门限。MAC 有效的命令不受影响（单包即应用）。
+COMMAND_CONFIRM_ADAPTIVE = os.environ.get("COMMAND_CONFIRM_ADAPTIVE", "0") == "1"
+COMMAND_CONFIRM_MIN = int(os.environ.get("COMMAND_CONFIRM_MIN", "2"))
+COMMAND_CONFIRM_RELIABILITY = float(os.environ.get("COMMAND_CONFIRM_RELIABILITY", "0.99"))
+LINK_LOSS_WINDOW_PACKETS = int(os.environ.get("LINK_LOSS_WINDOW_PACKETS", "500"))
+LINK_LOSS_MIN_SAMPLES = int(os.environ.get("LINK_LOSS_MIN_SAMPLES", "50"))
+LINK_LOSS_CLEAN = float(os.environ.get("LINK_LOSS_CLEAN", "0.01"))
+# 后端 config_loader 接受的 command_repeat_count 范围
+_BACKEND_REPEAT_RANGE = (3, 20)
 MAX_CONTROL_PACKET_BYTES = int(os.environ.get("MAX_CONTROL_PACKET_BYTES", "4096"))
 MAX_ABS_TARGET_M = float(os.environ.get("MAX_ABS_TARGET_M", "5000"))
 MAX_TELEMETRY_SAMPLE_AGE_SEC = float(
@@ -83,192 +135,4287 @@ MAX_GEOGRAPHIC_SAMPLE_SKEW_SEC = float(
 CONTROL_PROTOCOL = "ue5_drone_control"
 CONTROL_PROTOCOL_VERSION = 1
 
-# Offboard 心跳频率（Hz）——必须 > 2Hz，50Hz 留足余量
-OFFBOARD_HZ = 50
-OFFBOARD_INTERVAL = 1.0 / OFFBOARD_HZ
+# 同一 ue5_drone_control 消息的定长二进制变体。JSON 数据报总以 '{' 开头，
+# 因此按 4 字节魔数即可区分两种编码，无需额外端口或握手。
+# 布局（小端）：
+#   magic[4]="UE5C" | version u8 | type u8 (1=control)
+#   | mode u8 (0=hold,1=move,2=pause,3=resume)
+#   | flags u8 (保留，须为 0) | sequence u64 | drone_id u32 | slot u32
+#   | issued_at_unix_s f64 | sent_at_unix_s f64 | north/east/down f64 (NED 米，
+#   power_on_origin) | repeat_index u32 | repeat_total u32
+#   | session_id_len u8 | command_id_len u8 | session_id | command_id (UTF-8)
+#   | [auth mac 16B，仅当 flags & CONTROL_BINARY_FLAG_AUTH]
+CONTROL_BINARY_MAGIC = b"UE5C"
+CONTROL_BINARY_VERSION = 1
+CONTROL_BINARY_TYPE_CONTROL = 1
+CONTROL_BINARY_MODES = ("hold", "move", "pause", "resume")
+CONTROL_BINARY_FLAG_AUTH = 0x01
+# repeat_index / repeat_total 的上限与二进制 u32 字段一致；后端 hold 在
+# UINT32_MAX 处回绕，JSON 路径同样拒绝更大的值。
+CONTROL_MAX_REPEAT_INDEX = 0xFFFFFFFF
+_CONTROL_BINARY_HEADER = struct.Struct("<4sBBBBQIIdddddIIBB")
+
+# 可选的控制包完整性校验。配置 CONTROL_AUTH_KEY 后，携带有效 MAC 的命令
+# 在第一个数据报即可应用，其余重发包只用于丢包恢复；未携带 MAC 的包仍走
+# COMMAND_CONFIRM_COUNT 确认门，除非 CONTROL_AUTH_REQUIRED=1。
+# MAC = HMAC-SHA256(session_key, 规范指纹)[:16]，
+# session_key = HMAC-SHA256(CONTROL_AUTH_KEY, "ue5_drone_control/session/" + session_id)。
+# 规范指纹为 _control_fingerprint 的字段加 issued_at，按 _CONTROL_AUTH_FIELDS 小端
+# 打包，后接 UTF-8 的 session_id 与 command_id；不含 repeat_index/sent_at，因此同一
+# 命令的所有重发包共用一个 MAC。
+# MAC 不能阻止重放：Jetson 重启后会话与已应用记录都已清空，旧的签名数据报会被
+# 当作新命令。因此只有 issued_at 与 Jetson 墙钟相差不超过 CONTROL_AUTH_MAX_AGE_SEC
+# 的签名命令才在首包应用，过期的直接丢弃（计入 stale）。这要求两端时钟同步（NTP）；
+# 窗口内的重放仍然可能，0 表示关闭检查。
+CONTROL_AUTH_KEY = os.environ.get("CONTROL_AUTH_KEY", "").encode("utf-8")
+CONTROL_AUTH_REQUIRED = os.environ.get("CONTROL_AUTH_REQUIRED", "0") == "1"
+CONTROL_AUTH_MAX_AGE_SEC = float(os.environ.get("CONTROL_AUTH_MAX_AGE_SEC", "30"))
+CONTROL_AUTH_ALGORITHM = "hmac-sha256-128"
+CONTROL_AUTH_MAC_BYTES = 16
+_CONTROL_AUTH_FIELDS = struct.Struct("<QIIBddddHH")
+
+# 整条轨迹上传（type=trajectory）：后端把有序航点表拆成若干分片数据报，
+# 每片与 control 一样带 session/sequence/delivery/auth；Jetson 按 command_id
+# 重组，全部分片确认后作为一条命令应用，再在 50Hz 心跳中本地逐点推进。
+# 分片确认规则同 control：无 MAC 时每片需 COMMAND_CONFIRM_COUNT 个不同
+# repeat_index 且负载一致，MAC 有效时单包即确认。
+#   无 time_s 的航点：机体进入 TRAJECTORY_ACCEPT_RADIUS_M 后推进到下一点；
+#   带 time_s 的航点：按轨迹开始后的运行时间（暂停不计）线性插值，到时推进。
+# control 的 pause / resume 模式暂停 / 继续当前轨迹；move / hold 取消轨迹。
+# pause / resume 不使用目标点：JSON 可省略 target，省略时按 NED (0, 0, 0) 解析并
+# 计入 MAC；二进制变体的 north/east/down 同样须填 0。
+TRAJECTORY_MAX_WAYPOINTS = int(os.environ.get("TRAJECTORY_MAX_WAYPOINTS", "2048"))
+TRAJECTORY_MAX_CHUNKS = int(os.environ.get("TRAJECTORY_MAX_CHUNKS", "128"))
+TRAJECTORY_ASSEMBLY_TIMEOUT_SEC = float(
+    os.environ.get("TRAJECTORY_ASSEMBLY_TIMEOUT_SEC", "5.0")
+)
+TRAJECTORY_ACCEPT_RADIUS_M = float(os.environ.get("TRAJECTORY_ACCEPT_RADIUS_M", "0.5"))
+# encode_trajectory_chunks 每片默认航点数：约 1KB，避免 IP 分片
+TRAJECTORY_CHUNK_WAYPOINTS = 16
+_TRAJECTORY_AUTH_FIELDS = struct.Struct("<QIIHHHdHH")
+_TRAJECTORY_AUTH_WAYPOINT = struct.Struct("<dddd")
+
+# 解析前去重：同一命令的重发包只在 repeat_index / sent_at_unix_s 上不同。
+# 去掉这两个值后对其余字节取摘要，命中 LRU 即复用首包的解析结果，跳过
+# JSON 解码、语义校验与 MAC 计算；之后的会话、确认门与计数逻辑照常执行。
+# 只缓存通过了解析、slot 与 MAC 校验的数据报。0 表示关闭。
+CONTROL_DIGEST_CACHE_SIZE = int(os.environ.get("CONTROL_DIGEST_CACHE_SIZE", "256"))
+
+# 每次 socket 可读时最多连续取出的控制包数；上限保证多 slot 进程中
+# 单个被洪泛的 slot 不会饿死其他 slot 的接收。
+CONTROL_INGRESS_MAX_BATCH = int(os.environ.get("CONTROL_INGRESS_MAX_BATCH", "64"))
+
+# 控制入口过载保护：取出的数据报先做不解析 JSON 的分类，新命令内容
+# （move / trajectory / pause / resume）优先处理；每个 OFFBOARD 心跳周期内
+# 处理控制包最多占用 CONTROL_INGRESS_BUDGET_SEC（0 表示不限）。
+# 过载（批次触顶、已有积压或本周期预算用尽）时，同一 hold 流只保留最新一包，
+# 完全相同的重复包直接丢弃；预算用尽后已见过的 hold 丢弃，其余留到下一周期，
+# 积压最多 CONTROL_INGRESS_BACKLOG 个，超出时从最低优先级丢弃。
+CONTROL_INGRESS_BUDGET_SEC = float(os.environ.get("CONTROL_INGRESS_BUDGET_SEC", "0.004"))
+CONTROL_INGRESS_BACKLOG = int(os.environ.get("CONTROL_INGRESS_BACKLOG", "256"))
+
+# Linux 上为控制 socket 开启 SO_TIMESTAMPNS，用内核收包时间拆分
+# “网卡/协议栈排队”与“用户态处理”两段延迟。Python 未导出该常量时
+# 使用 asm-generic 的数值 35；非 Linux 平台不开启。
+CONTROL_KERNEL_TIMESTAMPS = os.environ.get("CONTROL_KERNEL_TIMESTAMPS", "1") == "1"
+_SO_TIMESTAMPNS = getattr(
+    socket, "SO_TIMESTAMPNS", 35 if sys.platform.startswith("linux") else None
+)
+_KERNEL_TIMESPEC = struct.Struct("@ll")
+
+# 控制命令逐跳延迟直方图的名称与顺序（每个 slot 一组）：
+#   issue→send        后端 issued_at → 首个收到的数据报 sent_at（后端时钟）
+#   send→kernel       sent_at → Jetson 内核收包（跨主机墙钟，含时钟偏差）
+#   kernel→read       内核收包 → recvmsg 返回（仅在有内核时间戳时记录）
+#   read→parse        recvmsg 返回 → 解析与校验完成
+#   rx→staged         首个数据报到达 → 进入确认门
+#   staged→confirmed  进入确认门 → 达到确认数（MAC 快速路径为 0）
+#   confirmed→applied 达到确认 → setpoint 写入
+#   applied→publish   setpoint 写入 → 首个携带该序号的 TrajectorySetpoint
+#   rx→publish        首个数据报到达 → 首次发布（Jetson 单调时钟端到端）
+#   issue→publish     后端 issued_at → 首次发布（跨主机墙钟端到端）
+# 除 kernel→read / read→parse 按数据报记录外，其余按命令记录一次。
+CONTROL_LATENCY_HOPS = (
+    "issue→send",
+    "send→kernel",
+    "kernel→read",
+    "read→parse",
+    "rx→staged",
+    "staged→confirmed",
+    "confirmed→applied",
+    "applied→publish",
+    "rx→publish",
+    "issue→publish",
+)
+
+# Offboard 心跳频率（Hz）——必须 > 2Hz，50Hz 留足余量
+OFFBOARD_HZ = 50
+OFFBOARD_INTERVAL = 1.0 / OFFBOARD_HZ
+# 实际发布间隔超过该倍数的周期记为一次漏拍（PX4 超时前的早期信号）
+OFFBOARD_MISS_FACTOR = 2.0
+
+# 心跳默认由 ROS 定时器驱动，与遥测编码、UDP 解析共用执行器。OFFBOARD_THREAD=1
+# 时改由每个 slot 独立的心跳线程按绝对截止时刻驱动，并在权限允许时应用
+# OFFBOARD_SCHED：fifo / rr（实时优先级 OFFBOARD_PRIORITY，1..99，需
+# CAP_SYS_NICE 或 rtprio 限额）、nice（OFFBOARD_PRIORITY 为 nice 值，负值需权限）
+# 或 other（不改）。OFFBOARD_CPUS（可按 OFFBOARD_CPUS_<slot> 单独设置）如 "3"
+# 或 "2-3" 把心跳线程绑到指定 CPU。权限不足只记录告警，心跳照常运行。
+# 心跳线程与多线程执行器都需取得 GIL：显式设置 OFFBOARD_SWITCH_INTERVAL_SEC（如
+# 0.001）时，开启任一项后把解释器切换间隔降到该值，使心跳唤醒后更快拿到 GIL，
+# 代价是所有线程更频繁地切换。默认 0 保持解释器默认值（5ms）。
+OFFBOARD_THREAD = os.environ.get("OFFBOARD_THREAD", "0") == "1"
+# ROS 回调按 slot 分为三个互斥回调组：心跳定时器、PX4 订阅回调、诊断定时器。
+# ROS_EXECUTOR=multi（默认）时由 MultiThreadedExecutor 并行执行不同组，诊断格式化
+# 或一批订阅回调不再让心跳排队；同组回调仍串行，组内状态无需额外加锁。
+# ROS_EXECUTOR_THREADS=0 表示每个 slot 3 个线程。ROS_EXECUTOR=single 退回单线程。
+ROS_EXECUTOR = os.environ.get("ROS_EXECUTOR", "multi").strip().lower()
+ROS_EXECUTOR_THREADS = int(os.environ.get("ROS_EXECUTOR_THREADS", "0"))
+OFFBOARD_SCHED = os.environ.get("OFFBOARD_SCHED", "fifo").strip().lower()
+OFFBOARD_PRIORITY = int(os.environ.get("OFFBOARD_PRIORITY", "10"))
+OFFBOARD_SWITCH_INTERVAL_SEC = float(os.environ.get("OFFBOARD_SWITCH_INTERVAL_SEC", "0"))
+
+# 遥测发送调度：PX4 位姿样本（vehicle_local_position / odometry）到达后等待
+# TELEMETRY_COALESCE_SEC，把同一批到达的其他话题合并进同一个数据报再发送。
+# TELEMETRY_HZ 为最大发送频率；无新样本时至少按 TELEMETRY_MIN_HZ 发送心跳遥测。
+TELEMETRY_HZ = float(os.environ.get("TELEMETRY_HZ", "10"))
+TELEMETRY_MIN_HZ = float(os.environ.get("TELEMETRY_MIN_HZ", "2"))
+TELEMETRY_COALESCE_SEC = float(os.environ.get("TELEMETRY_COALESCE_SEC", "0.003"))
+
+# 可选的增量遥测（TELEMETRY_DELTA=1）：每 TELEMETRY_KEYFRAME_SEC 发送一次完整关键帧，
+# 其间慢变字段（arming/nav_state、battery、gps_*、control_ack）只在变化时发送，
+# 并在随后 TELEMETRY_DELTA_REPEAT 个数据报中重复以抵抗丢包。位姿字段每帧都发。
+# 接收端需按 telemetry_seq 合并（Backend udp_receiver.cpp 已支持），默认关闭。
+TELEMETRY_DELTA = os.environ.get("TELEMETRY_DELTA", "0") == "1"
+TELEMETRY_KEYFRAME_SEC = float(os.environ.get("TELEMETRY_KEYFRAME_SEC", "1.0"))
+TELEMETRY_DELTA_REPEAT = int(os.environ.get("TELEMETRY_DELTA_REPEAT", "3"))
+
+# 附加遥测订阅者（TELEMETRY_SUBSCRIBERS，可按 TELEMETRY_SUBSCRIBERS_<slot> 单独设置，
+# 可含 {slot}）：逗号分隔的 host:port[/divisor]，例如
+#   TELEMETRY_SUBSCRIBERS=192.168.10.40:9888,239.10.0.1:9900/5
+# 每帧遥测只编码一次，再经各自的 connected UDP socket 发给主后端与每个订阅者；
+# divisor=N 表示每 N 帧发送一次。增量模式下 divisor > 1 的订阅者按自己收到的帧
+# 单独做增量编码（自有 telemetry_seq 与关键帧），不与主后端共用 payload。组播地址
+# （224.0.0.0/4）按 TELEMETRY_MULTICAST_TTL 设置 TTL，默认只在本网段内。
+# 主后端仍是 BACKEND_HOST:TELEMETRY_PORT，并随已校验控制包的源地址自愈。
+TELEMETRY_MULTICAST_TTL = int(os.environ.get("TELEMETRY_MULTICAST_TTL", "1"))
+
+# 可选的高频位姿通道（POSE_STREAM=1，可按 POSE_STREAM_<slot> 单独开启）：
+# 每个有效 VehicleLocalPosition 样本记录一次位姿，每 POSE_BATCH_INTERVAL_SEC
+# 打包成一个二进制数据报发往 BACKEND_HOST:POSE_PORT（默认 slot1=8988, slot2=8990, ...），
+# 与 YAML 状态遥测端口分离，后端现有解析器不受影响。布局（小端）：
+#   头部 magic "UE5P", version u8, slot u8, sample_count u8, flags u8,
+#        batch_seq u32, sent_at_us u64 (ROS 时钟)
+#   样本 timestamp_us u64 (PX4 VehicleLocalPosition.timestamp),
+#        NED position f32[3] m, q f32[4] [w,x,y,z]（最新 VehicleOdometry，未收到时 NaN）,
+#        NED velocity f32[3] m/s
+POSE_BATCH_INTERVAL_SEC = float(os.environ.get("POSE_BATCH_INTERVAL_SEC", "0.05"))
+POSE_BATCH_MAGIC = b"UE5P"
+POSE_BATCH_VERSION = 1
+_POSE_BATCH_HEADER = struct.Struct("<4sBBBBIQ")
+_POSE_SAMPLE = struct.Struct("<Q3f4f3f")
+# 单个数据报不超过常见以太网/Wi-Fi MTU（1472B UDP 负载）
+POSE_BATCH_MAX_SAMPLES = (1472 - _POSE_BATCH_HEADER.size) // _POSE_SAMPLE.size
+
+# 可选的 setpoint 平滑：开启后不再把新确认目标直接写进 TrajectorySetpoint，
+# 而是在速度/加速度限制内每 tick 生成中间点，并填入 velocity/acceleration 前馈。
+SETPOINT_SMOOTHING = os.environ.get("SETPOINT_SMOOTHING", "0") == "1"
+SETPOINT_MAX_VELOCITY_MPS = float(os.environ.get("SETPOINT_MAX_VELOCITY_MPS", "2.0"))
+SETPOINT_MAX_ACCEL_MPS2 = float(os.environ.get("SETPOINT_MAX_ACCEL_MPS2", "1.0"))
+
+# 可选的本地指标端点（METRICS_PORT>0 时开启）：在主循环 selector 中提供
+# GET /metrics，Prometheus 文本格式，覆盖全部 slot。默认只监听本机回环地址；
+# 渲染只读取计数器与直方图的当前值，不取任何锁，也不唤醒 ROS 线程。
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1").strip()
+# ROS 话题接收速率的最短统计窗口；更频繁的抓取复用上一窗口的结果
+METRICS_RATE_WINDOW_SEC = 1.0
+
+# 可选的飞行记录器：FLIGHT_RECORDER_PATH（或 FLIGHT_RECORDER_PATH_<slot>，
+# 可含 {slot}）非空时，把原始控制数据报、PX4 样本以及 setpoint 发布 / 命令
+# 应用决策写入固定大小的 mmap 环形文件，崩溃后可用 dump_flight_recorder.py 导出。
+# 页面由内核异步回写：进程崩溃不丢数据，断电可能丢失最后几十秒。
+FLIGHT_RECORDER_BYTES = int(float(os.environ.get("FLIGHT_RECORDER_MB", "32")) * 1024 * 1024)
+FLIGHT_RECORDER_BLOCK_BYTES = 65536
+
+# 热路径日志（UDP 接收、确认门、命令应用）：事件先按类别过令牌桶限速，
+# 再以结构化字段入队，由每个 slot 的后台线程格式化并写入 ROS logger，
+# 接收线程从不等待日志 I/O。每个类别每秒补充 LOG_RATE_PER_SEC 个令牌，
+# 最多积攒 LOG_BURST 个；被限速的事件只计数，在该类别下一条日志后附
+# “suppressed N” 汇总。队列超过 LOG_QUEUE_MAX 时丢弃新事件并计数。
+LOG_RATE_PER_SEC = float(os.environ.get("LOG_RATE_PER_SEC", "20"))
+LOG_BURST = float(os.environ.get("LOG_BURST", "40"))
+LOG_QUEUE_MAX = int(os.environ.get("LOG_QUEUE_MAX", "4096"))
+
+# ARM / 切 OFFBOARD 的 VehicleCommand 按 ACK 推进：每条命令发出后等待匹配的
+# VehicleCommandAck，VEHICLE_COMMAND_ACK_TIMEOUT_SEC 内未确认则重发，等待时间每次
+# 乘以 VEHICLE_COMMAND_BACKOFF（上限 VEHICLE_COMMAND_MAX_TIMEOUT_SEC），最多发送
+# VEHICLE_COMMAND_MAX_ATTEMPTS 次。ACCEPTED 立即进入下一步，DENIED 等明确拒绝或
+# 重试耗尽则终止序列。px4_msgs 缺少 VehicleCommandAck 时退回每 tick 发送一次、
+# 连发 MAX_ATTEMPTS 次后直接进入下一步（旧行为）。
+VEHICLE_COMMAND_ACK_TIMEOUT_SEC = float(os.environ.get("VEHICLE_COMMAND_ACK_TIMEOUT_SEC", "0.1"))
+VEHICLE_COMMAND_BACKOFF = float(os.environ.get("VEHICLE_COMMAND_BACKOFF", "2.0"))
+VEHICLE_COMMAND_MAX_TIMEOUT_SEC = float(os.environ.get("VEHICLE_COMMAND_MAX_TIMEOUT_SEC", "1.0"))
+VEHICLE_COMMAND_MAX_ATTEMPTS = int(os.environ.get("VEHICLE_COMMAND_MAX_ATTEMPTS", "5"))
+
+running = True
+
+
+# ============================================================
+# 控制包解析
+# ============================================================
+def parse_control_packet(data: bytes):
+    """严格解析并验证后端控制协议（JSON 或定长二进制）；失败时抛出 ValueError。"""
+    if not data:
+        raise ValueError("empty UDP datagram")
+    if len(data) > MAX_CONTROL_PACKET_BYTES:
+        raise ValueError(
+            f"packet too large: {len(data)}B > {MAX_CONTROL_PACKET_BYTES}B"
+        )
+    if data[:4] == CONTROL_BINARY_MAGIC:
+        return parse_binary_control_packet(data)
+    try:
+        message = json.loads(data.decode("utf-8"))
+    except UnicodeDecodeError as exc:
+        raise ValueError(f"payload is not UTF-8: {exc}") from exc
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"invalid JSON at char {exc.pos}: {exc.msg}") from exc
+
+    if not isinstance(message, dict):
+        raise ValueError("JSON root must be an object")
+    if message.get("protocol") != CONTROL_PROTOCOL:
+        raise ValueError(f"unexpected protocol={message.get('protocol')!r}")
+    if message.get("version") != CONTROL_PROTOCOL_VERSION:
+        raise ValueError(f"unsupported version={message.get('version')!r}")
+    message_type = message.get("type")
+    if message_type not in ("control", "trajectory"):
+        raise ValueError(f"unexpected type={message_type!r}")
+
+    session_id = message.get("session_id")
+    command_id = message.get("command_id")
+    if not isinstance(session_id, str) or not session_id:
+        raise ValueError("session_id must be a non-empty string")
+    if not isinstance(command_id, str) or not command_id:
+        raise ValueError("command_id must be a non-empty string")
+    if message_type == "control":
+        mode = message.get("mode")
+        if mode not in CONTROL_BINARY_MODES:
+            raise ValueError(
+                f"mode must be one of {'/'.join(CONTROL_BINARY_MODES)}, got {mode!r}"
+            )
+
+    try:
+        sequence = int(message["sequence"])
+        drone_id = int(message["drone_id"])
+        slot = int(message["slot"])
+        issued_at = float(message["issued_at_unix_s"])
+        sent_at = float(message["sent_at_unix_s"])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f"invalid command metadata: {exc}") from exc
+
+    delivery = message.get("delivery")
+    if not isinstance(delivery, dict):
+        raise ValueError("delivery must be an object")
+    try:
+        repeat_index = int(delivery["repeat_index"])
+        repeat_total = int(delivery["repeat_total"])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f"invalid delivery metadata: {exc}") from exc
+
+    auth_mac = None
+    auth = message.get("auth")
+    if auth is not None:
+        if not isinstance(auth, dict) or auth.get("alg") != CONTROL_AUTH_ALGORITHM:
+            raise ValueError(f"auth.alg must be {CONTROL_AUTH_ALGORITHM}")
+        mac_hex = auth.get("mac")
+        if not isinstance(mac_hex, str) or len(mac_hex) != CONTROL_AUTH_MAC_BYTES * 2:
+            raise ValueError(f"auth.mac must be {CONTROL_AUTH_MAC_BYTES * 2} hex chars")
+        try:
+            auth_mac = bytes.fromhex(mac_hex)
+        except ValueError as exc:
+            raise ValueError(f"auth.mac is not hex: {exc}") from exc
+
+    if message_type == "trajectory":
+        return _parse_trajectory_chunk(
+            message.get("trajectory"), session_id, command_id, sequence, drone_id, slot,
+            issued_at, sent_at, repeat_index, repeat_total, auth_mac,
+        )
+
+    target = message.get("target")
+    if target is None and mode in ("pause", "resume"):
+        # 暂停 / 继续不需要目标点，规范值为原点（MAC 按此计算）
+        north = east = down = 0.0
+    else:
+        if not isinstance(target, dict):
+            raise ValueError("target must be an object")
+        _check_ned_frame(target, "target")
+        try:
+            north = float(target["north"])
+            east = float(target["east"])
+            down = float(target["down"])
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ValueError(f"invalid NED target: {exc}") from exc
+
+    return _validated_control_command(
+        session_id, command_id, sequence, drone_id, slot, mode,
+        issued_at, sent_at, north, east, down, repeat_index, repeat_total,
+        auth_mac,
+    )
+
+
+def parse_binary_control_packet(data: bytes):
+    """解析定长二进制控制包；校验规则与 JSON 路径完全一致。"""
+    view = memoryview(data)
+    if len(view) < _CONTROL_BINARY_HEADER.size:
+        raise ValueError(
+            f"binary packet truncated: {len(view)}B < "
+            f"{_CONTROL_BINARY_HEADER.size}B header"
+        )
+    (
+        magic, version, message_type, mode_code, flags,
+        sequence, drone_id, slot, issued_at, sent_at,
+        north, east, down, repeat_index, repeat_total,
+        session_len, command_len,
+    ) = _CONTROL_BINARY_HEADER.unpack_from(view)
+    if magic != CONTROL_BINARY_MAGIC:
+        raise ValueError(f"unexpected binary magic={bytes(magic)!r}")
+    if version != CONTROL_BINARY_VERSION:
+        raise ValueError(f"unsupported binary version={version!r}")
+    if message_type != CONTROL_BINARY_TYPE_CONTROL:
+        raise ValueError(f"unexpected binary type={message_type!r}")
+    if mode_code >= len(CONTROL_BINARY_MODES):
+        raise ValueError(f"unknown mode code {mode_code!r}")
+    if flags & ~CONTROL_BINARY_FLAG_AUTH:
+        raise ValueError(f"unsupported binary flags=0x{flags:02x}")
+
+    offset = _CONTROL_BINARY_HEADER.size
+    command_end = offset + session_len + command_len
+    mac_len = CONTROL_AUTH_MAC_BYTES if flags & CONTROL_BINARY_FLAG_AUTH else 0
+    if len(view) != command_end + mac_len:
+        raise ValueError(
+            f"binary packet length {len(view)}B does not match header "
+            f"({offset}+{session_len}+{command_len}+{mac_len}B)"
+        )
+    auth_mac = bytes(view[command_end:]) if mac_len else None
+    try:
+        session_id = str(view[offset:offset + session_len], "utf-8")
+        command_id = str(view[offset + session_len:command_end], "utf-8")
+    except UnicodeDecodeError as exc:
+        raise ValueError(f"identifier is not UTF-8: {exc}") from exc
+    if not session_id:
+        raise ValueError("session_id must be a non-empty string")
+    if not command_id:
+        raise ValueError("command_id must be a non-empty string")
+
+    return _validated_control_command(
+        session_id, command_id, sequence, drone_id, slot,
+        CONTROL_BINARY_MODES[mode_code], issued_at, sent_at,
+        north, east, down, repeat_index, repeat_total, auth_mac,
+    )
+
+
+def encode_binary_control_packet(command: dict) -> bytes:
+    """把 parse_control_packet 的结果编码为二进制变体（后端/测试/基准共用布局）。"""
+    session_id = command["session_id"].encode("utf-8")
+    command_id = command["command_id"].encode("utf-8")
+    if not 0 < len(session_id) <= 255 or not 0 < len(command_id) <= 255:
+        raise ValueError("session_id/command_id must be 1..255 UTF-8 bytes")
+    auth_mac = command.get("auth_mac") or b""
+    header = _CONTROL_BINARY_HEADER.pack(
+        CONTROL_BINARY_MAGIC,
+        CONTROL_BINARY_VERSION,
+        CONTROL_BINARY_TYPE_CONTROL,
+        CONTROL_BINARY_MODES.index(command["mode"]),
+        CONTROL_BINARY_FLAG_AUTH if auth_mac else 0,
+        command["sequence"],
+        command["drone_id"],
+        command["slot"],
+        command["issued_at"],
+        command["sent_at"],
+        command["x"],
+        command["y"],
+        command["z"],
+        command["repeat_index"],
+        command["repeat_total"],
+        len(session_id),
+        len(command_id),
+    )
+    return header + session_id + command_id + auth_mac
+
+
+def _check_ned_frame(frame: dict, name: str):
+    if frame.get("frame") != "NED":
+        raise ValueError(f"{name}.frame must be NED, got {frame.get('frame')!r}")
+    if frame.get("reference") != "power_on_origin":
+        raise ValueError(
+            f"{name}.reference must be power_on_origin, got "
+            f"{frame.get('reference')!r}"
+        )
+    if frame.get("unit") != "m":
+        raise ValueError(f"{name}.unit must be m, got {frame.get('unit')!r}")
+
+
+def _check_command_metadata(sequence, drone_id, slot, repeat_index, repeat_total):
+    if sequence <= 0 or drone_id <= 0 or slot <= 0:
+        raise ValueError(
+            f"sequence/drone_id/slot must be positive: {sequence}/{drone_id}/{slot}"
+        )
+    if (
+        repeat_index <= 0 or repeat_total < 0
+        or repeat_index > CONTROL_MAX_REPEAT_INDEX
+        or repeat_total > CONTROL_MAX_REPEAT_INDEX
+    ):
+        raise ValueError(
+            f"invalid repeat_index/repeat_total={repeat_index}/{repeat_total}"
+        )
+    if repeat_total > 0 and repeat_index > repeat_total:
+        raise ValueError(
+            f"repeat_index {repeat_index} exceeds repeat_total {repeat_total}"
+        )
+
+
+def _validated_control_command(
+    session_id, command_id, sequence, drone_id, slot, mode,
+    issued_at, sent_at, north, east, down, repeat_index, repeat_total,
+    auth_mac=None,
+):
+    """JSON 与二进制路径共用的语义校验，返回统一的命令字典。"""
+    _check_command_metadata(sequence, drone_id, slot, repeat_index, repeat_total)
+    numeric_values = (issued_at, sent_at, north, east, down)
+    if not all(math.isfinite(value) for value in numeric_values):
+        raise ValueError("timestamps and NED coordinates must be finite")
+    if max(abs(north), abs(east), abs(down)) > MAX_ABS_TARGET_M:
+        raise ValueError(
+            f"NED target exceeds MAX_ABS_TARGET_M={MAX_ABS_TARGET_M}: "
+            f"({north},{east},{down})"
+        )
+
+    return {
+        "session_id": session_id,
+        "command_id": command_id,
+        "sequence": sequence,
+        "drone_id": drone_id,
+        "slot": slot,
+        "mode": mode,
+        "issued_at": issued_at,
+        "sent_at": sent_at,
+        "x": north,
+        "y": east,
+        "z": down,
+        "repeat_index": repeat_index,
+        "repeat_total": repeat_total,
+        "auth_mac": auth_mac,
+    }
+
+
+# 航点：NED 米（power_on_origin）；time_s 为轨迹开始后的相对到达时间，None 表示按位置推进
+TrajectoryWaypoint = namedtuple(
+    "TrajectoryWaypoint", ("north", "east", "down", "time_s"), defaults=(None,)
+)
+
+
+def _parse_trajectory_chunk(
+    body, session_id, command_id, sequence, drone_id, slot,
+    issued_at, sent_at, repeat_index, repeat_total, auth_mac,
+):
+    """校验一个轨迹分片；waypoints 为 [north, east, down] 或 [north, east, down, time_s]。"""
+    if not isinstance(body, dict):
+        raise ValueError("trajectory must be an object")
+    _check_ned_frame(body, "trajectory")
+    _check_command_metadata(sequence, drone_id, slot, repeat_index, repeat_total)
+    if not (math.isfinite(issued_at) and math.isfinite(sent_at)):
+        raise ValueError("timestamps and NED coordinates must be finite")
+    try:
+        chunk_index = int(body["chunk_index"])
+        chunk_count = int(body["chunk_count"])
+        waypoint_count = int(body["waypoint_count"])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f"invalid trajectory chunk metadata: {exc}") from exc
+    if not 0 < chunk_count <= TRAJECTORY_MAX_CHUNKS or not 0 <= chunk_index < chunk_count:
+        raise ValueError(
+            f"invalid chunk_index/chunk_count={chunk_index}/{chunk_count} "
+            f"(TRAJECTORY_MAX_CHUNKS={TRAJECTORY_MAX_CHUNKS})"
+        )
+    if not 0 < waypoint_count <= TRAJECTORY_MAX_WAYPOINTS:
+        raise ValueError(
+            f"waypoint_count={waypoint_count} outside 1..{TRAJECTORY_MAX_WAYPOINTS}"
+        )
+
+    raw_waypoints = body.get("waypoints")
+    if not isinstance(raw_waypoints, list) or not raw_waypoints:
+        raise ValueError("trajectory.waypoints must be a non-empty array")
+    if len(raw_waypoints) > waypoint_count:
+        raise ValueError(
+            f"chunk carries {len(raw_waypoints)} waypoints > waypoint_count={waypoint_count}"
+        )
+    waypoints = []
+    for item in raw_waypoints:
+        if not isinstance(item, list) or len(item) not in (3, 4):
+            raise ValueError(f"waypoint must be [north, east, down(, time_s)], got {item!r}")
+        try:
+            values = [float(value) for value in item]
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"invalid waypoint {item!r}: {exc}") from exc
+        if not all(math.isfinite(value) for value in values):
+            raise ValueError("timestamps and NED coordinates must be finite")
+        if max(abs(values[0]), abs(values[1]), abs(values[2])) > MAX_ABS_TARGET_M:
+            raise ValueError(
+                f"NED waypoint exceeds MAX_ABS_TARGET_M={MAX_ABS_TARGET_M}: {item!r}"
+            )
+        if len(values) == 4 and values[3] < 0.0:
+            raise ValueError(f"waypoint time_s must be >= 0, got {values[3]}")
+        waypoints.append(TrajectoryWaypoint(
+            values[0], values[1], values[2], values[3] if len(values) == 4 else None
+        ))
+    check_trajectory_timing(waypoints)
+
+    return {
+        "session_id": session_id,
+        "command_id": command_id,
+        "sequence": sequence,
+        "drone_id": drone_id,
+        "slot": slot,
+        "mode": "trajectory",
+        "issued_at": issued_at,
+        "sent_at": sent_at,
+        "chunk_index": chunk_index,
+        "chunk_count": chunk_count,
+        "waypoint_count": waypoint_count,
+        "waypoints": tuple(waypoints),
+        "repeat_index": repeat_index,
+        "repeat_total": repeat_total,
+        "auth_mac": auth_mac,
+    }
+
+
+def check_trajectory_timing(waypoints):
+    """带 time_s 的航点必须按时间非递减（分片内与重组后各校验一次）。"""
+    last_time = 0.0
+    for index, waypoint in enumerate(waypoints):
+        if waypoint.time_s is None:
+            continue
+        if waypoint.time_s < last_time:
+            raise ValueError(
+                f"waypoint {index} time_s={waypoint.time_s} is earlier than {last_time}"
+            )
+        last_time = waypoint.time_s
+
+
+def derive_control_session_key(master_key: bytes, session_id: str) -> bytes:
+    """由 CONTROL_AUTH_KEY 派生单个后端会话的 MAC 密钥。"""
+    return hmac.new(
+        master_key,
+        b"ue5_drone_control/session/" + session_id.encode("utf-8"),
+        hashlib.sha256,
+    ).digest()
+
+
+def compute_control_mac(session_key: bytes, command: dict) -> bytes:
+    """命令规范指纹的 MAC；指纹字段为 BridgeCore._control_fingerprint 加 issued_at。"""
+    session_id = command["session_id"].encode("utf-8")
+    command_id = command["command_id"].encode("utf-8")
+    payload = _CONTROL_AUTH_FIELDS.pack(
+        command["sequence"],
+        command["drone_id"],
+        command["slot"],
+        CONTROL_BINARY_MODES.index(command["mode"]),
+        command["x"],
+        command["y"],
+        command["z"],
+        command["issued_at"],
+        len(session_id),
+        len(command_id),
+    ) + session_id + command_id
+    return hmac.new(session_key, payload, hashlib.sha256).digest()[:CONTROL_AUTH_MAC_BYTES]
+
+
+def compute_trajectory_chunk_mac(session_key: bytes, chunk: dict) -> bytes:
+    """轨迹分片的 MAC：分片头 + 航点（time_s 缺省按 NaN 打包），同样不含重发字段。"""
+    session_id = chunk["session_id"].encode("utf-8")
+    command_id = chunk["command_id"].encode("utf-8")
+    payload = [b"trajectory\0", _TRAJECTORY_AUTH_FIELDS.pack(
+        chunk["sequence"],
+        chunk["drone_id"],
+        chunk["slot"],
+        chunk["chunk_index"],
+        chunk["chunk_count"],
+        chunk["waypoint_count"],
+        chunk["issued_at"],
+        len(session_id),
+        len(command_id),
+    ), session_id, command_id]
+    for north, east, down, time_s in chunk["waypoints"]:
+        payload.append(_TRAJECTORY_AUTH_WAYPOINT.pack(
+            north, east, down, math.nan if time_s is None else time_s
+        ))
+    return hmac.new(session_key, b"".join(payload), hashlib.sha256).digest()[
+        :CONTROL_AUTH_MAC_BYTES
+    ]
+
+
+def encode_trajectory_chunks(
+    command: dict,
+    waypoints,
+    repeat_index: int = 1,
+    repeat_total: int = 0,
+    session_key: bytes | None = None,
+    chunk_waypoints: int = TRAJECTORY_CHUNK_WAYPOINTS,
+) -> list:
+    """把航点表编码为 type=trajectory 的 JSON 分片（后端/测试/基准共用布局）。
+
+    command 提供 session_id/command_id/sequence/drone_id/slot/issued_at/sent_at；
+    给出 session_key 时为每片附加 MAC。返回按 chunk_index 排列的数据报列表。
+    """
+    waypoints = [TrajectoryWaypoint(*waypoint) for waypoint in waypoints]
+    chunks = [
+        waypoints[start:start + chunk_waypoints]
+        for start in range(0, len(waypoints), chunk_waypoints)
+    ]
+    datagrams = []
+    for chunk_index, chunk in enumerate(chunks):
+        message = {
+            "protocol": CONTROL_PROTOCOL,
+            "version": CONTROL_PROTOCOL_VERSION,
+            "type": "trajectory",
+            "session_id": command["session_id"],
+            "command_id": command["command_id"],
+            "sequence": command["sequence"],
+            "drone_id": command["drone_id"],
+            "slot": command["slot"],
+            "issued_at_unix_s": command["issued_at"],
+            "sent_at_unix_s": command["sent_at"],
+            "trajectory": {
+                "frame": "NED",
+                "reference": "power_on_origin",
+                "unit": "m",
+                "chunk_index": chunk_index,
+                "chunk_count": len(chunks),
+                "waypoint_count": len(waypoints),
+                "waypoints": [
+                    [waypoint.north, waypoint.east, waypoint.down]
+                    + ([] if waypoint.time_s is None else [waypoint.time_s])
+                    for waypoint in chunk
+                ],
+            },
+            "delivery": {"repeat_index": repeat_index, "repeat_total": repeat_total},
+        }
+        if session_key is not None:
+            mac = compute_trajectory_chunk_mac(session_key, {
+                **command,
+                "chunk_index": chunk_index,
+                "chunk_count": len(chunks),
+                "waypoint_count": len(waypoints),
+                "waypoints": chunk,
+            })
+            message["auth"] = {"alg": CONTROL_AUTH_ALGORITHM, "mac": mac.hex()}
+        datagrams.append(json.dumps(message, separators=(",", ":")).encode("utf-8"))
+    return datagrams
+
+
+# JSON 中的重发字段；键两侧的引号保证不会命中字符串内容（其中的引号必被转义），
+# 值只接受 JSON 数字字面量
+_CONTROL_VOLATILE_KEYS = (b'"repeat_index"', b'"sent_at_unix_s"')
+_JSON_NUMBER_VALUE = re.compile(
+    rb"\s*:\s*(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)"
+)
+# 二进制变体中从偏移 32 起的 sent_at_unix_s f64 …… repeat_index u32（偏移 64）
+_CONTROL_BINARY_VOLATILE = struct.Struct("<d24xI")
+
+
+def split_control_datagram(data: bytes):
+    """不解析 JSON，把控制数据报拆成 (标识字节, repeat_index, sent_at)。
+
+    标识字节是去掉两个重发字段值后的其余字节，同一命令的全部重发包相同。
+    无法可靠定位重发字段（缺失、重复键、非数字字面量、超长）时返回 None。
+    """
+    if len(data) > MAX_CONTROL_PACKET_BYTES:
+        return None
+    if data[:4] == CONTROL_BINARY_MAGIC:
+        if len(data) < _CONTROL_BINARY_HEADER.size:
+            return None
+        sent_at, repeat_index = _CONTROL_BINARY_VOLATILE.unpack_from(data, 32)
+        view = memoryview(data)
+        return b"".join((view[:32], view[40:64], view[68:])), repeat_index, sent_at
+
+    find = data.find
+    repeat_key, sent_key = _CONTROL_VOLATILE_KEYS
+    repeat_at = find(repeat_key)
+    sent_at_key = find(sent_key)
+    # 缺失或重复的键（json.loads 取最后一个）都交给完整解析
+    if (
+        repeat_at < 0 or sent_at_key < 0
+        or find(repeat_key, repeat_at + len(repeat_key)) >= 0
+        or find(sent_key, sent_at_key + len(sent_key)) >= 0
+    ):
+        return None
+    repeat_match = _JSON_NUMBER_VALUE.match(data, repeat_at + len(repeat_key))
+    sent_match = _JSON_NUMBER_VALUE.match(data, sent_at_key + len(sent_key))
+    if repeat_match is None or sent_match is None:
+        return None
+    try:
+        repeat_index = int(repeat_match.group(1))
+        sent_at = float(sent_match.group(1))
+    except ValueError:
+        return None
+
+    first, second = sorted((repeat_match.span(1), sent_match.span(1)))
+    view = memoryview(data)
+    identity = b"".join((view[:first[0]], view[first[1]:second[0]], view[second[1]:]))
+    return identity, repeat_index, sent_at
+
+
+class ControlDigestCache:
+    """控制数据报的解析前 LRU：命令标识字节 → 首包解析结果。
+
+    key() 剥离重发字段，其余字节原样作为字典键：dict 以进程随机密钥的
+    SipHash 作摘要索引，命中后再逐字节比较，因此不存在摘要碰撞误判。
+    无法可靠定位重发字段时返回 None（走完整解析）；get() 命中时返回首包的
+    解析结果（只读，调用方需要修改时先复制）。UDP 线程私有，不加锁。
+    """
+
+    def __init__(self, capacity: int = CONTROL_DIGEST_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def key(self, data: bytes, split=None):
+        """返回 (标识字节, repeat_index, sent_at)；无法剥离重发字段时返回 None。
+
+        split 为调用方已算好的 split_control_datagram(data) 结果（可省略）。
+        """
+        if self.capacity <= 0:
+            return None
+        if split is None:
+            split = split_control_datagram(data)
+            if split is None:
+                self.bypassed += 1
+        return split
+
+    def __contains__(self, identity: bytes) -> bool:
+        """只读查询标识是否已缓存；不计命中、不刷新 LRU 顺序。"""
+        return identity in self._entries
+
+    def get(self, key):
+        digest, repeat_index, sent_at = key
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        # 重发字段本身也须满足解析器的校验，否则交给完整解析去拒绝
+        repeat_total = entry["repeat_total"]
+        if (
+            repeat_index <= 0
+            or repeat_index > CONTROL_MAX_REPEAT_INDEX
+            or (repeat_total > 0 and repeat_index > repeat_total)
+            or not math.isfinite(sent_at)
+        ):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return entry
+
+    def put(self, key, parsed: dict):
+        entries = self._entries
+        entries[key[0]] = dict(parsed)
+        entries.move_to_end(key[0])
+        if len(entries) > self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ============================================================
+# 遥测编码
+# ============================================================
+# 后端 udp_receiver.cpp 用 yaml-cpp 解析遥测：顶层是块映射，值只有整数、
+# 浮点、布尔、字符串、纯标量 flow 序列和纯标量 flow 映射（control_ack）。
+# 下面按固定字段顺序直接拼出这一子集，不经过 PyYAML 的 representer/emitter。
+_YAML_PLAIN_STRING = re.compile(r"[A-Za-z][A-Za-z0-9_.\-]*")
+# YAML 1.1 会把这些单词解析成布尔/空值，必须加引号才能保持字符串语义。
+_YAML_RESERVED_WORDS = frozenset((
+    "y", "n", "yes", "no", "on", "off", "true", "false", "null",
+))
+
+
+def _yaml_float(value) -> str:
+    value = float(value)
+    if value != value:
+        return ".nan"
+    if value == math.inf:
+        return ".inf"
+    if value == -math.inf:
+        return "-.inf"
+    text = repr(value)
+    # 1e-05 在 YAML 1.1 中不是浮点；与 PyYAML 一样补成 1.0e-05。
+    if "." not in text and "e" in text:
+        text = text.replace("e", ".0e", 1)
+    return text
+
+
+def _yaml_string(value: str) -> str:
+    if _YAML_PLAIN_STRING.fullmatch(value) and value.lower() not in _YAML_RESERVED_WORDS:
+        return value
+    # JSON 字符串是合法的 YAML 双引号标量。
+    return json.dumps(value)
+
+
+def _yaml_scalar(value) -> str:
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, float):
+        return _yaml_float(value)
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        return _yaml_string(value)
+    if value is None:
+        return "null"
+    raise ValueError(f"unsupported telemetry scalar {type(value).__name__}")
+
+
+def _yaml_float_sequence(values) -> str:
+    return "[" + ", ".join([_yaml_float(value) for value in values]) + "]"
+
+
+def _yaml_scalar_mapping(mapping: dict) -> str:
+    return "{" + ", ".join(
+        [f"{_yaml_string(key)}: {_yaml_scalar(value)}" for key, value in mapping.items()]
+    ) + "}"
+
+
+# (字段名, 预拼好的 "key: " 前缀, 值格式化函数)，顺序即输出顺序。
+_TELEMETRY_TEMPLATE = tuple(
+    (name, name + ": ", formatter)
+    for name, formatter in (
+        ("timestamp", _yaml_scalar),
+        ("telemetry_seq", _yaml_scalar),
+        ("keyframe", _yaml_scalar),
+        ("position", _yaml_float_sequence),
+        ("q", _yaml_float_sequence),
+        ("velocity", _yaml_float_sequence),
+        ("angular_velocity", _yaml_float_sequence),
+        ("arming_state", _yaml_scalar),
+        ("nav_state", _yaml_scalar),
+        ("local_position", _yaml_float_sequence),
+        ("local_velocity", _yaml_float_sequence),
+        ("local_position_valid", _yaml_scalar),
+        ("gps_lat", _yaml_scalar),
+        ("gps_lon", _yaml_scalar),
+        ("gps_alt", _yaml_scalar),
+        ("gps_fix", _yaml_scalar),
+        ("battery", _yaml_scalar),
+        ("sample_latency_ms", _yaml_scalar),
+        ("control_ack", _yaml_scalar_mapping),
+        ("trajectory", _yaml_scalar_mapping),
+        ("link", _yaml_scalar_mapping),
+    )
+)
+
+
+def encode_telemetry_yaml(data: dict) -> bytes:
+    """把 BridgeCore.build_telemetry 的字段字典编码为后端可解析的 YAML 字节串。"""
+    lines = [
+        prefix + formatter(data[name])
+        for name, prefix, formatter in _TELEMETRY_TEMPLATE
+        if name in data
+    ]
+    if len(lines) != len(data):
+        known = {name for name, _, _ in _TELEMETRY_TEMPLATE}
+        raise ValueError(f"unknown telemetry fields: {sorted(data.keys() - known)}")
+    lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+class TelemetryDeltaEncoder:
+    """为遥测字段字典编号，并在增量模式下删掉未变化的慢变字段组。
+
+    不启用增量时只添加 telemetry_seq（接收端可据此统计丢包），字段保持完整。
+    增量模式下每个数据报带 keyframe: true/false；接收端在关键帧处整体重置，
+    增量帧只覆盖出现的字段。字段组内任一字段变化则整组发送（GPS 需完整元组）。
+    """
+
+    SLOW_FIELD_GROUPS = (
+        ("arming_state",),
+        ("nav_state",),
+        ("battery",),
+        ("gps_lat", "gps_lon", "gps_alt", "gps_fix"),
+        ("control_ack",),
+        ("trajectory",),
+        ("link",),
+    )
+
+    def __init__(self, delta: bool, keyframe_interval_sec: float, repeat_count: int):
+        self.delta = delta
+        self.keyframe_interval_sec = keyframe_interval_sec
+        self.repeat_count = max(1, repeat_count)
+        self.sequence = 0
+        self.keyframes = 0
+        self._last_keyframe = -math.inf
+        self._sent_values = {}
+        self._repeats_left = {}
+
+    def request_keyframe(self):
+        self._last_keyframe = -math.inf
+
+    def encode(self, data: dict, now_monotonic: float) -> dict:
+        """原地改写 data 并返回：添加 telemetry_seq/keyframe，删去无需重发的字段。"""
+        self.sequence += 1
+        data["telemetry_seq"] = self.sequence
+        if not self.delta:
+            return data
+
+        keyframe = now_monotonic - self._last_keyframe >= self.keyframe_interval_sec
+        data["keyframe"] = keyframe
+        if keyframe:
+            self.keyframes += 1
+            self._last_keyframe = now_monotonic
+        for group in self.SLOW_FIELD_GROUPS:
+            values = tuple(data.get(name) for name in group)
+            if keyframe:
+                self._sent_values[group] = values
+                self._repeats_left[group] = 0
+                continue
+            if values != self._sent_values.get(group):
+                self._sent_values[group] = values
+                self._repeats_left[group] = self.repeat_count
+            if self._repeats_left.get(group, 0) > 0:
+                self._repeats_left[group] -= 1
+            else:
+                for name in group:
+                    data.pop(name, None)
+        return data
+
+
+PoseSample = namedtuple(
+    "PoseSample", ("timestamp_us", "position", "q", "velocity")
+)
+_NAN_QUATERNION = (math.nan,) * 4
+
+
+def encode_pose_batch(slot: int, batch_seq: int, sent_at_us: int, samples) -> bytes:
+    """把至多 POSE_BATCH_MAX_SAMPLES 个 PoseSample 打包成一个位姿数据报。"""
+    if not 0 < len(samples) <= POSE_BATCH_MAX_SAMPLES:
+        raise ValueError(f"pose batch must hold 1..{POSE_BATCH_MAX_SAMPLES} samples")
+    parts = [
+        _POSE_BATCH_HEADER.pack(
+            POSE_BATCH_MAGIC, POSE_BATCH_VERSION, slot, len(samples), 0,
+            batch_seq & 0xFFFFFFFF, sent_at_us,
+        )
+    ]
+    pack = _POSE_SAMPLE.pack
+    for sample in samples:
+        parts.append(pack(sample.timestamp_us, *sample.position, *sample.q, *sample.velocity))
+    return b"".join(parts)
+
+
+def decode_pose_batch(data: bytes):
+    """解析位姿数据报，返回 (头部字典, PoseSample 列表)；供接收端与测试使用。"""
+    if len(data) < _POSE_BATCH_HEADER.size:
+        raise ValueError("truncated pose batch header")
+    magic, version, slot, count, flags, batch_seq, sent_at_us = (
+        _POSE_BATCH_HEADER.unpack_from(data)
+    )
+    if magic != POSE_BATCH_MAGIC or version != POSE_BATCH_VERSION:
+        raise ValueError(f"unsupported pose batch {magic!r} v{version}")
+    if len(data) != _POSE_BATCH_HEADER.size + count * _POSE_SAMPLE.size:
+        raise ValueError(f"pose batch length {len(data)} does not match {count} samples")
+    samples = [
+        PoseSample(values[0], values[1:4], values[4:8], values[8:11])
+        for values in _POSE_SAMPLE.iter_unpack(memoryview(data)[_POSE_BATCH_HEADER.size:])
+    ]
+    header = {
+        "slot": slot, "flags": flags, "batch_seq": batch_seq, "sent_at_us": sent_at_us,
+    }
+    return header, samples
+
+
+# ============================================================
+# 遥测调度
+# ============================================================
+class TelemetryScheduler:
+    """按 PX4 样本到达驱动的遥测发送时刻计算（纯状态机，时间由调用方传入）。
+
+    - 距上次触发样本至少 1/max_hz 的第一个新样本启动发送，延迟 coalesce_sec
+      合并突发；每次发送都在触发样本后固定延迟处，因此发送间隔同样不小于 1/max_hz；
+    - 限速窗口内到达的样本不单独触发，其数据会包含在下一次发送中；
+    - 距上次发送超过 1/min_hz 时即使没有新样本也发送心跳。
+    """
+
+    def __init__(self, max_hz: float, min_hz: float, coalesce_sec: float):
+        self.min_interval = 1.0 / max_hz
+        self.max_interval = 1.0 / min_hz
+        self.coalesce_sec = coalesce_sec
+        self.last_sent = -math.inf
+        self.last_trigger = -math.inf
+        self.due_at = None
+        self.latest_sample = None
+
+    def note_sample(self, now: float) -> bool:
+        """记录新样本；返回 True 表示发送时刻被提前，等待方需要被唤醒。"""
+        self.latest_sample = now
+        if (
+            self.due_at is None
+            and now >= self.last_trigger + self.min_interval
+            and now + self.coalesce_sec >= self.last_sent + self.min_interval
+        ):
+            self.last_trigger = now
+            self.due_at = now + self.coalesce_sec
+            return True
+        return False
+
+    def next_deadline(self) -> float:
+        if self.due_at is not None:
+            return self.due_at
+        return self.last_sent + self.max_interval
+
+    def due(self, now: float) -> bool:
+        return now >= self.next_deadline()
+
+    def mark_sent(self, now: float):
+        """记录一次发送；返回最新样本到发送的延迟，心跳（无新样本）返回 None。"""
+        latency = None
+        if self.latest_sample is not None and self.latest_sample > self.last_sent:
+            latency = now - self.latest_sample
+        self.last_sent = now
+        self.due_at = None
+        return latency
+
+
+# ============================================================
+# 遥测扇出
+# ============================================================
+class TelemetryTarget:
+    """一个遥测接收方：独立的 connected UDP socket、降频因子与收发计数。
+
+    connected socket 省去每次 sendto 的地址解析与路由查找；对端端口不可达的
+    ICMP 会在之后的 send 上以 ConnectionRefusedError 报告，计入 refused 而非
+    errors（接收方未启动不是本机故障）。socket 在首次发送时创建。
+    """
+
+    def __init__(self, host: str, port: int, divisor: int = 1, socket_factory=socket.socket):
+        self.host = host
+        self.port = port
+        self.divisor = divisor
+        self.sent = 0
+        self.skipped = 0
+        self.errors = 0
+        self.refused = 0
+        self.last_bytes = 0
+        self.sock = None
+        # 增量模式下降频订阅者自己的 TelemetryDeltaEncoder（见 TelemetryFanout）
+        self.delta = None
+        self._socket_factory = socket_factory
+
+    @property
+    def label(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def _connect(self):
+        sock = self._socket_factory(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            try:
+                multicast = ipaddress.ip_address(self.host).is_multicast
+            except ValueError:
+                multicast = False  # 主机名
+            if multicast:
+                sock.setsockopt(
+                    socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, TELEMETRY_MULTICAST_TTL
+                )
+            sock.connect((self.host, self.port))
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def send(self, payload: bytes):
+        """发送一帧；成功返回 None，失败返回异常（已计数）。"""
+        try:
+            if self.sock is None:
+                self._connect()
+            self.last_bytes = self.sock.send(payload)
+        except ConnectionRefusedError as exc:
+            self.refused += 1
+            return exc
+        except OSError as exc:
+            self.errors += 1
+            return exc
+        self.sent += 1
+        return None
+
+    def retarget(self, host: str, port: int):
+        self.close()
+        self.host = host
+        self.port = port
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+class TelemetryFanout:
+    """把同一份已编码遥测发给主后端（targets[0]）与附加订阅者。
+
+    主后端不降频，地址可由 retarget_primary 自愈；订阅者按 divisor 每 N 帧
+    发送一次，关键帧总是发送。给出 delta_encoder（无参工厂）时，divisor > 1 的
+    订阅者各持一个增量编码器，只对实际发给它的帧编码：慢变字段组的重发次数与
+    telemetry_seq 都按它自己收到的帧计算，不会错过变化或看到固定的序号缺口。
+    只由主线程（遥测发送 / 控制包校验）调用。
+    """
+
+    def __init__(self, primary_addr, subscribers=(), socket_factory=socket.socket,
+                 delta_encoder=None):
+        self.targets = [TelemetryTarget(*primary_addr, socket_factory=socket_factory)]
+        self.targets.extend(
+            TelemetryTarget(host, port, divisor, socket_factory=socket_factory)
+            for host, port, divisor in subscribers
+        )
+        if delta_encoder is not None:
+            for target in self.targets[1:]:
+                if target.divisor > 1:
+                    target.delta = delta_encoder()
+        # 为 True 时 send 需要增量编码前的完整字段（fields）
+        self.reencodes = any(target.delta is not None for target in self.targets)
+        self.frames = 0
+
+    @property
+    def primary(self) -> TelemetryTarget:
+        return self.targets[0]
+
+    @property
+    def subscribers(self):
+        return self.targets[1:]
+
+    def retarget_primary(self, addr):
+        primary = self.targets[0]
+        if (primary.host, primary.port) != tuple(addr):
+            primary.retarget(addr[0], addr[1])
+
+    def send(self, payload: bytes, keyframe: bool = False, fields=None,
+             now_monotonic: float = 0.0):
+        """发送一帧；返回 [(target, exc), ...] 失败列表。
+
+        fields 为增量编码前的遥测字段，供各自编码的订阅者使用（只读）。
+        """
+        self.frames += 1
+        failures = []
+        for target in self.targets:
+            own = target.delta is not None and fields is not None
+            if target.divisor > 1 and (own or not keyframe) and self.frames % target.divisor:
+                target.skipped += 1
+                continue
+            if own:
+                exc = target.send(
+                    encode_telemetry_yaml(target.delta.encode(dict(fields), now_monotonic))
+                )
+            else:
+                exc = target.send(payload)
+            if exc is not None:
+                failures.append((target, exc))
+        return failures
+
+    def close(self):
+        for target in self.targets:
+            target.close()
+
+
+def parse_telemetry_subscribers(value: str):
+    """解析 "host:port[/divisor],..."，返回 [(host, port, divisor), ...]。"""
+    subscribers = []
+    for token in value.replace(" ", "").split(","):
+        if not token:
+            continue
+        address, _, divisor_text = token.partition("/")
+        host, _, port_text = address.rpartition(":")
+        try:
+            port = int(port_text)
+            divisor = int(divisor_text) if divisor_text else 1
+        except ValueError as exc:
+            raise ValueError(f"invalid telemetry subscriber {token!r}") from exc
+        if not host or not 1 <= port <= 65535 or divisor < 1:
+            raise ValueError(
+                f"invalid telemetry subscriber {token!r}; expected host:port[/divisor]"
+            )
+        subscribers.append((host, port, divisor))
+    return subscribers
+
+
+# ============================================================
+# 心跳线程
+# ============================================================
+def apply_thread_scheduling(policy: str, priority: int, cpus=()):
+    """对调用线程应用 CPU 绑定与调度策略；返回各项结果描述，失败不抛出。"""
+    notes = []
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+            notes.append(f"cpus={','.join(str(cpu) for cpu in sorted(cpus))}")
+        except (AttributeError, OSError) as exc:
+            notes.append(f"cpu pinning denied ({type(exc).__name__}: {exc})")
+    if policy in ("fifo", "rr"):
+        name = f"SCHED_{policy.upper()}"
+        try:
+            os.sched_setscheduler(
+                0, getattr(os, name), os.sched_param(priority)
+            )
+            notes.append(f"{name} priority={priority}")
+        except (AttributeError, OSError) as exc:
+            notes.append(f"{name} denied ({type(exc).__name__}: {exc})")
+    elif policy == "nice":
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), priority)
+            notes.append(f"nice={priority}")
+        except (AttributeError, OSError) as exc:
+            notes.append(f"nice {priority} denied ({type(exc).__name__}: {exc})")
+    elif policy != "other":
+        notes.append(f"unknown OFFBOARD_SCHED {policy!r} ignored")
+    return notes
+
+
+class HeartbeatThread:
+    """按绝对截止时刻周期调用 callback 的守护线程（替代 ROS 定时器驱动心跳）。
+
+    截止时刻按周期累加，不随回调耗时漂移；落后超过一个周期时跳过错过的拍，
+    不连发补齐。线程启动时先应用调度设置，结果存入 scheduling 供启动日志输出。
+    """
+
+    def __init__(
+        self, period_sec: float, callback, logger, name: str = "offboard-heartbeat",
+        policy: str = OFFBOARD_SCHED, priority: int = OFFBOARD_PRIORITY, cpus=(),
+        clock=time.monotonic,
+    ):
+        self.period = period_sec
+        self.callback = callback
+        self.logger = logger
+        self.policy = policy
+        self.priority = priority
+        self.cpus = tuple(cpus)
+        self.clock = clock
+        self.scheduling = []
+        self.skipped = 0
+        self.errors = 0
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self, timeout: float = 1.0):
+        self._thread.start()
+        self._ready.wait(timeout)
+
+    def _run(self):
+        self.scheduling = apply_thread_scheduling(self.policy, self.priority, self.cpus)
+        self._ready.set()
+        clock = self.clock
+        period = self.period
+        next_due = clock() + period
+        while not self._stop.wait(max(0.0, next_due - clock())):
+            try:
+                self.callback()
+            except Exception as exc:
+                self.errors += 1
+                self.logger.error(f"[HEARTBEAT] tick failed: {type(exc).__name__}: {exc}")
+            next_due += period
+            behind = clock() - next_due
+            if behind > period:
+                missed = int(behind // period)
+                self.skipped += missed
+                next_due += missed * period
+
+    def stop(self, timeout: float = 1.0):
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+
+def parse_cpu_list(value: str):
+    """解析 "3"、"2,3" 或 "0-1,3" 形式的 CPU 列表，返回有序元组。"""
+    cpus = set()
+    for token in value.replace(" ", "").split(","):
+        if not token:
+            continue
+        first, _, last = token.partition("-")
+        try:
+            start = int(first)
+            stop = int(last) if last else start
+        except ValueError as exc:
+            raise ValueError(f"invalid CPU list entry {token!r}") from exc
+        if start < 0 or stop < start:
+            raise ValueError(f"invalid CPU range {token!r}")
+        cpus.update(range(start, stop + 1))
+    return tuple(sorted(cpus))
+
+
+# ============================================================
+# slot 配置（单进程可承载多个 slot）
+# ============================================================
+def parse_slot_list(value: str):
+    """解析 "1,2,3" 或 "1 2 3" 形式的 slot 列表，保持顺序并拒绝重复。"""
+    slots = []
+    for token in value.replace(",", " ").split():
+        try:
+            slot = int(token)
+        except ValueError as exc:
+            raise ValueError(f"invalid slot {token!r}") from exc
+        if slot < 1 or slot > 6:
+            raise ValueError(f"slot must be in 1..6, got {slot}")
+        if slot in slots:
+            raise ValueError(f"slot {slot} listed more than once")
+        slots.append(slot)
+    if not slots:
+        raise ValueError("slot list is empty")
+    return slots
+
+
+def resolve_slot_config(slot: int, environ=None) -> dict:
+    """返回单个 slot 的 ROS 话题前缀、UDP 端口和 MAVLink SYSID。
+
+    ``<NAME>_<slot>``（如 CONTROL_PORT_2）优先于全局 ``<NAME>``；
+    ROS_TOPIC_PREFIX 中的 ``{slot}`` 会替换为 slot 编号，便于多 slot
+    共用一个模板（ROS_TOPIC_PREFIX=/px4_{slot}）。
+    """
+    env = os.environ if environ is None else environ
+
+    def _setting(name, default):
+        return env.get(f"{name}_{slot}", env.get(name, default)).strip()
+
+    topic_prefix = _setting("ROS_TOPIC_PREFIX", "").replace("{slot}", str(slot))
+    topic_prefix = topic_prefix.rstrip("/")
+    if topic_prefix and not topic_prefix.startswith("/"):
+        topic_prefix = "/" + topic_prefix
+
+    try:
+        # Keep the legacy bridge behaviour by default: slot 1 targets SYSID 1.
+        # The former working script used ``target_system = slot``.  A different
+        # PX4 SYSID must be explicitly provided by MAVLINK_SYSTEM_ID, rather
+        # than silently changing the target to slot + 1.
+        mavlink_system_id = int(_setting("MAVLINK_SYSTEM_ID", str(slot)))
+        # UDP 端口（与接口规范对齐）：控制接收 slot1=8889, slot2=8891, ...；
+        # 遥测发送 slot1=8888, slot2=8890, ...
+        control_port = int(_setting("CONTROL_PORT", str(8889 + (slot - 1) * 2)))
+        telemetry_port = int(_setting("TELEMETRY_PORT", str(8888 + (slot - 1) * 2)))
+        # 0 表示该 slot 未开启高频位姿通道
+        pose_port = 0
+        if _setting("POSE_STREAM", "0") == "1":
+            pose_port = int(_setting("POSE_PORT", str(8988 + (slot - 1) * 2)))
+        telemetry_subscribers = parse_telemetry_subscribers(
+            _setting("TELEMETRY_SUBSCRIBERS", "").replace("{slot}", str(slot))
+        )
+        offboard_cpus = parse_cpu_list(_setting("OFFBOARD_CPUS", ""))
+    except ValueError as exc:
+        raise ValueError(f"invalid slot {slot} configuration: {exc}") from exc
+    # 空字符串表示不开启飞行记录器
+    recorder_path = _setting("FLIGHT_RECORDER_PATH", "").replace("{slot}", str(slot))
+
+    return {
+        "slot": slot,
+        "topic_prefix": topic_prefix,
+        "mavlink_system_id": mavlink_system_id,
+        "control_port": control_port,
+        "telemetry_port": telemetry_port,
+        "pose_port": pose_port,
+        "recorder_path": recorder_path,
+        "telemetry_subscribers": telemetry_subscribers,
+        "offboard_cpus": offboard_cpus,
+    }
+
+
+def resolve_bridge_configs(slots, environ=None):
+    """解析一个进程负责的全部 slot，并拒绝会互相干扰的重复配置。"""
+    configs = [resolve_slot_config(slot, environ) for slot in slots]
+    if len(configs) > 1:
+        for key in ("topic_prefix", "mavlink_system_id", "control_port", "telemetry_port",
+                    "pose_port", "recorder_path"):
+            # 可选通道（pose_port=0 / recorder_path=""）未开启时不参与去重
+            optional = key in ("pose_port", "recorder_path")
+            values = [config[key] for config in configs if not optional or config[key]]
+            if len(set(values)) != len(values):
+                raise ValueError(
+                    f"multi-slot bridge requires a distinct {key} per slot, got "
+                    f"{dict(zip(slots, values))}; set {key.upper()}_<slot> or "
+                    f"ROS_TOPIC_PREFIX=/px4_{{slot}}"
+                )
+    return configs
+
+
+def read_process_rss_bytes():
+    """当前进程常驻内存（字节）；非 Linux 平台返回 None。"""
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ProcessResourceMonitor:
+    """按进程采样 CPU 与 RSS，并折算为每个 slot 的份额。
+
+    单 slot 进程输出同样的 per_slot 数值，因此多进程布局与单进程多 slot
+    布局可以直接用 [RESOURCE] 日志逐 slot 对比。
+    """
+
+    def __init__(self, slot_count: int, clock=time.monotonic, cpu_clock=time.process_time):
+        self._slot_count = max(1, int(slot_count))
+        self._clock = clock
+        self._cpu_clock = cpu_clock
+        self._last_wall = clock()
+        self._last_cpu = cpu_clock()
+
+    def sample(self) -> dict:
+        now_wall = self._clock()
+        now_cpu = self._cpu_clock()
+        elapsed = now_wall - self._last_wall
+        cpu_percent = (
+            100.0 * (now_cpu - self._last_cpu) / elapsed if elapsed > 0 else 0.0
+        )
+        self._last_wall = now_wall
+        self._last_cpu = now_cpu
+        rss_bytes = read_process_rss_bytes()
+        return {
+            "slots": self._slot_count,
+            "cpu_percent": cpu_percent,
+            "rss_bytes": rss_bytes,
+            "cpu_percent_per_slot": cpu_percent / self._slot_count,
+            "rss_bytes_per_slot": (
+                rss_bytes / self._slot_count if rss_bytes is not None else None
+            ),
+        }
+
+
+def format_resource_sample(sample: dict) -> str:
+    def _mib(value):
+        return f"{value / (1024 * 1024):.1f}MiB" if value is not None else "n/a"
+
+    return (
+        f"[RESOURCE] slots={sample['slots']} process cpu={sample['cpu_percent']:.1f}% "
+        f"rss={_mib(sample['rss_bytes'])} | per_slot "
+        f"cpu={sample['cpu_percent_per_slot']:.1f}% "
+        f"rss={_mib(sample['rss_bytes_per_slot'])}"
+    )
+
+
+# ============================================================
+# 延迟统计
+# ============================================================
+class LatencyHistogram:
+    """对数分桶的延迟直方图（单位秒）：记录 O(1)，快照时按桶上界估算分位数。"""
+
+    BUCKET_BOUNDS_SEC = (
+        0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+        0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    )
+
+    def __init__(self, bounds=None):
+        # 默认分桶之外可传入更细的上界（如心跳间隔）；最后一个桶收纳超出上界的样本
+        self.bounds = self.BUCKET_BOUNDS_SEC if bounds is None else tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        # PrometheusText.latency 的渲染缓存：((name, labels, count), lines)
+        self.prometheus_cache = None
+
+    def record(self, seconds: float):
+        if not math.isfinite(seconds):
+            return
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        if self.count == 0:
+            return math.nan
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+        }
+
+
+def format_latency_ms(snapshot: dict) -> str:
+    if not snapshot.get("count"):
+        return "n=0"
+    return (
+        f"n={snapshot['count']} p50={snapshot['p50'] * 1e3:.1f}ms "
+        f"p99={snapshot['p99'] * 1e3:.1f}ms max={snapshot['max'] * 1e3:.1f}ms"
+    )
+
+
+class HeartbeatMonitor:
+    """心跳实际发布间隔：细分桶直方图（围绕名义周期）与超过 miss_factor 倍周期的漏拍数。
+
+    只由心跳所在线程调用 note；停发（无 setpoint）后调用 reset_gap，恢复发布的
+    第一个间隔不计入统计。
+    """
+
+    def __init__(self, period_sec: float, miss_factor: float = OFFBOARD_MISS_FACTOR):
+        self.period = period_sec
+        self.miss_threshold = period_sec * miss_factor
+        self.intervals = LatencyHistogram(
+            period_sec * factor
+            for factor in (
+                0.25, 0.5, 0.75, 0.9, 0.95, 0.98, 1.0, 1.02, 1.05, 1.1, 1.25,
+                1.5, 2.0, 3.0, 5.0, 10.0, 50.0,
+            )
+        )
+        self.misses = 0
+        self.last = None
+
+    def note(self, now: float):
+        last = self.last
+        self.last = now
+        if last is None:
+            return
+        interval = now - last
+        self.intervals.record(interval)
+        if interval > self.miss_threshold:
+            self.misses += 1
+
+    def reset_gap(self):
+        self.last = None
+
+    def summary(self) -> str:
+        snapshot = self.intervals.snapshot()
+        if not snapshot.get("count"):
+            return "n=0"
+        return (
+            f"n={snapshot['count']} min={snapshot['min'] * 1e3:.1f} "
+            f"p50={snapshot['p50'] * 1e3:.1f} p99={snapshot['p99'] * 1e3:.1f} "
+            f"max={snapshot['max'] * 1e3:.1f}ms misses={self.misses}"
+        )
+
+
+def format_hop_latency_ms(snapshots: dict) -> str:
+    """逐跳摘要 ``hop=p50/p99ms``，跳过尚无样本的跳。"""
+    parts = [
+        f"{hop}={snapshot['p50'] * 1e3:.1f}/{snapshot['p99'] * 1e3:.1f}ms"
+        for hop, snapshot in snapshots.items()
+        if snapshot.get("count")
+    ]
+    return " ".join(parts) or "n=0"
+
+
+# ============================================================
+# VehicleCommand 重传
+# ============================================================
+# VehicleCommandAck.result 取值
+VEHICLE_CMD_RESULT_ACCEPTED = 0
+VEHICLE_CMD_RESULT_TEMPORARILY_REJECTED = 1
+VEHICLE_CMD_RESULT_IN_PROGRESS = 5
+VEHICLE_CMD_RESULT_NAMES = {
+    0: "ACCEPTED",
+    1: "TEMPORARILY_REJECTED",
+    2: "DENIED",
+    3: "UNSUPPORTED",
+    4: "FAILED",
+    5: "IN_PROGRESS",
+    6: "CANCELLED",
+}
+
+VehicleCommandStep = namedtuple(
+    "VehicleCommandStep", ("name", "command", "param1", "param2")
+)
+
+
+class VehicleCommandSequencer:
+    """按顺序发送 VehicleCommand，收到匹配的 ACK 后推进（纯状态机，时间由调用方传入）。
+
+    - poll(now) 返回此刻需要（重）发送的步骤，否则返回 None；
+    - on_ack 按命令号匹配当前步骤：ACCEPTED 记录 ACK 延迟（相对最近一次发送）
+      并推进，IN_PROGRESS 把超时延长到上限，TEMPORARILY_REJECTED 等下一次超时
+      重发，其余结果终止序列；
+    - expect_ack=False 时不等待 ACK，发满 max_attempts 次即视为完成该步。
+    """
+
+    def __init__(
+        self,
+        steps,
+        timeout_sec: float = VEHICLE_COMMAND_ACK_TIMEOUT_SEC,
+        max_attempts: int = VEHICLE_COMMAND_MAX_ATTEMPTS,
+        backoff: float = VEHICLE_COMMAND_BACKOFF,
+        max_timeout_sec: float = VEHICLE_COMMAND_MAX_TIMEOUT_SEC,
+        expect_ack: bool = True,
+    ):
+        self.steps = tuple(steps)
+        self.timeout_sec = timeout_sec
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.max_timeout_sec = max(timeout_sec, max_timeout_sec)
+        self.expect_ack = expect_ack
+        # idle → running → done / failed
+        self.state = "idle"
+        self.index = 0
+        self.attempts = 0
+        self.last_sent = None
+        self.deadline = None
+        self.sent = 0
+        self.retries = 0
+        # 步骤名 → ACCEPTED / 拒绝结果名 / "timeout" / "unacknowledged"
+        self.outcomes = {}
+        self.ack_latency = {step.name: LatencyHistogram() for step in self.steps}
+
+    @property
+    def current(self):
+        if self.state != "running":
+            return None
+        return self.steps[self.index]
+
+    def start(self):
+        if self.state == "idle":
+            self.state = "running" if self.steps else "done"
+
+    def _advance(self, outcome: str):
+        self.outcomes[self.steps[self.index].name] = outcome
+        self.index += 1
+        self.attempts = 0
+        self.last_sent = None
+        self.deadline = None
+        if self.index >= len(self.steps):
+            self.state = "done"
+
+    def poll(self, now: float):
+        if self.state != "running":
+            return None
+        if self.deadline is not None:
+            if now < self.deadline:
+                return None
+            if self.attempts >= self.max_attempts:
+                if self.expect_ack:
+                    self.outcomes[self.steps[self.index].name] = "timeout"
+                    self.state = "failed"
+                    return None
+                self._advance("unacknowledged")
+                if self.state != "running":
+                    return None
+        step = self.steps[self.index]
+        if self.attempts:
+            self.retries += 1
+        self.attempts += 1
+        self.sent += 1
+        self.last_sent = now
+        if self.expect_ack:
+            timeout = self.timeout_sec * self.backoff ** (self.attempts - 1)
+            self.deadline = now + min(timeout, self.max_timeout_sec)
+        else:
+            self.deadline = now
+        return step
+
+    def on_ack(self, command: int, result: int, now: float):
+        """处理一条 ACK；返回 (步骤, 结果名)，与当前步骤无关时返回 None。"""
+        step = self.current
+        if step is None or self.last_sent is None or command != step.command:
+            return None
+        if result == VEHICLE_CMD_RESULT_ACCEPTED:
+            self.ack_latency[step.name].record(now - self.last_sent)
+            self._advance("ACCEPTED")
+        elif result == VEHICLE_CMD_RESULT_IN_PROGRESS:
+            self.deadline = now + self.max_timeout_sec
+        elif result != VEHICLE_CMD_RESULT_TEMPORARILY_REJECTED:
+            self.outcomes[step.name] = VEHICLE_CMD_RESULT_NAMES.get(result, str(result))
+            self.state = "failed"
+        return step, VEHICLE_CMD_RESULT_NAMES.get(result, "UNKNOWN")
+
+
+# ============================================================
+# 命令确认存储
+# ============================================================
+class PendingCommand:
+    """一个 command_id 的确认组；repeat_index 以位图记录，位 0 对应 base。"""
+
+    __slots__ = ("first_seen", "last_seen", "base", "repeat_mask", "fingerprint",
+                 "packet", "sender", "staged_at")
+
+    # 持续 hold 的 repeat_index 会无限递增，位图相对首包 index 偏移，
+    # 再留出这么多位容纳乱序早到的更小 index。
+    REORDER_SLACK = 32
+    # 位图固定宽度；更大的 index 把窗口整体上移（丢弃窗口外的旧位），
+    # 网络上任意大的 repeat_index 都不会让位图变长。
+    WINDOW_BITS = 64 + REORDER_SLACK
+
+    def __init__(
+        self, packet: dict, fingerprint, sender, now_monotonic: float,
+        staged_at: float | None = None,
+    ):
+        self.first_seen = now_monotonic
+        self.last_seen = now_monotonic
+        self.base = max(0, packet["repeat_index"] - self.REORDER_SLACK)
+        self.repeat_mask = 0
+        self.fingerprint = fingerprint
+        self.packet = packet
+        self.sender = sender
+        # 进入确认门的处理时刻（调用方时钟），供 rx→staged / staged→confirmed；
+        # 缺省为 now_monotonic
+        self.staged_at = now_monotonic if staged_at is None else staged_at
+
+    def has_repeat(self, repeat_index: int) -> bool:
+        """add_repeat 是否会把该 index 判为重复（只读）。"""
+        offset = repeat_index - self.base
+        if offset >= self.WINDOW_BITS:
+            return False
+        return offset < 0 or bool(self.repeat_mask >> offset & 1)
+
+    def add_repeat(self, repeat_index: int) -> bool:
+        """记录一个 repeat_index；重复或早于位图窗口的 index 返回 False。"""
+        offset = repeat_index - self.base
+        if offset < 0:
+            return False
+        if offset >= self.WINDOW_BITS:
+            shift = offset - self.WINDOW_BITS + 1
+            self.repeat_mask = self.repeat_mask >> shift if shift < self.WINDOW_BITS else 0
+            self.base += shift
+            offset -= shift
+        bit = 1 << offset
+        if self.repeat_mask & bit:
+            return False
+        self.repeat_mask |= bit
+        return True
+
+    @property
+    def confirmed(self) -> int:
+        return self.repeat_mask.bit_count()
+
+
+class CommandStore:
+    """待确认 / 已应用命令与退役会话的索引存储。
+
+    pending 另有两个惰性删除的小顶堆：按 sequence（应用新命令时淘汰旧序号）
+    和按 last_seen（空闲超时），淘汰只弹出真正过期的条目，每条 O(log n)。
+    已应用命令按应用顺序保存在 OrderedDict 中；序号单调递增，
+    因此该顺序同时也是 sequence 顺序和时间顺序，从头部淘汰即可。
+
+    非线程安全：堆与 OrderedDict 的弹出循环在并发修改下会抛出 StopIteration /
+    KeyError。全部方法只能由 BridgeCore 的所有者线程（主线程 selector 循环，见
+    JetsonBridge.poll_command_housekeeping）调用；其他线程至多读取 len()。
+    """
+
+    APPLIED_RETENTION_SEC = 300.0
+    APPLIED_LIMIT = 256
+    RETIRED_SESSION_LIMIT = 64
+
+    def __init__(self):
+        self.pending = {}
+        self.applied = OrderedDict()
+        self.retired_sessions = OrderedDict()
+        self._by_sequence = []
+        self._by_last_seen = []
+        self._tiebreak = 0
+
+    def _push(self, heap, key, command_id, pending):
+        self._tiebreak += 1
+        heapq.heappush(heap, (key, self._tiebreak, command_id, pending))
+
+    def _compact(self):
+        # 惰性删除残留过多时（冲突、窗口重启）按当前 pending 重建两个堆
+        if len(self._by_sequence) + len(self._by_last_seen) <= 8 * len(self.pending) + 128:
+            return
+        self._by_sequence = []
+        self._by_last_seen = []
+        for command_id, pending in self.pending.items():
+            self._tiebreak += 1
+            self._by_sequence.append(
+                (pending.packet["sequence"], self._tiebreak, command_id, pending)
+            )
+            self._by_last_seen.append((pending.last_seen, self._tiebreak, command_id, pending))
+        heapq.heapify(self._by_sequence)
+        heapq.heapify(self._by_last_seen)
+
+    def add_pending(self, command_id: str, pending: PendingCommand):
+        self.pending[command_id] = pending
+        self._push(self._by_sequence, pending.packet["sequence"], command_id, pending)
+        self._push(self._by_last_seen, pending.last_seen, command_id, pending)
+        self._compact()
+
+    def touch(self, command_id: str, pending: PendingCommand, now_monotonic: float):
+        pending.last_seen = now_monotonic
+        self._push(self._by_last_seen, now_monotonic, command_id, pending)
+
+    def discard_pending(self, command_id: str):
+        self.pending.pop(command_id, None)
+
+    def evict_through_sequence(self, sequence: int) -> int:
+        """删除 sequence 不大于给定值的全部 pending，返回删除条数。"""
+        evicted = 0
+        heap = self._by_sequence
+        while heap and heap[0][0] <= sequence:
+            _, _, command_id, pending = heapq.heappop(heap)
+            if self.pending.get(command_id) is pending:
+                del self.pending[command_id]
+                evicted += 1
+        return evicted
+
+    def expire_pending(self, now_monotonic: float, max_idle_sec: float) -> int:
+        """删除 last_seen 早于 now - max_idle_sec 的 pending，返回删除条数。"""
+        evicted = 0
+        heap = self._by_last_seen
+        cutoff = now_monotonic - max_idle_sec
+        while heap and heap[0][0] < cutoff:
+            last_seen, _, command_id, pending = heapq.heappop(heap)
+            if self.pending.get(command_id) is pending and pending.last_seen == last_seen:
+                del self.pending[command_id]
+                evicted += 1
+        return evicted
+
+    def record_applied(self, command_id: str, now_monotonic: float):
+        self.applied[command_id] = now_monotonic
+        self.applied.move_to_end(command_id)
+        self.prune_applied(now_monotonic)
+
+    def prune_applied(self, now_monotonic: float):
+        applied = self.applied
+        while applied and (
+            len(applied) > self.APPLIED_LIMIT
+            or now_monotonic - next(iter(applied.values())) > self.APPLIED_RETENTION_SEC
+        ):
+            applied.popitem(last=False)
+
+    def retire_session(self, session_id: str):
+        # 只保留最近的退役会话；更早会话的包在 UDP 中早已不可能迟到到达。
+        self.retired_sessions[session_id] = None
+        self.retired_sessions.move_to_end(session_id)
+        while len(self.retired_sessions) > self.RETIRED_SESSION_LIMIT:
+            self.retired_sessions.popitem(last=False)
+
+    def reset(self):
+        """会话切换：清空 pending/applied，保留退役会话记录。"""
+        self.pending.clear()
+        self.applied.clear()
+        self._by_sequence = []
+        self._by_last_seen = []
+
+
+# ============================================================
+# 链路质量估计
+# ============================================================
+def _confirm_probability(repeat_total: int, loss: float, count: int) -> float:
+    """repeat_total 次独立重发中至少到达 count 个的概率。"""
+    delivered = 1.0 - loss
+    return sum(
+        math.comb(repeat_total, k) * delivered ** k * loss ** (repeat_total - k)
+        for k in range(count, repeat_total + 1)
+    )
+
+
+def adaptive_confirm_count(loss: float | None, repeat_total: int) -> int:
+    """按丢包估计选择确认门限，结果总在 [COMMAND_CONFIRM_MIN, COMMAND_CONFIRM_COUNT] 内。"""
+    if loss is None:
+        return COMMAND_CONFIRM_COUNT
+    if loss <= LINK_LOSS_CLEAN:
+        return COMMAND_CONFIRM_MIN
+    if repeat_total <= 0:
+        # 持续 hold 没有重发上限，门限总能达到
+        return COMMAND_CONFIRM_COUNT
+    for count in range(COMMAND_CONFIRM_COUNT, COMMAND_CONFIRM_MIN, -1):
+        if _confirm_probability(repeat_total, loss, count) >= COMMAND_CONFIRM_RELIABILITY:
+            return count
+    return COMMAND_CONFIRM_MIN
+
+
+def recommended_repeat_count(loss: float | None) -> int | None:
+    """COMMAND_CONFIRM_COUNT 以 COMMAND_CONFIRM_RELIABILITY 概率可达所需的最少重发次数。"""
+    if loss is None:
+        return None
+    low, high = _BACKEND_REPEAT_RANGE
+    for repeat_total in range(max(low, COMMAND_CONFIRM_COUNT), high + 1):
+        if (
+            _confirm_probability(repeat_total, loss, COMMAND_CONFIRM_COUNT)
+            >= COMMAND_CONFIRM_RELIABILITY
+        ):
+            return repeat_total
+    return high
+
+
+class LinkQualityEstimator:
+    """按会话从 repeat_index 缺口估计控制链路丢包率（UDP 线程私有）。
+
+    每个重发流（command_id，轨迹再按分片区分）记录最高 repeat_index 及其下
+    REORDER_BITS 位的到达位图：跳过的 index 计为丢失，乱序补到的再扣回；
+    超出位图窗口的跳跃视为流重启而非丢包。
+    有限重发流被更新的 sequence 取代且空闲超过确认窗口后，按 repeat_total
+    补记尾部丢失；当前流不结束，因此持续 hold 中断期间的缺口在恢复时计入。
+    窗口计数超过两倍 LINK_LOSS_WINDOW_PACKETS 时减半，估计偏向最近的数据报。
+    """
+
+    REORDER_BITS = 64
+    OPEN_LIMIT = 256
+    _REORDER_MASK = (1 << REORDER_BITS) - 1
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # 会话累计
+        self.expected = 0
+        self.lost = 0
+        self.sequence_gaps = 0
+        # 最近一个有限重发流的 repeat_total，即后端当前的 command_repeat_count
+        self.repeat_total = 0
+        self._window_expected = 0.0
+        self._window_lost = 0.0
+        # key → [最高 repeat_index, 到达位图, repeat_total, last_seen, sequence]
+        self._streams = OrderedDict()
+        self._highest_sequence = None
+        self._cached_loss = None
+        self._cached_counts = {}
+
+    def _account(self, expected: int, lost: int):
+        self.expected += expected
+        self.lost += lost
+        self._window_expected += expected
+        self._window_lost += lost
+        if self._window_expected > 2 * LINK_LOSS_WINDOW_PACKETS:
+            self._window_expected *= 0.5
+            self._window_lost *= 0.5
+
+    def _finalize(self, stream):
+        trailing = stream[2] - stream[0]
+        if trailing > 0:
+            self._account(trailing, trailing)
+
+    def observe(self, parsed: dict, repeat_index: int, now_monotonic: float):
+        """记录一个通过校验的数据报；parsed 中的 repeat_index 不被读取。"""
+        sequence = parsed["sequence"]
+        highest = self._highest_sequence
+        if highest is None or sequence > highest:
+            if highest is not None:
+                self.sequence_gaps += sequence - highest - 1
+            self._highest_sequence = highest = sequence
+
+        streams = self._streams
+        cutoff = now_monotonic - COMMAND_CONFIRM_WINDOW_SEC
+        while streams:
+            stream = next(iter(streams.values()))
+            if stream[3] >= cutoff or stream[4] >= highest:
+                break
+            streams.popitem(last=False)
+            self._finalize(stream)
+
+        key = (parsed["command_id"], parsed.get("chunk_index"))
+        stream = streams.get(key)
+        repeat_total = parsed["repeat_total"]
+        if stream is None:
+            leading = repeat_index - 1
+            mask = 1
+            if repeat_total <= 0 and leading >= self.REORDER_BITS:
+                # 中途接入持续 hold：之前的 index 不属于本次观测，迟到的也不计入
+                leading = 0
+                mask = self._REORDER_MASK
+            self._account(leading + 1, leading)
+            streams[key] = [repeat_index, mask, repeat_total, now_monotonic, sequence]
+            if repeat_total > 0:
+                self.repeat_total = repeat_total
+            if len(streams) > self.OPEN_LIMIT:
+                self._finalize(streams.popitem(last=False)[1])
+            return
+
+        stream[3] = now_monotonic
+        streams.move_to_end(key)
+        high = stream[0]
+        if repeat_index > high:
+            shift = repeat_index - high
+            stream[0] = repeat_index
+            if shift >= self.REORDER_BITS:
+                # 跳跃超出位图窗口：按流重启处理，不把缺口计为丢失；窗口内
+                # 迟到的旧 index 同样不再计入
+                self._account(1, 0)
+                stream[1] = self._REORDER_MASK
+                return
+            self._account(shift, shift - 1)
+            stream[1] = (stream[1] << shift | 1) & self._REORDER_MASK
+            return
+        offset = high - repeat_index
+        if offset >= self.REORDER_BITS or stream[1] >> offset & 1:
+            return
+        # 先前按缺口计为丢失的乱序包
+        stream[1] |= 1 << offset
+        self._account(0, -1)
+
+    @property
+    def loss(self) -> float | None:
+        """最近窗口内的丢包率估计（保留 3 位小数）；样本不足时为 None。"""
+        if self._window_expected < LINK_LOSS_MIN_SAMPLES:
+            return None
+        return round(self._window_lost / self._window_expected, 3)
+
+    def confirm_count(self, repeat_total: int) -> int:
+        """当前生效的确认门限；未启用 COMMAND_CONFIRM_ADAPTIVE 时恒为 COMMAND_CONFIRM_COUNT。"""
+        if not COMMAND_CONFIRM_ADAPTIVE:
+            return COMMAND_CONFIRM_COUNT
+        return self._counts(repeat_total)[0]
+
+    def _counts(self, repeat_total: int):
+        # 二项分布求和按（估计值, repeat_total）缓存，估计变化时整体失效
+        loss = self.loss
+        if loss != self._cached_loss:
+            self._cached_loss = loss
+            self._cached_counts = {}
+        counts = self._cached_counts.get(repeat_total)
+        if counts is None:
+            counts = (adaptive_confirm_count(loss, repeat_total), recommended_repeat_count(loss))
+            self._cached_counts[repeat_total] = counts
+        return counts
+
+    def report(self) -> dict:
+        """遥测 link 字段：丢包估计、当前确认门限与推荐的 command_repeat_count。"""
+        return {
+            "loss": self.loss,
+            "sequence_gaps": self.sequence_gaps,
+            "confirm_count": self.confirm_count(self.repeat_total),
+            "recommended_repeat_count": self._counts(self.repeat_total)[1],
+        }
+
+
+# ============================================================
+# 轨迹上传
+# ============================================================
+class TrajectoryAssembly:
+    """一条分片轨迹的重组状态（UDP 线程私有）。
+
+    同一 command_id 的分片必须携带一致的头部；每片在 required 个不同
+    repeat_index 且航点一致后确认（MAC 有效的分片 required=1）。
+    """
+
+    def __init__(self, packet: dict, now_monotonic: float, staged_at: float):
+        self.command_id = packet["command_id"]
+        self.sequence = packet["sequence"]
+        self.header = self.header_of(packet)
+        self.first_seen = now_monotonic
+        self.packet = packet
+        self.staged_at = staged_at
+        count = packet["chunk_count"]
+        self.chunks = [None] * count
+        self.repeats = [set() for _ in range(count)]
+        self.confirmed = [False] * count
+        self.confirmed_count = 0
+        self.datagrams = 0
+        # 全部分片都由 MAC 单包确认时按 auth 路径统计延迟
+        self.authenticated = True
+
+    @staticmethod
+    def header_of(packet: dict):
+        return (
+            packet["session_id"], packet["command_id"], packet["sequence"],
+            packet["drone_id"], packet["slot"], packet["chunk_count"],
+            packet["waypoint_count"],
+        )
+
+    def add(self, packet: dict, required: int) -> str:
+        """记录一个分片数据报，返回 conflict / duplicate / pending / complete。"""
+        if self.header_of(packet) != self.header:
+            return "conflict"
+        index = packet["chunk_index"]
+        waypoints = packet["waypoints"]
+        if self.chunks[index] is None:
+            self.chunks[index] = waypoints
+        elif self.chunks[index] != waypoints:
+            return "conflict"
+        repeats = self.repeats[index]
+        if packet["repeat_index"] in repeats:
+            return "duplicate"
+        repeats.add(packet["repeat_index"])
+        self.datagrams += 1
+        if not self.confirmed[index] and len(repeats) >= required:
+            self.confirmed[index] = True
+            self.confirmed_count += 1
+            if required > 1:
+                self.authenticated = False
+        return "complete" if self.confirmed_count == len(self.chunks) else "pending"
+
+    def waypoints(self) -> tuple:
+        """按 chunk_index 拼接全部航点；总数或时间顺序不符时抛出 ValueError。"""
+        waypoints = tuple(waypoint for chunk in self.chunks for waypoint in chunk)
+        expected = self.packet["waypoint_count"]
+        if len(waypoints) != expected:
+            raise ValueError(
+                f"chunks carry {len(waypoints)} waypoints, header says {expected}"
+            )
+        check_trajectory_timing(waypoints)
+        return waypoints
+
+
+class TrajectoryFollower:
+    """在 50Hz 心跳中本地逐点执行一条已重组的轨迹。
+
+    state 为 running / paused / done / cancelled / aborted。各方法显式传入
+    单调时刻，由 BridgeCore 在 setpoint_lock 内调用；遥测只读取属性。
+    """
+
+    def __init__(
+        self,
+        trajectory_id: str,
+        sequence: int,
+        waypoints,
+        start,
+        now_monotonic: float,
+        accept_radius: float = TRAJECTORY_ACCEPT_RADIUS_M,
+    ):
+        self.trajectory_id = trajectory_id
+        # 最近一次作用于本轨迹的命令序号（开始 / pause / resume），随 setpoint 发布
+        self.sequence = sequence
+        self.waypoints = tuple(waypoints)
+        self.accept_radius = accept_radius
+        self.state = "running"
+        self.index = 0
+        # 运行时间（暂停期间不累计），与航点 time_s 比较
+        self.elapsed = 0.0
+        self._last_step = now_monotonic
+        self._segment_start = tuple(start)
+        self._segment_start_elapsed = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("running", "paused")
+
+    @property
+    def progress(self) -> float:
+        """已到达航点的比例，done 时为 1.0。"""
+        if self.state == "done":
+            return 1.0
+        return self.index / len(self.waypoints)
+
+    def step(self, now_monotonic: float, vehicle=None):
+        """推进运行时间并返回本拍目标 NED 元组；非 running 时返回 None。
+
+        vehicle 为当前本地 NED，无效时传 None（此时无 time_s 的航点不推进）。
+        """
+        if self.state != "running":
+            return None
+        self.elapsed += max(0.0, now_monotonic - self._last_step)
+        self._last_step = now_monotonic
+        waypoints = self.waypoints
+        while self.index < len(waypoints):
+            waypoint = waypoints[self.index]
+            target = (waypoint.north, waypoint.east, waypoint.down)
+            if waypoint.time_s is not None:
+                if self.elapsed < waypoint.time_s:
+                    start = self._segment_start
+                    fraction = (self.elapsed - self._segment_start_elapsed) / (
+                        waypoint.time_s - self._segment_start_elapsed
+                    )
+                    return (
+                        start[0] + (target[0] - start[0]) * fraction,
+                        start[1] + (target[1] - start[1]) * fraction,
+                        start[2] + (target[2] - start[2]) * fraction,
+                    )
+                self._segment_start_elapsed = waypoint.time_s
+            elif vehicle is None or math.dist(vehicle, target) > self.accept_radius:
+                return target
+            else:
+                self._segment_start_elapsed = self.elapsed
+            self._segment_start = target
+            self.index += 1
+        self.state = "done"
+        return self._segment_start
+
+    def pause(self, now_monotonic: float, sequence: int):
+        if self.state == "running":
+            self.elapsed += max(0.0, now_monotonic - self._last_step)
+            self._last_step = now_monotonic
+            self.state = "paused"
+            self.sequence = sequence
+
+    def resume(self, now_monotonic: float, sequence: int):
+        if self.state == "paused":
+            self._last_step = now_monotonic
+            self.state = "running"
+            self.sequence = sequence
+
+    def cancel(self, state: str = "cancelled"):
+        if self.active:
+            self.state = state
+
+
+# ============================================================
+# UDP 控制入口（事件驱动，按唤醒批量取包）
+# ============================================================
+ReceivedDatagram = namedtuple(
+    "ReceivedDatagram", ("data", "addr", "rx_monotonic", "kernel_rx_unix", "kernel_delay")
+)
+
+
+def drain_udp_socket(
+    sock,
+    bufsize: int,
+    max_datagrams: int,
+    clock=time.monotonic,
+    kernel_timestamps: bool = False,
+    wall_clock=time.time,
+):
+    """非阻塞取出 socket 中已排队的数据报，最多 max_datagrams 个。
+
+    返回 ``(batch, error)``：batch 为 ReceivedDatagram 列表；
+    error 为遇到的非 EAGAIN 类 OSError（取包随即停止），否则为 None。
+    kernel_timestamps=True 时 socket 须已开启 SO_TIMESTAMPNS：kernel_rx_unix
+    为内核收包墙钟时间，kernel_delay 为内核收包 → 本次读取的秒数；
+    未携带时间戳的数据报两者均为 None。
+    """
+    batch = []
+    ancbufsize = socket.CMSG_SPACE(_KERNEL_TIMESPEC.size) if kernel_timestamps else 0
+    while len(batch) < max_datagrams:
+        try:
+            if kernel_timestamps:
+                data, ancdata, _, addr = sock.recvmsg(bufsize, ancbufsize)
+            else:
+                data, addr = sock.recvfrom(bufsize)
+        except BlockingIOError:
+            break
+        except OSError as exc:
+            return batch, exc
+        rx_monotonic = clock()
+        kernel_rx_unix = kernel_delay = None
+        if kernel_timestamps:
+            for level, kind, cdata in ancdata:
+                if (
+                    level == socket.SOL_SOCKET
+                    and kind == _SO_TIMESTAMPNS
+                    and len(cdata) >= _KERNEL_TIMESPEC.size
+                ):
+                    sec, nsec = _KERNEL_TIMESPEC.unpack_from(cdata)
+                    kernel_rx_unix = sec + nsec * 1e-9
+                    # 墙钟可能被 NTP 回拨，负值按 0 计
+                    kernel_delay = max(0.0, wall_clock() - kernel_rx_unix)
+                    break
+        batch.append(ReceivedDatagram(data, addr, rx_monotonic, kernel_rx_unix, kernel_delay))
+    return batch, None
+
+
+class IngressBatchStats:
+    """每次唤醒的排队深度 / 批大小统计。
+
+    一次唤醒取出的包数即唤醒时内核队列中的控制包数；达到
+    CONTROL_INGRESS_MAX_BATCH 的唤醒计入 capped，表示队列比单批更深。
+    """
+
+    BUCKET_LIMITS = (1, 2, 4, 8, 16, 32, 64)
+
+    def __init__(self):
+        self.wakeups = 0
+        self.empty_wakeups = 0
+        self.datagrams = 0
+        self.capped = 0
+        self.last_batch = 0
+        self.max_batch = 0
+        # 最后一个桶收纳超过 64 的批次
+        self.histogram = [0] * (len(self.BUCKET_LIMITS) + 1)
+
+    def record(self, batch_size: int, capped: bool = False):
+        self.wakeups += 1
+        self.last_batch = batch_size
+        if batch_size == 0:
+            self.empty_wakeups += 1
+            return
+        self.datagrams += batch_size
+        self.max_batch = max(self.max_batch, batch_size)
+        if capped:
+            self.capped += 1
+        for index, limit in enumerate(self.BUCKET_LIMITS):
+            if batch_size <= limit:
+                self.histogram[index] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def snapshot(self) -> dict:
+        labels = [f"<={limit}" for limit in self.BUCKET_LIMITS]
+        labels.append(f">{self.BUCKET_LIMITS[-1]}")
+        return {
+            "wakeups": self.wakeups,
+            "empty_wakeups": self.empty_wakeups,
+            "datagrams": self.datagrams,
+            "capped": self.capped,
+            "last_batch": self.last_batch,
+            "max_batch": self.max_batch,
+            "mean_batch": (
+                self.datagrams / (self.wakeups - self.empty_wakeups)
+                if self.wakeups > self.empty_wakeups else 0.0
+            ),
+            "histogram": dict(zip(labels, self.histogram)),
+        }
+
+
+_JSON_MODE_VALUE = re.compile(rb'"mode"\s*:\s*"([a-z]+)"')
+_CONTROL_BINARY_MODE_HOLD = CONTROL_BINARY_MODES.index("hold")
+
+
+class ControlIngressQueue:
+    """控制数据报的优先级入口（UDP 线程私有）。
+
+    admit() 不解析 JSON，按 split_control_datagram 的标识与 mode 字段分三级：
+      0 摘要缓存未见过的非 hold 命令（新的 move / trajectory / pause / resume）；
+      1 已见过命令的重发、新的 hold、无法拆分的数据报；
+      2 已见过的 hold（持续心跳的重发）。
+    同级保持到达顺序。提前处理更高级的包不会让旧命令生效：sequence 排序仍由
+    确认门负责。run() 在每个心跳周期内最多花 budget_sec 处理，用尽后 2 级
+    丢弃、其余留到下一周期；过载时的去重规则见 CONTROL_INGRESS_BUDGET_SEC。
+    """
+
+    PRIORITY_NAMES = ("command", "repeat", "hold")
+    SHED_REASONS = ("hold", "duplicate", "budget", "overflow")
+
+    def __init__(
+        self,
+        cache: ControlDigestCache,
+        budget_sec: float = CONTROL_INGRESS_BUDGET_SEC,
+        period_sec: float = OFFBOARD_INTERVAL,
+        backlog_limit: int = CONTROL_INGRESS_BACKLOG,
+        clock=time.monotonic,
+    ):
+        self.cache = cache
+        self.budget_sec = budget_sec
+        self.period_sec = period_sec
+        self.backlog_limit = backlog_limit
+        self.clock = clock
+        # 条目为 [ReceivedDatagram, split, 是否仍在队列中]
+        self._queues = tuple(deque() for _ in self.PRIORITY_NAMES)
+        # 仅在过载期间维护：hold 流标识 → 条目，(标识, repeat_index)
+        self._holds = {}
+        self._seen = set()
+        self._period_start = -math.inf
+        self._exhausted = False
+        self.spent = 0.0
+        self.admitted = [0] * len(self.PRIORITY_NAMES)
+        self.shed = dict.fromkeys(self.SHED_REASONS, 0)
+        self.exhausted_periods = 0
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues)
+
+    def classify(self, data: bytes):
+        """返回 (优先级, split)；split 供 handle_datagram 复用。"""
+        split = split_control_datagram(data)
+        if split is None:
+            return 1, None
+        if data[:4] == CONTROL_BINARY_MAGIC:
+            hold = data[6] == _CONTROL_BINARY_MODE_HOLD
+        else:
+            match = _JSON_MODE_VALUE.search(split[0])
+            hold = match is not None and match.group(1) == b"hold"
+        known = split[0] in self.cache
+        if hold:
+            return (2 if known else 1), split
+        return (1 if known else 0), split
+
+    def _overloaded(self, capped: bool) -> bool:
+        return capped or self._exhausted or any(self._queues)
+
+    def admit(self, batch, capped: bool = False):
+        """按优先级入队一批数据报；过载时就地丢弃重复包与过时的 hold。"""
+        self._roll_period(self.clock())
+        overloaded = self._overloaded(capped)
+        queues = self._queues
+        holds = self._holds
+        seen = self._seen
+        shed = self.shed
+        for datagram in batch:
+            priority, split = self.classify(datagram.data)
+            if overloaded and split is not None:
+                identity, repeat_index, _ = split
+                if (identity, repeat_index) in seen:
+                    shed["duplicate"] += 1
+                    continue
+                seen.add((identity, repeat_index))
+                if priority == 2:
+                    queued = holds.get(identity)
+                    if queued is not None and queued[2]:
+                        # 同一 hold 流只需最新一包：原位替换，保持队列位置
+                        shed["hold"] += 1
+                        if repeat_index > queued[1][1]:
+                            queued[0] = datagram
+                            queued[1] = split
+                        continue
+            item = [datagram, split, True]
+            if overloaded and priority == 2:
+                holds[split[0]] = item
+            queues[priority].append(item)
+            self.admitted[priority] += 1
+        if len(seen) > 4 * self.backlog_limit:
+            seen.clear()
+
+        excess = len(self) - self.backlog_limit
+        for queue in reversed(queues):
+            while excess > 0 and queue:
+                queue.pop()[2] = False
+                shed["overflow"] += 1
+                excess -= 1
+
+    def _roll_period(self, now: float):
+        # 与 next_deadline 使用同一表达式，到期时刻调用必然开始新周期
+        if now >= self._period_start + self.period_sec:
+            self._period_start = now
+            self.spent = 0.0
+            self._exhausted = False
+
+    def run(self, handle) -> int:
+        """按优先级调用 handle(*datagram, split)，直到队列清空或本周期预算用尽。"""
+        clock = self.clock
+        now = clock()
+        self._roll_period(now)
+        queues = self._queues
+        budget = self.budget_sec
+        processed = 0
+        while not self._exhausted:
+            for queue in queues:
+                if queue:
+                    item = queue.popleft()
+                    break
+            else:
+                break
+            item[2] = False
+            handle(*item[0], item[1])
+            processed += 1
+            end = clock()
+            self.spent += end - now
+            now = end
+            if budget > 0 and self.spent >= budget:
+                self._exhausted = True
+                self.exhausted_periods += 1
+
+        if self._exhausted:
+            low = queues[-1]
+            self.shed["budget"] += len(low)
+            for item in low:
+                item[2] = False
+            low.clear()
+        if not any(queues):
+            self._holds.clear()
+            self._seen.clear()
+        return processed
+
+    def next_deadline(self) -> float:
+        """有积压时返回下一心跳周期的开始时刻，否则 inf。"""
+        if not any(self._queues):
+            return math.inf
+        return self._period_start + self.period_sec
+
+
+# ============================================================
+# 本地指标导出（Prometheus 文本格式）
+# ============================================================
+def _prometheus_value(value) -> str:
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+_PROMETHEUS_LABEL_TEXT = {}
+
+
+def _prometheus_labels(labels: dict) -> str:
+    # 标签组合（slot/topic/hop/…）是固定的有限集合，转义结果缓存复用
+    if not labels:
+        return ""
+    key = tuple(labels.items())
+    text = _PROMETHEUS_LABEL_TEXT.get(key)
+    if text is None:
+        parts = []
+        for name, value in key:
+            escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+            parts.append(f'{name}="{escaped}"')
+        text = _PROMETHEUS_LABEL_TEXT[key] = "{" + ",".join(parts) + "}"
+    return text
+
+
+_PROMETHEUS_LE_TEXT = {}
+
+
+class PrometheusText:
+    """按 Prometheus 文本格式 0.0.4 累积指标行；同名指标的 HELP/TYPE 只输出一次。
+
+    同一指标的全部样本须连续写入（按指标逐个遍历各 slot）。
+    """
+
+    def __init__(self):
+        self._lines = []
+        self._declared = set()
+
+    def _declare(self, name: str, kind: str, help_text: str):
+        if name not in self._declared:
+            self._declared.add(name)
+            self._lines.append(f"# HELP {name} {help_text}")
+            self._lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, kind: str, help_text: str, value, labels: dict | None = None):
+        self._declare(name, kind, help_text)
+        self._lines.append(f"{name}{_prometheus_labels(labels)} {_prometheus_value(value)}")
+
+    def histogram(self, name: str, help_text: str, bounds, counts, total, labels: dict | None = None):
+        """bounds 为各桶上界，counts 比 bounds 多一个溢出桶（非累计）。"""
+        self._declare(name, "histogram", help_text)
+        label_text = _prometheus_labels(labels)
+        # 桶行只在标签末尾追加 le，前缀与各上界文本只拼接一次
+        bucket_prefix = f"{name}_bucket{label_text[:-1]}," if label_text else f"{name}_bucket{{"
+        le_texts = _PROMETHEUS_LE_TEXT.get(bounds)
+        if le_texts is None:
+            le_texts = _PROMETHEUS_LE_TEXT[bounds] = [
+                f'le="{_prometheus_value(bound)}"}} ' for bound in bounds
+            ]
+        counts = list(counts)  # 复制一次，其他线程继续写入也不影响本次输出的一致性
+        lines = self._lines
+        cumulative = 0
+        for le_text, bucket_count in zip(le_texts, counts):
+            cumulative += bucket_count
+            lines.append(f"{bucket_prefix}{le_text}{cumulative}")
+        cumulative += sum(counts[len(bounds):])
+        lines.append(f'{bucket_prefix}le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{label_text} {_prometheus_value(total)}")
+        lines.append(f"{name}_count{label_text} {cumulative}")
+
+    def latency(self, name: str, help_text: str, histogram, labels: dict | None = None):
+        # 多数逐跳直方图只随命令（≤5Hz）变化：样本数未变时直接复用上次渲染的行
+        label_text = _prometheus_labels(labels)
+        cache = histogram.prometheus_cache
+        if cache is not None and cache[0] == (name, label_text, histogram.count):
+            self._declare(name, "histogram", help_text)
+            self._lines.extend(cache[1])
+            return
+        start = len(self._lines)
+        count = histogram.count
+        self.histogram(
+            name, help_text, histogram.bounds,
+            histogram.counts, histogram.total, labels,
+        )
+        # HELP/TYPE 可能刚在本次写入，缓存只取样本行
+        lines = [line for line in self._lines[start:] if not line.startswith("#")]
+        histogram.prometheus_cache = ((name, label_text, count), lines)
+
+    def render(self) -> bytes:
+        return ("\n".join(self._lines) + "\n").encode("utf-8")
+
+
+class CounterRates:
+    """由单调递增计数推算速率（次/秒），统计窗口不短于 min_window_sec。"""
+
+    def __init__(self, min_window_sec: float = METRICS_RATE_WINDOW_SEC):
+        self._min_window_sec = min_window_sec
+        self._last_time = None
+        self._last_counts = {}
+        self.rates = {}
+
+    def update(self, now: float, counts: dict) -> dict:
+        if self._last_time is None:
+            self._last_time = now
+            self._last_counts = dict(counts)
+            return self.rates
+        elapsed = now - self._last_time
+        if elapsed >= self._min_window_sec:
+            self.rates = {
+                name: (count - self._last_counts.get(name, 0)) / elapsed
+                for name, count in counts.items()
+            }
+            self._last_time = now
+            self._last_counts = dict(counts)
+        return self.rates
+
+
+def render_metrics(bridges, now: float) -> bytes:
+    """把各 slot 的 collect_metrics 与进程级指标渲染成一次抓取的响应体。"""
+    out = PrometheusText()
+    out.sample(
+        "process_cpu_seconds_total", "counter",
+        "Total user and system CPU time spent in seconds.", time.process_time(),
+    )
+    rss_bytes = read_process_rss_bytes()
+    if rss_bytes is not None:
+        out.sample(
+            "process_resident_memory_bytes", "gauge",
+            "Resident memory size in bytes.", rss_bytes,
+        )
+    samples = {}
+    for bridge in bridges:
+        for metric in bridge.collect_metrics(now):
+            samples.setdefault(metric[0], []).append(metric)
+    # 同名指标在各 slot 间连续输出
+    for metrics in samples.values():
+        for name, kind, help_text, value, labels in metrics:
+            if kind == "histogram":
+                out.latency(name, help_text, value, labels)
+            else:
+                out.sample(name, kind, help_text, value, labels)
+    return out.render()
+
+
+class MetricsServer:
+    """挂在主循环 selector 上的最小 HTTP/1.0 服务，只响应 GET /metrics。
+
+    监听与客户端 socket 均为非阻塞；请求头收齐后写回响应，发送缓冲满时保留余量并
+    改为等待 EVENT_WRITE，写完即关闭连接。读写总时长超过 CLIENT_TIMEOUT_SEC 的客户端
+    由 expire_clients 断开。
+    render 在主线程调用，返回响应体字节串。
+    """
+
+    MAX_CLIENTS = 8
+    MAX_REQUEST_BYTES = 8192
+    CLIENT_TIMEOUT_SEC = 2.0
+
+    def __init__(self, host: str, port: int, render, selector, clock=time.monotonic):
+        self._render = render
+        self._selector = selector
+        self._clock = clock
+        self._clients = {}
+        self.requests = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.sock.bind((host, port))
+            self.sock.listen(self.MAX_CLIENTS)
+        except OSError:
+            self.sock.close()
+            raise
+        self.sock.setblocking(False)
+        selector.register(self.sock, selectors.EVENT_READ, self._accept)
+
+    @property
+    def address(self):
+        return self.sock.getsockname()
+
+    def _accept(self):
+        try:
+            client, _ = self.sock.accept()
+        except (BlockingIOError, OSError):
+            return
+        if len(self._clients) >= self.MAX_CLIENTS:
+            client.close()
+            return
+        client.setblocking(False)
+        self._clients[client] = [bytearray(), self._clock()]
+        self._selector.register(
+            client, selectors.EVENT_READ, lambda: self._read(client)
+        )
+
+    def _read(self, client):
+        state = self._clients.get(client)
+        if state is None:
+            return
+        try:
+            chunk = client.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._close(client)
+            return
+        buffer = state[0]
+        buffer += chunk
+        if chunk and b"\r\n\r\n" not in buffer and len(buffer) < self.MAX_REQUEST_BYTES:
+            return
+        self._respond(client, bytes(buffer))
+
+    def _respond(self, client, request: bytes):
+        request_line = request.split(b"\r\n", 1)[0].split()
+        if len(request_line) >= 2 and request_line[0] == b"GET" and (
+            request_line[1].split(b"?", 1)[0] in (b"/metrics", b"/")
+        ):
+            self.requests += 1
+            status, content_type = b"200 OK", b"text/plain; version=0.0.4; charset=utf-8"
+            body = self._render()
+        else:
+            status, content_type, body = b"404 Not Found", b"text/plain", b"not found\n"
+        response = (
+            b"HTTP/1.0 " + status + b"\r\nContent-Type: " + content_type
+            + b"\r\nContent-Length: " + str(len(body)).encode("ascii")
+            + b"\r\nConnection: close\r\n\r\n" + body
+        )
+        state = self._clients.get(client)
+        if state is None:
+            client.close()
+            return
+        state[0] = memoryview(response)
+        if self._write(client):
+            self._selector.modify(
+                client, selectors.EVENT_WRITE, lambda: self._write(client)
+            )
+
+    def _write(self, client) -> bool:
+        """尽量发送剩余响应；仍有余量时返回 True，否则关闭连接并返回 False。"""
+        state = self._clients.get(client)
+        if state is None:
+            return False
+        pending = state[0]
+        try:
+            pending = pending[client.send(pending):]
+        except BlockingIOError:
+            return True
+        except OSError:
+            pending = b""
+        if pending:
+            state[0] = pending
+            return True
+        self._close(client)
+        return False
+
+    def _close(self, client):
+        if self._clients.pop(client, None) is not None:
+            try:
+                self._selector.unregister(client)
+            except (KeyError, ValueError):
+                pass
+        client.close()
+
+    def expire_clients(self, now: float):
+        for client, (_, accepted_at) in list(self._clients.items()):
+            if now - accepted_at > self.CLIENT_TIMEOUT_SEC:
+                self._close(client)
+
+    def close(self):
+        for client in list(self._clients):
+            self._close(client)
+        try:
+            self._selector.unregister(self.sock)
+        except (KeyError, ValueError):
+            pass
+        self.sock.close()
+
+
+# ============================================================
+# 飞行记录器（mmap 环形文件）
+# ============================================================
+# 文件布局（小端）：
+#   文件头 4096B：magic "UE5FRING" | version u32 | block_size u32 | block_count u32 | slot u32
+#   其后 block_count 个块。块头 16B：block_seq u64（0 表示从未写入）+ 保留；
+#   块内紧凑排列记录，记录不跨块，未用部分为 0。
+#   记录头 24B：size u16（含记录头）| kind u8 | 保留 u8 | record_seq u32 |
+#   monotonic_ns i64 | stamp_us i64，随后为 kind 对应的定长负载，部分 kind 再接变长字节。
+# size 最后写入：进程在写一条记录的中途崩溃时该记录 size 仍为 0，读取端视为块尾。
+# 每个块先整体清零，再以一条 clock 记录开头（墙钟 + pid），因此环形覆盖掉
+# 开头之后每个块仍能独立换算墙钟时间。重新打开同一文件时从最大 block_seq
+# 之后继续写，上一次运行的记录保留到被覆盖为止。
+FLIGHT_RECORDER_MAGIC = b"UE5FRING"
+FLIGHT_RECORDER_VERSION = 1
+_FLIGHT_FILE_HEADER = struct.Struct("<8sIIII")
+_FLIGHT_FILE_HEADER_BYTES = 4096
+_FLIGHT_BLOCK_HEADER = struct.Struct("<Q8x")
+_FLIGHT_RECORD_HEADER = struct.Struct("<HBxIqq")
+_FLIGHT_RECORD_SIZE = struct.Struct("<H")
+
+# kind -> (名称, 负载结构, ((字段名, 元素个数), ...), 变长尾部字段名或 None)
+# stamp_us：clock/control_datagram 为 Unix 微秒（数据报优先取内核收包时间，
+# 无则为 0），PX4 样本为消息 timestamp，setpoint_publish / vehicle_command 为
+# ROS 时钟微秒，command_applied 为 0。
+FLIGHT_RECORD_LAYOUTS = {
+    1: ("clock", struct.Struct("<dII"),
+        (("unix_time", 1), ("pid", 1), ("slot", 1)), None),
+    2: ("control_datagram", struct.Struct("<4sH"),
+        (("ip", 1), ("port", 1)), "data"),
+    3: ("odometry", struct.Struct("<Q3f4f3f3f"),
+        (("timestamp_sample", 1), ("position", 3), ("q", 4), ("velocity", 3),
+         ("angular_velocity", 3)), None),
+    4: ("status", struct.Struct("<BB"),
+        (("arming_state", 1), ("nav_state", 1)), None),
+    5: ("local_position", struct.Struct("<6f??"),
+        (("position", 3), ("velocity", 3), ("xy_valid", 1), ("z_valid", 1)), None),
+    6: ("global_position", struct.Struct("<ddf?"),
+        (("lat", 1), ("lon", 1), ("alt", 1), ("lat_lon_valid", 1)), None),
+    7: ("battery", struct.Struct("<ff"),
+        (("voltage_v", 1), ("remaining", 1)), None),
+    8: ("command_ack", struct.Struct("<IBBiBH?"),
+        (("command", 1), ("result", 1), ("result_param1", 1), ("result_param2", 1),
+         ("target_system", 1), ("target_component", 1), ("from_external", 1)), None),
+    9: ("setpoint_publish", struct.Struct("<QB3f"),
+        (("sequence", 1), ("mode", 1), ("position", 3)), None),
+    10: ("command_applied", struct.Struct("<QB3fBB"),
+         (("sequence", 1), ("mode", 1), ("position", 3), ("confirmed_packets", 1),
+          ("authenticated", 1)), "command_id"),
+    11: ("vehicle_command", struct.Struct("<Iff"),
+         (("command", 1), ("param1", 1), ("param2", 1)), None),
+}
+_FLIGHT_KIND = {name: kind for kind, (name, _, _, _) in FLIGHT_RECORD_LAYOUTS.items()}
+# setpoint 还可能处于本地轨迹执行中，编码追加在控制模式之后
+_FLIGHT_MODES = CONTROL_BINARY_MODES + ("trajectory",)
+_FLIGHT_MODE_CODES = {mode: code for code, mode in enumerate(_FLIGHT_MODES)}
+
+FlightRecord = namedtuple(
+    "FlightRecord", ("kind", "record_seq", "monotonic_ns", "stamp_us", "fields")
+)
+
+
+class FlightRecorder:
+    """按块组织的 mmap 环形记录器。
+
+    record 由 ROS 回调线程与 UDP 主线程并发调用；锁内只有两三次 pack_into
+    与一次切片拷贝，每条记录为微秒级，不做任何系统调用（换块时清零 64KB）。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size_bytes: int,
+        slot: int,
+        block_bytes: int = FLIGHT_RECORDER_BLOCK_BYTES,
+        clock_ns=time.monotonic_ns,
+        wall_clock=time.time,
+    ):
+        self.path = path
+        self.slot = slot
+        self._block_bytes = block_bytes
+        self._block_count = max(2, (size_bytes - _FLIGHT_FILE_HEADER_BYTES) // block_bytes)
+        self._clock_ns = clock_ns
+        self._wall_clock = wall_clock
+        self._lock = threading.Lock()
+        self._zero_block = bytes(block_bytes)
+        self.records = 0
+        self.dropped = 0
+        self.blocks = 0
+
+        total = _FLIGHT_FILE_HEADER_BYTES + self._block_count * block_bytes
+        expected = _FLIGHT_FILE_HEADER.pack(
+            FLIGHT_RECORDER_MAGIC, FLIGHT_RECORDER_VERSION, block_bytes, self._block_count, slot
+        )
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            existing = os.pread(fd, _FLIGHT_FILE_HEADER.size, 0)
+            reuse = existing == expected and os.fstat(fd).st_size == total
+            if not reuse:
+                os.ftruncate(fd, total)
+            self._mm = mmap.mmap(fd, total)
+        finally:
+            os.close(fd)
+
+        mm = self._mm
+        self._block_seq = 0
+        if reuse:
+            for index in range(self._block_count):
+                (block_seq,) = _FLIGHT_BLOCK_HEADER.unpack_from(mm, self._block_start(index))
+                self._block_seq = max(self._block_seq, block_seq)
+        else:
+            # 几何参数变化或新文件：旧块头全部作废
+            for index in range(self._block_count):
+                _FLIGHT_BLOCK_HEADER.pack_into(mm, self._block_start(index), 0)
+            mm[:_FLIGHT_FILE_HEADER.size] = expected
+        with self._lock:
+            self._start_block()
+
+    def _block_start(self, index: int) -> int:
+        return _FLIGHT_FILE_HEADER_BYTES + index * self._block_bytes
+
+    def _start_block(self):
+        self._block_seq += 1
+        self.blocks += 1
+        start = self._block_start((self._block_seq - 1) % self._block_count)
+        mm = self._mm
+        mm[start:start + self._block_bytes] = self._zero_block
+        _FLIGHT_BLOCK_HEADER.pack_into(mm, start, self._block_seq)
+        self._pos = start + _FLIGHT_BLOCK_HEADER.size
+        self._block_end = start + self._block_bytes
+        wall = self._wall_clock()
+        self._write(
+            1, FLIGHT_RECORD_LAYOUTS[1][1], (wall, os.getpid(), self.slot),
+            self._clock_ns(), int(wall * 1e6), b"",
+        )
+
+    def _write(self, kind, layout, values, monotonic_ns, stamp_us, tail):
+        # 调用方持锁
+        size = _FLIGHT_RECORD_HEADER.size + layout.size + len(tail)
+        pos = self._pos
+        if pos + size > self._block_end:
+            self._start_block()
+            pos = self._pos
+        mm = self._mm
+        self.records += 1
+        body = pos + _FLIGHT_RECORD_HEADER.size
+        _FLIGHT_RECORD_HEADER.pack_into(
+            mm, pos, 0, kind, self.records & 0xFFFFFFFF, monotonic_ns, stamp_us
+        )
+        layout.pack_into(mm, body, *values)
+        if tail:
+            mm[body + layout.size:pos + size] = tail
+        _FLIGHT_RECORD_SIZE.pack_into(mm, pos, size)
+        self._pos = pos + size
+
+    def record(self, kind: int, values, stamp_us: int = 0, monotonic_ns: int | None = None,
+               tail: bytes = b""):
+        layout = FLIGHT_RECORD_LAYOUTS[kind][1]
+        if monotonic_ns is None:
+            monotonic_ns = self._clock_ns()
+        max_size = self._block_bytes - _FLIGHT_BLOCK_HEADER.size - 64
+        if _FLIGHT_RECORD_HEADER.size + layout.size + len(tail) > max_size:
+            self.dropped += 1
+            return
+        with self._lock:
+            if self._mm is None:
+                return
+            try:
+                self._write(kind, layout, values, monotonic_ns, stamp_us, tail)
+            except struct.error:
+                # size 尚未写入，半条记录对读取端不可见
+                self.dropped += 1
+
+    # ---- 按消息类型的便捷入口 ----
+    def record_datagram(self, data: bytes, addr, rx_monotonic: float,
+                        kernel_rx_unix: float | None = None):
+        try:
+            ip = socket.inet_aton(addr[0])
+        except OSError:
+            ip = bytes(4)
+        self.record(
+            2, (ip, addr[1]),
+            int(kernel_rx_unix * 1e6) if kernel_rx_unix is not None else 0,
+            int(rx_monotonic * 1e9), data,
+        )
+
+    def record_odometry(self, msg):
+        self.record(3, (
+            int(msg.timestamp_sample), *msg.position, *msg.q, *msg.velocity,
+            *msg.angular_velocity,
+        ), int(msg.timestamp))
+
+    def record_status(self, msg):
+        self.record(4, (int(msg.arming_state), int(msg.nav_state)), int(msg.timestamp))
+
+    def record_local_position(self, msg):
+        self.record(5, (
+            msg.x, msg.y, msg.z, msg.vx, msg.vy, msg.vz,
+            bool(msg.xy_valid), bool(msg.z_valid),
+        ), int(msg.timestamp))
+
+    def record_global_position(self, msg):
+        self.record(
+            6, (msg.lat, msg.lon, msg.alt, bool(msg.lat_lon_valid)), int(msg.timestamp)
+        )
+
+    def record_battery(self, msg):
+        self.record(
+            7, (getattr(msg, "voltage_v", math.nan), msg.remaining), int(msg.timestamp)
+        )
+
+    def record_command_ack(self, msg):
+        self.record(8, (
+            int(msg.command), int(msg.result), int(msg.result_param1),
+            int(msg.result_param2), int(msg.target_system), int(msg.target_component),
+            bool(msg.from_external),
+        ), int(msg.timestamp))
+
+    def record_setpoint_publish(self, sequence: int, mode: str, position, stamp_us: int):
+        self.record(9, (
+            sequence, _FLIGHT_MODE_CODES.get(mode, 255), position[0], position[1], position[2]
+        ), stamp_us)
+
+    def record_command_applied(self, parsed: dict, confirmed_packets: int, authenticated: bool):
+        self.record(10, (
+            parsed["sequence"], _FLIGHT_MODE_CODES.get(parsed["mode"], 255),
+            parsed["x"], parsed["y"], parsed["z"], min(confirmed_packets, 255), authenticated,
+        ), tail=parsed["command_id"].encode("utf-8"))
+
+    def record_vehicle_command(self, command: int, param1: float, param2: float, stamp_us: int):
+        self.record(11, (command, param1, param2), stamp_us)
+
+    def close(self):
+        with self._lock:
+            mm, self._mm = self._mm, None
+        if mm is not None:
+            mm.flush()
+            mm.close()
+
+
+def _decode_flight_fields(kind: int, payload: bytes) -> tuple:
+    layout = FLIGHT_RECORD_LAYOUTS.get(kind)
+    if layout is None:
+        return f"unknown_{kind}", {"payload_hex": payload.hex()}
+    name, fixed, spec, tail_name = layout
+    values = fixed.unpack_from(payload)
+    fields = {}
+    index = 0
+    for field, count in spec:
+        fields[field] = values[index] if count == 1 else list(values[index:index + count])
+        index += count
+    if name == "control_datagram":
+        fields["ip"] = socket.inet_ntoa(fields["ip"])
+    if "mode" in fields:
+        mode = fields["mode"]
+        fields["mode"] = _FLIGHT_MODES[mode] if mode < len(_FLIGHT_MODES) else mode
+    if tail_name is not None:
+        tail = payload[fixed.size:]
+        fields[tail_name] = tail.decode("utf-8") if tail_name == "command_id" else tail
+    return name, fields
+
+
+def read_flight_records(path: str) -> list:
+    """按写入顺序返回记录文件中的全部完整记录（FlightRecord 列表）。"""
+    with open(path, "rb") as recording:
+        data = recording.read()
+    if len(data) < _FLIGHT_FILE_HEADER_BYTES:
+        raise ValueError(f"{path}: file too short for a flight recorder header")
+    magic, version, block_bytes, block_count, _ = _FLIGHT_FILE_HEADER.unpack_from(data)
+    if magic != FLIGHT_RECORDER_MAGIC or version != FLIGHT_RECORDER_VERSION:
+        raise ValueError(f"{path}: not a flight recorder file (magic={magic!r} version={version})")
+    if len(data) < _FLIGHT_FILE_HEADER_BYTES + block_bytes * block_count:
+        raise ValueError(f"{path}: truncated flight recorder file")
+
+    blocks = []
+    for index in range(block_count):
+        start = _FLIGHT_FILE_HEADER_BYTES + index * block_bytes
+        (block_seq,) = _FLIGHT_BLOCK_HEADER.unpack_from(data, start)
+        if block_seq:
+            blocks.append((block_seq, start))
+    blocks.sort()
+
+    records = []
+    header_size = _FLIGHT_RECORD_HEADER.size
+    for _, start in blocks:
+        pos = start + _FLIGHT_BLOCK_HEADER.size
+        end = start + block_bytes
+        while pos + header_size <= end:
+            size, kind, record_seq, monotonic_ns, stamp_us = (
+                _FLIGHT_RECORD_HEADER.unpack_from(data, pos)
+            )
+            if size < header_size or pos + size > end:
+                break
+            name, fields = _decode_flight_fields(kind, data[pos + header_size:pos + size])
+            records.append(FlightRecord(name, record_seq, monotonic_ns, stamp_us, fields))
+            pos += size
+    return records
+
+
+def flight_record_unix_times(records) -> list:
+    """用每块开头的 clock 记录把 monotonic_ns 换算为 Unix 秒，返回 (unix_time, record) 列表。
+
+    首个 clock 之前的记录无法换算，直接跳过。
+    """
+    timed = []
+    anchor = None
+    for record in records:
+        if record.kind == "clock":
+            anchor = (record.fields["unix_time"], record.monotonic_ns)
+        if anchor is not None:
+            timed.append((anchor[0] + (record.monotonic_ns - anchor[1]) / 1e9, record))
+    return timed
+
+
+# ============================================================
+# ROS2 桥接节点
+# ============================================================
+# 不可变 setpoint：写入方整体替换 BridgeCore.last_setpoint 引用，
+# 50Hz 心跳只读取引用，读到的永远是一组完整一致的值。
+Setpoint = namedtuple("Setpoint", ("x", "y", "z", "mode", "sequence"))
+
+# 平滑模式下心跳线程私有的运动状态，三个字段均为 NED (x, y, z) 元组。
+MotionState = namedtuple("MotionState", ("position", "velocity", "acceleration"))
+
+_ZERO_VECTOR = (0.0, 0.0, 0.0)
+
+
+def step_setpoint_motion(state, target, dt, max_velocity, max_acceleration):
+    """朝 target 生成下一个中间 setpoint，返回新的 MotionState（纯函数）。
+
+    沿当前位置到目标的直线做梯形速度规划：期望速度取 max_velocity 与刹车
+    曲线 sqrt(2·a·d) 的较小者，每步速度变化不超过 max_acceleration·dt。
+    返回的 velocity / acceleration 直接作为 TrajectorySetpoint 前馈。
+    """
+    px, py, pz = state.position
+    vx, vy, vz = state.velocity
+    dx = target[0] - px
+    dy = target[1] - py
+    dz = target[2] - pz
+    distance = math.sqrt(dx * dx + dy * dy + dz * dz)
+    speed = math.sqrt(vx * vx + vy * vy + vz * vz)
+    speed_step = max_acceleration * dt
+    if distance <= max(speed * dt, 1e-6) and speed <= speed_step:
+        return MotionState(tuple(target), _ZERO_VECTOR, _ZERO_VECTOR)
+
+    desired_speed = min(max_velocity, math.sqrt(2.0 * max_acceleration * distance))
+    scale = desired_speed / distance if distance > 0.0 else 0.0
+    ax = dx * scale - vx
+    ay = dy * scale - vy
+    az = dz * scale - vz
+    delta_v = math.sqrt(ax * ax + ay * ay + az * az)
+    if delta_v > speed_step:
+        limit = speed_step / delta_v
+        ax *= limit
+        ay *= limit
+        az *= limit
+    vx += ax
+    vy += ay
+    vz += az
+    nx = px + vx * dt
+    ny = py + vy * dt
+    nz = pz + vz * dt
+    # 越过目标（剩余位移与原方向反向）时直接落到目标点并停住。
+    if (target[0] - nx) * dx + (target[1] - ny) * dy + (target[2] - nz) * dz <= 0.0:
+        return MotionState(tuple(target), _ZERO_VECTOR, _ZERO_VECTOR)
+    return MotionState(
+        (nx, ny, nz), (vx, vy, vz), (ax / dt, ay / dt, az / dt)
+    )
+
+
+def valid_vehicle_local_ned(local_position):
+    """Return a finite PX4 VehicleLocalPosition NED tuple, or ``None``."""
+    if local_position is None:
+        return None
+
+    try:
+        local_ned = [
+            float(local_position.x),
+            float(local_position.y),
+            float(local_position.z),
+        ]
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        return None
+
+    if not bool(getattr(local_position, "xy_valid", False)):
+        return None
+    if not bool(getattr(local_position, "z_valid", False)):
+        return None
+    if not all(math.isfinite(value) for value in local_ned):
+        return None
+    return local_ned
+
+
+def ros_sample_is_fresh(last_sample_times, name, now_monotonic, max_age_sec):
+    """Whether a named ROS sample is recent enough to drive control telemetry."""
+    if not math.isfinite(now_monotonic) or not math.isfinite(max_age_sec):
+        return False
+    if max_age_sec <= 0.0:
+        return False
+    last_sample = last_sample_times.get(name)
+    if last_sample is None or not math.isfinite(last_sample):
+        return False
+    age = now_monotonic - last_sample
+    return 0.0 <= age <= max_age_sec
+
+
+# ============================================================
+# 热路径日志
+# ============================================================
+class EventLogWriter:
+    """后台格式化线程：取出 EventLog 入队的结构化事件并写入各自的 logger。
+
+    入队只做 deque.append（线程安全、不取锁）；仅在队列由空变非空时置位
+    Event 唤醒本线程，洪泛期间不会每条事件都触发一次唤醒。
+    """
+
+    def __init__(self, name: str = "bridge-log", max_queue: int = LOG_QUEUE_MAX):
+        self.max_queue = max(1, max_queue)
+        self.written = 0
+        self.dropped = 0
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, event) -> bool:
+        queue = self._queue
+        if len(queue) >= self.max_queue:
+            self.dropped += 1
+            return False
+        queue.append(event)
+        if len(queue) == 1:
+            self._wakeup.set()
+        return True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(0.5)
+            self._wakeup.clear()
+            self._drain()
+            if self._stopping:
+                self._drain()
+                return
+
+    def _drain(self):
+        queue = self._queue
+        while queue:
+            write_event(queue.popleft())
+            self.written += 1
+
+    def close(self, timeout: float = 2.0):
+        """写出已入队的事件后停止线程。"""
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+
+def write_event(event):
+    """格式化并输出一个 (logger, level, template, fields, suppressed) 事件。"""
+    logger, level, template, fields, suppressed = event
+    try:
+        message = template.format_map(fields)
+    except (KeyError, IndexError, ValueError) as exc:
+        message = f"{template} {fields!r} (format error: {exc})"
+    if suppressed:
+        message += f" [suppressed {suppressed} similar]"
+    getattr(logger, level)(message)
+
+
+class EventLog:
+    """按类别限速的结构化日志入口；单写入线程（UDP 线程）使用。
+
+    ``emit(level, category, template, **fields)`` 不格式化字符串：模板与字段
+    交给 writer 线程按 str.format 规则展开；writer 为 None 时在调用线程同步
+    输出（测试与离线工具）。返回 False 表示被限速或队列已满。
+    """
+
+    def __init__(
+        self,
+        logger,
+        writer: EventLogWriter | None = None,
+        rate_per_sec: float = LOG_RATE_PER_SEC,
+        burst: float = LOG_BURST,
+        clock=time.monotonic,
+    ):
+        self.logger = logger
+        self.writer = writer
+        self.rate_per_sec = rate_per_sec
+        self.burst = max(1.0, burst)
+        self.clock = clock
+        self.emitted = 0
+        # 按类别累计的限速丢弃数（指标用），以及尚未随日志汇报的部分
+        self.suppressed = {}
+        self._unreported = {}
+        # 类别 → [令牌数, 上次补充时刻]
+        self._buckets = {}
+
+    def emit(self, level: str, category: str, template: str, **fields) -> bool:
+        if self.rate_per_sec > 0:
+            now = self.clock()
+            bucket = self._buckets.get(category)
+            if bucket is None:
+                bucket = self._buckets[category] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_per_sec)
+            bucket[1] = now
+            if tokens < 1.0:
+                bucket[0] = tokens
+                self.suppressed[category] = self.suppressed.get(category, 0) + 1
+                self._unreported[category] = self._unreported.get(category, 0) + 1
+                return False
+            bucket[0] = tokens - 1.0
+        event = (self.logger, level, template, fields, self._unreported.pop(category, 0))
+        self.emitted += 1
+        if self.writer is None:
+            write_event(event)
+            return True
+        return self.writer.submit(event)
+
+    def flush_suppressed(self):
+        """把尚未汇报的限速计数作为一条汇总输出（诊断周期 / 退出时调用）。"""
+        if not self._unreported:
+            return
+        unreported, self._unreported = self._unreported, {}
+        summary = ", ".join(f"{category}={count}" for category, count in sorted(unreported.items()))
+        event = (self.logger, "warning", "[LOG] rate-limited events: {summary}",
+                 {"summary": summary}, 0)
+        if self.writer is None:
+            write_event(event)
+        else:
+            self.writer.submit(event)
+
+
+# ============================================================
+# 桥接核心（不依赖 ROS2）
+# ============================================================
+# 控制包解析 → 会话 → 确认门 → 应用，以及遥测字段组装，全部在 BridgeCore 中。
+# 时钟与副作用均由外部注入：JetsonBridge 传入真实时钟并以自身作为 sink，
+# 测试与 replay_jetson_bridge.py 传入虚拟时钟，无需 rclpy/px4_msgs 即可运行。
+PX4_SAMPLE_NAMES = (
+    "odometry", "status", "local_position", "global_position", "battery", "command_ack",
+)
+
+
+class BridgeCoreSink:
+    """BridgeCore 的副作用出口，默认全部为空操作。
+
+    JetsonBridge 以同名方法实现（鸭子类型，不继承）；replay 等离线工具
+    可只覆盖关心的方法。
+    """
+
+    def control_sender_validated(self, addr):
+        """数据报已通过协议、MAC 与会话校验；addr 为其源地址。"""
+
+    def command_applied(self, parsed: dict, confirmed_packets: int, authenticated: bool):
+        """命令已写入 setpoint。"""
+
+
+class BridgeCore:
+    """单个 slot 的控制协议状态机与 PX4 样本缓存。
+
+    线程约定同 JetsonBridge：handle_datagram 只由 UDP 线程调用；note_sample /
+    update_safe_hold 由 ROS 回调线程调用；心跳线程读取 last_setpoint 与
+    publish_probe 引用、调用 record_publish_hops，并经 step_trajectory 在
+    setpoint_lock 内推进本地轨迹。
+    """
+
+    def __init__(
+        self,
+        slot: int,
+        logger,
+        sink=None,
+        clock=time.monotonic,
+        wall_clock=time.time,
+        events: EventLog | None = None,
+    ):
+        self.slot = slot
+        self.logger = logger
+        self.sink = sink if sink is not None else BridgeCoreSink()
+        self.clock = clock
+        self.wall_clock = wall_clock
+        # UDP 线程上的日志一律经 events 限速；未传入时同步输出（测试 / 离线工具）
+        self.events = events if events is not None else EventLog(logger, clock=clock)
+        self.digest_cache = ControlDigestCache()
+
+        # -------- 控制链路计数 --------
+        self.rx_total = 0
+        self.rx_valid = 0
+        self.rx_invalid = 0
+        self.rx_hold = 0
+        self.rx_move = 0
+        # 轨迹分片与 pause / resume
+        self.rx_trajectory = 0
+        self.rx_duplicate = 0
+        # 命中摘要缓存后直接按重复包计数、未进入命令路径的数据报
+        self.rx_short_circuit = 0
+        self.rx_stale = 0
+        self.last_ctrl_monotonic = None
+        self.last_ctrl_sender = None
+        self.last_backend_timestamp = None
+        self._last_clock_warning_monotonic = 0.0
+
+        # -------- 会话与确认门 --------
+        self.active_session = None
+        self.highest_applied_sequence = 0
+        self.commands = CommandStore()
+        self.link = LinkQualityEstimator()
+        self.commands_applied = 0
+        self.last_applied_command = None
+        self._auth_session_key = None
+        # 命令延迟，按应用路径区分：confirm = 多包确认门，auth = 单包 MAC 快速路径。
+        # rx_to_apply 为首个数据报到达 → setpoint 写入（Jetson 单调时钟）；
+        # issue_to_apply 为后端 issued_at_unix_s → 写入（跨主机墙钟，含时钟偏差）。
+        self.apply_latency = {
+            "confirm": LatencyHistogram(),
+            "auth": LatencyHistogram(),
+        }
+        self.issue_latency = {
+            "confirm": LatencyHistogram(),
+            "auth": LatencyHistogram(),
+        }
+        # 逐跳延迟，见 CONTROL_LATENCY_HOPS。applied→publish 等三项由心跳线程
+        # 写入，其余由 UDP 线程写入，各直方图只有一个写入方。
+        self.hop_latency = {hop: LatencyHistogram() for hop in CONTROL_LATENCY_HOPS}
+        # 最近应用命令的发布探针：(sequence, applied_monotonic,
+        # first_rx_monotonic, issued_at)。UDP 线程整体替换，心跳线程在首次
+        # 发布该序号后置 None；只做引用读写，不取锁。
+        self.publish_probe = None
+
+        # -------- 最新 setpoint 缓存 --------
+        # 在 PX4 给出首个有效 VehicleLocalPosition 前不得猜测本地原点。
+        # last_setpoint 为 Setpoint 或 None。setpoint_lock 只串行化写入方
+        # （UDP 线程应用命令 / 本地位置回调的检查后替换），心跳读取不取锁。
+        self.last_setpoint = None
+        self.setpoint_lock = threading.Lock()
+
+        # -------- 轨迹上传 --------
+        # trajectory_assembly 为 UDP 线程私有的未完成重组（同一时刻至多一条）；
+        # trajectory 为最近应用的 TrajectoryFollower，其状态只在 setpoint_lock
+        # 内修改，结束后保留供遥测报告最终状态。
+        self.trajectory_assembly = None
+        self.trajectory = None
+
+        # -------- PX4 样本 --------
+        # 各话题最新消息与到达时刻（clock 时基），键见 PX4_SAMPLE_NAMES。
+        self.samples = dict.fromkeys(PX4_SAMPLE_NAMES)
+        self.sample_monotonic = {}
+
+    # ------------------------------------------------------------------
+    # PX4 样本
+    # ------------------------------------------------------------------
+    def note_sample(self, name: str, msg, now_monotonic: float | None = None):
+        self.samples[name] = msg
+        self.sample_monotonic[name] = self.clock() if now_monotonic is None else now_monotonic
+
+    def update_safe_hold(self, local_position):
+        """按最新本地位置维护安全保持点；返回有效 NED，无效时清除旧坐标系 setpoint 并返回 None。"""
+        local_ned = valid_vehicle_local_ned(local_position)
+        if local_ned is None:
+            with self.setpoint_lock:
+                cleared_stale_setpoint = self.last_setpoint is not None
+                self.last_setpoint = None
+                if self.trajectory is not None:
+                    self.trajectory.cancel("aborted")
+            if cleared_stale_setpoint:
+                self.logger.warning(
+                    "[SAFE-HOLD] PX4 local position became invalid; "
+                    "cleared the old-frame setpoint"
+                )
+            return None
+
+        initialized_now = False
+        with self.setpoint_lock:
+            if self.last_setpoint is None:
+                self.last_setpoint = Setpoint(
+                    local_ned[0], local_ned[1], local_ned[2], "hold", 0
+                )
+                initialized_now = True
+
+        if initialized_now:
+            self.logger.info(
+                f"[SAFE-HOLD] initialized from first valid VehicleLocalPosition: "
+                f"NED=({local_ned[0]:.3f},{local_ned[1]:.3f},{local_ned[2]:.3f})"
+            )
+        return local_ned
+
+    def build_telemetry(
+        self,
+        timestamp_us: int,
+        now_monotonic: float | None = None,
+        sample_latency: float | None = None,
+    ) -> dict:
+        """按当前样本组装一帧遥测字段字典（编码与发送由调用方负责）。"""
+        if now_monotonic is None:
+            now_monotonic = self.clock()
+        samples = self.samples
+        sample_monotonic = self.sample_monotonic
+        data = {}
+        data["timestamp"] = timestamp_us  # μs
+
+        o = samples["odometry"]
+        if o:
+            data["position"] = [float(v) for v in o.position]
+            data["q"] = [float(v) for v in o.q]
+            data["velocity"] = [float(v) for v in o.velocity]
+            data["angular_velocity"] = [float(v) for v in o.angular_velocity]
+
+        status = samples["status"]
+        if status:
+            data["arming_state"] = int(status.arming_state)
+            data["nav_state"] = int(status.nav_state)
+
+        local_position_fresh = ros_sample_is_fresh(
+            sample_monotonic,
+            "local_position",
+            now_monotonic,
+            MAX_TELEMETRY_SAMPLE_AGE_SEC,
+        )
+        lp = samples["local_position"]
+        if lp and local_position_fresh:
+            data["local_position"] = [float(lp.x), float(lp.y), float(lp.z)]
+            data["local_velocity"] = [float(lp.vx), float(lp.vy), float(lp.vz)]
+            # Use the exact frame consumed by TrajectorySetpoint. VehicleOdometry
+            # may advertise a different pose frame (for example FRD).
+            local_ned = valid_vehicle_local_ned(lp)
+            data["local_position_valid"] = local_ned is not None
+            if local_ned is not None:
+                data["position"] = local_ned
+        else:
+            data["local_position_valid"] = False
+
+        global_position_fresh = ros_sample_is_fresh(
+            sample_monotonic,
+            "global_position",
+            now_monotonic,
+            MAX_TELEMETRY_SAMPLE_AGE_SEC,
+        )
+        gp = samples["global_position"]
+        if gp and global_position_fresh:
+            # PX4 v1.17: lat / lon / alt / lat_lon_valid
+            gps_lat = float(gp.lat)
+            gps_lon = float(gp.lon)
+            gps_alt = float(gp.alt)
+            data["gps_lat"] = gps_lat
+            data["gps_lon"] = gps_lon
+            data["gps_alt"] = gps_alt
+            geographic_sample_skew = abs(
+                sample_monotonic.get("global_position", float("-inf"))
+                - sample_monotonic.get("local_position", float("inf"))
+            )
+            data["gps_fix"] = (
+                bool(gp.lat_lon_valid)
+                and bool(getattr(gp, "alt_valid", True))
+                and local_position_fresh
+                and geographic_sample_skew <= MAX_GEOGRAPHIC_SAMPLE_SKEW_SEC
+                and all(math.isfinite(value) for value in (gps_lat, gps_lon, gps_alt))
+                and -90.0 <= gps_lat <= 90.0
+                and -180.0 <= gps_lon <= 180.0
+            )
+        else:
+            data["gps_fix"] = False
+
+        battery = samples["battery"]
+        if battery:
+            data["battery"] = (
+                int(battery.remaining * 100)
+                if battery.remaining >= 0
+                else -1
+            )
+
+        # 最新 PX4 样本到达 → 本数据报发送的延迟；心跳遥测不带该字段
+        if sample_latency is not None:
+            data["sample_latency_ms"] = round(sample_latency * 1e3, 3)
+
+        # 应用层 ACK：只有达到确认阈值且 setpoint 已写入缓存后才回传。
+        # 后端据此能区分“UDP 已发出”和“Jetson 已确认执行”。
+        if self.last_applied_command:
+            data["control_ack"] = dict(self.last_applied_command)
+
+        trajectory = self.trajectory
+        if trajectory is not None:
+            data["trajectory"] = {
+                "command_id": trajectory.trajectory_id,
+                "state": trajectory.state,
+                "index": trajectory.index,
+                "count": len(trajectory.waypoints),
+                "progress": round(trajectory.progress, 4),
+            }
+
+        if self.link.expected:
+            data["link"] = self.link.report()
+        return data
+
+    def _fresh_local_ned(self, now_monotonic: float):
+        """新鲜且有效的本地 NED 位置，否则 None。"""
+        if not ros_sample_is_fresh(
+            self.sample_monotonic, "local_position", now_monotonic,
+            MAX_TELEMETRY_SAMPLE_AGE_SEC,
+        ):
+            return None
+        return valid_vehicle_local_ned(self.samples["local_position"])
+
+    def step_trajectory(self, now_monotonic: float):
+        """心跳每拍调用：推进运行中的轨迹并替换 last_setpoint。"""
+        trajectory = self.trajectory
+        if trajectory is None or trajectory.state != "running":
+            return
+        vehicle = self._fresh_local_ned(now_monotonic)
+        with self.setpoint_lock:
+            if self.trajectory is not trajectory:
+                return
+            if self.last_setpoint is None:
+                trajectory.cancel("aborted")
+                return
+            target = trajectory.step(now_monotonic, vehicle)
+            if target is None:
+                return
+            mode = "trajectory" if trajectory.state == "running" else "hold"
+            setpoint = Setpoint(target[0], target[1], target[2], mode, trajectory.sequence)
+            if setpoint != self.last_setpoint:
+                self.last_setpoint = setpoint
+
+    # ------------------------------------------------------------------
+    # 控制数据报
+    # ------------------------------------------------------------------
+    def handle_datagram(
+        self,
+        data: bytes,
+        addr,
+        now_monotonic: float,
+        kernel_rx_unix: float | None = None,
+        kernel_delay: float | None = None,
+        split=None,
+    ):
+        """处理一个控制数据报；now_monotonic 为用户态读出时刻。
+
+        split 为入口分类时已算好的 split_control_datagram 结果，避免重复拆分。
+        """
+        self.rx_total += 1
+        cache_key = self.digest_cache.key(data, split)
+        if cache_key is not None:
+            cached = self.digest_cache.get(cache_key)
+            if cached is not None:
+                if self._short_circuit_repeat(cached, cache_key, addr, now_monotonic, kernel_delay):
+                    return
+                parsed = dict(cached)
+                parsed["repeat_index"] = cache_key[1]
+                parsed["sent_at"] = cache_key[2]
+                self._handle_validated(parsed, addr, now_monotonic, kernel_rx_unix, kernel_delay)
+                return
+        try:
+            parsed = parse_control_packet(data)
+        except ValueError as exc:
+            self.rx_invalid += 1
+            self.events.emit(
+                "warning", "udp-reject",
+                "[UDP-RX] rejected packet #{rx_total} from {host}:{port}: {error}; "
+                "size={size}B; preview={preview!r}",
+                rx_total=self.rx_total, host=addr[0], port=addr[1], error=exc,
+                size=len(data), preview=data[:160],
+            )
+            return
+
+        if parsed["slot"] != self.slot:
+            self.rx_invalid += 1
+            self.events.emit(
+                "warning", "udp-reject",
+                "[UDP-RX] rejected command_id={command_id}: JSON slot={packet_slot} but "
+                "this bridge slot={slot}. Check backend port_map; packet came from "
+                "{host}:{port}.",
+                command_id=parsed["command_id"], packet_slot=parsed["slot"], slot=self.slot,
+                host=addr[0], port=addr[1],
+            )
+            return
+
+        # 必须先校验 MAC 再处理会话：伪造的新 session_id 不能让当前会话退役。
+        if not self._verify_control_auth(parsed, addr):
+            return
+        if cache_key is not None:
+            self.digest_cache.put(cache_key, parsed)
+        self._handle_validated(parsed, addr, now_monotonic, kernel_rx_unix, kernel_delay)
+
+    def _short_circuit_repeat(
+        self,
+        cached: dict,
+        cache_key,
+        addr,
+        now_monotonic: float,
+        kernel_delay: float | None,
+    ) -> bool:
+        """已应用命令或已计入确认组的重发包：只更新链路计数，不再进入命令路径。
+
+        与完整路径结果相同的前提：会话与发送方未变、确认窗口未过期。hold
+        每 25 包一次的心跳日志仍交给完整路径输出。
+        """
+        if cached["session_id"] != self.active_session or addr != self.last_ctrl_sender:
+            return False
+        command_id = cached["command_id"]
+        if command_id not in self.commands.applied:
+            pending = self.commands.pending.get(command_id)
+            if (
+                pending is None
+                or now_monotonic - pending.first_seen > COMMAND_CONFIRM_WINDOW_SEC
+                or not pending.has_repeat(cache_key[1])
+            ):
+                return False
+        mode = cached["mode"]
+        if mode == "hold":
+            if (self.rx_hold + 1) % 25 == 0:
+                return False
+            self.rx_hold += 1
+        elif mode == "move":
+            self.rx_move += 1
+        else:
+            self.rx_trajectory += 1
+        hops = self.hop_latency
+        hops["read→parse"].record(self.clock() - now_monotonic)
+        if kernel_delay is not None:
+            hops["kernel→read"].record(kernel_delay)
+        self.link.observe(cached, cache_key[1], now_monotonic)
+        self.last_ctrl_monotonic = now_monotonic
+        self.last_backend_timestamp = cache_key[2]
+        self.rx_valid += 1
+        self.rx_duplicate += 1
+        self.rx_short_circuit += 1
+        return True
+
+    def _handle_validated(
+        self,
+        parsed: dict,
+        addr,
+        now_monotonic: float,
+        kernel_rx_unix: float | None,
+        kernel_delay: float | None,
+    ):
+        """已通过解析、slot 与 MAC 校验（或命中摘要缓存）的数据报。"""
+        if not self._accept_backend_session(parsed):
+            return
+        self._record_datagram_hops(parsed, now_monotonic, kernel_rx_unix, kernel_delay)
+        self.link.observe(parsed, parsed["repeat_index"], now_monotonic)
+
+        if self.last_ctrl_sender is not None and addr != self.last_ctrl_sender:
+            self.events.emit(
+                "warning", "sender-change",
+                "[UDP-RX] control sender changed: {old_host}:{old_port} → {host}:{port}",
+                old_host=self.last_ctrl_sender[0], old_port=self.last_ctrl_sender[1],
+                host=addr[0], port=addr[1],
+            )
+        self.last_ctrl_sender = addr
+        self.sink.control_sender_validated(addr)
+        self.last_ctrl_monotonic = now_monotonic
+        self.last_backend_timestamp = parsed["sent_at"]
+        self.rx_valid += 1
+        mode = parsed["mode"]
+        if mode == "hold":
+            self.rx_hold += 1
+        elif mode == "move":
+            self.rx_move += 1
+        else:
+            self.rx_trajectory += 1
+
+        clock_delta = self.wall_clock() - parsed["sent_at"]
+        if (
+            abs(clock_delta) > 10.0
+            and now_monotonic - self._last_clock_warning_monotonic >= 30.0
+        ):
+            self.events.emit(
+                "warning", "clock",
+                "[CLOCK] backend timestamp differs from Jetson by {delta:+.3f}s. "
+                "Check NTP/time sync; packet is still accepted.",
+                delta=clock_delta,
+            )
+            self._last_clock_warning_monotonic = now_monotonic
+
+        if mode == "trajectory":
+            self._stage_trajectory_chunk(parsed, addr, now_monotonic)
+            return
+
+        # 每个 move 重发包都打印；持续 hold 降采样，避免长时间运行刷屏。
+        should_log = (
+            mode != "hold"
+            or self.rx_valid == 1
+            or self.rx_hold % 25 == 0
+        )
+        if should_log:
+            self.events.emit(
+                "info", "udp-rx",
+                "[UDP-RX] valid #{rx_valid} id={command_id} seq={sequence} "
+                "repeat={repeat_index}/{repeat_total} from {host}:{port} mode={mode} "
+                "NED=({x:.3f},{y:.3f},{z:.3f}) reference=power_on_origin unit=m "
+                "clock_delta={delta:+.3f}s",
+                rx_valid=self.rx_valid, command_id=parsed["command_id"],
+                sequence=parsed["sequence"], repeat_index=parsed["repeat_index"],
+                repeat_total=parsed["repeat_total"] or "continuous",
+                host=addr[0], port=addr[1], mode=parsed["mode"],
+                x=parsed["x"], y=parsed["y"], z=parsed["z"], delta=clock_delta,
+            )
+
+        self._stage_control_command(parsed, addr, now_monotonic)
+
+    def _record_datagram_hops(
+        self,
+        parsed: dict,
+        read_monotonic: float,
+        kernel_rx_unix: float | None,
+        kernel_delay: float | None,
+    ):
+        """记录 kernel→read / read→parse，并把到达时间附在 parsed 上供后续各跳使用。"""
+        parsed_monotonic = self.clock()
+        hops = self.hop_latency
+        hops["read→parse"].record(parsed_monotonic - read_monotonic)
+        if kernel_delay is not None:
+            hops["kernel→read"].record(kernel_delay)
+            parsed["rx_monotonic"] = read_monotonic - kernel_delay
+            parsed["rx_unix"] = kernel_rx_unix
+        else:
+            parsed["rx_monotonic"] = read_monotonic
+            parsed["rx_unix"] = self.wall_clock() - (parsed_monotonic - read_monotonic)
+
+    def _verify_control_auth(self, parsed: dict, addr) -> bool:
+        """校验可选 MAC；有效时标记 authenticated，返回 False 表示丢弃该包。"""
+        if not CONTROL_AUTH_KEY:
+            return True
+        mac = parsed["auth_mac"]
+        if mac is None:
+            if CONTROL_AUTH_REQUIRED:
+                self.rx_invalid += 1
+                self.events.emit(
+                    "warning", "auth-reject",
+                    "[AUTH] rejected unauthenticated command_id={command_id} "
+                    "from {host}:{port} (CONTROL_AUTH_REQUIRED=1)",
+                    command_id=parsed["command_id"], host=addr[0], port=addr[1],
+                )
+                return False
+            return True
+
+        session_id = parsed["session_id"]
+        if self._auth_session_key is None or self._auth_session_key[0] != session_id:
+            self._auth_session_key = (
+                session_id, derive_control_session_key(CONTROL_AUTH_KEY, session_id)
+            )
+        compute_mac = (
+            compute_trajectory_chunk_mac if parsed["mode"] == "trajectory"
+            else compute_control_mac
+        )
+        try:
+            expected = compute_mac(self._auth_session_key[1], parsed)
+        except struct.error:
+            expected = b""
+        if not hmac.compare_digest(mac, expected):
+            self.rx_invalid += 1
+            self.events.emit(
+                "warning", "auth-reject",
+                "[AUTH] rejected command_id={command_id} from {host}:{port}: "
+                "MAC mismatch for session {session_id}",
+                command_id=parsed["command_id"], host=addr[0], port=addr[1],
+                session_id=session_id,
+            )
+            return False
+        parsed["authenticated"] = True
+        return True
+
+    def _auth_is_fresh(self, parsed: dict, addr) -> bool:
+        """签名命令的 issued_at 是否在 CONTROL_AUTH_MAX_AGE_SEC 窗口内；过期的计入 stale。"""
+        if CONTROL_AUTH_MAX_AGE_SEC <= 0:
+            return True
+        age = self.wall_clock() - parsed["issued_at"]
+        if abs(age) <= CONTROL_AUTH_MAX_AGE_SEC:
+            return True
+        self.rx_stale += 1
+        self.events.emit(
+            "warning", "auth-expired",
+            "[AUTH] rejected command_id={command_id} from {host}:{port}: issued_at is "
+            "{age:+.3f}s from Jetson time (window {window:g}s); replay or clock not synced",
+            command_id=parsed["command_id"], host=addr[0], port=addr[1],
+            age=age, window=CONTROL_AUTH_MAX_AGE_SEC,
+        )
+        return False
+
+    def _accept_backend_session(self, parsed: dict) -> bool:
+        """识别后端重启会话，并阻止旧会话的迟到包重新生效。"""
+        session_id = parsed["session_id"]
+        if self.active_session is None:
+            self.active_session = session_id
+            self.link.reset()
+            self.events.emit(
+                "info", "session", "[SESSION] backend session established: {session_id}",
+                session_id=session_id,
+            )
+            return True
+        if session_id == self.active_session:
+            return True
+        if session_id in self.commands.retired_sessions:
+            self.rx_stale += 1
+            self.events.emit(
+                "warning", "session-stale",
+                "[SESSION] rejected packet from retired backend session {session_id}; "
+                "active={active}",
+                session_id=session_id, active=self.active_session,
+            )
+            return False
+
+        old_session = self.active_session
+        self.commands.retire_session(old_session)
+        self.active_session = session_id
+        self.highest_applied_sequence = 0
+        self.commands.reset()
+        self.link.reset()
+        self.trajectory_assembly = None
+        self.events.emit(
+            "warning", "session",
+            "[SESSION] backend session changed {old_session} → {session_id}; "
+            "pending commands cleared and sequence ordering restarted",
+            old_session=old_session, session_id=session_id,
+        )
+        return True
+
+    @staticmethod
+    def _control_fingerprint(parsed: dict):
+        """同一 command_id 的所有重发包必须具有完全一致的执行语义。"""
+        return (
+            parsed["session_id"], parsed["command_id"], parsed["sequence"],
+            parsed["drone_id"], parsed["slot"], parsed["mode"],
+            parsed["x"], parsed["y"], parsed["z"],
+        )
+
+    def _stage_control_command(self, parsed: dict, addr, now_monotonic: float):
+        command_id = parsed["command_id"]
+        sequence = parsed["sequence"]
 
-# 遥测发送频率（Hz）
-TELEMETRY_HZ = 10
+        commands = self.commands
+        if command_id in commands.applied:
+            self.rx_duplicate += 1
+            return
+        if sequence <= self.highest_applied_sequence:
+            self.rx_stale += 1
+            self.events.emit(
+                "warning", "command-stale",
+                "[COMMAND-STALE] rejected id={command_id} sequence={sequence}; "
+                "highest_applied={highest}",
+                command_id=command_id, sequence=sequence,
+                highest=self.highest_applied_sequence,
+            )
+            return
 
-running = True
+        # MAC 已证明负载来自持有密钥的后端且未被篡改：首个有效数据报即应用。
+        # issued_at 超出新鲜度窗口的签名包可能是重放，直接丢弃。
+        if parsed.get("authenticated"):
+            if not self._auth_is_fresh(parsed, addr):
+                return
+            staged_at = self.clock()
+            self._apply_control_command(
+                parsed, 1, now_monotonic, now_monotonic, parsed, staged_at, staged_at
+            )
+            return
 
+        pending = commands.pending.get(command_id)
+        fingerprint = self._control_fingerprint(parsed)
+        if pending and pending.fingerprint != fingerprint:
+            self.rx_invalid += 1
+            commands.discard_pending(command_id)
+            self.events.emit(
+                "error", "command-conflict",
+                "[COMMAND-CONFLICT] same command_id={command_id} carried different "
+                "payloads; entire confirmation group discarded",
+                command_id=command_id,
+            )
+            return
 
-# ============================================================
-# 控制包解析
-# ============================================================
-def parse_control_packet(data: bytes):
-    """严格解析并验证后端 JSON 控制协议；失败时抛出 ValueError。"""
-    if not data:
-        raise ValueError("empty UDP datagram")
-    if len(data) > MAX_CONTROL_PACKET_BYTES:
-        raise ValueError(
-            f"packet too large: {len(data)}B > {MAX_CONTROL_PACKET_BYTES}B"
-        )
-    try:
-        message = json.loads(data.decode("utf-8"))
-    except UnicodeDecodeError as exc:
-        raise ValueError(f"payload is not UTF-8: {exc}") from exc
-    except json.JSONDecodeError as exc:
-        raise ValueError(f"invalid JSON at char {exc.pos}: {exc.msg}") from exc
+        required = self.link.confirm_count(parsed["repeat_total"])
+        if pending and now_monotonic - pending.first_seen > COMMAND_CONFIRM_WINDOW_SEC:
+            self.events.emit(
+                "warning", "command-window",
+                "[COMMAND-WINDOW] id={command_id} did not reach {count} packets within "
+                "{window:.2f}s; restarting window (link loss={loss})",
+                command_id=command_id, count=required,
+                window=COMMAND_CONFIRM_WINDOW_SEC, loss=self.link.loss,
+            )
+            pending = None
 
-    if not isinstance(message, dict):
-        raise ValueError("JSON root must be an object")
-    if message.get("protocol") != CONTROL_PROTOCOL:
-        raise ValueError(f"unexpected protocol={message.get('protocol')!r}")
-    if message.get("version") != CONTROL_PROTOCOL_VERSION:
-        raise ValueError(f"unsupported version={message.get('version')!r}")
-    if message.get("type") != "control":
-        raise ValueError(f"unexpected type={message.get('type')!r}")
+        if pending is None:
+            pending = PendingCommand(parsed, fingerprint, addr, now_monotonic, self.clock())
+            commands.add_pending(command_id, pending)
 
-    session_id = message.get("session_id")
-    command_id = message.get("command_id")
-    mode = message.get("mode")
-    if not isinstance(session_id, str) or not session_id:
-        raise ValueError("session_id must be a non-empty string")
-    if not isinstance(command_id, str) or not command_id:
-        raise ValueError("command_id must be a non-empty string")
-    if mode not in ("move", "hold"):
-        raise ValueError(f"mode must be move/hold, got {mode!r}")
+        if not pending.add_repeat(parsed["repeat_index"]):
+            self.rx_duplicate += 1
+            return
 
-    try:
-        sequence = int(message["sequence"])
-        drone_id = int(message["drone_id"])
-        slot = int(message["slot"])
-        issued_at = float(message["issued_at_unix_s"])
-        sent_at = float(message["sent_at_unix_s"])
-    except (KeyError, TypeError, ValueError) as exc:
-        raise ValueError(f"invalid command metadata: {exc}") from exc
-    if sequence <= 0 or drone_id <= 0 or slot <= 0:
-        raise ValueError(
-            f"sequence/drone_id/slot must be positive: {sequence}/{drone_id}/{slot}"
+        commands.touch(command_id, pending, now_monotonic)
+        confirmed = pending.confirmed
+        self.events.emit(
+            "info", "command-pending",
+            "[COMMAND-PENDING] id={command_id} sequence={sequence} "
+            "unique={confirmed}/{count} repeat_mask={mask:#x}@{base} age={age:.3f}s",
+            command_id=command_id, sequence=sequence, confirmed=confirmed,
+            count=required, mask=pending.repeat_mask, base=pending.base,
+            age=now_monotonic - pending.first_seen,
         )
 
-    target = message.get("target")
-    if not isinstance(target, dict):
-        raise ValueError("target must be an object")
-    if target.get("frame") != "NED":
-        raise ValueError(f"target.frame must be NED, got {target.get('frame')!r}")
-    if target.get("reference") != "power_on_origin":
-        raise ValueError(
-            "target.reference must be power_on_origin, got "
-            f"{target.get('reference')!r}"
-        )
-    if target.get("unit") != "m":
-        raise ValueError(f"target.unit must be m, got {target.get('unit')!r}")
-    try:
-        north = float(target["north"])
-        east = float(target["east"])
-        down = float(target["down"])
-    except (KeyError, TypeError, ValueError) as exc:
-        raise ValueError(f"invalid NED target: {exc}") from exc
+        if parsed["repeat_total"] and parsed["repeat_total"] < required:
+            self.events.emit(
+                "warning", "command-policy",
+                "[COMMAND-POLICY] backend repeat_total={repeat_total} is lower than "
+                "Jetson threshold={count}",
+                repeat_total=parsed["repeat_total"], count=required,
+            )
 
-    delivery = message.get("delivery")
-    if not isinstance(delivery, dict):
-        raise ValueError("delivery must be an object")
-    try:
-        repeat_index = int(delivery["repeat_index"])
-        repeat_total = int(delivery["repeat_total"])
-    except (KeyError, TypeError, ValueError) as exc:
-        raise ValueError(f"invalid delivery metadata: {exc}") from exc
-    if repeat_index <= 0 or repeat_total < 0:
-        raise ValueError(
-            f"invalid repeat_index/repeat_total={repeat_index}/{repeat_total}"
-        )
-    if repeat_total > 0 and repeat_index > repeat_total:
-        raise ValueError(
-            f"repeat_index {repeat_index} exceeds repeat_total {repeat_total}"
+        if confirmed >= required:
+            self._apply_control_command(
+                parsed, confirmed, now_monotonic, pending.first_seen,
+                pending.packet, pending.staged_at, self.clock(),
+            )
+
+    def _stage_trajectory_chunk(self, parsed: dict, addr, now_monotonic: float):
+        """重组轨迹分片；全部分片确认后作为一条命令应用。"""
+        command_id = parsed["command_id"]
+        sequence = parsed["sequence"]
+        if command_id in self.commands.applied:
+            self.rx_duplicate += 1
+            return
+        if sequence <= self.highest_applied_sequence:
+            self.rx_stale += 1
+            self.events.emit(
+                "warning", "command-stale",
+                "[COMMAND-STALE] rejected trajectory id={command_id} sequence={sequence}; "
+                "highest_applied={highest}",
+                command_id=command_id, sequence=sequence,
+                highest=self.highest_applied_sequence,
+            )
+            return
+        if parsed.get("authenticated") and not self._auth_is_fresh(parsed, addr):
+            return
+
+        assembly = self.trajectory_assembly
+        if assembly is not None:
+            expired = now_monotonic - assembly.first_seen > TRAJECTORY_ASSEMBLY_TIMEOUT_SEC
+            if assembly.command_id != command_id and not expired and assembly.sequence > sequence:
+                self.rx_stale += 1
+                return
+            if assembly.command_id != command_id or expired:
+                self.events.emit(
+                    "warning", "trajectory-window",
+                    "[TRAJECTORY] id={old} dropped with {confirmed}/{count} chunks confirmed "
+                    "({reason})",
+                    old=assembly.command_id, confirmed=assembly.confirmed_count,
+                    count=len(assembly.chunks),
+                    reason="timed out" if expired else f"superseded by {command_id}",
+                )
+                assembly = None
+        if assembly is None:
+            assembly = TrajectoryAssembly(parsed, now_monotonic, self.clock())
+            self.trajectory_assembly = assembly
+
+        required = (
+            1 if parsed.get("authenticated")
+            else self.link.confirm_count(parsed["repeat_total"])
         )
+        result = assembly.add(parsed, required)
+        if result == "conflict":
+            self.rx_invalid += 1
+            self.trajectory_assembly = None
+            self.events.emit(
+                "error", "command-conflict",
+                "[COMMAND-CONFLICT] trajectory id={command_id} chunk {chunk} carried "
+                "different payloads; entire trajectory discarded",
+                command_id=command_id, chunk=parsed["chunk_index"],
+            )
+            return
+        if result == "duplicate":
+            self.rx_duplicate += 1
+            return
+        if result == "pending":
+            self.events.emit(
+                "info", "trajectory-pending",
+                "[TRAJECTORY] id={command_id} sequence={sequence} chunk {chunk}/{count} "
+                "confirmed_chunks={confirmed} age={age:.3f}s",
+                command_id=command_id, sequence=sequence, chunk=parsed["chunk_index"] + 1,
+                count=parsed["chunk_count"], confirmed=assembly.confirmed_count,
+                age=now_monotonic - assembly.first_seen,
+            )
+            return
 
-    numeric_values = (issued_at, sent_at, north, east, down)
-    if not all(math.isfinite(value) for value in numeric_values):
-        raise ValueError("timestamps and NED coordinates must be finite")
-    if max(abs(north), abs(east), abs(down)) > MAX_ABS_TARGET_M:
-        raise ValueError(
-            f"NED target exceeds MAX_ABS_TARGET_M={MAX_ABS_TARGET_M}: "
-            f"({north},{east},{down})"
+        try:
+            waypoints = assembly.waypoints()
+        except ValueError as exc:
+            self.rx_invalid += 1
+            self.trajectory_assembly = None
+            self.events.emit(
+                "error", "trajectory-invalid",
+                "[TRAJECTORY] id={command_id} discarded after reassembly: {error}",
+                command_id=command_id, error=exc,
+            )
+            return
+        first = waypoints[0]
+        command = dict(
+            assembly.packet, x=first.north, y=first.east, z=first.down,
+            waypoints=waypoints, authenticated=assembly.authenticated,
         )
+        if self._apply_control_command(
+            command, assembly.datagrams, now_monotonic, assembly.first_seen,
+            assembly.packet, assembly.staged_at, self.clock(),
+        ):
+            self.trajectory_assembly = None
+            self.events.emit(
+                "info", "trajectory",
+                "[TRAJECTORY] executing id={command_id} waypoints={count} "
+                "timed={timed} chunks={chunks} datagrams={datagrams}",
+                command_id=command_id, count=len(waypoints),
+                timed=sum(1 for waypoint in waypoints if waypoint.time_s is not None),
+                chunks=len(assembly.chunks), datagrams=assembly.datagrams,
+            )
 
-    return {
-        "session_id": session_id,
-        "command_id": command_id,
-        "sequence": sequence,
-        "drone_id": drone_id,
-        "slot": slot,
-        "mode": mode,
-        "issued_at": issued_at,
-        "sent_at": sent_at,
-        "x": north,
-        "y": east,
-        "z": down,
-        "repeat_index": repeat_index,
-        "repeat_total": repeat_total,
-    }
+    def _apply_control_command(
+        self,
+        parsed: dict,
+        confirmed_packets: int,
+        now_monotonic: float,
+        first_seen_monotonic: float | None = None,
+        first_packet: dict | None = None,
+        staged_at: float | None = None,
+        confirmed_at: float | None = None,
+    ) -> bool:
+        """应用已确认命令；first_packet/staged_at/confirmed_at 用于逐跳延迟统计。
 
+        仅在 setpoint 实际更新时返回 True；过期、延后或被忽略均返回 False。
+        """
+        sequence = parsed["sequence"]
+        if sequence <= self.highest_applied_sequence:
+            self.rx_stale += 1
+            return False
 
-# ============================================================
-# ROS2 桥接节点
-# ============================================================
-def valid_vehicle_local_ned(local_position):
-    """Return a finite PX4 VehicleLocalPosition NED tuple, or ``None``."""
-    if local_position is None:
-        return None
+        # JSON 中已经是 PX4 所需的 NED 米坐标，原点为本次上电位置。
+        # Jetson 只透传到 TrajectorySetpoint，不做 UE/NED 二次转换。
+        mode = parsed["mode"]
+        vehicle = None if mode in ("move", "hold") else self._fresh_local_ned(now_monotonic)
+        with self.setpoint_lock:
+            if self.last_setpoint is None:
+                self.events.emit(
+                    "warning", "command-safety",
+                    "[COMMAND-SAFETY] deferred id={command_id} sequence={sequence}: "
+                    "waiting for first valid VehicleLocalPosition",
+                    command_id=parsed["command_id"], sequence=sequence,
+                )
+                return False
+            trajectory = self.trajectory
+            if mode in ("pause", "resume") and (
+                trajectory is None
+                or trajectory.state != ("running" if mode == "pause" else "paused")
+            ):
+                self.events.emit(
+                    "warning", "trajectory-control",
+                    "[TRAJECTORY] ignored {mode} id={command_id} sequence={sequence}: "
+                    "trajectory state={state}",
+                    mode=mode, command_id=parsed["command_id"], sequence=sequence,
+                    state=trajectory.state if trajectory is not None else "none",
+                )
+                # 已有定论的命令：后续重发按 duplicate 计，不再重跑判定和日志
+                self.commands.discard_pending(parsed["command_id"])
+                self.commands.record_applied(parsed["command_id"], now_monotonic)
+                return False
+            # 探针先于 setpoint 发布：心跳线程读到新序号时探针必已就位。
+            applied_monotonic = self.clock()
+            first_packet = first_packet or parsed
+            first_rx = first_packet.get("rx_monotonic")
+            self.publish_probe = (
+                sequence, applied_monotonic, first_rx, parsed["issued_at"]
+            )
+            current = self.last_setpoint
+            if mode == "trajectory":
+                if trajectory is not None:
+                    trajectory.cancel()
+                trajectory = self.trajectory = TrajectoryFollower(
+                    parsed["command_id"], sequence, parsed["waypoints"],
+                    vehicle or (current.x, current.y, current.z), applied_monotonic,
+                )
+                target = trajectory.step(applied_monotonic, vehicle)
+                mode = "trajectory" if trajectory.state == "running" else "hold"
+            elif mode == "pause":
+                # 暂停即原地悬停：优先取机体当前位置，而不是正在飞向的航点
+                trajectory.pause(applied_monotonic, sequence)
+                target = vehicle or (current.x, current.y, current.z)
+            elif mode == "resume":
+                trajectory.resume(applied_monotonic, sequence)
+                target = trajectory.step(applied_monotonic, vehicle)
+                mode = "trajectory" if trajectory.state == "running" else "hold"
+            else:
+                if trajectory is not None:
+                    trajectory.cancel()
+                target = (parsed["x"], parsed["y"], parsed["z"])
+            self.last_setpoint = Setpoint(target[0], target[1], target[2], mode, sequence)
 
-    try:
-        local_ned = [
-            float(local_position.x),
-            float(local_position.y),
-            float(local_position.z),
-        ]
-    except (AttributeError, TypeError, ValueError, OverflowError):
-        return None
+        applied_at = self.wall_clock()
+        path = "auth" if parsed.get("authenticated") else "confirm"
+        if first_seen_monotonic is not None:
+            self.apply_latency[path].record(now_monotonic - first_seen_monotonic)
+        self.issue_latency[path].record(applied_at - parsed["issued_at"])
 
-    if not bool(getattr(local_position, "xy_valid", False)):
-        return None
-    if not bool(getattr(local_position, "z_valid", False)):
-        return None
-    if not all(math.isfinite(value) for value in local_ned):
-        return None
-    return local_ned
+        hops = self.hop_latency
+        hops["issue→send"].record(first_packet["sent_at"] - first_packet["issued_at"])
+        if first_rx is not None:
+            hops["send→kernel"].record(first_packet["rx_unix"] - first_packet["sent_at"])
+            if staged_at is not None:
+                hops["rx→staged"].record(staged_at - first_rx)
+        if staged_at is not None and confirmed_at is not None:
+            hops["staged→confirmed"].record(confirmed_at - staged_at)
+        if confirmed_at is not None:
+            hops["confirmed→applied"].record(applied_monotonic - confirmed_at)
 
+        self.highest_applied_sequence = sequence
+        self.commands_applied += 1
+        self.commands.record_applied(parsed["command_id"], now_monotonic)
+        self.last_applied_command = {
+            "session_id": parsed["session_id"],
+            "command_id": parsed["command_id"],
+            "sequence": sequence,
+            "mode": parsed["mode"],
+            "confirmed_packets": confirmed_packets,
+            "authenticated": path == "auth",
+            "applied_at_unix_s": applied_at,
+        }
 
-def ros_sample_is_fresh(last_sample_times, name, now_monotonic, max_age_sec):
-    """Whether a named ROS sample is recent enough to drive control telemetry."""
-    if not math.isfinite(now_monotonic) or not math.isfinite(max_age_sec):
-        return False
-    if max_age_sec <= 0.0:
-        return False
-    last_sample = last_sample_times.get(name)
-    if last_sample is None or not math.isfinite(last_sample):
-        return False
-    age = now_monotonic - last_sample
-    return 0.0 <= age <= max_age_sec
+        self.commands.evict_through_sequence(sequence)
+        self.sink.command_applied(parsed, confirmed_packets, path == "auth")
+
+        self.events.emit(
+            "info", "command-execute",
+            "[COMMAND-EXECUTE] #{applied} id={command_id} sequence={sequence} mode={mode} "
+            "confirmed={confirmed} path={path} NED(m, power_on_origin)=({x:.3f},{y:.3f},{z:.3f})",
+            applied=self.commands_applied, command_id=parsed["command_id"],
+            sequence=sequence, mode=parsed["mode"], confirmed=confirmed_packets, path=path,
+            x=parsed["x"], y=parsed["y"], z=parsed["z"],
+        )
+        return True
+
+    # ------------------------------------------------------------------
+    # 发布侧延迟
+    # ------------------------------------------------------------------
+    def record_publish_hops(self, probe):
+        """首个携带新序号的 TrajectorySetpoint 已发布：记录 applied/rx/issue→publish。"""
+        _, applied_monotonic, first_rx_monotonic, issued_at = probe
+        published_monotonic = self.clock()
+        hops = self.hop_latency
+        hops["applied→publish"].record(published_monotonic - applied_monotonic)
+        if first_rx_monotonic is not None:
+            hops["rx→publish"].record(published_monotonic - first_rx_monotonic)
+        hops["issue→publish"].record(self.wall_clock() - issued_at)
+
+    def control_latency_snapshot(self) -> dict:
+        """返回本 slot 各跳延迟直方图快照（秒），键顺序同 CONTROL_LATENCY_HOPS。"""
+        return {hop: self.hop_latency[hop].snapshot() for hop in CONTROL_LATENCY_HOPS}
 
 
 class JetsonBridge(Node):
-    def __init__(self, slot: int = 1):
+    def __init__(
+        self,
+        slot: int = 1,
+        config: dict | None = None,
+        clock=time.monotonic,
+        wall_clock=time.time,
+    ):
         if slot < 1 or slot > 6:
             raise ValueError(f"slot must be in 1..6, got {slot}")
         if COMMAND_CONFIRM_COUNT < 1:
             raise ValueError("COMMAND_CONFIRM_COUNT must be >= 1")
         if COMMAND_CONFIRM_WINDOW_SEC <= 0:
             raise ValueError("COMMAND_CONFIRM_WINDOW_SEC must be > 0")
+        if not math.isfinite(CONTROL_INGRESS_BUDGET_SEC) or CONTROL_INGRESS_BUDGET_SEC < 0:
+            raise ValueError("CONTROL_INGRESS_BUDGET_SEC must be finite and >= 0")
+        if CONTROL_INGRESS_BACKLOG < 1:
+            raise ValueError("CONTROL_INGRESS_BACKLOG must be >= 1")
+        if not 1 <= COMMAND_CONFIRM_MIN <= COMMAND_CONFIRM_COUNT:
+            raise ValueError("COMMAND_CONFIRM_MIN must be in 1..COMMAND_CONFIRM_COUNT")
+        if not 0.0 < COMMAND_CONFIRM_RELIABILITY < 1.0:
+            raise ValueError("COMMAND_CONFIRM_RELIABILITY must be in (0, 1)")
+        if not 0 < LINK_LOSS_MIN_SAMPLES <= LINK_LOSS_WINDOW_PACKETS:
+            raise ValueError("LINK_LOSS_MIN_SAMPLES must be in 1..LINK_LOSS_WINDOW_PACKETS")
+        if not 0.0 <= LINK_LOSS_CLEAN < 1.0:
+            raise ValueError("LINK_LOSS_CLEAN must be in [0, 1)")
         if not math.isfinite(MAX_TELEMETRY_SAMPLE_AGE_SEC) or MAX_TELEMETRY_SAMPLE_AGE_SEC <= 0:
             raise ValueError("MAX_TELEMETRY_SAMPLE_AGE_SEC must be finite and > 0")
         if not math.isfinite(MAX_GEOGRAPHIC_SAMPLE_SKEW_SEC) or MAX_GEOGRAPHIC_SAMPLE_SKEW_SEC <= 0:
             raise ValueError("MAX_GEOGRAPHIC_SAMPLE_SKEW_SEC must be finite and > 0")
+        if SETPOINT_SMOOTHING and not (
+            math.isfinite(SETPOINT_MAX_VELOCITY_MPS) and SETPOINT_MAX_VELOCITY_MPS > 0
+            and math.isfinite(SETPOINT_MAX_ACCEL_MPS2) and SETPOINT_MAX_ACCEL_MPS2 > 0
+        ):
+            raise ValueError(
+                "SETPOINT_MAX_VELOCITY_MPS and SETPOINT_MAX_ACCEL_MPS2 must be finite and > 0"
+            )
+        if not (
+            math.isfinite(TELEMETRY_HZ) and math.isfinite(TELEMETRY_MIN_HZ)
+            and 0 < TELEMETRY_MIN_HZ <= TELEMETRY_HZ
+        ):
+            raise ValueError("telemetry rates must satisfy 0 < TELEMETRY_MIN_HZ <= TELEMETRY_HZ")
+        if not math.isfinite(TELEMETRY_COALESCE_SEC) or TELEMETRY_COALESCE_SEC < 0:
+            raise ValueError("TELEMETRY_COALESCE_SEC must be finite and >= 0")
+        if TELEMETRY_DELTA and not (
+            math.isfinite(TELEMETRY_KEYFRAME_SEC) and TELEMETRY_KEYFRAME_SEC > 0
+        ):
+            raise ValueError("TELEMETRY_KEYFRAME_SEC must be finite and > 0")
+        if config is None:
+            config = resolve_slot_config(slot)
+        if config["slot"] != slot:
+            raise ValueError(f"config for slot {config['slot']} given to slot {slot}")
 
         self.slot = slot
-        self._topic_prefix = ROS_TOPIC_PREFIX
-        if self._topic_prefix and not self._topic_prefix.startswith("/"):
-            self._topic_prefix = "/" + self._topic_prefix
-
-        # Keep the legacy bridge behaviour by default: slot 1 targets SYSID 1.
-        # The former working script used ``target_system = slot``.  A different
-        # PX4 SYSID must be explicitly provided by MAVLINK_SYSTEM_ID, rather
-        # than silently changing the target to slot + 1.
-        self._mavlink_system_id = int(
-            os.environ.get("MAVLINK_SYSTEM_ID", str(slot))
-        )
+        # 单调时钟与墙钟：实机为 time.monotonic / time.time；替身运行时传入虚拟
+        # 时钟，使压缩运行的遥测调度、诊断与确认窗口按模拟时间推进
+        self._monotonic = clock
+        self._wall_clock = wall_clock
+        self._topic_prefix = config["topic_prefix"]
+        self._mavlink_system_id = config["mavlink_system_id"]
         if not 1 <= self._mavlink_system_id <= 255:
             raise ValueError(
                 f"MAVLINK_SYSTEM_ID must be in 1..255, got {self._mavlink_system_id}"
@@ -276,19 +4423,22 @@ class JetsonBridge(Node):
 
         super().__init__(f"jetson_bridge_{slot}")
 
-        # UDP 端口（与接口规范对齐）
-        # 控制接收：后端发到此端口
-        self._ctrl_port = int(os.environ.get(
-            "CONTROL_PORT", str(8889 + (slot - 1) * 2)
-        ))  # slot1=8889, slot2=8891, ...
-        # 遥测发送：后端监听此端口
-        self._tel_port = int(os.environ.get(
-            "TELEMETRY_PORT", str(8888 + (slot - 1) * 2)
-        ))  # slot1=8888, slot2=8890, ...
-        if not 1 <= self._ctrl_port <= 65535 or not 1 <= self._tel_port <= 65535:
+        # 控制接收：后端发到此端口；遥测发送：后端监听此端口
+        self._ctrl_port = config["control_port"]
+        self._tel_port = config["telemetry_port"]
+        self._pose_port = config.get("pose_port", 0)
+        if (
+            not 1 <= self._ctrl_port <= 65535 or not 1 <= self._tel_port <= 65535
+            or not 0 <= self._pose_port <= 65535
+        ):
             raise ValueError(
-                f"invalid UDP ports: control={self._ctrl_port}, telemetry={self._tel_port}"
+                f"invalid UDP ports: control={self._ctrl_port}, telemetry={self._tel_port}, "
+                f"pose={self._pose_port}"
             )
+        if self._pose_port and not (
+            math.isfinite(POSE_BATCH_INTERVAL_SEC) and POSE_BATCH_INTERVAL_SEC > 0
+        ):
+            raise ValueError("POSE_BATCH_INTERVAL_SEC must be finite and > 0")
 
         # -------- QoS --------
         sensor_qos = QoSProfile(
@@ -315,44 +4465,69 @@ class JetsonBridge(Node):
             sensor_qos,
         )
 
-        # -------- 订阅者 --------
-        self._odometry: VehicleOdometry | None = None
-        self._status: VehicleStatus | None = None
-        self._local_pos: VehicleLocalPosition | None = None
-        self._global_pos: VehicleGlobalPosition | None = None
-        self._battery: BatteryStatus | None = None
+        # 50Hz 心跳复用的消息对象：publish() 同步序列化，之后即可原地改写。
+        # 每个 tick 只更新 timestamp 和 position，其余字段初始化后保持不变。
+        self._ocm_msg = OffboardControlMode()
+        self._ocm_msg.position = True
+        self._ocm_msg.velocity = False
+        self._ocm_msg.acceleration = False
+        self._ocm_msg.attitude = False
+        self._ocm_msg.body_rate = False
+        self._ocm_msg.thrust_and_torque = False
+        self._ocm_msg.direct_actuator = False
+        self._tsp_msg = TrajectorySetpoint()
+        self._tsp_msg.position = [float("nan")] * 3
+        self._tsp_msg.velocity = [float("nan")] * 3
+        self._tsp_msg.acceleration = [float("nan")] * 3
+        self._tsp_msg.yaw = float("nan")
+        self._tsp_msg.yawspeed = float("nan")
+        # rosidl 把定长数组存成 numpy 数组，getter 返回同一对象，可原地写入。
+        self._tsp_position = self._tsp_msg.position
+        self._tsp_velocity = self._tsp_msg.velocity
+        self._tsp_acceleration = self._tsp_msg.acceleration
 
+        # -------- 回调组 --------
+        # 心跳 / 订阅 / 诊断各自互斥、彼此并行（见 ROS_EXECUTOR）。跨组共享的状态：
+        # setpoint 为整体替换的不可变 Setpoint（写入持 setpoint_lock，心跳只读引用），
+        # ACK 经 deque 交给心跳，计数器只由所属组写入、诊断只读。CommandStore 与
+        # LinkQualityEstimator 归主线程所有，诊断不调用其方法，只读
+        # poll_command_housekeeping 发布的快照。
+        self._heartbeat_group = MutuallyExclusiveCallbackGroup()
+        self._sample_group = MutuallyExclusiveCallbackGroup()
+        self._diagnostics_group = MutuallyExclusiveCallbackGroup()
+
+        # -------- 订阅者 --------
         self.create_subscription(
             VehicleOdometry,
             f"{self._topic_prefix}/fmu/out/vehicle_odometry",
-            self._on_odometry, sensor_qos,
+            self._on_odometry, sensor_qos, callback_group=self._sample_group,
         )
         # PX4 v1.17: vehicle_status_v1
         self.create_subscription(
             VehicleStatus,
             f"{self._topic_prefix}/fmu/out/vehicle_status_v1",
-            self._on_status, sensor_qos,
+            self._on_status, sensor_qos, callback_group=self._sample_group,
         )
         self.create_subscription(
             VehicleLocalPosition,
             f"{self._topic_prefix}/fmu/out/vehicle_local_position",
-            self._on_local_pos, sensor_qos,
+            self._on_local_pos, sensor_qos, callback_group=self._sample_group,
         )
         self.create_subscription(
             VehicleGlobalPosition,
             f"{self._topic_prefix}/fmu/out/vehicle_global_position",
-            self._on_global_pos, sensor_qos,
+            self._on_global_pos, sensor_qos, callback_group=self._sample_group,
         )
         self.create_subscription(
             BatteryStatus,
             f"{self._topic_prefix}/fmu/out/battery_status",
-            self._on_battery, sensor_qos,
+            self._on_battery, sensor_qos, callback_group=self._sample_group,
         )
         if VehicleCommandAck is not None:
             self.create_subscription(
                 VehicleCommandAck,
                 f"{self._topic_prefix}/fmu/out/vehicle_command_ack",
-                self._on_command_ack, sensor_qos,
+                self._on_command_ack, sensor_qos, callback_group=self._sample_group,
             )
         else:
             self.get_logger().warning(
@@ -361,71 +4536,104 @@ class JetsonBridge(Node):
             )
 
         # -------- 链路诊断状态 --------
-        self._started_monotonic = time.monotonic()
-        self._udp_rx_total = 0
-        self._udp_rx_valid = 0
-        self._udp_rx_invalid = 0
-        self._udp_rx_hold = 0
-        self._udp_rx_move = 0
-        self._udp_rx_duplicate = 0
-        self._udp_rx_stale = 0
+        self._started_monotonic = clock()
         self._udp_recv_errors = 0
-        self._last_ctrl_monotonic = None
-        self._last_ctrl_sender = None
-        self._last_backend_timestamp = None
-        self._last_clock_warning_monotonic = 0.0
+        self._ingress_stats = IngressBatchStats()
         self._last_no_control_warning_monotonic = 0.0
         self._last_ros_link_warning_monotonic = 0.0
+        # 主线程维护命令存储的下一时刻，以及发布给诊断的
+        # (pending 数, 当前确认门限) 快照（整体替换，跨线程只读）
+        self._next_command_housekeeping = 0.0
+        self._command_snapshot = (0, COMMAND_CONFIRM_COUNT)
         self._telemetry_sent = 0
         self._telemetry_send_errors = 0
         self._telemetry_last_bytes = 0
+        self._telemetry_heartbeats = 0
+        # 样本回调（executor 线程）与发送（主线程 selector 循环）共享调度状态
+        self._telemetry_lock = threading.Lock()
+        self._telemetry_scheduler = TelemetryScheduler(
+            TELEMETRY_HZ, TELEMETRY_MIN_HZ, TELEMETRY_COALESCE_SEC
+        )
+        self._telemetry_wakeup = None
+        self._sample_latency = LatencyHistogram()
+        self._telemetry_delta = TelemetryDeltaEncoder(
+            TELEMETRY_DELTA, TELEMETRY_KEYFRAME_SEC, TELEMETRY_DELTA_REPEAT
+        )
+        # 高频位姿：executor 线程追加，主线程按批取出；deque 两端操作线程安全，
+        # 上限防止主循环停顿时无限堆积（超出部分丢弃最旧样本）
+        self._pose_samples = deque(maxlen=POSE_BATCH_MAX_SAMPLES * 4)
+        self._pose_next_flush = 0.0
+        self._pose_batch_seq = 0
+        self._pose_batches_sent = 0
+        self._pose_samples_sent = 0
+        self._pose_samples_dropped = 0
+        self._pose_send_errors = 0
         self._offboard_publish_count = 0
         self._vehicle_command_count = 0
         self._command_ack_count = 0
         # None 表示尚未收到 PX4 状态；之后只在解锁/上锁状态切换时输出一次。
         self._px4_armed = None
-        self._ros_rx_counts = {
-            "odometry": 0,
-            "status": 0,
-            "local_position": 0,
-            "global_position": 0,
-            "battery": 0,
-            "command_ack": 0,
-        }
-        self._ros_last_monotonic = {}
+        self._ros_rx_counts = dict.fromkeys(PX4_SAMPLE_NAMES, 0)
         self._last_vehicle_state = None
-        self._active_backend_session = None
-        self._retired_backend_sessions = set()
-        self._highest_applied_sequence = 0
-        self._pending_commands = {}
-        self._applied_command_ids = {}
-        self._commands_applied = 0
-        self._last_applied_command = None
+        self._ros_rx_rates = CounterRates()
+        # FlightRecorder 或 None；None 时各记录点只多一次属性判断
+        self._recorder = None
 
-        # -------- 最新 setpoint 缓存 --------
-        # 在 PX4 给出首个有效 VehicleLocalPosition 前不得猜测本地原点。
-        self._last_setpoint = None
-        self._setpoint_lock = threading.Lock()
+        # -------- 协议核心 --------
+        # 控制会话、确认门、最新 setpoint 与 PX4 样本缓存都在 BridgeCore 中；
+        # 本节点只负责 ROS 收发、socket 与诊断，副作用经 sink 回调到本节点。
+        # UDP 线程的日志经 EventLog 限速后交给本 slot 的后台线程格式化输出
+        self._log_writer = EventLogWriter(name=f"bridge-log-{self.slot}")
+        self._core = BridgeCore(
+            self.slot, self.get_logger(), sink=self,
+            events=EventLog(self.get_logger(), self._log_writer, clock=clock),
+            clock=clock, wall_clock=wall_clock,
+        )
+        # 控制包优先级入口，与 drain_control 同在主线程
+        self._ingress = ControlIngressQueue(self._core.digest_cache, clock=clock)
+        # SETPOINT_SMOOTHING 的中间状态，只由心跳线程读写。
+        self._motion = None
+        self._motion_time_us = 0
 
         # 预热计数 + 手动触发标志
         # 无遥控器流程：bridge 发心跳预热后，等待用户键盘确认再 ARM + 切模式
         self._warmup_count = 0
         self._warmup_needed = OFFBOARD_HZ  # 等待 1 秒（50 帧）
         self._arm_triggered = False        # 由主线程键盘输入置 True
-        self._arm_sent_count = 0
-        self._offboard_sent_count = 0
+        # ARM → OFFBOARD 序列；ACK 回调只入队，由心跳 tick 统一推进
+        self._vehicle_commands = VehicleCommandSequencer(
+            (
+                VehicleCommandStep(
+                    "ARM", int(VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM), 1.0, 0.0
+                ),
+                VehicleCommandStep(
+                    # param2=6: PX4_CUSTOM_MAIN_MODE_OFFBOARD
+                    "OFFBOARD", int(VehicleCommand.VEHICLE_CMD_DO_SET_MODE), 1.0, 6.0
+                ),
+            ),
+            expect_ack=VehicleCommandAck is not None,
+        )
+        self._vehicle_command_acks = deque(maxlen=64)
 
         # -------- 定时器 --------
-        # 50Hz Offboard 心跳 + setpoint
-        self._offboard_timer = self.create_timer(
-            OFFBOARD_INTERVAL, self._offboard_loop
-        )
-        # 10Hz 遥测发送
-        self._tel_timer = self.create_timer(
-            1.0 / TELEMETRY_HZ, self._send_telemetry
-        )
+        # 50Hz Offboard 心跳 + setpoint；实际发布间隔由 HeartbeatMonitor 统计
+        self._heartbeat_monitor = HeartbeatMonitor(OFFBOARD_INTERVAL)
+        self._heartbeat_thread = None
+        if OFFBOARD_THREAD:
+            self._offboard_timer = None
+            self._heartbeat_thread = HeartbeatThread(
+                OFFBOARD_INTERVAL, self._offboard_loop, self.get_logger(),
+                name=f"offboard-{self.slot}", cpus=config.get("offboard_cpus", ()),
+            )
+        else:
+            self._offboard_timer = self.create_timer(
+                OFFBOARD_INTERVAL, self._offboard_loop,
+                callback_group=self._heartbeat_group,
+            )
+        # 遥测不再由固定定时器发送，见 poll_telemetry / TelemetryScheduler
         self._diag_timer = self.create_timer(
-            max(1.0, DIAGNOSTIC_INTERVAL_SEC), self._log_diagnostics
+            max(1.0, DIAGNOSTIC_INTERVAL_SEC), self._log_diagnostics,
+            callback_group=self._diagnostics_group,
         )
 
         # -------- UDP sockets --------
@@ -439,17 +4647,68 @@ class JetsonBridge(Node):
             )
             self._ctrl_sock.close()
             raise
-        self._ctrl_sock.settimeout(0.05)  # 50ms 超时，不阻塞控制线程
+        # 非阻塞：由 main() 的 selector 在可读时唤醒，再一次取空队列
+        self._ctrl_sock.setblocking(False)
+        self._ctrl_kernel_timestamps = False
+        # 内核时间戳是真实墙钟，与注入的虚拟时钟不可比，只在真实时钟下开启
+        if CONTROL_KERNEL_TIMESTAMPS and _SO_TIMESTAMPNS is not None and wall_clock is time.time:
+            try:
+                self._ctrl_sock.setsockopt(socket.SOL_SOCKET, _SO_TIMESTAMPNS, 1)
+                self._ctrl_kernel_timestamps = True
+            except OSError as exc:
+                self.get_logger().warning(
+                    f"[UDP-RX] SO_TIMESTAMPNS unavailable ({exc}); "
+                    f"kernel→read latency will not be recorded"
+                )
 
+        # _tel_sock 只用于位姿批次；遥测经 TelemetryFanout 的 connected socket 发送
         self._tel_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._backend_addr = (BACKEND_HOST, self._tel_port)
+        self._telemetry_fanout = TelemetryFanout(
+            self._backend_addr, config.get("telemetry_subscribers", ()),
+            delta_encoder=(lambda: TelemetryDeltaEncoder(
+                True, TELEMETRY_KEYFRAME_SEC, TELEMETRY_DELTA_REPEAT
+            )) if TELEMETRY_DELTA else None,
+        )
         self._route_local_ip = self._detect_route_local_ip()
 
+        recorder_path = config.get("recorder_path", "")
+        if recorder_path:
+            # 记录器只用于事后分析：打不开时记录错误并继续运行
+            try:
+                self._recorder = FlightRecorder(
+                    recorder_path, FLIGHT_RECORDER_BYTES, slot,
+                    clock_ns=time.monotonic_ns if clock is time.monotonic
+                    else lambda: int(clock() * 1e9),
+                    wall_clock=wall_clock,
+                )
+                self.get_logger().info(
+                    f"[RECORDER] recording to {recorder_path} "
+                    f"({FLIGHT_RECORDER_BYTES / (1024 * 1024):.0f}MiB ring)"
+                )
+            except (OSError, ValueError) as exc:
+                self.get_logger().error(
+                    f"[RECORDER] cannot open {recorder_path}: "
+                    f"{type(exc).__name__}: {exc}; flight recorder disabled"
+                )
+
         self.get_logger().info(
             f"[slot {slot}] Bridge ready | "
             f"ctrl UDP {CONTROL_BIND_HOST}:{self._ctrl_port} | "
             f"tel UDP → {BACKEND_HOST}:{self._tel_port} | "
-            f"ROS2 prefix: {self._topic_prefix or '<none>'} | "
+            + (
+                "tel subscribers → " + ", ".join(
+                    target.label + (f"/{target.divisor}" if target.divisor > 1 else "")
+                    for target in self._telemetry_fanout.subscribers
+                ) + " | "
+                if self._telemetry_fanout.subscribers else ""
+            )
+            + (
+                f"pose UDP → {BACKEND_HOST}:{self._pose_port} every "
+                f"{POSE_BATCH_INTERVAL_SEC * 1e3:.0f}ms | "
+                if self._pose_port else ""
+            )
+            + f"ROS2 prefix: {self._topic_prefix or '<none>'} | "
             f"MAVLink system_id: {self._mavlink_system_id}"
         )
         self.get_logger().info(
@@ -464,26 +4723,61 @@ class JetsonBridge(Node):
             f"{self._cmd_pub.topic_name}"
         )
         self.get_logger().info(
-            f"[PROTOCOL] JSON {CONTROL_PROTOCOL} v{CONTROL_PROTOCOL_VERSION}; "
+            f"[PROTOCOL] JSON {CONTROL_PROTOCOL} v{CONTROL_PROTOCOL_VERSION} + "
+            f"binary {CONTROL_BINARY_MAGIC.decode('ascii')} v{CONTROL_BINARY_VERSION}; "
             f"confirm={COMMAND_CONFIRM_COUNT} unique packets within "
-            f"{COMMAND_CONFIRM_WINDOW_SEC:.2f}s; target=NED meters relative to "
+            f"{COMMAND_CONFIRM_WINDOW_SEC:.2f}s"
+            + (
+                f" (adaptive {COMMAND_CONFIRM_MIN}..{COMMAND_CONFIRM_COUNT} by link loss, "
+                f"reliability {COMMAND_CONFIRM_RELIABILITY:g})"
+                if COMMAND_CONFIRM_ADAPTIVE else ""
+            )
+            + "; auth fast path="
+            f"{('required' if CONTROL_AUTH_REQUIRED else 'on') if CONTROL_AUTH_KEY else 'off'}; "
+            f"target=NED meters relative to "
             f"power_on_origin; max_abs_target={MAX_ABS_TARGET_M:.1f}m"
         )
         self.get_logger().info(
             f"[slot {slot}] Offboard heartbeat: {OFFBOARD_HZ}Hz | "
-            f"Warmup: {self._warmup_needed} frames (~1s)"
+            f"Warmup: {self._warmup_needed} frames (~1s) | setpoint smoothing: "
+            + (
+                f"on (v<={SETPOINT_MAX_VELOCITY_MPS:.2f}m/s, "
+                f"a<={SETPOINT_MAX_ACCEL_MPS2:.2f}m/s^2, velocity/acceleration feedforward)"
+                if SETPOINT_SMOOTHING else "off"
+            )
+        )
+        self.get_logger().info(
+            f"[slot {slot}] Telemetry: sent {TELEMETRY_COALESCE_SEC * 1e3:.1f}ms after fresh "
+            f"local_position/odometry, max {TELEMETRY_HZ:g}Hz, heartbeat >= {TELEMETRY_MIN_HZ:g}Hz; "
+            + (
+                f"delta encoding on (keyframe every {TELEMETRY_KEYFRAME_SEC:g}s, "
+                f"changes repeated x{TELEMETRY_DELTA_REPEAT})"
+                if TELEMETRY_DELTA else "full datagrams"
+            )
         )
+        # 心跳线程最后启动：此时 tick 用到的消息与状态均已就绪
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.start()
+            self.get_logger().info(
+                f"[slot {slot}] Offboard heartbeat on dedicated thread: "
+                + ("; ".join(self._heartbeat_thread.scheduling) or "default scheduling")
+            )
 
     # ------------------------------------------------------------------
     # ROS2 订阅回调
     # ------------------------------------------------------------------
     def _on_odometry(self, msg: VehicleOdometry):
-        self._mark_ros_rx("odometry")
-        self._odometry = msg
+        self._mark_ros_rx("odometry", msg)
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_odometry(msg)
+        self._note_telemetry_sample()
 
     def _on_status(self, msg: VehicleStatus):
-        self._mark_ros_rx("status")
-        self._status = msg
+        self._mark_ros_rx("status", msg)
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_status(msg)
         state = (int(msg.arming_state), int(msg.nav_state))
 
         # VehicleStatus.ARMING_STATE_ARMED 在不同 px4_msgs 版本中均为 2；
@@ -515,66 +4809,48 @@ class JetsonBridge(Node):
             self._last_vehicle_state = state
 
     def _on_local_pos(self, msg: VehicleLocalPosition):
-        self._mark_ros_rx("local_position")
-        self._local_pos = msg
-        if valid_vehicle_local_ned(msg) is None:
-            with self._setpoint_lock:
-                cleared_stale_setpoint = self._last_setpoint is not None
-                self._last_setpoint = None
-            self._warmup_count = 0
-            if cleared_stale_setpoint:
-                self.get_logger().warning(
-                    "[SAFE-HOLD] PX4 local position became invalid; "
-                    "cleared the old-frame setpoint"
-                )
-            return
-        self._ensure_safe_hold_initialized(msg)
-
-    def _ensure_safe_hold_initialized(self, local_position) -> bool:
-        """Initialize the first setpoint from a valid PX4 local NED sample."""
-        local_ned = valid_vehicle_local_ned(local_position)
+        self._mark_ros_rx("local_position", msg)
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_local_position(msg)
+        self._note_telemetry_sample()
+        local_ned = self._core.update_safe_hold(msg)
         if local_ned is None:
-            return False
-
-        initialized_now = False
-        with self._setpoint_lock:
-            if self._last_setpoint is None:
-                self._last_setpoint = {
-                    "x": local_ned[0],
-                    "y": local_ned[1],
-                    "z": local_ned[2],
-                    "mode": "hold",
-                    "sequence": 0,
-                }
-                initialized_now = True
-
-        if initialized_now:
-            self.get_logger().info(
-                f"[SAFE-HOLD] initialized from first valid VehicleLocalPosition: "
-                f"NED=({local_ned[0]:.3f},{local_ned[1]:.3f},{local_ned[2]:.3f})"
-            )
-        return True
+            return
+        if self._pose_port:
+            self._record_pose_sample(msg, local_ned)
+
+    def _record_pose_sample(self, msg, local_ned):
+        odometry = self._core.samples["odometry"]
+        q = tuple(float(v) for v in odometry.q) if odometry is not None else _NAN_QUATERNION
+        if len(self._pose_samples) == self._pose_samples.maxlen:
+            self._pose_samples_dropped += 1
+        self._pose_samples.append(PoseSample(
+            int(msg.timestamp), local_ned, q,
+            (float(msg.vx), float(msg.vy), float(msg.vz)),
+        ))
 
     def _on_global_pos(self, msg: VehicleGlobalPosition):
-        self._mark_ros_rx("global_position")
-        self._global_pos = msg
+        self._mark_ros_rx("global_position", msg)
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_global_position(msg)
 
     def _on_battery(self, msg: BatteryStatus):
-        self._mark_ros_rx("battery")
-        self._battery = msg
+        self._mark_ros_rx("battery", msg)
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_battery(msg)
 
     def _on_command_ack(self, msg):
-        self._mark_ros_rx("command_ack")
+        self._mark_ros_rx("command_ack", msg)
         self._command_ack_count += 1
-        result_names = {
-            0: "ACCEPTED",
-            1: "TEMPORARILY_REJECTED",
-            2: "DENIED",
-            3: "UNSUPPORTED",
-            4: "FAILED",
-            5: "IN_PROGRESS",
-            6: "CANCELLED",
-        }
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_command_ack(msg)
+        self._vehicle_command_acks.append(
+            (int(msg.command), int(msg.result), self.get_clock().now().nanoseconds / 1e9)
+        )
         command_names = {
             int(VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM): "ARM_DISARM",
             int(VehicleCommand.VEHICLE_CMD_DO_SET_MODE): "DO_SET_MODE",
@@ -584,7 +4860,7 @@ class JetsonBridge(Node):
         self.get_logger().info(
             f"[PX4-ACK] #{self._command_ack_count} "
             f"command={command}({command_names.get(command, 'OTHER')}) "
-            f"result={result}({result_names.get(result, 'UNKNOWN')}) "
+            f"result={result}({VEHICLE_CMD_RESULT_NAMES.get(result, 'UNKNOWN')}) "
             f"result_param1={int(msg.result_param1)} "
             f"result_param2={int(msg.result_param2)} "
             f"target_system={int(msg.target_system)} "
@@ -592,9 +4868,9 @@ class JetsonBridge(Node):
             f"from_external={bool(msg.from_external)}"
         )
 
-    def _mark_ros_rx(self, name: str):
+    def _mark_ros_rx(self, name: str, msg):
         self._ros_rx_counts[name] += 1
-        self._ros_last_monotonic[name] = time.monotonic()
+        self._core.note_sample(name, msg)
         if self._ros_rx_counts[name] == 1:
             self.get_logger().info(f"[ROS-RX] first {name} message received")
 
@@ -602,37 +4878,52 @@ class JetsonBridge(Node):
     # 50Hz Offboard 心跳循环（核心）
     # ------------------------------------------------------------------
     def _offboard_loop(self):
-        now_us = int(self.get_clock().now().nanoseconds / 1000)
+        now_us = self.get_clock().now().nanoseconds // 1000
 
         # Never publish a guessed origin setpoint or advance toward
         # ARM/OFFBOARD before the PX4 local estimator is valid.
-        with self._setpoint_lock:
-            sp = dict(self._last_setpoint) if self._last_setpoint is not None else None
+        # 本地轨迹运行时先在 setpoint_lock 内推进一拍；此后单次引用读取即得到
+        # 完整的不可变 Setpoint，无需与 UDP 线程争锁。
+        core = self._core
+        core.step_trajectory(core.clock())
+        sp = core.last_setpoint
         if sp is None:
+            # 预热计数只由心跳读写：停发期间清零，恢复后重新预热
+            self._warmup_count = 0
+            self._motion = None
+            self._heartbeat_monitor.reset_gap()
             return
 
-        # 1. 持续发布 OffboardControlMode（位置控制）
-        ocm = OffboardControlMode()
+        # 1. 持续发布 OffboardControlMode（位置控制，常量字段已在初始化时写好）
+        ocm = self._ocm_msg
         ocm.timestamp = now_us
-        ocm.position = True
-        ocm.velocity = False
-        ocm.acceleration = False
-        ocm.attitude = False
-        ocm.body_rate = False
-        ocm.thrust_and_torque = False
-        ocm.direct_actuator = False
         self._offboard_pub.publish(ocm)
 
-        # 2. 持续发布 TrajectorySetpoint（最新缓存值）
-        tsp = TrajectorySetpoint()
+        # 2. 持续发布 TrajectorySetpoint（最新缓存值），原地改写 position
+        tsp = self._tsp_msg
         tsp.timestamp = now_us
-        tsp.position = [sp["x"], sp["y"], sp["z"]]
-        tsp.velocity = [float("nan")] * 3
-        tsp.acceleration = [float("nan")] * 3
-        tsp.yaw = float("nan")
-        tsp.yawspeed = float("nan")
+        position = self._tsp_position
+        if SETPOINT_SMOOTHING:
+            motion = self._advance_motion(sp, now_us)
+            position[0], position[1], position[2] = motion.position
+            velocity = self._tsp_velocity
+            velocity[0], velocity[1], velocity[2] = motion.velocity
+            acceleration = self._tsp_acceleration
+            acceleration[0], acceleration[1], acceleration[2] = motion.acceleration
+        else:
+            position[0] = sp.x
+            position[1] = sp.y
+            position[2] = sp.z
         self._traj_pub.publish(tsp)
+        self._heartbeat_monitor.note(self._monotonic())
         self._offboard_publish_count += 1
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_setpoint_publish(sp.sequence, sp.mode, position, now_us)
+        probe = core.publish_probe
+        if probe is not None and probe[0] == sp.sequence:
+            core.publish_probe = None
+            core.record_publish_hops(probe)
 
         # 3. 预热计数
         if self._warmup_count < self._warmup_needed:
@@ -648,183 +4939,238 @@ class JetsonBridge(Node):
         if not self._arm_triggered:
             return
 
-        # 5. ARM，连发 5 次
-        if self._arm_sent_count < 5:
-            self._send_vehicle_command(
-                VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM,
-                param1=1.0,
-            )
-            self._arm_sent_count += 1
-            if self._arm_sent_count == 1:
-                self.get_logger().info(f"[slot {self.slot}] ARM sending (x5)...")
+        # 5. ARM → 切 OFFBOARD：按 ACK 推进，超时退避重发
+        sequencer = self._vehicle_commands
+        if sequencer.state in ("done", "failed"):
             return
+        sequencer.start()
+        self._step_vehicle_commands(sequencer, now_us / 1e6)
 
-        # 6. 切 OFFBOARD，连发 5 次
-        if self._offboard_sent_count < 5:
-            self._send_vehicle_command(
-                VehicleCommand.VEHICLE_CMD_DO_SET_MODE,
-                param1=1.0,
-                param2=6.0,  # PX4_CUSTOM_MAIN_MODE_OFFBOARD
+    def _step_vehicle_commands(self, sequencer, now: float):
+        logger = self.get_logger()
+        acks = self._vehicle_command_acks
+        while acks:
+            command, result, received = acks.popleft()
+            handled = sequencer.on_ack(command, result, received)
+            if handled is None:
+                continue
+            step, result_name = handled
+            if result_name == "ACCEPTED":
+                logger.info(
+                    f"[slot {self.slot}] {step.name} accepted: "
+                    f"ack {format_latency_ms(sequencer.ack_latency[step.name].snapshot())}"
+                )
+            elif sequencer.state == "failed":
+                logger.error(
+                    f"[slot {self.slot}] {step.name} rejected by PX4: {result_name}; "
+                    f"ARM/OFFBOARD sequence stopped"
+                )
+            else:
+                logger.warning(f"[slot {self.slot}] {step.name} ack {result_name}, waiting")
+
+        was_running = sequencer.state == "running"
+        step = sequencer.poll(now)
+        if step is not None:
+            self._send_vehicle_command(step.command, param1=step.param1, param2=step.param2)
+            if sequencer.attempts == 1:
+                logger.info(f"[slot {self.slot}] {step.name} sending...")
+            elif sequencer.expect_ack:
+                logger.warning(
+                    f"[slot {self.slot}] {step.name} not acknowledged, "
+                    f"retry {sequencer.attempts}/{sequencer.max_attempts}"
+                )
+        elif was_running and sequencer.state == "failed":
+            failed = sequencer.steps[sequencer.index]
+            logger.error(
+                f"[slot {self.slot}] {failed.name} not acknowledged after "
+                f"{sequencer.attempts} attempts; ARM/OFFBOARD sequence stopped"
+            )
+        if sequencer.state == "done":
+            logger.info(f"[slot {self.slot}] Done. Check QGC: ARMED + OFFBOARD")
+
+    def _advance_motion(self, sp, now_us: int):
+        """平滑模式：把运动状态推进一个心跳周期，首个 tick 从 setpoint 原地起步。"""
+        motion = self._motion
+        if motion is None:
+            motion = MotionState((sp.x, sp.y, sp.z), _ZERO_VECTOR, _ZERO_VECTOR)
+        else:
+            # 用实际 tick 间隔积分，但限制在名义周期的 0.5~2 倍，避免
+            # 定时器停顿后一步跳出很远。
+            dt = min(
+                max((now_us - self._motion_time_us) / 1e6, OFFBOARD_INTERVAL * 0.5),
+                OFFBOARD_INTERVAL * 2.0,
             )
-            self._offboard_sent_count += 1
-            if self._offboard_sent_count == 1:
-                self.get_logger().info(f"[slot {self.slot}] OFFBOARD mode sending (x5)...")
-            elif self._offboard_sent_count == 5:
-                self.get_logger().info(f"[slot {self.slot}] Done. Check QGC: ARMED + OFFBOARD")
+            motion = step_setpoint_motion(
+                motion, (sp.x, sp.y, sp.z), dt,
+                SETPOINT_MAX_VELOCITY_MPS, SETPOINT_MAX_ACCEL_MPS2,
+            )
+        self._motion = motion
+        self._motion_time_us = now_us
+        return motion
 
     # ------------------------------------------------------------------
-    # 10Hz 遥测发送
+    # 遥测发送：PX4 样本驱动（TelemetryScheduler，≤TELEMETRY_HZ，空闲时按
+    # TELEMETRY_MIN_HZ 心跳），由主循环 poll_telemetry 在截止时刻发送
     # ------------------------------------------------------------------
-    def _send_telemetry(self):
-        data = {}
-        data["timestamp"] = self.get_clock().now().nanoseconds // 1000  # μs
-        now_monotonic = time.monotonic()
-
-        if self._odometry:
-            o = self._odometry
-            data["position"] = [float(v) for v in o.position]
-            data["q"] = [float(v) for v in o.q]
-            data["velocity"] = [float(v) for v in o.velocity]
-            data["angular_velocity"] = [float(v) for v in o.angular_velocity]
+    def set_telemetry_wakeup(self, wakeup):
+        """注册唤醒回调：新样本使发送时刻提前时调用，通常写入主循环的 self-pipe。"""
+        self._telemetry_wakeup = wakeup
 
-        if self._status:
-            data["arming_state"] = int(self._status.arming_state)
-            data["nav_state"] = int(self._status.nav_state)
+    def _note_telemetry_sample(self):
+        with self._telemetry_lock:
+            wake = self._telemetry_scheduler.note_sample(self._monotonic())
+        if wake and self._telemetry_wakeup is not None:
+            self._telemetry_wakeup()
 
-        local_position_fresh = ros_sample_is_fresh(
-            self._ros_last_monotonic,
-            "local_position",
-            now_monotonic,
-            MAX_TELEMETRY_SAMPLE_AGE_SEC,
-        )
-        if self._local_pos and local_position_fresh:
-            lp = self._local_pos
-            data["local_position"] = [float(lp.x), float(lp.y), float(lp.z)]
-            data["local_velocity"] = [float(lp.vx), float(lp.vy), float(lp.vz)]
-            # Use the exact frame consumed by TrajectorySetpoint. VehicleOdometry
-            # may advertise a different pose frame (for example FRD).
-            local_ned = valid_vehicle_local_ned(lp)
-            data["local_position_valid"] = local_ned is not None
-            if local_ned is not None:
-                data["position"] = local_ned
+    def poll_telemetry(self, now_monotonic: float) -> float:
+        """到期则发送一次遥测；返回下一次需要调用的单调时钟时刻。"""
+        with self._telemetry_lock:
+            scheduler = self._telemetry_scheduler
+            if not scheduler.due(now_monotonic):
+                return scheduler.next_deadline()
+            latency = scheduler.mark_sent(now_monotonic)
+            deadline = scheduler.next_deadline()
+        if latency is None:
+            self._telemetry_heartbeats += 1
         else:
-            data["local_position_valid"] = False
+            self._sample_latency.record(latency)
+        self._send_telemetry(latency)
+        return deadline
 
-        global_position_fresh = ros_sample_is_fresh(
-            self._ros_last_monotonic,
-            "global_position",
-            now_monotonic,
-            MAX_TELEMETRY_SAMPLE_AGE_SEC,
-        )
-        if self._global_pos and global_position_fresh:
-            gp = self._global_pos
-            # PX4 v1.17: lat / lon / alt / lat_lon_valid
-            gps_lat = float(gp.lat)
-            gps_lon = float(gp.lon)
-            gps_alt = float(gp.alt)
-            data["gps_lat"] = gps_lat
-            data["gps_lon"] = gps_lon
-            data["gps_alt"] = gps_alt
-            geographic_sample_skew = abs(
-                self._ros_last_monotonic.get("global_position", float("-inf"))
-                - self._ros_last_monotonic.get("local_position", float("inf"))
-            )
-            data["gps_fix"] = (
-                bool(gp.lat_lon_valid)
-                and bool(getattr(gp, "alt_valid", True))
-                and local_position_fresh
-                and geographic_sample_skew <= MAX_GEOGRAPHIC_SAMPLE_SKEW_SEC
-                and all(math.isfinite(value) for value in (gps_lat, gps_lon, gps_alt))
-                and -90.0 <= gps_lat <= 90.0
-                and -180.0 <= gps_lon <= 180.0
-            )
-        else:
-            data["gps_fix"] = False
+    def poll_pose_batch(self, now_monotonic: float) -> float:
+        """到期则把缓存的位姿样本打包发送；返回下一次需要调用的时刻。"""
+        if not self._pose_port:
+            return math.inf
+        if now_monotonic < self._pose_next_flush:
+            return self._pose_next_flush
+        self._pose_next_flush = now_monotonic + POSE_BATCH_INTERVAL_SEC
+        samples = self._pose_samples
+        if not samples:
+            return self._pose_next_flush
 
-        if self._battery:
-            data["battery"] = (
-                int(self._battery.remaining * 100)
-                if self._battery.remaining >= 0
-                else -1
-            )
+        sent_at_us = self.get_clock().now().nanoseconds // 1000
+        addr = (self._backend_addr[0], self._pose_port)
+        while samples:
+            batch = [samples.popleft() for _ in range(min(len(samples), POSE_BATCH_MAX_SAMPLES))]
+            self._pose_batch_seq += 1
+            try:
+                self._tel_sock.sendto(
+                    encode_pose_batch(self.slot, self._pose_batch_seq, sent_at_us, batch), addr
+                )
+                self._pose_batches_sent += 1
+                self._pose_samples_sent += len(batch)
+            except OSError as exc:
+                self._pose_send_errors += 1
+                if self._pose_send_errors == 1 or self._pose_send_errors % 100 == 0:
+                    self.get_logger().error(
+                        f"[POSE-TX] pose batch send failed #{self._pose_send_errors} "
+                        f"to {addr[0]}:{addr[1]}: {type(exc).__name__}: {exc}"
+                    )
+        return self._pose_next_flush
 
-        # 应用层 ACK：只有达到确认阈值且 setpoint 已写入缓存后才回传。
-        # 后端据此能区分“UDP 已发出”和“Jetson 已确认执行”。
-        if self._last_applied_command:
-            data["control_ack"] = dict(self._last_applied_command)
+    def _send_telemetry(self, sample_latency: float | None = None):
+        data = self._core.build_telemetry(
+            self.get_clock().now().nanoseconds // 1000, self._monotonic(), sample_latency
+        )
 
+        # 各自增量编码的降频订阅者需要编码前的完整字段
+        fanout = self._telemetry_fanout
+        fields = dict(data) if fanout.reencodes else None
+        now = self._monotonic()
         try:
-            payload = yaml.dump(
-                data, sort_keys=False, default_flow_style=None
-            ).encode("utf-8")
-            sent = self._tel_sock.sendto(payload, self._backend_addr)
-            self._telemetry_sent += 1
-            self._telemetry_last_bytes = sent
-            if self._telemetry_sent == 1:
-                self.get_logger().info(
-                    f"[UDP-TX] first telemetry sent: {sent}B → "
-                    f"{self._backend_addr[0]}:{self._backend_addr[1]}, "
-                    f"fields={list(data.keys())}"
-                )
+            self._telemetry_delta.encode(data, now)
+            payload = encode_telemetry_yaml(data)
         except Exception as e:
             self._telemetry_send_errors += 1
             self.get_logger().error(
-                f"[UDP-TX] telemetry send failed #{self._telemetry_send_errors} "
-                f"to {self._backend_addr[0]}:{self._backend_addr[1]}: "
+                f"[UDP-TX] telemetry encode failed #{self._telemetry_send_errors}: "
                 f"{type(e).__name__}: {e}"
             )
+            return
+
+        # 编码一次，主后端与不降频的订阅者共用同一份 payload
+        failures = fanout.send(payload, data.get("keyframe", False), fields, now)
+        primary = fanout.primary
+        for target, exc in failures:
+            if target is primary and not isinstance(exc, ConnectionRefusedError):
+                self._telemetry_send_errors += 1
+            self._core.events.emit(
+                "warning" if isinstance(exc, ConnectionRefusedError) else "error",
+                "telemetry-tx",
+                "[UDP-TX] telemetry send to {target} failed "
+                "(sent/errors/refused={sent}/{errors}/{refused}): {kind}: {error}",
+                target=target.label, sent=target.sent, errors=target.errors,
+                refused=target.refused, kind=type(exc).__name__, error=exc,
+            )
+        if not failures or all(target is not primary for target, _ in failures):
+            self._telemetry_sent += 1
+            self._telemetry_last_bytes = primary.last_bytes
+            if self._telemetry_sent == 1:
+                self.get_logger().info(
+                    f"[UDP-TX] first telemetry sent: {primary.last_bytes}B → "
+                    f"{primary.label}, fields={list(data.keys())}"
+                )
 
     # ------------------------------------------------------------------
-    # UDP 控制包接收（主线程轮询调用）
+    # UDP 控制包接收（主线程 selector 可读时调用）
     # ------------------------------------------------------------------
-    def process_control(self):
-        try:
-            data, addr = self._ctrl_sock.recvfrom(MAX_CONTROL_PACKET_BYTES + 1)
-        except socket.timeout:
-            return
-        except OSError as exc:
-            if not running:
-                return
+    def drain_control(self) -> int:
+        """控制 socket 可读时调用：取出全部已排队数据报并作为一批处理。"""
+        batch, error = drain_udp_socket(
+            self._ctrl_sock, MAX_CONTROL_PACKET_BYTES + 1, CONTROL_INGRESS_MAX_BATCH,
+            clock=self._monotonic, kernel_timestamps=self._ctrl_kernel_timestamps,
+        )
+        self._ingress_stats.record(
+            len(batch), capped=len(batch) >= CONTROL_INGRESS_MAX_BATCH
+        )
+        if error is not None and running:
             self._udp_recv_errors += 1
-            self.get_logger().error(
-                f"[UDP-RX] recvfrom failed #{self._udp_recv_errors}: "
-                f"{type(exc).__name__}: {exc}"
+            self._core.events.emit(
+                "error", "udp-recv", "[UDP-RX] recvfrom failed #{count}: {kind}: {error}",
+                count=self._udp_recv_errors, kind=type(error).__name__, error=error,
             )
-            return
-
-        self._udp_rx_total += 1
-        try:
-            parsed = parse_control_packet(data)
-        except ValueError as exc:
-            self._udp_rx_invalid += 1
-            self.get_logger().warning(
-                f"[UDP-RX] rejected packet #{self._udp_rx_total} from "
-                f"{addr[0]}:{addr[1]}: {exc}; size={len(data)}B; "
-                f"preview={data[:160]!r}"
-            )
-            return
+        # 记录器保存收到的原始输入，包括随后在入口被丢弃的数据报
+        recorder = self._recorder
+        if recorder is not None:
+            for datagram in batch:
+                recorder.record_datagram(
+                    datagram.data, datagram.addr, datagram.rx_monotonic,
+                    datagram.kernel_rx_unix,
+                )
+        self._ingress.admit(batch, capped=len(batch) >= CONTROL_INGRESS_MAX_BATCH)
+        self._ingress.run(self._core.handle_datagram)
+        return len(batch)
 
-        if parsed["slot"] != self.slot:
-            self._udp_rx_invalid += 1
-            self.get_logger().warning(
-                f"[UDP-RX] rejected command_id={parsed['command_id']}: "
-                f"JSON slot={parsed['slot']} but this bridge slot={self.slot}. "
-                f"Check backend port_map; packet came from {addr[0]}:{addr[1]}."
-            )
-            return
+    def poll_control_ingress(self, now_monotonic: float) -> float:
+        """预算用尽后积压的控制包在新心跳周期处理；返回下一次需要调用的时刻。"""
+        ingress = self._ingress
+        deadline = ingress.next_deadline()
+        if now_monotonic >= deadline:
+            ingress.run(self._core.handle_datagram)
+            deadline = ingress.next_deadline()
+        return deadline
 
-        if not self._accept_backend_session(parsed):
-            return
+    def poll_command_housekeeping(self, now_monotonic: float) -> float:
+        """到期则淘汰空闲 pending 与过期 applied；返回下一次需要调用的时刻。
 
-        now_monotonic = time.monotonic()
-        if self._last_ctrl_sender is not None and addr != self._last_ctrl_sender:
-            self.get_logger().warning(
-                f"[UDP-RX] control sender changed: "
-                f"{self._last_ctrl_sender[0]}:{self._last_ctrl_sender[1]} → "
-                f"{addr[0]}:{addr[1]}"
-            )
-        self._last_ctrl_sender = addr
+        必须与 drain_control 在同一线程调用：CommandStore 只允许其所有者线程修改。
+        """
+        if now_monotonic < self._next_command_housekeeping:
+            return self._next_command_housekeeping
+        core = self._core
+        commands = core.commands
+        commands.expire_pending(now_monotonic, COMMAND_CONFIRM_WINDOW_SEC * 2)
+        commands.prune_applied(now_monotonic)
+        self._command_snapshot = (
+            len(commands.pending), core.link.confirm_count(core.link.repeat_total)
+        )
+        self._next_command_housekeeping = now_monotonic + COMMAND_CONFIRM_WINDOW_SEC
+        return self._next_command_housekeeping
 
+    # ------------------------------------------------------------------
+    # BridgeCore sink
+    # ------------------------------------------------------------------
+    def control_sender_validated(self, addr):
         # UDP sendto() 在错误目标 IP 时通常也会返回成功，单靠
         # telemetry_sent 不能证明后端收到了包。已通过协议校验的控制包
         # 来自真实后端时，以其源 IP 自愈遥测回传目标，端口仍固定为本 slot 的
@@ -834,6 +5180,7 @@ class JetsonBridge(Node):
         if sender_backend_addr != self._backend_addr:
             previous_backend_addr = self._backend_addr
             self._backend_addr = sender_backend_addr
+            self._telemetry_fanout.retarget_primary(sender_backend_addr)
             self._route_local_ip = self._detect_route_local_ip()
             self.get_logger().warning(
                 f"[UDP-TX] telemetry target corrected from "
@@ -841,210 +5188,11 @@ class JetsonBridge(Node):
                 f"{self._backend_addr[0]}:{self._backend_addr[1]} based on "
                 f"validated control sender"
             )
-        self._last_ctrl_monotonic = now_monotonic
-        self._last_backend_timestamp = parsed["sent_at"]
-        self._udp_rx_valid += 1
-        if parsed["mode"] == "hold":
-            self._udp_rx_hold += 1
-        else:
-            self._udp_rx_move += 1
-
-        clock_delta = time.time() - parsed["sent_at"]
-        if (
-            abs(clock_delta) > 10.0
-            and now_monotonic - self._last_clock_warning_monotonic >= 30.0
-        ):
-            self.get_logger().warning(
-                f"[CLOCK] backend timestamp differs from Jetson by "
-                f"{clock_delta:+.3f}s. Check NTP/time sync; packet is still accepted."
-            )
-            self._last_clock_warning_monotonic = now_monotonic
-
-        # 每个 move 重发包都打印；持续 hold 降采样，避免长时间运行刷屏。
-        should_log = (
-            parsed["mode"] == "move"
-            or self._udp_rx_valid == 1
-            or self._udp_rx_hold % 25 == 0
-        )
-        if should_log:
-            self.get_logger().info(
-                f"[UDP-RX] valid #{self._udp_rx_valid} id={parsed['command_id']} "
-                f"seq={parsed['sequence']} repeat={parsed['repeat_index']}/"
-                f"{parsed['repeat_total'] or 'continuous'} from {addr[0]}:{addr[1]} "
-                f"mode={parsed['mode']} "
-                f"NED=({parsed['x']:.3f},{parsed['y']:.3f},{parsed['z']:.3f}) "
-                f"reference=power_on_origin unit=m clock_delta={clock_delta:+.3f}s"
-            )
-
-        self._stage_control_command(parsed, addr, now_monotonic)
-
-    def _accept_backend_session(self, parsed: dict) -> bool:
-        """识别后端重启会话，并阻止旧会话的迟到包重新生效。"""
-        session_id = parsed["session_id"]
-        if self._active_backend_session is None:
-            self._active_backend_session = session_id
-            self.get_logger().info(
-                f"[SESSION] backend session established: {session_id}"
-            )
-            return True
-        if session_id == self._active_backend_session:
-            return True
-        if session_id in self._retired_backend_sessions:
-            self._udp_rx_stale += 1
-            self.get_logger().warning(
-                f"[SESSION] rejected packet from retired backend session "
-                f"{session_id}; active={self._active_backend_session}"
-            )
-            return False
-
-        old_session = self._active_backend_session
-        self._retired_backend_sessions.add(old_session)
-        self._active_backend_session = session_id
-        self._highest_applied_sequence = 0
-        self._pending_commands.clear()
-        self._applied_command_ids.clear()
-        self.get_logger().warning(
-            f"[SESSION] backend session changed {old_session} → {session_id}; "
-            f"pending commands cleared and sequence ordering restarted"
-        )
-        return True
-
-    @staticmethod
-    def _control_fingerprint(parsed: dict):
-        """同一 command_id 的所有重发包必须具有完全一致的执行语义。"""
-        return (
-            parsed["session_id"], parsed["command_id"], parsed["sequence"],
-            parsed["drone_id"], parsed["slot"], parsed["mode"],
-            parsed["x"], parsed["y"], parsed["z"],
-        )
-
-    def _stage_control_command(self, parsed: dict, addr, now_monotonic: float):
-        command_id = parsed["command_id"]
-        sequence = parsed["sequence"]
-
-        if command_id in self._applied_command_ids:
-            self._udp_rx_duplicate += 1
-            return
-        if sequence <= self._highest_applied_sequence:
-            self._udp_rx_stale += 1
-            self.get_logger().warning(
-                f"[COMMAND-STALE] rejected id={command_id} sequence={sequence}; "
-                f"highest_applied={self._highest_applied_sequence}"
-            )
-            return
-
-        pending = self._pending_commands.get(command_id)
-        fingerprint = self._control_fingerprint(parsed)
-        if pending and pending["fingerprint"] != fingerprint:
-            self._udp_rx_invalid += 1
-            del self._pending_commands[command_id]
-            self.get_logger().error(
-                f"[COMMAND-CONFLICT] same command_id={command_id} carried "
-                f"different payloads; entire confirmation group discarded"
-            )
-            return
-
-        if pending and now_monotonic - pending["first_seen"] > COMMAND_CONFIRM_WINDOW_SEC:
-            self.get_logger().warning(
-                f"[COMMAND-WINDOW] id={command_id} did not reach "
-                f"{COMMAND_CONFIRM_COUNT} packets within "
-                f"{COMMAND_CONFIRM_WINDOW_SEC:.2f}s; restarting window"
-            )
-            pending = None
-
-        if pending is None:
-            pending = {
-                "first_seen": now_monotonic,
-                "last_seen": now_monotonic,
-                "repeat_indices": set(),
-                "fingerprint": fingerprint,
-                "packet": parsed,
-                "sender": addr,
-            }
-            self._pending_commands[command_id] = pending
-
-        repeat_index = parsed["repeat_index"]
-        if repeat_index in pending["repeat_indices"]:
-            self._udp_rx_duplicate += 1
-            return
-
-        pending["repeat_indices"].add(repeat_index)
-        pending["last_seen"] = now_monotonic
-        confirmed = len(pending["repeat_indices"])
-        self.get_logger().info(
-            f"[COMMAND-PENDING] id={command_id} sequence={sequence} "
-            f"unique={confirmed}/{COMMAND_CONFIRM_COUNT} "
-            f"indices={sorted(pending['repeat_indices'])} "
-            f"age={now_monotonic - pending['first_seen']:.3f}s"
-        )
-
-        if parsed["repeat_total"] and parsed["repeat_total"] < COMMAND_CONFIRM_COUNT:
-            self.get_logger().warning(
-                f"[COMMAND-POLICY] backend repeat_total={parsed['repeat_total']} "
-                f"is lower than Jetson threshold={COMMAND_CONFIRM_COUNT}"
-            )
-
-        if confirmed >= COMMAND_CONFIRM_COUNT:
-            self._apply_control_command(parsed, confirmed, now_monotonic)
-
-    def _apply_control_command(
-        self, parsed: dict, confirmed_packets: int, now_monotonic: float
-    ):
-        sequence = parsed["sequence"]
-        if sequence <= self._highest_applied_sequence:
-            self._udp_rx_stale += 1
-            return
-
-        # JSON 中已经是 PX4 所需的 NED 米坐标，原点为本次上电位置。
-        # Jetson 只透传到 TrajectorySetpoint，不做 UE/NED 二次转换。
-        with self._setpoint_lock:
-            if self._last_setpoint is None:
-                self.get_logger().warning(
-                    f"[COMMAND-SAFETY] deferred id={parsed['command_id']} "
-                    f"sequence={sequence}: waiting for first valid "
-                    f"VehicleLocalPosition"
-                )
-                return False
-            self._last_setpoint = {
-                "x": parsed["x"],
-                "y": parsed["y"],
-                "z": parsed["z"],
-                "mode": parsed["mode"],
-                "sequence": sequence,
-            }
-
-        self._highest_applied_sequence = sequence
-        self._commands_applied += 1
-        self._applied_command_ids[parsed["command_id"]] = now_monotonic
-        self._last_applied_command = {
-            "session_id": parsed["session_id"],
-            "command_id": parsed["command_id"],
-            "sequence": sequence,
-            "mode": parsed["mode"],
-            "confirmed_packets": confirmed_packets,
-            "applied_at_unix_s": time.time(),
-        }
-
-        for command_id, pending in list(self._pending_commands.items()):
-            if pending["packet"]["sequence"] <= sequence:
-                del self._pending_commands[command_id]
-        self._prune_applied_commands(now_monotonic)
-
-        self.get_logger().info(
-            f"[COMMAND-EXECUTE] #{self._commands_applied} "
-            f"id={parsed['command_id']} sequence={sequence} mode={parsed['mode']} "
-            f"confirmed={confirmed_packets} NED(m, power_on_origin)="
-            f"({parsed['x']:.3f},{parsed['y']:.3f},{parsed['z']:.3f})"
-        )
-        return True
 
-    def _prune_applied_commands(self, now_monotonic: float):
-        for command_id, applied_at in list(self._applied_command_ids.items()):
-            if now_monotonic - applied_at > 300.0:
-                del self._applied_command_ids[command_id]
-        while len(self._applied_command_ids) > 256:
-            oldest = next(iter(self._applied_command_ids))
-            del self._applied_command_ids[oldest]
+    def command_applied(self, parsed: dict, confirmed_packets: int, authenticated: bool):
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_command_applied(parsed, confirmed_packets, authenticated)
 
     # ------------------------------------------------------------------
     # 发送 VehicleCommand 辅助函数
@@ -1077,6 +5225,9 @@ class JetsonBridge(Node):
         cmd.from_external = True
         self._cmd_pub.publish(cmd)
         self._vehicle_command_count += 1
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_vehicle_command(command, param1, param2, cmd.timestamp)
         self.get_logger().info(
             f"[ROS-TX] VehicleCommand #{self._vehicle_command_count}: "
             f"command={command}, target_system={cmd.target_system}, "
@@ -1103,38 +5254,232 @@ class JetsonBridge(Node):
         finally:
             probe.close()
 
+    def collect_metrics(self, now: float) -> list:
+        """返回本 slot 的指标 ``(name, kind, help, value, labels)`` 列表，供 render_metrics。
+
+        只读取属性（必要时先整体复制字典），不取锁；计数与 ROS/UDP 线程的
+        写入之间允许有一个样本的偏差。
+        """
+        slot = {"slot": self.slot}
+        core = self._core
+        prefix = "jetson_bridge_"
+        metrics = []
+
+        def add(name, kind, help_text, value, **labels):
+            metrics.append((prefix + name, kind, help_text, value, {**slot, **labels}))
+
+        add("control_datagrams_total", "counter",
+            "Control datagrams read from the UDP socket.", core.rx_total)
+        for result, value in (
+            ("hold", core.rx_hold),
+            ("move", core.rx_move),
+            ("trajectory", core.rx_trajectory),
+            ("invalid", core.rx_invalid),
+            ("duplicate", core.rx_duplicate),
+            ("stale", core.rx_stale),
+        ):
+            add("control_datagram_results_total", "counter",
+                "Control datagrams by validation outcome.", value, result=result)
+        add("control_recv_errors_total", "counter",
+            "recvfrom/recvmsg errors on the control socket.", self._udp_recv_errors)
+        cache = core.digest_cache
+        for result, value in (
+            ("hit", cache.hits),
+            ("miss", cache.misses),
+            ("bypass", cache.bypassed),
+        ):
+            add("control_parse_cache_total", "counter",
+                "Control datagrams by parse cache outcome; hits skipped the decode.",
+                value, result=result)
+        add("control_parse_cache_short_circuit_total", "counter",
+            "Cached repeats counted as duplicates without entering the command path.",
+            core.rx_short_circuit)
+        add("control_parse_cache_entries", "gauge",
+            "Parsed control datagrams held in the parse cache.", len(cache))
+        ctrl_age = (
+            now - core.last_ctrl_monotonic if core.last_ctrl_monotonic is not None else None
+        )
+        add("control_last_age_seconds", "gauge",
+            "Seconds since the last valid control datagram.", ctrl_age)
+        add("commands_applied_total", "counter",
+            "Commands written to the setpoint.", core.commands_applied)
+        link = core.link
+        add("control_link_expected_total", "counter",
+            "Control datagrams the backend sent in this session, inferred from repeat_index.",
+            link.expected)
+        add("control_link_lost_total", "counter",
+            "Control datagrams inferred lost from repeat_index gaps in this session.",
+            link.lost)
+        add("control_link_sequence_gaps_total", "counter",
+            "Skipped command sequence numbers (shared across drones by the backend).",
+            link.sequence_gaps)
+        add("control_link_loss_ratio", "gauge",
+            "Recent control datagram loss estimate.", link.loss)
+        add("command_confirm_count", "gauge",
+            "Unique repeats currently required to apply an unsigned command.",
+            link.confirm_count(link.repeat_total))
+        add("commands_pending", "gauge",
+            "Commands waiting for confirmation.", len(core.commands.pending))
+        add("highest_applied_sequence", "gauge",
+            "Highest applied command sequence.", core.highest_applied_sequence)
+        trajectory = core.trajectory
+        add("trajectory_progress", "gauge",
+            "Fraction of the current uploaded trajectory's waypoints reached.",
+            trajectory.progress if trajectory is not None else None)
+        ingress = self._ingress_stats
+        add("ingress_wakeups_total", "counter",
+            "Control socket wakeups.", ingress.wakeups)
+        add("ingress_capped_wakeups_total", "counter",
+            "Wakeups that hit CONTROL_INGRESS_MAX_BATCH.", ingress.capped)
+        add("ingress_max_batch", "gauge",
+            "Largest datagram batch drained in one wakeup.", ingress.max_batch)
+        queue = self._ingress
+        for priority, value in zip(queue.PRIORITY_NAMES, queue.admitted):
+            add("ingress_admitted_total", "counter",
+                "Control datagrams queued by pre-parse priority class.", value,
+                priority=priority)
+        for reason, value in queue.shed.items():
+            add("ingress_shed_total", "counter",
+                "Control datagrams dropped before parsing under overload.", value,
+                reason=reason)
+        add("ingress_budget_exhausted_total", "counter",
+            "Heartbeat periods whose CONTROL_INGRESS_BUDGET_SEC was used up.",
+            queue.exhausted_periods)
+        add("ingress_backlog", "gauge",
+            "Control datagrams deferred to the next heartbeat period.", len(queue))
+
+        add("offboard_publish_total", "counter",
+            "TrajectorySetpoint heartbeats published.", self._offboard_publish_count)
+        add("vehicle_command_acks_total", "counter",
+            "VehicleCommandAck messages received.", self._command_ack_count)
+        sequencer = self._vehicle_commands
+        heartbeat = self._heartbeat_monitor
+        add("offboard_interval_seconds", "histogram",
+            "Actual interval between offboard heartbeat publishes.", heartbeat.intervals)
+        add("offboard_interval_misses_total", "counter",
+            "Heartbeat intervals longer than OFFBOARD_MISS_FACTOR periods.", heartbeat.misses)
+        if heartbeat.intervals.count:
+            add("offboard_interval_max_seconds", "gauge",
+                "Longest heartbeat interval observed.", heartbeat.intervals.max)
+        add("vehicle_command_retries_total", "counter",
+            "ARM/OFFBOARD VehicleCommand retransmissions after an ack timeout.",
+            sequencer.retries)
+        for name, histogram in sequencer.ack_latency.items():
+            add("vehicle_command_ack_latency_seconds", "histogram",
+                "VehicleCommand send to accepted VehicleCommandAck, by command.",
+                histogram, command=name)
+        add("telemetry_sent_total", "counter",
+            "Telemetry datagrams sent.", self._telemetry_sent)
+        add("telemetry_send_errors_total", "counter",
+            "Telemetry send failures.", self._telemetry_send_errors)
+        add("telemetry_heartbeats_total", "counter",
+            "Telemetry datagrams sent without a fresh PX4 sample.", self._telemetry_heartbeats)
+        add("telemetry_keyframes_total", "counter",
+            "Full telemetry keyframes sent.", self._telemetry_delta.keyframes)
+        add("telemetry_sequence", "gauge",
+            "Last telemetry_seq sent.", self._telemetry_delta.sequence)
+        add("telemetry_last_bytes", "gauge",
+            "Size of the last telemetry datagram.", self._telemetry_last_bytes)
+        for target in self._telemetry_fanout.subscribers:
+            for name, help_text, value in (
+                ("telemetry_subscriber_sent_total",
+                 "Telemetry datagrams sent to an extra subscriber.", target.sent),
+                ("telemetry_subscriber_errors_total",
+                 "Telemetry send failures for an extra subscriber.", target.errors),
+                ("telemetry_subscriber_refused_total",
+                 "Sends rejected with ICMP port unreachable for an extra subscriber.",
+                 target.refused),
+            ):
+                add(name, "counter", help_text, value, target=target.label)
+        if self._pose_port:
+            add("pose_batches_total", "counter",
+                "Binary pose batches sent.", self._pose_batches_sent)
+            add("pose_samples_total", "counter",
+                "Pose samples sent in batches.", self._pose_samples_sent)
+            add("pose_samples_dropped_total", "counter",
+                "Pose samples dropped before sending.", self._pose_samples_dropped)
+            add("pose_send_errors_total", "counter",
+                "Pose batch send failures.", self._pose_send_errors)
+
+        counts = dict(self._ros_rx_counts)
+        last_seen = dict(core.sample_monotonic)
+        rates = self._ros_rx_rates.update(now, counts)
+        for topic, count in counts.items():
+            add("ros_messages_total", "counter",
+                "PX4 ROS messages received per topic.", count, topic=topic)
+        for topic in counts:
+            if topic in rates:
+                add("ros_message_rate_hz", "gauge",
+                    "PX4 ROS receive rate per topic over the last window.",
+                    rates[topic], topic=topic)
+        for topic, seen_at in last_seen.items():
+            add("ros_message_age_seconds", "gauge",
+                "Seconds since the last PX4 ROS message per topic.", now - seen_at, topic=topic)
+
+        for hop in CONTROL_LATENCY_HOPS:
+            add("control_hop_latency_seconds", "histogram",
+                "Per-hop control command latency (see CONTROL_LATENCY_HOPS).",
+                core.hop_latency[hop], hop=hop)
+        for path, histogram in core.apply_latency.items():
+            add("command_apply_latency_seconds", "histogram",
+                "First datagram to setpoint write, by apply path.", histogram, path=path)
+        add("telemetry_sample_latency_seconds", "histogram",
+            "PX4 sample arrival to telemetry send.", self._sample_latency)
+        events = core.events
+        add("log_events_total", "counter",
+            "Hot-path log events queued for output.", events.emitted)
+        for category, value in list(events.suppressed.items()):
+            add("log_events_suppressed_total", "counter",
+                "Hot-path log events dropped by the per-category rate limit.",
+                value, category=category)
+        if events.writer is not None:
+            add("log_queue_dropped_total", "counter",
+                "Hot-path log events dropped because the log queue was full.",
+                events.writer.dropped)
+        recorder = self._recorder
+        if recorder is not None:
+            add("recorder_records_total", "counter",
+                "Flight recorder records written.", recorder.records)
+            add("recorder_dropped_total", "counter",
+                "Flight recorder records dropped (oversized or unpackable).", recorder.dropped)
+            add("recorder_blocks_total", "counter",
+                "Flight recorder ring blocks started.", recorder.blocks)
+        return metrics
+
     def _log_diagnostics(self):
-        now = time.monotonic()
-        for command_id, pending in list(self._pending_commands.items()):
-            if now - pending["last_seen"] > COMMAND_CONFIRM_WINDOW_SEC * 2:
-                del self._pending_commands[command_id]
+        now = self._monotonic()
+        core = self._core
+        # 诊断在执行器线程运行：命令存储只读主线程发布的快照
+        pending_count, confirm_count = self._command_snapshot
         uptime = now - self._started_monotonic
         ctrl_age = (
-            f"{now - self._last_ctrl_monotonic:.1f}s"
-            if self._last_ctrl_monotonic is not None else "never"
+            f"{now - core.last_ctrl_monotonic:.1f}s"
+            if core.last_ctrl_monotonic is not None else "never"
         )
         sender = (
-            f"{self._last_ctrl_sender[0]}:{self._last_ctrl_sender[1]}"
-            if self._last_ctrl_sender else "none"
+            f"{core.last_ctrl_sender[0]}:{core.last_ctrl_sender[1]}"
+            if core.last_ctrl_sender else "none"
         )
-        with self._setpoint_lock:
-            sp = (
-                dict(self._last_setpoint)
-                if self._last_setpoint is not None
-                else None
-            )
+        sp = core.last_setpoint
         sp_text = (
-            f"({sp['x']:.2f},{sp['y']:.2f},{sp['z']:.2f},"
-            f"{sp['mode']},seq={sp['sequence']})"
+            f"({sp.x:.2f},{sp.y:.2f},{sp.z:.2f},"
+            f"{sp.mode},seq={sp.sequence})"
             if sp is not None
             else "waiting_for_valid_local_position"
         )
+        trajectory = core.trajectory
+        if trajectory is not None:
+            sp_text += (
+                f" trajectory={trajectory.trajectory_id}:{trajectory.state}:"
+                f"{trajectory.index}/{len(trajectory.waypoints)}"
+            )
 
         status_text = "none"
-        if self._status is not None:
+        status = core.samples["status"]
+        if status is not None:
             status_text = (
-                f"armed={int(self._status.arming_state)},"
-                f"nav={int(self._status.nav_state)}"
+                f"armed={int(status.arming_state)},"
+                f"nav={int(status.nav_state)}"
             )
 
         pub_links = (
@@ -1142,32 +5487,74 @@ class JetsonBridge(Node):
             self._traj_pub.get_subscription_count(),
             self._cmd_pub.get_subscription_count(),
         )
+        ingress = self._ingress_stats.snapshot()
+        shed = self._ingress.shed
         seen_topics = ",".join(
             name for name, count in self._ros_rx_counts.items() if count > 0
         ) or "none"
 
         self.get_logger().info(
             f"[DIAG] up={uptime:.0f}s | UDP control total/valid/invalid="
-            f"{self._udp_rx_total}/{self._udp_rx_valid}/{self._udp_rx_invalid} "
-            f"hold/move={self._udp_rx_hold}/{self._udp_rx_move} "
-            f"duplicate/stale={self._udp_rx_duplicate}/{self._udp_rx_stale} "
-            f"last_age={ctrl_age} sender={sender} | "
-            f"confirmed applied/pending={self._commands_applied}/"
-            f"{len(self._pending_commands)} highest_seq={self._highest_applied_sequence} | "
+            f"{core.rx_total}/{core.rx_valid}/{core.rx_invalid} "
+            f"hold/move/trajectory={core.rx_hold}/{core.rx_move}/{core.rx_trajectory} "
+            f"duplicate/stale={core.rx_duplicate}/{core.rx_stale} "
+            f"parse_cache hit/miss/bypass/short={core.digest_cache.hits}/"
+            f"{core.digest_cache.misses}/{core.digest_cache.bypassed}/{core.rx_short_circuit} "
+            f"last_age={ctrl_age} sender={sender} "
+            f"ingress wakeups/max_batch/mean_batch/capped="
+            f"{ingress['wakeups']}/{ingress['max_batch']}/"
+            f"{ingress['mean_batch']:.2f}/{ingress['capped']} "
+            f"shed hold/dup/budget/overflow={shed['hold']}/{shed['duplicate']}/"
+            f"{shed['budget']}/{shed['overflow']} backlog={len(self._ingress)} | "
+            f"link loss={core.link.loss} seq_gaps={core.link.sequence_gaps} "
+            f"confirm={confirm_count} | "
+            f"confirmed applied/pending={core.commands_applied}/"
+            f"{pending_count} highest_seq={core.highest_applied_sequence} "
+            f"rx→apply confirm[{format_latency_ms(core.apply_latency['confirm'].snapshot())}] "
+            f"auth[{format_latency_ms(core.apply_latency['auth'].snapshot())}] | "
             f"setpoint={sp_text} | "
             f"ROS pub_subscribers ocm/traj/cmd={pub_links[0]}/{pub_links[1]}/{pub_links[2]} "
-            f"published={self._offboard_publish_count} PX4={status_text} "
-            f"ACK={self._command_ack_count} ROS_RX={seen_topics} | "
+            f"published={self._offboard_publish_count} "
+            f"interval[{self._heartbeat_monitor.summary()}] PX4={status_text} "
+            f"ACK={self._command_ack_count} arm_sequence={self._vehicle_commands.state} "
+            f"ROS_RX={seen_topics} | "
             f"telemetry target={self._backend_addr[0]}:{self._backend_addr[1]} "
             f"sent/errors/last_bytes="
-            f"{self._telemetry_sent}/{self._telemetry_send_errors}/{self._telemetry_last_bytes}"
+            f"{self._telemetry_sent}/{self._telemetry_send_errors}/{self._telemetry_last_bytes} "
+            f"heartbeats={self._telemetry_heartbeats} seq={self._telemetry_delta.sequence} "
+            f"keyframes={self._telemetry_delta.keyframes} "
+            f"sample→send[{format_latency_ms(self._sample_latency.snapshot())}]"
+            + (
+                " | subscribers sent/errors/refused " + " ".join(
+                    f"{target.label}={target.sent}/{target.errors}/{target.refused}"
+                    for target in self._telemetry_fanout.subscribers
+                )
+                if self._telemetry_fanout.subscribers else ""
+            )
+            + (
+                f" | pose batches/samples/dropped/errors={self._pose_batches_sent}/"
+                f"{self._pose_samples_sent}/{self._pose_samples_dropped}/{self._pose_send_errors}"
+                if self._pose_port else ""
+            )
+            + (
+                f" | recorder records/dropped/blocks={self._recorder.records}/"
+                f"{self._recorder.dropped}/{self._recorder.blocks}"
+                if self._recorder is not None else ""
+            )
         )
 
+        if core.commands_applied:
+            self.get_logger().info(
+                f"[LATENCY] slot {self.slot} control hops p50/p99 "
+                f"(send→kernel/issue→publish use cross-host wall clocks): "
+                f"{format_hop_latency_ms(core.control_latency_snapshot())}"
+            )
+
         # 遥测能发而控制一直收不到，正是本次外场出现的单向链路症状。
         if (
             uptime >= 10.0
             and self._telemetry_sent > 0
-            and self._udp_rx_valid == 0
+            and core.rx_valid == 0
             and now - self._last_no_control_warning_monotonic >= 30.0
         ):
             self.get_logger().warning(
@@ -1194,6 +5581,10 @@ class JetsonBridge(Node):
     # ------------------------------------------------------------------
     # 清理
     # ------------------------------------------------------------------
+    def flush_log_suppressed(self):
+        """汇报限速丢弃的日志数；与 drain_control 同在主线程调用。"""
+        self._core.events.flush_suppressed()
+
     def cleanup(self):
         try:
             self._ctrl_sock.close()
@@ -1203,61 +5594,111 @@ class JetsonBridge(Node):
             self._tel_sock.close()
         except OSError:
             pass
+        self._telemetry_fanout.close()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.stop()
+        if self._recorder is not None:
+            self._recorder.close()
+        self.flush_log_suppressed()
+        self._log_writer.close()
         self.get_logger().info(f"[slot {self.slot}] Bridge shutdown")
 
 
 # ============================================================
 # 入口
 # ============================================================
+def executor_threads(slot_count: int) -> int:
+    """每个 slot 的心跳 / 订阅 / 诊断三个回调组各一个线程，可由 ROS_EXECUTOR_THREADS 覆盖。"""
+    return ROS_EXECUTOR_THREADS if ROS_EXECUTOR_THREADS > 0 else 3 * slot_count
+
+
+def build_executor(slot_count: int):
+    if ROS_EXECUTOR == "single":
+        return SingleThreadedExecutor()
+    if ROS_EXECUTOR != "multi":
+        raise ValueError(f"ROS_EXECUTOR must be 'multi' or 'single', got {ROS_EXECUTOR!r}")
+    return MultiThreadedExecutor(num_threads=executor_threads(slot_count))
+
+
 def main(args=None):
     global running
 
+    if rclpy is None:
+        raise RuntimeError(
+            "ROS2 Python packages are unavailable; source /opt/ros/humble/setup.bash "
+            "and the PX4 workspace install/setup.bash"
+        )
     rclpy.init(args=args)
+    if OFFBOARD_SWITCH_INTERVAL_SEC > 0 and (OFFBOARD_THREAD or ROS_EXECUTOR == "multi"):
+        # 心跳唤醒后最多等待一个切换间隔即可取得 GIL
+        sys.setswitchinterval(min(sys.getswitchinterval(), OFFBOARD_SWITCH_INTERVAL_SEC))
 
-    # 支持两种传参方式：
+    # 支持三种传参方式：
     #   ros2 run jetson_bridge jetson_bridge --ros-args -p slot:=2
     #   python3 jetson_bridge.py 2
+    #   python3 jetson_bridge.py 1 2 3（或 BRIDGE_SLOTS=1,2,3）：单进程承载多个 slot，
+    #   共用一个 rclpy context、executor 和 UDP 接收循环
     _tmp_node = rclpy.create_node("_slot_reader")
     _tmp_node.declare_parameter("slot", 1)
     slot = _tmp_node.get_parameter("slot").get_parameter_value().integer_value
     _tmp_node.destroy_node()
 
+    slots = [slot]
     # 兼容直接 python3 jetson_bridge.py 2 的用法
-    if slot == 1 and len(sys.argv) > 1:
-        try:
-            slot = int(sys.argv[1])
-        except ValueError:
-            pass
+    if slot == 1:
+        cli_slots = []
+        for arg in sys.argv[1:]:
+            if not arg.isdigit():
+                break
+            cli_slots.append(arg)
+        slot_spec = " ".join(cli_slots) or os.environ.get("BRIDGE_SLOTS", "")
+        if slot_spec.strip():
+            slots = parse_slot_list(slot_spec)
 
-    bridge = JetsonBridge(slot)
-
-    # ROS2 spin 在独立线程，主线程做 UDP 控制包轮询
-    spin_thread = threading.Thread(
-        target=rclpy.spin, args=(bridge,), daemon=True
+    # ROS2 spin 在独立线程，主线程做 UDP 控制包接收
+    executor = build_executor(len(slots))
+    bridges = []
+    try:
+        for config in resolve_bridge_configs(slots):
+            bridges.append(JetsonBridge(config["slot"], config))
+    except Exception:
+        for bridge in bridges:
+            bridge.cleanup()
+        raise
+    logger = bridges[0].get_logger()
+    logger.info(
+        f"[ROS] executor={type(executor).__name__}"
+        + (f" threads={executor_threads(len(bridges))}" if ROS_EXECUTOR == "multi" else "")
     )
+    for bridge in bridges:
+        executor.add_node(bridge)
+    spin_thread = threading.Thread(target=executor.spin, daemon=True)
     spin_thread.start()
 
     def _shutdown(sig, frame):
         global running
         running = False
         # 退出时发送 DISARM 指令，防止电机继续转
-        bridge.get_logger().info("Shutting down: sending DISARM...")
-        bridge._send_vehicle_command(
-            VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM,
-            param1=0.0,
-        )
+        for bridge in bridges:
+            bridge.get_logger().info("Shutting down: sending DISARM...")
+            bridge._send_vehicle_command(
+                VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM,
+                param1=0.0,
+            )
 
     signal.signal(signal.SIGINT, _shutdown)
     signal.signal(signal.SIGTERM, _shutdown)
 
-    bridge.get_logger().info("UDP control receive loop started...")
-    bridge.get_logger().info("Waiting for heartbeat warmup (~1s)...")
+    slot_text = ",".join(str(bridge.slot) for bridge in bridges)
+    logger.info(f"UDP control receive loop started for slot(s) {slot_text}...")
+    logger.info("Waiting for heartbeat warmup (~1s)...")
 
     # 独立线程等待键盘输入，避免阻塞主循环
     def _wait_for_arm():
-        import os
-        # 等预热完成
-        while running and bridge._warmup_count < bridge._warmup_needed:
+        # 等全部 slot 预热完成
+        while running and any(
+            bridge._warmup_count < bridge._warmup_needed for bridge in bridges
+        ):
             time.sleep(0.1)
         if not running:
             return
@@ -1265,20 +5706,101 @@ def main(args=None):
         if os.environ.get("ARM_NOW") == "1":
             print("\n>>> ARM_NOW=1 detected, skipping confirmation.")
         else:
-            sys.stdout.write("\n>>> Heartbeat ready. Press ENTER to ARM + OFFBOARD (Ctrl+C to abort): ")
+            sys.stdout.write(
+                f"\n>>> Heartbeat ready on slot(s) {slot_text}. "
+                f"Press ENTER to ARM + OFFBOARD (Ctrl+C to abort): "
+            )
             sys.stdout.flush()
             sys.stdin.readline()
         print(">>> ARM + OFFBOARD triggered. Motor should spin soon.")
         print(">>> Press Ctrl+C to DISARM immediately.\n")
-        bridge._arm_triggered = True
+        for bridge in bridges:
+            bridge._arm_triggered = True
 
     arm_thread = threading.Thread(target=_wait_for_arm, daemon=True)
     arm_thread.start()
 
+    # 所有 slot 的控制 socket 共用一个 selector：空闲时阻塞等待，
+    # 只有可读的 slot 才会被唤醒，并一次取空其队列。遥测也在这里发送：
+    # 超时取各 slot 遥测调度与位姿批次的最早到期时刻，新样本提前发送时刻时由 ROS
+    # 回调写 self-pipe 唤醒。
+    # 每个注册项的 data 为可读时调用的无参回调。
+    selector = selectors.DefaultSelector()
+    for bridge in bridges:
+        selector.register(bridge._ctrl_sock, selectors.EVENT_READ, bridge.drain_control)
+    wake_reader, wake_writer = socket.socketpair()
+    wake_reader.setblocking(False)
+    wake_writer.setblocking(False)
+
+    def _drain_wakeups():
+        try:
+            while wake_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    selector.register(wake_reader, selectors.EVENT_READ, _drain_wakeups)
+
+    def _wake_main_loop():
+        try:
+            wake_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # 缓冲区已满说明唤醒已挂起
+
+    for bridge in bridges:
+        bridge.set_telemetry_wakeup(_wake_main_loop)
+    metrics_server = None
+    if METRICS_PORT > 0:
+        # 指标只用于观测：端口被占用时记录错误并继续运行，不影响飞控链路
+        try:
+            metrics_server = MetricsServer(
+                METRICS_HOST, METRICS_PORT,
+                lambda: render_metrics(bridges, time.monotonic()), selector,
+            )
+            logger.info(
+                f"[METRICS] serving Prometheus metrics on "
+                f"http://{METRICS_HOST}:{METRICS_PORT}/metrics"
+            )
+        except OSError as exc:
+            logger.error(
+                f"[METRICS] bind failed on {METRICS_HOST}:{METRICS_PORT}: "
+                f"{type(exc).__name__}: {exc}; metrics endpoint disabled"
+            )
+    resources = ProcessResourceMonitor(len(bridges))
+    resource_interval = max(1.0, DIAGNOSTIC_INTERVAL_SEC)
+    next_resource_report = time.monotonic() + resource_interval
+
     while running and rclpy.ok():
-        bridge.process_control()
+        now = time.monotonic()
+        next_telemetry = min(
+            min(
+                bridge.poll_telemetry(now),
+                bridge.poll_pose_batch(now),
+                bridge.poll_control_ingress(now),
+                bridge.poll_command_housekeeping(now),
+            )
+            for bridge in bridges
+        )
+        timeout = min(0.5, next_resource_report - now, next_telemetry - now)
+        for key, _ in selector.select(timeout=max(0.0, timeout)):
+            key.data()
+        now = time.monotonic()
+        if now >= next_resource_report:
+            logger.info(format_resource_sample(resources.sample()))
+            next_resource_report = now + resource_interval
+            for bridge in bridges:
+                bridge.flush_log_suppressed()
+            if metrics_server is not None:
+                metrics_server.expire_clients(now)
 
-    bridge.cleanup()
+    if metrics_server is not None:
+        metrics_server.close()
+    selector.close()
+    wake_reader.close()
+    wake_writer.close()
+    executor.shutdown()
+    for bridge in bridges:
+        bridge.cleanup()
     rclpy.shutdown()
 
 
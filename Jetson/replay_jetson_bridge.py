@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+replay_jetson_bridge.py — 在虚拟时钟上加速回放 jetson_bridge 协议核心
+
+把飞行记录器环形文件或合成的控制数据报 / PX4 样本流送入 BridgeCore，
+不等待真实时间，开发机无需 ROS2：
+  python3 replay_jetson_bridge.py --synthetic --seconds 600
+  python3 replay_jetson_bridge.py --synthetic --loss 0.2 --binary
+  python3 replay_jetson_bridge.py --recording /var/log/ue5drone/slot1.ring
+  python3 replay_jetson_bridge.py --recording slot1.ring --verbose --telemetry-out tel.jsonl
+
+遥测按 TelemetryScheduler / TelemetryDeltaEncoder 的实机规则在虚拟时间上生成；
+--telemetry-out 每行一个遥测字段字典，可直接作为
+benchmark_jetson_bridge.py telemetry-delta --recording 的输入。
+CONTROL_AUTH_KEY 等环境变量与实机含义相同；设置后合成数据报附带 MAC。
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+import types
+from collections import namedtuple
+
+import jetson_bridge
+
+# monotonic 为 Jetson 单调时钟（秒）；kind 为 "datagram" 或 PX4_SAMPLE_NAMES 之一。
+# datagram 的 payload 为 (data, addr, kernel_rx_unix, kernel_delay)，样本为消息对象。
+ReplayEvent = namedtuple("ReplayEvent", ("monotonic", "kind", "payload"))
+
+
+class VirtualClock:
+    """回放时钟：monotonic 由回放循环推进，unix 与之保持固定偏移。"""
+
+    def __init__(self, start: float = 0.0, unix_offset: float = 0.0):
+        self.now = start
+        self.unix_offset = unix_offset
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def unix(self) -> float:
+        return self.now + self.unix_offset
+
+
+class _ReplayLogger:
+    def __init__(self, clock: VirtualClock, verbose: bool):
+        self._clock = clock
+        self._verbose = verbose
+
+    def _emit(self, level: str, message: str):
+        if self._verbose:
+            print(f"[{self._clock.now:12.6f}] {level} {message}")
+
+    def info(self, message):
+        self._emit("INFO", message)
+
+    def warning(self, message):
+        self._emit("WARN", message)
+
+    def error(self, message):
+        self._emit("ERROR", message)
+
+
+class _ReplaySink(jetson_bridge.BridgeCoreSink):
+    def __init__(self):
+        self.applied = []
+
+    def command_applied(self, parsed, confirmed_packets, authenticated):
+        self.applied.append(parsed["command_id"])
+
+
+# ------------------------------------------------------------------
+# 输入：飞行记录器
+# ------------------------------------------------------------------
+def _sample_from_record(name: str, fields: dict, stamp_us: int):
+    """由记录字段重建 BridgeCore 读取的 px4_msgs 属性子集。"""
+    if name == "local_position":
+        x, y, z = fields["position"]
+        vx, vy, vz = fields["velocity"]
+        return types.SimpleNamespace(
+            timestamp=stamp_us, x=x, y=y, z=z, vx=vx, vy=vy, vz=vz,
+            xy_valid=fields["xy_valid"], z_valid=fields["z_valid"],
+        )
+    return types.SimpleNamespace(timestamp=stamp_us, **fields)
+
+
+def load_recording_events(path: str):
+    """读取环形文件，返回 (events, slot, unix_offset, recorded_applied)。"""
+    timed = jetson_bridge.flight_record_unix_times(jetson_bridge.read_flight_records(path))
+    if not timed:
+        raise ValueError(f"{path}: no records with a clock anchor")
+    slot = None
+    events = []
+    recorded_applied = []
+    for unix_time, record in timed:
+        monotonic = record.monotonic_ns / 1e9
+        if record.kind == "clock":
+            slot = record.fields["slot"]
+        elif record.kind == "control_datagram":
+            kernel_rx_unix = kernel_delay = None
+            if record.stamp_us:
+                kernel_rx_unix = record.stamp_us / 1e6
+                kernel_delay = max(0.0, unix_time - kernel_rx_unix)
+            addr = (record.fields["ip"], record.fields["port"])
+            events.append(ReplayEvent(
+                monotonic, "datagram",
+                (record.fields["data"], addr, kernel_rx_unix, kernel_delay),
+            ))
+        elif record.kind in jetson_bridge.PX4_SAMPLE_NAMES:
+            events.append(ReplayEvent(
+                monotonic, record.kind,
+                _sample_from_record(record.kind, record.fields, record.stamp_us),
+            ))
+        elif record.kind == "command_applied":
+            recorded_applied.append(record.fields["command_id"])
+    # 多线程写入的记录按时间可能有微小交错，按单调时钟稳定排序
+    events.sort(key=lambda event: event.monotonic)
+    unix_offset = timed[0][0] - timed[0][1].monotonic_ns / 1e9
+    return events, slot, unix_offset, recorded_applied
+
+
+# ------------------------------------------------------------------
+# 输入：合成流
+# ------------------------------------------------------------------
+def _control_datagram(slot, sequence, repeat, args, issued_unix, sent_unix, north, east):
+    message = {
+        "protocol": jetson_bridge.CONTROL_PROTOCOL,
+        "version": jetson_bridge.CONTROL_PROTOCOL_VERSION,
+        "type": "control",
+        "session_id": "replay-session",
+        "command_id": f"replay-session-d{slot}-s{sequence}",
+        "sequence": sequence,
+        "drone_id": slot,
+        "slot": slot,
+        "mode": "move",
+        "issued_at_unix_s": issued_unix,
+        "sent_at_unix_s": sent_unix,
+        "target": {
+            "frame": "NED",
+            "reference": "power_on_origin",
+            "unit": "m",
+            "north": north,
+            "east": east,
+            "down": -5.0,
+        },
+        "delivery": {"repeat_index": repeat, "repeat_total": args.repeat_total},
+    }
+    data = json.dumps(message).encode("utf-8")
+    if not jetson_bridge.CONTROL_AUTH_KEY and not args.binary:
+        return data
+    parsed = jetson_bridge.parse_control_packet(data)
+    if jetson_bridge.CONTROL_AUTH_KEY:
+        session_key = jetson_bridge.derive_control_session_key(
+            jetson_bridge.CONTROL_AUTH_KEY, parsed["session_id"]
+        )
+        parsed["auth_mac"] = jetson_bridge.compute_control_mac(session_key, parsed)
+    if args.binary:
+        return jetson_bridge.encode_binary_control_packet(parsed)
+    message["auth"] = {
+        "alg": jetson_bridge.CONTROL_AUTH_ALGORITHM, "mac": parsed["auth_mac"].hex()
+    }
+    return json.dumps(message).encode("utf-8")
+
+
+def synthetic_events(args, unix_offset: float):
+    """后端按 heartbeat_hz 每条命令重发 repeat_total 次（有丢包与时延），PX4 按 sample_hz 出样本。"""
+    rng = random.Random(args.seed)
+    slot = args.slot
+    sender = ("192.168.30.100", 50123)
+    period = 1.0 / args.heartbeat_hz
+    events = []
+
+    command_period = args.repeat_total * period
+    for index in range(int(args.seconds / command_period)):
+        sequence = index + 1
+        first_sent = index * command_period
+        angle = index * 0.1
+        north, east = 10.0 * math.cos(angle), 10.0 * math.sin(angle)
+        for repeat in range(1, args.repeat_total + 1):
+            sent = first_sent + (repeat - 1) * period
+            if rng.random() < args.loss:
+                continue
+            arrival = sent + (args.delay_ms + rng.random() * args.jitter_ms) / 1e3
+            data = _control_datagram(
+                slot, sequence, repeat, args,
+                unix_offset + first_sent - 0.001, unix_offset + sent, north, east,
+            )
+            # 内核收包 → 用户态读出固定 50us
+            events.append(ReplayEvent(
+                arrival + 50e-6, "datagram",
+                (data, sender, unix_offset + arrival, 50e-6),
+            ))
+
+    sample_period = 1.0 / args.sample_hz
+    for tick in range(int(args.seconds * args.sample_hz)):
+        t = tick * sample_period
+        stamp_us = int((unix_offset + t) * 1e6)
+        x, y = 10.0 * math.cos(t * 0.05), 10.0 * math.sin(t * 0.05)
+        vx, vy = -0.5 * y * 0.1, 0.5 * x * 0.1
+        events.append(ReplayEvent(t, "local_position", types.SimpleNamespace(
+            timestamp=stamp_us, x=x, y=y, z=-5.0, vx=vx, vy=vy, vz=0.0,
+            xy_valid=True, z_valid=True,
+        )))
+        events.append(ReplayEvent(t, "odometry", types.SimpleNamespace(
+            timestamp=stamp_us, timestamp_sample=stamp_us, position=[x, y, -5.0],
+            q=[1.0, 0.0, 0.0, 0.0], velocity=[vx, vy, 0.0], angular_velocity=[0.0] * 3,
+        )))
+        if tick % 5 == 0:
+            events.append(ReplayEvent(t, "global_position", types.SimpleNamespace(
+                timestamp=stamp_us, lat=30.0 + x * 1e-5, lon=120.0 + y * 1e-5, alt=15.0,
+                lat_lon_valid=True,
+            )))
+        if tick % args.sample_hz == 0:
+            events.append(ReplayEvent(t, "status", types.SimpleNamespace(
+                timestamp=stamp_us, arming_state=2, nav_state=14,
+            )))
+            events.append(ReplayEvent(t, "battery", types.SimpleNamespace(
+                timestamp=stamp_us, voltage_v=15.8, remaining=max(0.0, 1.0 - t / 3600.0),
+            )))
+    events.sort(key=lambda event: event.monotonic)
+    return events
+
+
+# ------------------------------------------------------------------
+# 回放
+# ------------------------------------------------------------------
+def replay(events, slot: int, clock: VirtualClock, logger, telemetry_out=None) -> dict:
+    """按事件时间推进虚拟时钟，在事件之间补发心跳、遥测与诊断清理；返回统计。"""
+    sink = _ReplaySink()
+    core = jetson_bridge.BridgeCore(
+        slot, logger, sink=sink, clock=clock.monotonic, wall_clock=clock.unix
+    )
+    scheduler = jetson_bridge.TelemetryScheduler(
+        jetson_bridge.TELEMETRY_HZ, jetson_bridge.TELEMETRY_MIN_HZ,
+        jetson_bridge.TELEMETRY_COALESCE_SEC,
+    )
+    delta = jetson_bridge.TelemetryDeltaEncoder(
+        jetson_bridge.TELEMETRY_DELTA, jetson_bridge.TELEMETRY_KEYFRAME_SEC,
+        jetson_bridge.TELEMETRY_DELTA_REPEAT,
+    )
+    stats = {
+        "datagrams": 0, "samples": 0, "publishes": 0,
+        "telemetry": 0, "telemetry_bytes": 0,
+    }
+    start = events[0].monotonic if events else 0.0
+    next_heartbeat = start
+    next_diagnostics = start + jetson_bridge.DIAGNOSTIC_INTERVAL_SEC
+
+    def _send_telemetry(now):
+        latency = scheduler.mark_sent(now)
+        data = core.build_telemetry(int(clock.unix() * 1e6), now, latency)
+        if telemetry_out is not None:
+            telemetry_out.write(json.dumps(data))
+            telemetry_out.write("\n")
+        delta.encode(data, now)
+        stats["telemetry"] += 1
+        stats["telemetry_bytes"] += len(jetson_bridge.encode_telemetry_yaml(data))
+
+    def _advance(until):
+        nonlocal next_heartbeat, next_diagnostics
+        while True:
+            telemetry_at = max(scheduler.next_deadline(), clock.now)
+            due = min(next_heartbeat, telemetry_at, next_diagnostics)
+            if due > until:
+                return
+            clock.now = due
+            if due == next_heartbeat:
+                next_heartbeat += jetson_bridge.OFFBOARD_INTERVAL
+                core.step_trajectory(due)
+                sp = core.last_setpoint
+                if sp is not None:
+                    stats["publishes"] += 1
+                    probe = core.publish_probe
+                    if probe is not None and probe[0] == sp.sequence:
+                        core.publish_probe = None
+                        core.record_publish_hops(probe)
+            elif due == telemetry_at:
+                _send_telemetry(due)
+            else:
+                next_diagnostics += jetson_bridge.DIAGNOSTIC_INTERVAL_SEC
+                core.commands.expire_pending(
+                    due, jetson_bridge.COMMAND_CONFIRM_WINDOW_SEC * 2
+                )
+                core.commands.prune_applied(due)
+
+    for event in events:
+        _advance(event.monotonic)
+        clock.now = event.monotonic
+        if event.kind == "datagram":
+            stats["datagrams"] += 1
+            data, addr, kernel_rx_unix, kernel_delay = event.payload
+            core.handle_datagram(data, addr, event.monotonic, kernel_rx_unix, kernel_delay)
+            continue
+        stats["samples"] += 1
+        core.note_sample(event.kind, event.payload, event.monotonic)
+        if event.kind == "local_position":
+            core.update_safe_hold(event.payload)
+        if event.kind in ("local_position", "odometry"):
+            scheduler.note_sample(event.monotonic)
+    if events:
+        _advance(events[-1].monotonic)
+
+    stats["core"] = core
+    stats["applied"] = sink.applied
+    stats["keyframes"] = delta.keyframes
+    stats["span_sec"] = events[-1].monotonic - start if events else 0.0
+    return stats
+
+
+def _report(source: str, stats: dict, elapsed: float, recorded_applied) -> None:
+    core = stats["core"]
+    span = stats["span_sec"]
+    print(
+        f"replay over {source}: {stats['datagrams']} datagrams, {stats['samples']} PX4 samples, "
+        f"{span:.1f}s of virtual time"
+    )
+    print(
+        f"  wall {elapsed:.3f}s  {stats['datagrams'] / max(elapsed, 1e-9):,.0f} datagrams/s  "
+        f"{(stats['datagrams'] + stats['samples']) / max(elapsed, 1e-9):,.0f} events/s  "
+        f"{span / max(elapsed, 1e-9):,.0f}x real time"
+    )
+    print(
+        f"  control total/valid/invalid={core.rx_total}/{core.rx_valid}/{core.rx_invalid} "
+        f"duplicate/stale={core.rx_duplicate}/{core.rx_stale} "
+        f"applied={core.commands_applied} pending={len(core.commands.pending)} "
+        f"rx→apply confirm[{jetson_bridge.format_latency_ms(core.apply_latency['confirm'].snapshot())}] "
+        f"auth[{jetson_bridge.format_latency_ms(core.apply_latency['auth'].snapshot())}]"
+    )
+    print(
+        f"  heartbeats={stats['publishes']} telemetry datagrams={stats['telemetry']} "
+        f"bytes={stats['telemetry_bytes']} keyframes={stats['keyframes']} "
+        f"({stats['telemetry_bytes'] / max(span, 1e-9):.0f} B/s)"
+    )
+    print(
+        "  control hops (virtual clock) "
+        + jetson_bridge.format_hop_latency_ms(core.control_latency_snapshot())
+    )
+    if recorded_applied is not None:
+        # 环形文件最旧一块内的命令可能缺少早期重发包，回放结果与录制不同属正常
+        replayed = stats["applied"]
+        replayed_set = set(replayed)
+        recorded_set = set(recorded_applied)
+        missing = [command for command in recorded_applied if command not in replayed_set]
+        extra = [command for command in replayed if command not in recorded_set]
+        print(
+            f"  recorded applied={len(recorded_applied)} replayed applied={len(replayed)} "
+            f"only in recording={len(missing)} only in replay={len(extra)}"
+        )
+        for command in missing[:5]:
+            print(f"    recorded but not replayed: {command}")
+        for command in extra[:5]:
+            print(f"    replayed but not recorded: {command}")
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--recording", help="FLIGHT_RECORDER_PATH ring file to replay")
+    source.add_argument("--synthetic", action="store_true", help="generate a synthetic flight")
+    parser.add_argument("--slot", type=int, default=1, help="slot for synthetic streams")
+    parser.add_argument("--seconds", type=float, default=300.0)
+    parser.add_argument("--heartbeat-hz", type=float, default=5.0,
+                        help="backend datagram rate of the synthetic stream")
+    parser.add_argument("--repeat-total", type=int, default=5)
+    parser.add_argument("--loss", type=float, default=0.05)
+    parser.add_argument("--delay-ms", type=float, default=2.0)
+    parser.add_argument("--jitter-ms", type=float, default=3.0)
+    parser.add_argument("--sample-hz", type=int, default=50)
+    parser.add_argument("--binary", action="store_true",
+                        help="encode synthetic datagrams with the binary variant")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--verbose", action="store_true",
+                        help="print core log lines stamped with virtual time")
+    parser.add_argument("--telemetry-out",
+                        help="write one telemetry field dict per line (JSON Lines)")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_argument_parser().parse_args(argv)
+    recorded_applied = None
+    if args.recording:
+        try:
+            events, slot, unix_offset, recorded_applied = load_recording_events(args.recording)
+        except (OSError, ValueError) as exc:
+            print(f"replay_jetson_bridge: {exc}", file=sys.stderr)
+            return 1
+        source = args.recording
+    else:
+        unix_offset = 1_784_200_000.0
+        events = synthetic_events(args, unix_offset)
+        slot = args.slot
+        source = (
+            f"synthetic {args.seconds:.0f}s flight, {args.heartbeat_hz:g}Hz x "
+            f"{args.repeat_total} repeats, loss={args.loss:.0%}"
+        )
+    if not events:
+        print("replay_jetson_bridge: nothing to replay", file=sys.stderr)
+        return 1
+
+    clock = VirtualClock(events[0].monotonic, unix_offset)
+    logger = _ReplayLogger(clock, args.verbose)
+    telemetry_out = open(args.telemetry_out, "w", encoding="utf-8") if args.telemetry_out else None
+    try:
+        started = time.perf_counter()
+        stats = replay(events, slot, clock, logger, telemetry_out)
+        elapsed = time.perf_counter() - started
+    finally:
+        if telemetry_out is not None:
+            telemetry_out.close()
+    _report(source, stats, elapsed, recorded_applied)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+"""
+soak_jetson_bridge.py — 在替身 ROS2 运行时上长时间压测 JetsonBridge
+
+不需要 ROS2 / PX4：fake_ros_runtime 提供 rclpy 与 px4_msgs，JetsonBridge 原样运行；
+模拟 PX4 按真实频率发布 odometry / 位置 / 状态 / 电量并回 VehicleCommandAck，
+模拟后端经 UDP 按心跳频率重发控制命令并接收遥测。默认虚拟时钟，数小时的运行
+压缩到几分钟内，输出 CPU、RSS 增长与各定时器的触发延迟/回调耗时：
+  python3 soak_jetson_bridge.py --hours 2
+  python3 soak_jetson_bridge.py --hours 1 --slots 1,2,3 --loss 0.1
+  python3 soak_jetson_bridge.py --minutes 5 --realtime
+  python3 soak_jetson_bridge.py --minutes 1 --realtime --executor single --load-ms 15
+  python3 soak_jetson_bridge.py --hours 1 --video --tracemalloc
+  python3 soak_jetson_bridge.py --hours 4 --max-rss-growth-mib 8   # 超出时退出码 1
+
+虚拟时钟同时注入桥接的单调时钟与墙钟（遥测调度、UDP 收包、确认窗口、诊断
+速率与日志限速），压缩运行按模拟时间完成与实机相同的每小时工作量。
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import selectors
+import socket
+import sys
+import time
+
+import fake_ros_runtime
+
+
+def _free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class TimerStats:
+    """按回调名汇总定时器触发延迟与回调耗时（LatencyHistogram）。"""
+
+    def __init__(self, histogram_type):
+        self._histogram_type = histogram_type
+        self.by_name = {}
+
+    def observe(self, timer, lateness: float, duration: float):
+        stats = self.by_name.get(timer.name)
+        if stats is None:
+            stats = self.by_name[timer.name] = (
+                self._histogram_type(), self._histogram_type()
+            )
+        stats[0].record(max(0.0, lateness))
+        stats[1].record(duration)
+
+
+class SimulatedPx4:
+    """一个 slot 的 PX4 uXRCE-DDS 端：订阅 fmu/in，按实机频率发布 fmu/out。"""
+
+    def __init__(self, node_type, messages, prefix: str, system_id: int):
+        self.node = node_type(f"sim_px4_{system_id}")
+        self._m = messages
+        self._system_id = system_id
+        self._prefix = prefix
+        self.armed = False
+        self.nav_state = messages.VehicleStatus.NAVIGATION_STATE_AUTO_LOITER
+        self.position = [0.0, 0.0, 0.0]
+        self.velocity = [0.0, 0.0, 0.0]
+        self.target = None
+        self.commands = 0
+        self.setpoints = 0
+        self.offboard_heartbeats = 0
+        self.battery = 1.0
+
+        node = self.node
+        out = f"{prefix}/fmu/out/"
+        self._odometry_pub = node.create_publisher(messages.VehicleOdometry, out + "vehicle_odometry")
+        self._local_pub = node.create_publisher(
+            messages.VehicleLocalPosition, out + "vehicle_local_position"
+        )
+        self._global_pub = node.create_publisher(
+            messages.VehicleGlobalPosition, out + "vehicle_global_position"
+        )
+        self._status_pub = node.create_publisher(messages.VehicleStatus, out + "vehicle_status_v1")
+        self._battery_pub = node.create_publisher(messages.BatteryStatus, out + "battery_status")
+        self._ack_pub = node.create_publisher(
+            messages.VehicleCommandAck, out + "vehicle_command_ack"
+        )
+        node.create_subscription(
+            messages.TrajectorySetpoint, f"{prefix}/fmu/in/trajectory_setpoint", self._on_setpoint
+        )
+        node.create_subscription(
+            messages.OffboardControlMode, f"{prefix}/fmu/in/offboard_control_mode",
+            self._on_offboard_mode,
+        )
+        node.create_subscription(
+            messages.VehicleCommand, f"{prefix}/fmu/in/vehicle_command", self._on_command
+        )
+        node.create_timer(0.02, self._publish_estimator)
+        node.create_timer(0.1, self._publish_global)
+        node.create_timer(0.5, self._publish_status)
+        node.create_timer(1.0, self._publish_battery)
+
+    def _stamp_us(self) -> int:
+        return self.node.get_clock().now().nanoseconds // 1000
+
+    def _on_offboard_mode(self, msg):
+        self.offboard_heartbeats += 1
+
+    def _on_setpoint(self, msg):
+        self.setpoints += 1
+        if all(math.isfinite(value) for value in msg.position):
+            self.target = list(msg.position)
+
+    def _on_command(self, msg):
+        m = self._m
+        self.commands += 1
+        if msg.command == m.VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM:
+            self.armed = msg.param1 >= 0.5
+        elif msg.command == m.VehicleCommand.VEHICLE_CMD_DO_SET_MODE and int(msg.param2) == 6:
+            self.nav_state = m.VehicleStatus.NAVIGATION_STATE_OFFBOARD
+        self._ack_pub.publish(m.VehicleCommandAck(
+            timestamp=self._stamp_us(), command=msg.command,
+            result=m.VehicleCommandAck.VEHICLE_CMD_RESULT_ACCEPTED,
+            target_system=msg.source_system, target_component=msg.source_component,
+        ))
+
+    def _publish_estimator(self):
+        # 位置以 3 m/s 上限向 setpoint 逼近，足以让遥测与到达判定有变化
+        dt = 0.02
+        if self.armed and self.target is not None:
+            for axis in range(3):
+                error = self.target[axis] - self.position[axis]
+                self.velocity[axis] = max(-3.0, min(3.0, error / 0.5))
+                self.position[axis] += self.velocity[axis] * dt
+        else:
+            self.velocity = [0.0, 0.0, 0.0]
+        stamp_us = self._stamp_us()
+        x, y, z = self.position
+        vx, vy, vz = self.velocity
+        self._local_pub.publish(self._m.VehicleLocalPosition(
+            timestamp=stamp_us, timestamp_sample=stamp_us, xy_valid=True, z_valid=True,
+            v_xy_valid=True, v_z_valid=True, x=x, y=y, z=z, vx=vx, vy=vy, vz=vz,
+        ))
+        self._odometry_pub.publish(self._m.VehicleOdometry(
+            timestamp=stamp_us, timestamp_sample=stamp_us, position=[x, y, z],
+            q=[1.0, 0.0, 0.0, 0.0], velocity=[vx, vy, vz], angular_velocity=[0.0, 0.0, 0.0],
+        ))
+
+    def _publish_global(self):
+        stamp_us = self._stamp_us()
+        x, y, z = self.position
+        self._global_pub.publish(self._m.VehicleGlobalPosition(
+            timestamp=stamp_us, timestamp_sample=stamp_us,
+            lat=30.0 + x / 111_320.0, lon=120.0 + y / 96_486.0, alt=50.0 - z,
+            alt_ellipsoid=40.0 - z, eph=0.8, epv=1.2, lat_lon_valid=True, alt_valid=True,
+        ))
+
+    def _publish_status(self):
+        m = self._m.VehicleStatus
+        self._status_pub.publish(m(
+            timestamp=self._stamp_us(),
+            arming_state=m.ARMING_STATE_ARMED if self.armed else m.ARMING_STATE_DISARMED,
+            nav_state=self.nav_state,
+        ))
+
+    def _publish_battery(self):
+        self.battery = max(0.05, self.battery - 1.0 / 7200.0)
+        self._battery_pub.publish(self._m.BatteryStatus(
+            timestamp=self._stamp_us(), connected=True,
+            voltage_v=14.0 + 2.8 * self.battery, remaining=self.battery,
+        ))
+
+
+class SimulatedBackend:
+    """后端：按心跳频率把每条命令重发 repeat_total 次（可丢包），并计数遥测。"""
+
+    def __init__(self, node_type, bridge_module, targets, args):
+        self.node = node_type("sim_backend")
+        self._bridge = bridge_module
+        self._targets = targets
+        self._repeat_total = args.repeat_total
+        self._loss = args.loss
+        self._rng = random.Random(args.seed)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._session_id = f"soak-{os.getpid()}"
+        self._tick = 0
+        self.commands_issued = 0
+        self.datagrams_sent = 0
+        self.datagrams_lost = 0
+        self.telemetry_datagrams = 0
+        self.telemetry_bytes = 0
+        self.telemetry_sockets = []
+        for slot, _, telemetry_port in targets:
+            receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            receiver.bind(("127.0.0.1", telemetry_port))
+            receiver.setblocking(False)
+            self.telemetry_sockets.append(receiver)
+        self.node.create_timer(1.0 / args.heartbeat_hz, self._send_heartbeat)
+
+    def _datagram(self, slot: int, sequence: int, repeat: int) -> bytes:
+        # 桥接的墙钟与 ROS 时钟同为 runtime.unix，虚拟时钟下同样一致
+        now_unix = self.node.get_clock().now().nanoseconds / 1e9
+        angle = sequence * 0.2
+        message = {
+            "protocol": self._bridge.CONTROL_PROTOCOL,
+            "version": self._bridge.CONTROL_PROTOCOL_VERSION,
+            "type": "control",
+            "session_id": self._session_id,
+            "command_id": f"{self._session_id}-d{slot}-s{sequence}",
+            "sequence": sequence,
+            "drone_id": slot,
+            "slot": slot,
+            "mode": "move",
+            "issued_at_unix_s": now_unix,
+            "sent_at_unix_s": now_unix,
+            "target": {
+                "frame": "NED",
+                "reference": "power_on_origin",
+                "unit": "m",
+                "north": 20.0 * math.cos(angle),
+                "east": 20.0 * math.sin(angle),
+                "down": -10.0,
+            },
+            "delivery": {"repeat_index": repeat, "repeat_total": self._repeat_total},
+        }
+        if self._bridge.CONTROL_AUTH_KEY:
+            parsed = self._bridge.parse_control_packet(json.dumps(message).encode("utf-8"))
+            session_key = self._bridge.derive_control_session_key(
+                self._bridge.CONTROL_AUTH_KEY, self._session_id
+            )
+            message["auth"] = {
+                "alg": self._bridge.CONTROL_AUTH_ALGORITHM,
+                "mac": self._bridge.compute_control_mac(session_key, parsed).hex(),
+            }
+        return json.dumps(message).encode("utf-8")
+
+    def _send_heartbeat(self):
+        sequence, repeat_index = divmod(self._tick, self._repeat_total)
+        self._tick += 1
+        sequence += 1
+        if repeat_index == 0:
+            self.commands_issued += 1
+        for slot, control_port, _ in self._targets:
+            if self._rng.random() < self._loss:
+                self.datagrams_lost += 1
+                continue
+            self._sock.sendto(
+                self._datagram(slot, sequence, repeat_index + 1), ("127.0.0.1", control_port)
+            )
+            self.datagrams_sent += 1
+
+    def drain_telemetry(self):
+        for receiver in self.telemetry_sockets:
+            while True:
+                try:
+                    data = receiver.recv(65535)
+                except (BlockingIOError, InterruptedError):
+                    break
+                self.telemetry_datagrams += 1
+                self.telemetry_bytes += len(data)
+
+    def close(self):
+        self._sock.close()
+        for receiver in self.telemetry_sockets:
+            receiver.close()
+
+
+class SimulatedCamera:
+    """以 --video-fps 发布小尺寸 Image，每秒一条 CameraInfo。"""
+
+    def __init__(self, node_type, messages, fps: int):
+        self.node = node_type("sim_camera")
+        self._m = messages
+        self._image_pub = self.node.create_publisher(messages.Image, "/image_raw")
+        self._info_pub = self.node.create_publisher(messages.CameraInfo, "/camera_info")
+        self._payload = bytes(64 * 48 * 3)
+        self.frames = 0
+        self.node.create_timer(1.0 / fps, self._publish_frame)
+        self.node.create_timer(1.0, self._publish_info)
+
+    def _header(self):
+        header = self._m.Header(frame_id="camera")
+        header.stamp = self.node.get_clock().now().to_msg()
+        return header
+
+    def _publish_frame(self):
+        self.frames += 1
+        self._image_pub.publish(self._m.Image(
+            header=self._header(), height=48, width=64, encoding="rgb8", step=64 * 3,
+            data=self._payload,
+        ))
+
+    def _publish_info(self):
+        self._info_pub.publish(self._m.CameraInfo(
+            header=self._header(), height=48, width=64, distortion_model="plumb_bob",
+            d=[0.0] * 5, k=[60.0, 0.0, 32.0, 0.0, 60.0, 24.0, 0.0, 0.0, 1.0],
+        ))
+
+
+def _cpu_load(bridge_module, seconds: float):
+    """返回一个占用 GIL 约 seconds 秒的回调：反复编码一帧遥测。"""
+    sample = {
+        "timestamp": 1784200000123456, "position": [12.5, -3.25, -8.0],
+        "velocity": [0.4, -0.05, 0.0], "q": [1.0, 0.0, 0.0, 0.0], "arming_state": 2,
+    }
+
+    def _load():
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            bridge_module.encode_telemetry_yaml(sample)
+
+    _load.__qualname__ = "diagnostics_load"
+    return _load
+
+
+def _mib(value) -> str:
+    return f"{value / (1024 * 1024):.1f}MiB" if value is not None else "n/a"
+
+
+def soak(args) -> int:
+    # 端口与后端地址必须在 import jetson_bridge 之前确定（模块级常量）
+    os.environ.setdefault("BACKEND_HOST", "127.0.0.1")
+    os.environ.setdefault("CONTROL_BIND_HOST", "127.0.0.1")
+    if args.executor:
+        os.environ["ROS_EXECUTOR"] = args.executor
+    runtime = fake_ros_runtime.install(virtual_clock=not args.realtime)
+    import jetson_bridge
+
+    messages = runtime.modules
+    msg_namespace = type("Messages", (), {
+        **vars(messages["px4_msgs.msg"]), **vars(messages["sensor_msgs.msg"]),
+        **vars(messages["std_msgs.msg"]),
+    })
+    node_type = messages["rclpy.node"].Node
+    runtime.init()
+
+    slots = jetson_bridge.parse_slot_list(args.slots)
+    environ = dict(os.environ)
+    if len(slots) > 1:
+        environ.setdefault("ROS_TOPIC_PREFIX", "/px4_{slot}")
+    for slot in slots:
+        environ[f"CONTROL_PORT_{slot}"] = str(_free_udp_port())
+        environ[f"TELEMETRY_PORT_{slot}"] = str(_free_udp_port())
+    configs = jetson_bridge.resolve_bridge_configs(slots, environ)
+
+    timer_stats = TimerStats(jetson_bridge.LatencyHistogram)
+    runtime.timer_observer = timer_stats.observe
+    # 模拟端在桥接之前创建，保证同一时刻 PX4 样本先于心跳处理
+    px4 = [
+        SimulatedPx4(node_type, msg_namespace, config["topic_prefix"], config["mavlink_system_id"])
+        for config in configs
+    ]
+    backend = SimulatedBackend(
+        node_type, jetson_bridge,
+        [(c["slot"], c["control_port"], c["telemetry_port"]) for c in configs], args,
+    )
+    bridges = [
+        jetson_bridge.JetsonBridge(
+            config["slot"], config, clock=runtime.monotonic, wall_clock=runtime.unix
+        )
+        for config in configs
+    ]
+    selector = selectors.DefaultSelector()
+    for bridge in bridges:
+        selector.register(bridge._ctrl_sock, selectors.EVENT_READ, bridge.drain_control)
+
+    video_node = camera = None
+    if args.video:
+        import jetson_video_stream
+
+        video_args = jetson_video_stream.finalize_arguments(
+            jetson_video_stream.build_argument_parser().parse_args([
+                "--drone-id", str(slots[0]), "--topic-prefix", configs[0]["topic_prefix"],
+                "--no-upload-metadata", "--no-update-backend", "--fps", str(args.video_fps),
+            ])
+        )
+        video_node = jetson_video_stream.JetsonVideoStreamNode(video_args)
+        camera = SimulatedCamera(node_type, msg_namespace, args.video_fps)
+
+    if args.tracemalloc:
+        import tracemalloc
+
+        tracemalloc.start()
+    if args.load_ms > 0:
+        # 诊断回调组里的慢回调（如大段 YAML / 诊断格式化），用于比较单线程与
+        # 多线程执行器下心跳的触发延迟
+        for bridge in bridges:
+            bridge.create_timer(
+                1.0 / args.load_hz, _cpu_load(jetson_bridge, args.load_ms / 1e3),
+                callback_group=bridge._diagnostics_group,
+            )
+    executor = None
+    if args.realtime:
+        import threading
+
+        if jetson_bridge.ROS_EXECUTOR == "multi" and jetson_bridge.OFFBOARD_SWITCH_INTERVAL_SEC > 0:
+            sys.setswitchinterval(jetson_bridge.OFFBOARD_SWITCH_INTERVAL_SEC)
+        executor = jetson_bridge.build_executor(len(slots))
+        threading.Thread(target=executor.spin, daemon=True).start()
+
+    duration = args.hours * 3600.0 + args.minutes * 60.0
+    report_every = args.report_every
+    step = jetson_bridge.OFFBOARD_INTERVAL
+    wall_started = time.monotonic()
+    cpu_started = time.process_time()
+    rss_samples = []
+    armed = False
+    next_report = min(report_every, duration)
+    snapshot_before = None
+    print(
+        f"soak: slots={','.join(map(str, slots))} duration={duration / 3600.0:.2f}h "
+        f"clock={'real' if args.realtime else 'virtual'} loss={args.loss:.0%} "
+        f"video={'on' if args.video else 'off'} executor={jetson_bridge.ROS_EXECUTOR}"
+        + (f" load={args.load_ms:g}ms@{args.load_hz:g}Hz" if args.load_ms > 0 else "")
+    )
+    try:
+        while True:
+            elapsed = runtime.elapsed_sec()
+            if elapsed >= duration:
+                break
+            if args.realtime:
+                timeout = 0.005
+            else:
+                runtime.run_for(min(step, duration - elapsed))
+                timeout = 0.0
+            for key, _ in selector.select(timeout=timeout):
+                key.data()
+            now = runtime.monotonic()
+            for bridge in bridges:
+                bridge.poll_telemetry(now)
+                bridge.poll_pose_batch(now)
+                bridge.poll_control_ingress(now)
+                bridge.poll_command_housekeeping(now)
+            backend.drain_telemetry()
+            if not armed and all(b._warmup_count >= b._warmup_needed for b in bridges):
+                # 等价于 ARM_NOW=1
+                for bridge in bridges:
+                    bridge._arm_triggered = True
+                armed = True
+            elapsed = runtime.elapsed_sec()
+            if elapsed >= next_report:
+                rss = jetson_bridge.read_process_rss_bytes()
+                rss_samples.append((elapsed, rss))
+                if args.tracemalloc and snapshot_before is None:
+                    snapshot_before = tracemalloc.take_snapshot()
+                wall = time.monotonic() - wall_started
+                applied = sum(bridge._core.commands_applied for bridge in bridges)
+                print(
+                    f"soak: t={elapsed / 3600.0:6.2f}h wall={wall:7.1f}s "
+                    f"speedup={elapsed / max(wall, 1e-9):6.0f}x "
+                    f"cpu={time.process_time() - cpu_started:7.1f}s rss={_mib(rss)} "
+                    f"issued={backend.commands_issued} applied={applied} "
+                    f"telemetry={backend.telemetry_datagrams}",
+                    flush=True,
+                )
+                next_report = min(duration, next_report + report_every)
+                if next_report <= elapsed:
+                    next_report = math.inf
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        runtime.shutdown()
+        selector.close()
+        if video_node is not None:
+            video_node.shutdown()
+            video_node.destroy_node()
+        for bridge in bridges:
+            bridge.cleanup()
+        backend.close()
+
+    wall = time.monotonic() - wall_started
+    cpu = time.process_time() - cpu_started
+    simulated = runtime.elapsed_sec()
+    print(
+        f"\nsimulated {simulated / 3600.0:.2f}h in {wall:.1f}s wall "
+        f"({simulated / max(wall, 1e-9):.0f}x), cpu {cpu:.1f}s "
+        f"({100.0 * cpu / max(wall, 1e-9):.0f}% of one core), "
+        f"{runtime.delivered} ROS messages delivered"
+    )
+    for bridge, sim in zip(bridges, px4):
+        core = bridge._core
+        print(
+            f"slot {bridge.slot}: rx={core.rx_total} valid={core.rx_valid} "
+            f"duplicate={core.rx_duplicate} applied={core.commands_applied} "
+            f"offboard_heartbeats={sim.offboard_heartbeats} setpoints={sim.setpoints} "
+            f"vehicle_commands={sim.commands} armed={sim.armed} | rx→apply "
+            f"{jetson_bridge.format_latency_ms(core.apply_latency['confirm'].snapshot())}"
+            # 心跳间隔按真实单调时钟统计，只在真实时钟下有意义
+            + (f" | heartbeat interval {bridge._heartbeat_monitor.summary()}" if args.realtime else "")
+        )
+    print(
+        f"backend: issued={backend.commands_issued} sent={backend.datagrams_sent} "
+        f"lost={backend.datagrams_lost} telemetry={backend.telemetry_datagrams} "
+        f"({_mib(backend.telemetry_bytes)})"
+    )
+    if camera is not None:
+        print(
+            f"video: camera_frames={camera.frames} node_frames={video_node.frame_index} "
+            f"queue_drops={video_node.stream_queue_drops}"
+        )
+
+    print("\ntimer                                   calls   lateness p50/p99/max       callback p50/p99/max")
+    for name, (lateness, duration_hist) in sorted(timer_stats.by_name.items()):
+        late = lateness.snapshot()
+        cost = duration_hist.snapshot()
+        print(
+            f"{name:38s} {cost['count']:7d}   "
+            f"{late['p50'] * 1e3:6.2f}/{late['p99'] * 1e3:6.2f}/{late['max'] * 1e3:7.2f}ms   "
+            f"{cost['p50'] * 1e3:6.3f}/{cost['p99'] * 1e3:6.3f}/{cost['max'] * 1e3:7.3f}ms"
+        )
+
+    growth_mib_per_hour = None
+    if len(rss_samples) >= 2 and rss_samples[0][1] is not None:
+        # 第一个采样点之前是导入与预热，不计入增长
+        (t0, rss0), (t1, rss1) = rss_samples[0], rss_samples[-1]
+        if t1 > t0:
+            growth_mib_per_hour = (rss1 - rss0) / (1024 * 1024) / ((t1 - t0) / 3600.0)
+            print(
+                f"\nrss {_mib(rss0)} -> {_mib(rss1)} "
+                f"({growth_mib_per_hour:+.2f} MiB per simulated hour)"
+            )
+    if args.tracemalloc and snapshot_before is not None:
+        print("\ntop allocation growth since first report:")
+        for stat in tracemalloc.take_snapshot().compare_to(snapshot_before, "lineno")[:8]:
+            print(f"  {stat}")
+        tracemalloc.stop()
+
+    if (
+        args.max_rss_growth_mib is not None and growth_mib_per_hour is not None
+        and growth_mib_per_hour > args.max_rss_growth_mib
+    ):
+        print(
+            f"soak: FAIL rss growth {growth_mib_per_hour:.2f} MiB/h exceeds "
+            f"{args.max_rss_growth_mib} MiB/h", file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hours", type=float, default=0.0)
+    parser.add_argument("--minutes", type=float, default=0.0)
+    parser.add_argument("--slots", default="1", help="slot list, e.g. 1,2,3")
+    parser.add_argument("--heartbeat-hz", type=float, default=5.0, help="backend send rate")
+    parser.add_argument("--repeat-total", type=int, default=5)
+    parser.add_argument("--loss", type=float, default=0.0, help="control datagram loss rate")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--report-every", type=float, default=600.0, help="simulated seconds between reports"
+    )
+    parser.add_argument("--realtime", action="store_true", help="use the wall clock")
+    parser.add_argument(
+        "--executor", choices=("multi", "single"), default=None,
+        help="ROS executor for --realtime (default: ROS_EXECUTOR)",
+    )
+    parser.add_argument(
+        "--load-ms", type=float, default=0.0,
+        help="CPU time of an extra callback in each bridge's diagnostics group",
+    )
+    parser.add_argument("--load-hz", type=float, default=9.0)
+    parser.add_argument("--video", action="store_true", help="also run JetsonVideoStreamNode")
+    parser.add_argument("--video-fps", type=int, default=30)
+    parser.add_argument("--tracemalloc", action="store_true")
+    parser.add_argument(
+        "--max-rss-growth-mib", type=float,
+        help="exit 1 when RSS grows faster than this many MiB per simulated hour",
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    if args.hours * 3600.0 + args.minutes * 60.0 <= 0:
+        args.minutes = 10.0
+    if not 0.0 <= args.loss < 1.0 or args.repeat_total < 1 or args.heartbeat_hz <= 0:
+        parser.error("--loss must be in [0, 1), --repeat-total >= 1, --heartbeat-hz > 0")
+    logging.basicConfig(
+        level=getattr(logging, args.log_level.upper()),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    return soak(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
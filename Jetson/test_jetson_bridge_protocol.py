@@ -1,13 +1,28 @@
-import ast
+import importlib.util
 import json
 import math
 import pathlib
+import selectors
+import socket
+import sys
+import tempfile
 import threading
 import time
+import types
 import unittest
+from unittest import mock
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
 
 SCRIPT_PATH = pathlib.Path(__file__).with_name("jetson_bridge.py")
+SPEC = importlib.util.spec_from_file_location("jetson_bridge_under_test", SCRIPT_PATH)
+MODULE = importlib.util.module_from_spec(SPEC)
+sys.modules[SPEC.name] = MODULE
+SPEC.loader.exec_module(MODULE)
 
 
 class _Logger:
@@ -21,53 +36,7 @@ class _Logger:
         pass
 
 
-def _load_protocol_code():
-    """加载纯协议代码，避免测试机必须安装 ROS2/px4_msgs。"""
-    tree = ast.parse(SCRIPT_PATH.read_text(encoding="utf-8"))
-    parser = next(
-        node for node in tree.body
-        if isinstance(node, ast.FunctionDef)
-        and node.name == "parse_control_packet"
-    )
-    bridge = next(
-        node for node in tree.body
-        if isinstance(node, ast.ClassDef) and node.name == "JetsonBridge"
-    )
-    method_names = {
-        "_accept_backend_session",
-        "_control_fingerprint",
-        "_stage_control_command",
-        "_apply_control_command",
-        "_prune_applied_commands",
-    }
-    gate_class = ast.ClassDef(
-        name="ProtocolGate",
-        bases=[],
-        keywords=[],
-        decorator_list=[],
-        body=[
-            node for node in bridge.body
-            if isinstance(node, ast.FunctionDef) and node.name in method_names
-        ],
-    )
-    namespace = {
-        "json": json,
-        "math": math,
-        "time": time,
-        "MAX_CONTROL_PACKET_BYTES": 4096,
-        "MAX_ABS_TARGET_M": 5000.0,
-        "CONTROL_PROTOCOL": "ue5_drone_control",
-        "CONTROL_PROTOCOL_VERSION": 1,
-        "COMMAND_CONFIRM_COUNT": 3,
-        "COMMAND_CONFIRM_WINDOW_SEC": 2.5,
-    }
-    module = ast.Module(body=[parser, gate_class], type_ignores=[])
-    module = ast.fix_missing_locations(module)
-    exec(compile(module, str(SCRIPT_PATH), "exec"), namespace)
-    return namespace["parse_control_packet"], namespace["ProtocolGate"]
-
-
-parse_control_packet, ProtocolGate = _load_protocol_code()
+parse_control_packet = MODULE.parse_control_packet
 
 
 def _message(
@@ -100,24 +69,9 @@ def _message(
     }
 
 
-def _new_gate():
-    gate = ProtocolGate()
-    gate._active_backend_session = None
-    gate._retired_backend_sessions = set()
-    gate._highest_applied_sequence = 0
-    gate._pending_commands = {}
-    gate._applied_command_ids = {}
-    gate._commands_applied = 0
-    gate._last_applied_command = None
-    gate._udp_rx_duplicate = 0
-    gate._udp_rx_stale = 0
-    gate._udp_rx_invalid = 0
-    gate._last_setpoint = {
-        "x": 0.0, "y": 0.0, "z": 0.0,
-        "mode": "hold", "sequence": 0,
-    }
-    gate._setpoint_lock = threading.Lock()
-    gate.get_logger = lambda: _Logger()
+def _new_gate(**kwargs):
+    gate = MODULE.BridgeCore(1, _Logger(), **kwargs)
+    gate.last_setpoint = MODULE.Setpoint(0.0, 0.0, 0.0, "hold", 0)
     return gate
 
 
@@ -134,6 +88,18 @@ class ControlProtocolTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             parse_control_packet(json.dumps(message).encode("utf-8"))
 
+    def test_pause_and_resume_may_omit_the_target(self):
+        for mode in ("pause", "resume"):
+            message = dict(_message(), mode=mode)
+            del message["target"]
+            parsed = parse_control_packet(json.dumps(message).encode("utf-8"))
+            self.assertEqual((parsed["mode"], parsed["x"], parsed["y"], parsed["z"]),
+                             (mode, 0.0, 0.0, 0.0))
+        message = _message()
+        del message["target"]
+        with self.assertRaises(ValueError):
+            parse_control_packet(json.dumps(message).encode("utf-8"))
+
     def test_three_unique_repeats_apply_once(self):
         gate = _new_gate()
         sender = ("192.168.30.100", 50123)
@@ -143,15 +109,15 @@ class ControlProtocolTest(unittest.TestCase):
             )
             self.assertTrue(gate._accept_backend_session(packet))
             gate._stage_control_command(packet, sender, 10.0 + index * 0.1)
-        self.assertEqual(gate._commands_applied, 0)
+        self.assertEqual(gate.commands_applied, 0)
 
         packet = parse_control_packet(
             json.dumps(_message(repeat_index=3)).encode("utf-8")
         )
         gate._stage_control_command(packet, sender, 10.3)
-        self.assertEqual(gate._commands_applied, 1)
-        self.assertEqual(gate._last_setpoint["sequence"], 100)
-        self.assertEqual(gate._last_setpoint["z"], -5.0)
+        self.assertEqual(gate.commands_applied, 1)
+        self.assertEqual(gate.last_setpoint.sequence, 100)
+        self.assertEqual(gate.last_setpoint.z, -5.0)
 
     def test_duplicate_repeat_index_does_not_reach_threshold(self):
         gate = _new_gate()
@@ -162,8 +128,8 @@ class ControlProtocolTest(unittest.TestCase):
             )
             gate._accept_backend_session(packet)
             gate._stage_control_command(packet, sender, 20.0 + index * 0.1)
-        self.assertEqual(gate._commands_applied, 0)
-        self.assertEqual(gate._udp_rx_duplicate, 1)
+        self.assertEqual(gate.commands_applied, 0)
+        self.assertEqual(gate.rx_duplicate, 1)
 
     def test_older_sequence_is_rejected_after_newer_command(self):
         gate = _new_gate()
@@ -178,8 +144,8 @@ class ControlProtocolTest(unittest.TestCase):
             repeat_index=4, sequence=100, command_id="cmd-100"
         )).encode("utf-8"))
         gate._stage_control_command(old, sender, 31.0)
-        self.assertEqual(gate._commands_applied, 1)
-        self.assertEqual(gate._udp_rx_stale, 1)
+        self.assertEqual(gate.commands_applied, 1)
+        self.assertEqual(gate.rx_stale, 1)
 
     def test_same_command_id_with_conflicting_target_is_discarded(self):
         gate = _new_gate()
@@ -193,9 +159,9 @@ class ControlProtocolTest(unittest.TestCase):
             gate._accept_backend_session(packet)
             gate._stage_control_command(packet, sender, 40.0)
 
-        self.assertEqual(gate._commands_applied, 0)
-        self.assertEqual(gate._udp_rx_invalid, 1)
-        self.assertNotIn("cmd-100", gate._pending_commands)
+        self.assertEqual(gate.commands_applied, 0)
+        self.assertEqual(gate.rx_invalid, 1)
+        self.assertNotIn("cmd-100", gate.commands.pending)
 
     def test_new_session_retires_old_session_and_restarts_ordering(self):
         gate = _new_gate()
@@ -220,10 +186,2074 @@ class ControlProtocolTest(unittest.TestCase):
             self.assertTrue(gate._accept_backend_session(new))
             gate._stage_control_command(new, sender, 50.0 + index * 0.1)
 
-        self.assertEqual(gate._commands_applied, 1)
-        self.assertEqual(gate._highest_applied_sequence, 1)
+        self.assertEqual(gate.commands_applied, 1)
+        self.assertEqual(gate.highest_applied_sequence, 1)
         self.assertFalse(gate._accept_backend_session(old))
-        self.assertEqual(gate._udp_rx_stale, 1)
+        self.assertEqual(gate.rx_stale, 1)
+
+
+class CommandStoreTest(unittest.TestCase):
+    @staticmethod
+    def _pending(sequence, repeat_index=1, now=0.0):
+        packet = {"sequence": sequence, "repeat_index": repeat_index}
+        return MODULE.PendingCommand(packet, (sequence,), None, now)
+
+    def test_repeat_mask_counts_unique_indices(self):
+        pending = self._pending(1, repeat_index=1000)
+        for index in (1000, 998, 1000, 1003):
+            pending.add_repeat(index)
+        self.assertEqual(pending.confirmed, 3)
+        self.assertFalse(pending.add_repeat(998))
+        # 远早于位图窗口的 index 视为重复，不会让位图无限增长
+        self.assertFalse(pending.add_repeat(1))
+
+    def test_staged_at_comes_from_the_caller_clock(self):
+        self.assertEqual(self._pending(1, now=42.0).staged_at, 42.0)
+        gate = _new_gate(clock=lambda: 500.0)
+        message = _message(repeat_index=1)
+        gate.handle_datagram(json.dumps(message).encode("utf-8"), ("192.168.30.100", 50123), 60.0)
+        pending = gate.commands.pending[message["command_id"]]
+        self.assertEqual((pending.first_seen, pending.staged_at), (60.0, 500.0))
+
+    def test_huge_repeat_index_slides_a_fixed_width_window(self):
+        pending = self._pending(1, repeat_index=1)
+        pending.add_repeat(1)
+        self.assertFalse(pending.has_repeat(10**11))
+        self.assertTrue(pending.add_repeat(10**11))
+        self.assertLess(pending.repeat_mask.bit_length(), MODULE.PendingCommand.WINDOW_BITS + 1)
+        self.assertEqual(pending.confirmed, 1)
+        self.assertFalse(pending.add_repeat(10**11))
+        self.assertTrue(pending.add_repeat(10**11 - 5))
+        self.assertEqual(pending.confirmed, 2)
+
+    def test_gate_rejects_repeat_index_beyond_u32(self):
+        gate = _new_gate()
+        sender = ("192.168.30.100", 50123)
+        for index in (1, 10**11):
+            message = _message(repeat_index=index)
+            message["mode"] = "hold"
+            message["delivery"]["repeat_total"] = 0
+            gate.handle_datagram(json.dumps(message).encode("utf-8"), sender, 60.0)
+        self.assertEqual(gate.rx_valid, 1)
+        self.assertEqual(gate.rx_invalid, 1)
+        with self.assertRaises(ValueError):
+            message["delivery"]["repeat_index"] = MODULE.CONTROL_MAX_REPEAT_INDEX + 1
+            parse_control_packet(json.dumps(message).encode("utf-8"))
+
+    def test_evicts_by_sequence_regardless_of_arrival_order(self):
+        store = MODULE.CommandStore()
+        for sequence in (7, 3, 9, 1, 5):
+            store.add_pending(f"cmd-{sequence}", self._pending(sequence))
+        self.assertEqual(store.evict_through_sequence(5), 3)
+        self.assertEqual(sorted(store.pending), ["cmd-7", "cmd-9"])
+
+    def test_idle_expiry_follows_latest_touch(self):
+        store = MODULE.CommandStore()
+        first, second = self._pending(1, now=0.0), self._pending(2, now=0.0)
+        store.add_pending("cmd-1", first)
+        store.add_pending("cmd-2", second)
+        store.touch("cmd-2", second, 4.0)
+        self.assertEqual(store.expire_pending(6.0, 5.0), 1)
+        self.assertEqual(list(store.pending), ["cmd-2"])
+
+        # 同一 command_id 重建后，旧对象的堆条目不能删除新对象
+        replacement = self._pending(2, now=8.0)
+        store.add_pending("cmd-2", replacement)
+        self.assertEqual(store.expire_pending(10.0, 5.0), 0)
+        self.assertIs(store.pending["cmd-2"], replacement)
+
+    def test_applied_and_retired_sessions_are_bounded(self):
+        store = MODULE.CommandStore()
+        for index in range(store.APPLIED_LIMIT + 10):
+            store.record_applied(f"cmd-{index}", float(index))
+        self.assertEqual(len(store.applied), store.APPLIED_LIMIT)
+        self.assertNotIn("cmd-0", store.applied)
+        store.prune_applied(store.APPLIED_LIMIT + 10 + store.APPLIED_RETENTION_SEC)
+        self.assertLess(len(store.applied), store.APPLIED_LIMIT)
+
+        for index in range(store.RETIRED_SESSION_LIMIT * 3):
+            store.retire_session(f"backend-{index}")
+        self.assertEqual(len(store.retired_sessions), store.RETIRED_SESSION_LIMIT)
+        self.assertIn(f"backend-{store.RETIRED_SESSION_LIMIT * 3 - 1}", store.retired_sessions)
+
+
+class BinaryControlProtocolTest(unittest.TestCase):
+    @staticmethod
+    def _binary(**kwargs):
+        parsed = parse_control_packet(json.dumps(_message(**kwargs)).encode("utf-8"))
+        return MODULE.encode_binary_control_packet(parsed)
+
+    def test_binary_variant_matches_json_parse(self):
+        from_json = parse_control_packet(json.dumps(_message()).encode("utf-8"))
+        from_binary = parse_control_packet(self._binary())
+        self.assertEqual(from_binary, from_json)
+
+    def test_binary_repeats_pass_the_same_confirmation_gate(self):
+        gate = _new_gate()
+        sender = ("192.168.30.100", 50123)
+        for index in (1, 2, 3):
+            packet = parse_control_packet(self._binary(repeat_index=index))
+            self.assertTrue(gate._accept_backend_session(packet))
+            gate._stage_control_command(packet, sender, 60.0 + index * 0.1)
+        self.assertEqual(gate.commands_applied, 1)
+        self.assertEqual(gate.last_setpoint.x, 10.0)
+
+    def test_binary_rejects_unknown_version_and_truncation(self):
+        packet = bytearray(self._binary())
+        packet[4] = MODULE.CONTROL_BINARY_VERSION + 1
+        with self.assertRaises(ValueError):
+            parse_control_packet(bytes(packet))
+        with self.assertRaises(ValueError):
+            parse_control_packet(self._binary()[:-1])
+        with self.assertRaises(ValueError):
+            parse_control_packet(MODULE.CONTROL_BINARY_MAGIC + b"\x01")
+
+    def test_binary_applies_json_semantic_validation(self):
+        packet = bytearray(self._binary(repeat_index=1))
+        # repeat_index 在 repeat_total(5) 之后，越界值必须与 JSON 路径一样被拒绝。
+        offset = MODULE._CONTROL_BINARY_HEADER.size - 10
+        packet[offset:offset + 4] = (6).to_bytes(4, "little")
+        with self.assertRaises(ValueError):
+            parse_control_packet(bytes(packet))
+
+
+class AuthenticatedControlTest(unittest.TestCase):
+    KEY = b"test-master-key"
+    SENDER = ("192.168.30.100", 50123)
+
+    def _signed(self, binary=False, **kwargs):
+        parsed = parse_control_packet(json.dumps(_message(**kwargs)).encode("utf-8"))
+        session_key = MODULE.derive_control_session_key(self.KEY, parsed["session_id"])
+        parsed["auth_mac"] = MODULE.compute_control_mac(session_key, parsed)
+        if binary:
+            return parse_control_packet(MODULE.encode_binary_control_packet(parsed))
+        message = _message(**kwargs)
+        message["auth"] = {
+            "alg": MODULE.CONTROL_AUTH_ALGORITHM,
+            "mac": parsed["auth_mac"].hex(),
+        }
+        return parse_control_packet(json.dumps(message).encode("utf-8"))
+
+    def _admit(self, gate, packet, now):
+        with mock.patch.object(MODULE, "CONTROL_AUTH_KEY", self.KEY):
+            if not gate._verify_control_auth(packet, self.SENDER):
+                return False
+        self.assertTrue(gate._accept_backend_session(packet))
+        gate._stage_control_command(packet, self.SENDER, now)
+        return True
+
+    def test_json_and_binary_mac_round_trip(self):
+        from_json = self._signed()
+        from_binary = self._signed(binary=True)
+        self.assertEqual(len(from_json["auth_mac"]), MODULE.CONTROL_AUTH_MAC_BYTES)
+        self.assertEqual(from_binary, from_json)
+
+    def test_authenticated_command_applies_on_first_datagram(self):
+        gate = _new_gate(wall_clock=lambda: 1000.2)
+        self.assertTrue(self._admit(gate, self._signed(binary=True), 70.0))
+        self.assertEqual(gate.commands_applied, 1)
+        self.assertTrue(gate.last_applied_command["authenticated"])
+        self.assertEqual(gate.last_applied_command["confirmed_packets"], 1)
+        self.assertEqual(gate.apply_latency["auth"].snapshot()["count"], 1)
+
+        # 后续重复包按已应用命令计为 duplicate，不会再次写 setpoint
+        self.assertTrue(self._admit(gate, self._signed(repeat_index=2), 70.1))
+        self.assertEqual(gate.commands_applied, 1)
+        self.assertEqual(gate.rx_duplicate, 1)
+
+    def test_replayed_command_outside_the_freshness_window_is_dropped(self):
+        # Jetson 重启后无会话与已应用记录：只有 issued_at 能识别旧的签名数据报
+        gate = _new_gate(wall_clock=lambda: 1000.0 + MODULE.CONTROL_AUTH_MAX_AGE_SEC + 1.0)
+        self.assertTrue(self._admit(gate, self._signed(binary=True), 70.0))
+        self.assertEqual((gate.commands_applied, gate.rx_stale), (0, 1))
+
+        # issued_at 在 MAC 内，改写成新鲜时间会使 MAC 失效
+        packet = self._signed(sequence=101, command_id="cmd-101")
+        packet["issued_at"] += MODULE.CONTROL_AUTH_MAX_AGE_SEC
+        self.assertFalse(self._admit(gate, packet, 70.1))
+        self.assertEqual(gate.rx_invalid, 1)
+
+        with mock.patch.object(MODULE, "CONTROL_AUTH_MAX_AGE_SEC", 0.0):
+            self.assertTrue(self._admit(gate, self._signed(), 70.2))
+        self.assertEqual(gate.commands_applied, 1)
+
+    def test_tampered_mac_is_rejected_before_session_handling(self):
+        gate = _new_gate()
+        packet = self._signed(session_id="forged-session")
+        packet["x"] += 1.0
+        self.assertFalse(self._admit(gate, packet, 80.0))
+        self.assertEqual(gate.rx_invalid, 1)
+        self.assertIsNone(gate.active_session)
+
+    def test_unsigned_packets_still_use_the_confirmation_gate(self):
+        gate = _new_gate()
+        for index in (1, 2, 3):
+            packet = parse_control_packet(
+                json.dumps(_message(repeat_index=index)).encode("utf-8")
+            )
+            self.assertTrue(self._admit(gate, packet, 90.0 + index * 0.1))
+        self.assertEqual(gate.commands_applied, 1)
+        self.assertFalse(gate.last_applied_command["authenticated"])
+
+        with mock.patch.object(MODULE, "CONTROL_AUTH_REQUIRED", True):
+            unsigned = parse_control_packet(
+                json.dumps(_message(sequence=101, command_id="cmd-101")).encode("utf-8")
+            )
+            self.assertFalse(self._admit(gate, unsigned, 91.0))
+
+
+class _RecordingSink(MODULE.BridgeCoreSink):
+    def __init__(self):
+        self.senders = []
+        self.applied = []
+
+    def control_sender_validated(self, addr):
+        self.senders.append(addr)
+
+    def command_applied(self, parsed, confirmed_packets, authenticated):
+        self.applied.append((parsed["command_id"], confirmed_packets, authenticated))
+
+
+class BridgeCoreTest(unittest.TestCase):
+    SENDER = ("192.168.30.100", 50123)
+
+    def _core(self):
+        self.now = 100.0
+        self.sink = _RecordingSink()
+        return MODULE.BridgeCore(
+            1, _Logger(), sink=self.sink,
+            clock=lambda: self.now, wall_clock=lambda: 1000.0 + self.now - 100.0,
+        )
+
+    def test_raw_datagrams_flow_through_the_core_on_an_injected_clock(self):
+        core = self._core()
+        core.handle_datagram(b"not a packet", self.SENDER, self.now)
+        for index in (1, 2, 3):
+            self.now = 100.0 + index * 0.2
+            core.handle_datagram(
+                json.dumps(_message(repeat_index=index)).encode("utf-8"),
+                self.SENDER, self.now,
+            )
+        # 未有有效本地位置前不应用命令，确认组保留在 pending 中
+        self.assertEqual(core.commands_applied, 0)
+        self.assertEqual((core.rx_total, core.rx_valid, core.rx_invalid), (4, 3, 1))
+
+        local = types.SimpleNamespace(
+            x=1.0, y=2.0, z=-3.0, vx=0.0, vy=0.0, vz=0.0, xy_valid=True, z_valid=True
+        )
+        core.note_sample("local_position", local)
+        self.assertEqual(core.update_safe_hold(local), [1.0, 2.0, -3.0])
+        self.assertEqual(core.last_setpoint.mode, "hold")
+
+        self.now = 100.8
+        core.handle_datagram(
+            json.dumps(_message(repeat_index=4)).encode("utf-8"), self.SENDER, self.now
+        )
+        self.assertEqual(core.commands_applied, 1)
+        self.assertEqual(core.last_setpoint, MODULE.Setpoint(10.0, 20.0, -5.0, "move", 100))
+        self.assertEqual(self.sink.senders, [self.SENDER] * 4)
+        self.assertEqual(self.sink.applied, [("cmd-100", 4, False)])
+        # 虚拟时钟下延迟完全确定：首包 100.2 → 应用 100.8
+        self.assertAlmostEqual(core.apply_latency["confirm"].snapshot()["mean"], 0.6)
+        self.assertAlmostEqual(core.last_applied_command["applied_at_unix_s"], 1000.8)
+
+        core.record_publish_hops(core.publish_probe)
+        self.assertEqual(core.control_latency_snapshot()["rx→publish"]["count"], 1)
+
+    def test_telemetry_uses_sample_times_from_the_core_clock(self):
+        core = self._core()
+        local = types.SimpleNamespace(
+            x=1.0, y=2.0, z=-3.0, vx=0.1, vy=0.2, vz=0.3, xy_valid=True, z_valid=True
+        )
+        core.note_sample("local_position", local)
+        core.note_sample("status", types.SimpleNamespace(arming_state=2, nav_state=14))
+        core.note_sample("battery", types.SimpleNamespace(remaining=0.5))
+
+        data = core.build_telemetry(123, sample_latency=0.002)
+        self.assertEqual(data["timestamp"], 123)
+        self.assertEqual(data["position"], [1.0, 2.0, -3.0])
+        self.assertTrue(data["local_position_valid"])
+        self.assertEqual((data["arming_state"], data["battery"]), (2, 50))
+        self.assertEqual(data["sample_latency_ms"], 2.0)
+        self.assertFalse(data["gps_fix"])
+
+        self.now += MODULE.MAX_TELEMETRY_SAMPLE_AGE_SEC + 0.1
+        stale = core.build_telemetry(456)
+        self.assertFalse(stale["local_position_valid"])
+        self.assertNotIn("local_position", stale)
+        self.assertIsNone(core.update_safe_hold(types.SimpleNamespace(
+            x=float("nan"), y=0.0, z=0.0, xy_valid=True, z_valid=True
+        )))
+        self.assertIsNone(core.last_setpoint)
+
+
+class TrajectoryUploadTest(unittest.TestCase):
+    SENDER = ("192.168.30.100", 50123)
+    KEY = b"test-master-key"
+    COMMAND = {
+        "session_id": "backend-test", "command_id": "traj-200", "sequence": 200,
+        "drone_id": 1, "slot": 1, "issued_at": 1000.0, "sent_at": 1000.1,
+    }
+
+    def _core(self):
+        self.now = 100.0
+        core = MODULE.BridgeCore(
+            1, _Logger(), clock=lambda: self.now,
+            wall_clock=lambda: 1000.0 + self.now - 100.0,
+        )
+        self._move_vehicle(core, (0.0, 0.0, -5.0))
+        core.update_safe_hold(core.samples["local_position"])
+        return core
+
+    def _move_vehicle(self, core, ned):
+        core.note_sample("local_position", types.SimpleNamespace(
+            x=ned[0], y=ned[1], z=ned[2], vx=0.0, vy=0.0, vz=0.0,
+            xy_valid=True, z_valid=True,
+        ))
+
+    def _upload(self, core, waypoints, repeats=(1, 2, 3), **kwargs):
+        for repeat_index in repeats:
+            for datagram in MODULE.encode_trajectory_chunks(
+                self.COMMAND, waypoints, repeat_index=repeat_index, repeat_total=5,
+                chunk_waypoints=2, **kwargs
+            ):
+                core.handle_datagram(datagram, self.SENDER, self.now)
+
+    def _control(self, core, mode, sequence, repeats=(1, 2, 3)):
+        for repeat_index in repeats:
+            message = _message(
+                repeat_index=repeat_index, sequence=sequence, command_id=f"{mode}-{sequence}"
+            )
+            message["mode"] = mode
+            core.handle_datagram(json.dumps(message).encode("utf-8"), self.SENDER, self.now)
+
+    def test_chunks_round_trip_through_the_parser(self):
+        waypoints = [(1.0, 0.0, -5.0), (2.0, 0.0, -5.0, 1.5), (3.0, 0.0, -5.0, 2.0)]
+        datagrams = MODULE.encode_trajectory_chunks(self.COMMAND, waypoints, chunk_waypoints=2)
+        chunks = [parse_control_packet(datagram) for datagram in datagrams]
+        self.assertEqual([chunk["chunk_index"] for chunk in chunks], [0, 1])
+        self.assertEqual({chunk["chunk_count"] for chunk in chunks}, {2})
+        self.assertEqual(chunks[0]["waypoints"][1], MODULE.TrajectoryWaypoint(2.0, 0.0, -5.0, 1.5))
+        self.assertIsNone(chunks[0]["waypoints"][0].time_s)
+
+        message = json.loads(datagrams[0])
+        message["trajectory"]["waypoints"][1][3] = -1.0
+        with self.assertRaises(ValueError):
+            parse_control_packet(json.dumps(message).encode("utf-8"))
+        message["trajectory"]["waypoints"] = [[0.0, 0.0, MODULE.MAX_ABS_TARGET_M + 1]]
+        with self.assertRaises(ValueError):
+            parse_control_packet(json.dumps(message).encode("utf-8"))
+
+    def test_chunked_trajectory_applies_once_after_every_chunk_is_confirmed(self):
+        core = self._core()
+        waypoints = [(1.0, 0.0, -5.0), (2.0, 0.0, -5.0), (3.0, 0.0, -5.0)]
+        self._upload(core, waypoints, repeats=(1, 2))
+        self.assertEqual(core.commands_applied, 0)
+        self.assertEqual(core.trajectory_assembly.confirmed_count, 0)
+
+        self._upload(core, waypoints, repeats=(3, 4))
+        self.assertEqual(core.commands_applied, 1)
+        self.assertIsNone(core.trajectory_assembly)
+        self.assertEqual(core.last_setpoint, MODULE.Setpoint(1.0, 0.0, -5.0, "trajectory", 200))
+        self.assertEqual(core.last_applied_command["mode"], "trajectory")
+        # 4 号重发的两片都晚于应用，按已应用命令计为 duplicate
+        self.assertEqual(core.rx_duplicate, 2)
+        self.assertEqual(core.rx_trajectory, 8)
+
+        telemetry = core.build_telemetry(1)["trajectory"]
+        self.assertEqual(
+            telemetry,
+            {"command_id": "traj-200", "state": "running", "index": 0, "count": 3,
+             "progress": 0.0},
+        )
+        MODULE.encode_telemetry_yaml(core.build_telemetry(1))
+
+        # 机体逐点到达后推进，终点后保持最后一个航点
+        for ned in waypoints:
+            self._move_vehicle(core, ned)
+            self.now += MODULE.OFFBOARD_INTERVAL
+            core.step_trajectory(self.now)
+        self.assertEqual(core.trajectory.state, "done")
+        self.assertEqual(core.trajectory.progress, 1.0)
+        self.assertEqual(core.last_setpoint, MODULE.Setpoint(3.0, 0.0, -5.0, "hold", 200))
+
+    def test_signed_chunks_apply_on_first_datagram(self):
+        core = self._core()
+        session_key = MODULE.derive_control_session_key(self.KEY, self.COMMAND["session_id"])
+        waypoints = [(1.0, 0.0, -5.0), (2.0, 0.0, -5.0), (3.0, 0.0, -5.0)]
+        with mock.patch.object(MODULE, "CONTROL_AUTH_KEY", self.KEY):
+            self._upload(core, waypoints, repeats=(1,), session_key=session_key)
+            self.assertEqual(core.commands_applied, 1)
+            self.assertTrue(core.last_applied_command["authenticated"])
+
+            tampered = json.loads(MODULE.encode_trajectory_chunks(
+                dict(self.COMMAND, sequence=201, command_id="traj-201"), waypoints,
+                session_key=session_key,
+            )[0])
+            tampered["trajectory"]["waypoints"][0][0] = 50.0
+            core.handle_datagram(json.dumps(tampered).encode("utf-8"), self.SENDER, self.now)
+        self.assertEqual(core.rx_invalid, 1)
+
+    def test_conflicting_chunk_discards_the_whole_trajectory(self):
+        core = self._core()
+        self._upload(core, [(1.0, 0.0, -5.0), (2.0, 0.0, -5.0)], repeats=(1,))
+        self._upload(core, [(1.0, 0.0, -5.0), (9.0, 0.0, -5.0)], repeats=(2,))
+        self.assertIsNone(core.trajectory_assembly)
+        self.assertEqual(core.rx_invalid, 1)
+        self.assertEqual(core.commands_applied, 0)
+
+    def test_timed_waypoints_interpolate_and_pause_stops_the_clock(self):
+        core = self._core()
+        self._upload(core, [(10.0, 0.0, -5.0, 1.0), (10.0, 10.0, -5.0, 2.0)])
+        self.now += 0.5
+        core.step_trajectory(self.now)
+        self.assertAlmostEqual(core.last_setpoint.x, 5.0)
+
+        self._move_vehicle(core, (5.0, 0.0, -5.0))
+        self._control(core, "pause", 201)
+        self.assertEqual(core.trajectory.state, "paused")
+        self.assertEqual(core.last_setpoint, MODULE.Setpoint(5.0, 0.0, -5.0, "pause", 201))
+        self.now += 10.0
+        core.step_trajectory(self.now)
+        self.assertEqual(core.last_setpoint.mode, "pause")
+
+        self._move_vehicle(core, (5.0, 0.0, -5.0))
+        self._control(core, "resume", 202)
+        self.assertEqual(core.last_setpoint.sequence, 202)
+        self.now += 1.0
+        core.step_trajectory(self.now)
+        self.assertEqual(core.trajectory.index, 1)
+        self.assertAlmostEqual(core.last_setpoint.y, 5.0)
+        self.assertEqual(core.last_setpoint.mode, "trajectory")
+
+        # 普通 move 命令取消轨迹；此后 resume 被忽略
+        self._control(core, "move", 203)
+        self.assertEqual(core.trajectory.state, "cancelled")
+        self.assertEqual(core.last_setpoint.mode, "move")
+        self._control(core, "resume", 204)
+        self.assertEqual(core.highest_applied_sequence, 203)
+
+    def test_ignored_resume_repeats_count_as_duplicates(self):
+        core = self._core()
+        self._control(core, "resume", 201, repeats=(1, 2, 3))
+        self.assertIsNone(core.trajectory)
+        self.assertNotIn("resume-201", core.commands.pending)
+        self.assertIn("resume-201", core.commands.applied)
+
+        duplicates = core.rx_duplicate
+        with mock.patch.object(core.events, "emit", wraps=core.events.emit) as emit:
+            self._control(core, "resume", 201, repeats=(4, 5))
+        self.assertEqual(core.rx_duplicate, duplicates + 2)
+        emit.assert_not_called()
+        self.assertEqual(core.commands_applied, 0)
+
+        stale = MODULE.parse_control_packet(json.dumps(_message(sequence=1)).encode("utf-8"))
+        core.highest_applied_sequence = 5
+        self.assertIs(core._apply_control_command(stale, 3, self.now), False)
+
+    def test_invalid_local_position_aborts_the_trajectory(self):
+        core = self._core()
+        self._upload(core, [(1.0, 0.0, -5.0)])
+        core.update_safe_hold(types.SimpleNamespace(
+            x=float("nan"), y=0.0, z=0.0, xy_valid=True, z_valid=True
+        ))
+        self.assertEqual(core.trajectory.state, "aborted")
+        core.step_trajectory(self.now + 1.0)
+        self.assertIsNone(core.last_setpoint)
+
+
+class ControlDigestCacheTest(unittest.TestCase):
+    SENDER = ("192.168.30.100", 50123)
+
+    @staticmethod
+    def _json(repeat_index, sequence=100, sent_at=1000.1):
+        message = _message(
+            repeat_index=repeat_index, sequence=sequence, command_id=f"cmd-{sequence}"
+        )
+        message["sent_at_unix_s"] = sent_at
+        return json.dumps(message).encode("utf-8")
+
+    def _binary(self, repeat_index, sequence=100, sent_at=1000.1):
+        return MODULE.encode_binary_control_packet(
+            parse_control_packet(self._json(repeat_index, sequence, sent_at))
+        )
+
+    def _run(self, datagrams, capacity):
+        gate = _new_gate(wall_clock=lambda: 1000.2)
+        gate.digest_cache = MODULE.ControlDigestCache(capacity)
+        for offset, datagram in enumerate(datagrams):
+            gate.handle_datagram(datagram, self.SENDER, 60.0 + offset * 0.01)
+        return gate
+
+    def test_repeats_hit_the_cache_with_their_own_repeat_fields(self):
+        for encode in (self._json, self._binary):
+            cache = MODULE.ControlDigestCache(8)
+            first = encode(1)
+            cache.put(cache.key(first), parse_control_packet(first))
+            repeat = encode(3, sent_at=1000.4)
+            key = cache.key(repeat)
+            cached = cache.get(key)
+            self.assertIsNotNone(cached)
+            self.assertEqual((key[1], key[2]), (3, 1000.4))
+            parsed = dict(cached, repeat_index=key[1], sent_at=key[2])
+            self.assertEqual(parsed, parse_control_packet(repeat))
+            self.assertIsNone(cache.get(cache.key(encode(1, sequence=101))))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_ambiguous_or_out_of_range_repeat_fields_are_not_served(self):
+        cache = MODULE.ControlDigestCache(8)
+        first = self._json(1)
+        cache.put(cache.key(first), parse_control_packet(first))
+        # 重复键时无法确定 json.loads 取哪个值，必须走完整解析
+        doubled = first.replace(b'"delivery": {', b'"delivery": {"repeat_index": 2, ', 1)
+        self.assertIsNone(cache.key(doubled))
+        self.assertEqual(cache.bypassed, 1)
+        self.assertIsNone(cache.get(cache.key(self._json(6))))
+        # json.dumps 写出的 Infinity 不是 JSON 数字，同样交给完整解析
+        self.assertIsNone(cache.key(self._json(1, sent_at=float("inf"))))
+        self.assertIsNone(MODULE.ControlDigestCache(0).key(first))
+
+    def test_cache_does_not_change_what_the_gate_applies(self):
+        for encode in (self._json, self._binary):
+            datagrams = [
+                encode(index, sequence=sequence, sent_at=1000.0 + sequence + index / 10)
+                for sequence in (100, 101, 102) for index in (1, 2, 2, 3, 4, 5)
+            ]
+            uncached = self._run(datagrams, 0)
+            cached = self._run(datagrams, 16)
+            for name in ("commands_applied", "rx_valid", "rx_move", "rx_duplicate",
+                         "highest_applied_sequence", "last_backend_timestamp"):
+                self.assertEqual(getattr(cached, name), getattr(uncached, name), name)
+            self.assertEqual(cached.last_setpoint, uncached.last_setpoint)
+            self.assertEqual(cached.digest_cache.hits, 15)
+            # 组内重复的 2 号与应用后的 4、5 号都在缓存层短路
+            self.assertEqual(cached.rx_short_circuit, 9)
+            self.assertEqual(uncached.rx_short_circuit, 0)
+
+    def test_tampered_mac_misses_and_is_rejected(self):
+        key = b"test-master-key"
+        packet = parse_control_packet(self._json(1))
+        session_key = MODULE.derive_control_session_key(key, packet["session_id"])
+        packet["auth_mac"] = MODULE.compute_control_mac(session_key, packet)
+        signed = MODULE.encode_binary_control_packet(packet)
+        tampered = bytearray(signed)
+        tampered[-1] ^= 0xFF
+        with mock.patch.object(MODULE, "CONTROL_AUTH_KEY", key):
+            gate = self._run([signed, bytes(tampered)], 16)
+        self.assertEqual(gate.commands_applied, 1)
+        self.assertEqual(gate.digest_cache.hits, 0)
+        self.assertEqual(gate.rx_invalid, 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = MODULE.ControlDigestCache(2)
+        datagrams = [self._json(1, sequence=sequence) for sequence in (100, 101, 102)]
+        for datagram in datagrams[:2]:
+            cache.put(cache.key(datagram), parse_control_packet(datagram))
+        self.assertIsNotNone(cache.get(cache.key(datagrams[0])))
+        cache.put(cache.key(datagrams[2]), parse_control_packet(datagrams[2]))
+        self.assertEqual((len(cache), cache.evictions), (2, 1))
+        self.assertIsNone(cache.get(cache.key(datagrams[1])))
+        self.assertIsNotNone(cache.get(cache.key(datagrams[0])))
+
+
+class LinkQualityTest(unittest.TestCase):
+    SENDER = ("192.168.30.100", 50123)
+
+    @staticmethod
+    def _packet(repeat_index, sequence=100, repeat_total=5, mode="move"):
+        return {
+            "command_id": f"cmd-{sequence}", "sequence": sequence, "mode": mode,
+            "repeat_index": repeat_index, "repeat_total": repeat_total,
+        }
+
+    def _observe(self, link, indices, now=0.0, **kwargs):
+        for offset, repeat_index in enumerate(indices):
+            link.observe(self._packet(repeat_index, **kwargs), repeat_index, now + offset * 0.2)
+
+    def test_repeat_index_gaps_reorders_and_trailing_losses(self):
+        link = MODULE.LinkQualityEstimator()
+        self._observe(link, (1, 3, 2, 3))
+        self.assertEqual((link.expected, link.lost), (3, 0))
+        self._observe(link, (1, 4), now=1.0, sequence=101)
+        self.assertEqual((link.expected, link.lost), (7, 2))
+        # 101 被取代且空闲超过确认窗口后补记 100 与 101 的尾部丢失
+        self._observe(link, (1,), now=10.0, sequence=102, repeat_total=0, mode="hold")
+        self.assertEqual((link.expected, link.lost), (11, 5))
+        self.assertEqual(link.repeat_total, 5)
+        self.assertEqual(link.sequence_gaps, 0)
+        # 中途接入的持续 hold 不计之前的 index
+        self._observe(link, (900, 899, 901), now=11.0, sequence=105, repeat_total=0)
+        self.assertEqual((link.expected, link.lost), (13, 5))
+        self.assertEqual(link.sequence_gaps, 2)
+        self.assertIsNone(link.loss)
+
+    def test_jump_beyond_the_window_restarts_the_stream_instead_of_losing(self):
+        link = MODULE.LinkQualityEstimator()
+        indices = range(1, MODULE.LINK_LOSS_MIN_SAMPLES + 60)
+        self._observe(link, indices, repeat_total=0, mode="hold")
+        clean = link.expected
+        self._observe(link, (10**7, 10**7 - 1, 10**7 + 2), now=20.0, repeat_total=0, mode="hold")
+        self.assertEqual((link.expected - clean, link.lost), (3, 1))
+        self.assertLess(link.loss, 0.05)
+
+    def test_confirm_count_stays_within_configured_bounds(self):
+        self.assertEqual(MODULE.adaptive_confirm_count(None, 5), MODULE.COMMAND_CONFIRM_COUNT)
+        self.assertEqual(MODULE.adaptive_confirm_count(0.0, 5), MODULE.COMMAND_CONFIRM_MIN)
+        self.assertEqual(MODULE.adaptive_confirm_count(0.1, 5), 3)
+        self.assertEqual(MODULE.adaptive_confirm_count(0.1, 0), 3)
+        self.assertEqual(MODULE.adaptive_confirm_count(0.6, 5), MODULE.COMMAND_CONFIRM_MIN)
+        with mock.patch.object(MODULE, "COMMAND_CONFIRM_COUNT", 4):
+            self.assertEqual(MODULE.adaptive_confirm_count(0.1, 5), 3)
+            self.assertEqual(MODULE.adaptive_confirm_count(0.02, 8), 4)
+        self.assertEqual(MODULE.recommended_repeat_count(0.0), 3)
+        self.assertEqual(MODULE.recommended_repeat_count(0.1), 5)
+        self.assertEqual(MODULE.recommended_repeat_count(0.95), 20)
+        self.assertIsNone(MODULE.recommended_repeat_count(None))
+
+    def _send(self, gate, repeat_index, sequence, now, repeat_total=5, mode="move"):
+        message = _message(
+            repeat_index=repeat_index, sequence=sequence, command_id=f"cmd-{sequence}"
+        )
+        message["mode"] = mode
+        message["delivery"]["repeat_total"] = repeat_total
+        gate.handle_datagram(json.dumps(message).encode("utf-8"), self.SENDER, now)
+
+    def test_clean_link_lowers_the_threshold_only_when_adaptive(self):
+        for adaptive, required in ((False, 3), (True, MODULE.COMMAND_CONFIRM_MIN)):
+            gate = _new_gate()
+            with mock.patch.object(MODULE, "COMMAND_CONFIRM_ADAPTIVE", adaptive):
+                for index in range(1, MODULE.LINK_LOSS_MIN_SAMPLES + 1):
+                    self._send(gate, index, 100, 60.0 + index * 0.02, repeat_total=0, mode="hold")
+                self.assertEqual(gate.link.loss, 0.0)
+                applied = gate.commands_applied
+                for index in range(1, 4):
+                    self._send(gate, index, 101, 62.0 + index * 0.2)
+                    if gate.commands_applied > applied:
+                        break
+                self.assertEqual(index, required)
+                telemetry = gate.build_telemetry(1)["link"]
+            self.assertEqual(telemetry, {
+                "loss": 0.0, "sequence_gaps": 0, "confirm_count": required,
+                "recommended_repeat_count": 3,
+            })
+            MODULE.encode_telemetry_yaml(gate.build_telemetry(1))
+
+        message = _message(session_id="backend-restarted", sequence=5, command_id="cmd-5")
+        gate.handle_datagram(json.dumps(message).encode("utf-8"), self.SENDER, 70.0)
+        self.assertEqual(gate.link.expected, 1)
+
+
+class _ListLogger:
+    def __init__(self):
+        self.lines = []
+
+    def info(self, message):
+        self.lines.append(("info", message))
+
+    def warning(self, message):
+        self.lines.append(("warning", message))
+
+    def error(self, message):
+        self.lines.append(("error", message))
+
+
+class EventLogTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+
+    def test_rate_limit_is_per_category_and_reports_suppressed_count(self):
+        logger = _ListLogger()
+        events = MODULE.EventLog(logger, rate_per_sec=1.0, burst=2.0, clock=lambda: self.now)
+
+        results = [events.emit("info", "udp-rx", "rx #{n}", n=n) for n in range(5)]
+        self.assertEqual(results, [True, True, False, False, False])
+        self.assertTrue(events.emit("warning", "udp-reject", "bad {size}B", size=3))
+        self.now = 1.0
+        self.assertTrue(events.emit("info", "udp-rx", "rx #{n}", n=5))
+
+        self.assertEqual(logger.lines, [
+            ("info", "rx #0"), ("info", "rx #1"), ("warning", "bad 3B"),
+            ("info", "rx #5 [suppressed 3 similar]"),
+        ])
+        self.assertEqual(events.suppressed, {"udp-rx": 3})
+
+    def test_flush_suppressed_summarizes_unreported_categories(self):
+        logger = _ListLogger()
+        events = MODULE.EventLog(logger, rate_per_sec=1.0, burst=1.0, clock=lambda: self.now)
+        for _ in range(3):
+            events.emit("info", "command-pending", "pending")
+        events.flush_suppressed()
+        events.flush_suppressed()
+
+        self.assertEqual(logger.lines[-1],
+                         ("warning", "[LOG] rate-limited events: command-pending=2"))
+        self.assertEqual(len(logger.lines), 2)
+
+    def test_writer_thread_absorbs_a_blocked_logger(self):
+        release = threading.Event()
+        logger = _ListLogger()
+        blocking_info = logger.info
+
+        def _blocked(message):
+            release.wait(5.0)
+            blocking_info(message)
+
+        logger.info = _blocked
+        writer = MODULE.EventLogWriter(max_queue=4)
+        events = MODULE.EventLog(logger, writer, rate_per_sec=0.0)
+        started = time.monotonic()
+        for n in range(20):
+            events.emit("info", "udp-rx", "rx {n:03d}", n=n)
+        self.assertLess(time.monotonic() - started, 1.0)
+        release.set()
+        writer.close()
+
+        self.assertGreater(writer.dropped, 0)
+        self.assertEqual(writer.written + writer.dropped, 20)
+        self.assertEqual(logger.lines[0], ("info", "rx 000"))
+
+    def test_bridge_core_routes_rejects_through_the_event_log(self):
+        logger = _ListLogger()
+        gate = MODULE.BridgeCore(1, logger, events=MODULE.EventLog(
+            logger, rate_per_sec=1.0, burst=2.0, clock=lambda: self.now,
+        ))
+        for _ in range(10):
+            gate.handle_datagram(b"not json", ("10.0.0.1", 9), 0.0)
+
+        self.assertEqual(gate.rx_invalid, 10)
+        self.assertEqual(len(logger.lines), 2)
+        self.assertIn("preview=b'not json'", logger.lines[0][1])
+        self.assertEqual(gate.events.suppressed, {"udp-reject": 8})
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_snapshot_percentiles_use_bucket_bounds(self):
+        histogram = MODULE.LatencyHistogram()
+        self.assertEqual(histogram.snapshot(), {"count": 0})
+        for _ in range(98):
+            histogram.record(0.0003)
+        histogram.record(0.2)
+        histogram.record(7.0)
+        histogram.record(float("nan"))
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["count"], 100)
+        self.assertEqual(snapshot["p50"], 0.0005)
+        self.assertEqual(snapshot["p99"], 0.25)
+        self.assertEqual(snapshot["max"], 7.0)
+        self.assertEqual(histogram.counts[-1], 1)
+
+    def test_confirmed_command_records_per_hop_latency(self):
+        gate = _new_gate()
+        sender = ("192.168.30.100", 50123)
+        now = time.monotonic()
+        for index in range(1, 4):
+            parsed = parse_control_packet(
+                json.dumps(_message(repeat_index=index)).encode("utf-8")
+            )
+            self.assertTrue(gate._accept_backend_session(parsed))
+            gate._record_datagram_hops(parsed, now, 1000.15, 0.002)
+            gate._stage_control_command(parsed, sender, now)
+        self.assertEqual(gate.commands_applied, 1)
+
+        snapshot = gate.control_latency_snapshot()
+        self.assertEqual(tuple(snapshot), MODULE.CONTROL_LATENCY_HOPS)
+        self.assertEqual(snapshot["read→parse"]["count"], 3)
+        self.assertEqual(snapshot["kernel→read"]["count"], 3)
+        self.assertAlmostEqual(snapshot["kernel→read"]["mean"], 0.002)
+        self.assertAlmostEqual(snapshot["issue→send"]["mean"], 0.1)
+        self.assertAlmostEqual(snapshot["send→kernel"]["mean"], 0.05)
+        for hop in ("rx→staged", "staged→confirmed", "confirmed→applied"):
+            self.assertEqual(snapshot[hop]["count"], 1, hop)
+            self.assertGreaterEqual(snapshot[hop]["min"], 0.0, hop)
+        # 发布相关三跳由心跳线程在首次发布时记录
+        self.assertEqual(snapshot["applied→publish"], {"count": 0})
+        sequence, _, first_rx, issued_at = gate.publish_probe
+        self.assertEqual((sequence, issued_at), (100, 1000.0))
+        self.assertAlmostEqual(first_rx, now - 0.002)
+        self.assertIn("rx→staged=", MODULE.format_hop_latency_ms(snapshot))
+
+
+class TelemetrySchedulerTest(unittest.TestCase):
+    def test_first_fresh_sample_triggers_after_coalesce_delay(self):
+        scheduler = MODULE.TelemetryScheduler(10.0, 2.0, 0.003)
+        self.assertEqual(scheduler.mark_sent(0.0), None)
+        self.assertEqual(scheduler.next_deadline(), 0.5)
+
+        # 限速窗口内的样本不触发，窗口打开后的第一个样本才触发
+        self.assertFalse(scheduler.note_sample(0.05))
+        self.assertTrue(scheduler.note_sample(0.12))
+        self.assertFalse(scheduler.note_sample(0.121))
+        self.assertAlmostEqual(scheduler.next_deadline(), 0.123)
+        self.assertFalse(scheduler.due(0.122))
+        self.assertTrue(scheduler.due(0.123))
+        self.assertAlmostEqual(scheduler.mark_sent(0.123), 0.002)
+
+    def test_heartbeat_without_samples(self):
+        scheduler = MODULE.TelemetryScheduler(10.0, 2.0, 0.003)
+        scheduler.mark_sent(1.0)
+        self.assertFalse(scheduler.due(1.49))
+        self.assertTrue(scheduler.due(1.5))
+        self.assertIsNone(scheduler.mark_sent(1.5))
+
+    def test_rate_is_capped_under_sample_flood(self):
+        scheduler = MODULE.TelemetryScheduler(10.0, 2.0, 0.0)
+        sends = 0
+        for tick in range(1000):
+            now = tick * 0.001
+            scheduler.note_sample(now)
+            if scheduler.due(now):
+                scheduler.mark_sent(now)
+                sends += 1
+        self.assertEqual(sends, 10)
+
+
+class TelemetryDeltaEncoderTest(unittest.TestCase):
+    def test_full_mode_only_numbers_datagrams(self):
+        encoder = MODULE.TelemetryDeltaEncoder(False, 1.0, 3)
+        first = encoder.encode(_telemetry_sample(), 0.0)
+        second = encoder.encode(_telemetry_sample(), 0.1)
+        self.assertEqual((first["telemetry_seq"], second["telemetry_seq"]), (1, 2))
+        self.assertNotIn("keyframe", second)
+        self.assertIn("battery", second)
+
+    def test_unchanged_slow_fields_are_dropped_between_keyframes(self):
+        encoder = MODULE.TelemetryDeltaEncoder(True, 1.0, 2)
+        keyframe = encoder.encode(_telemetry_sample(), 0.0)
+        self.assertTrue(keyframe["keyframe"])
+        self.assertIn("control_ack", keyframe)
+
+        delta = encoder.encode(_telemetry_sample(), 0.1)
+        self.assertFalse(delta["keyframe"])
+        for name in ("arming_state", "nav_state", "battery", "gps_lat", "gps_fix", "control_ack"):
+            self.assertNotIn(name, delta)
+        self.assertIn("position", delta)
+        self.assertIn("local_position_valid", delta)
+
+        self.assertTrue(encoder.encode(_telemetry_sample(), 1.0)["keyframe"])
+
+    def test_changed_group_is_sent_whole_and_repeated(self):
+        encoder = MODULE.TelemetryDeltaEncoder(True, 10.0, 2)
+        encoder.encode(_telemetry_sample(), 0.0)
+        changed = _telemetry_sample()
+        changed["gps_lat"] = 30.2
+        sent = [encoder.encode(dict(changed), 0.1 * index) for index in (1, 2, 3)]
+        self.assertEqual(
+            [("gps_lat" in data, "gps_fix" in data, "battery" in data) for data in sent],
+            [(True, True, False), (True, True, False), (False, False, False)],
+        )
+
+
+class _Publisher:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, message):
+        self.published.append(message)
+
+
+class _Clock:
+    def now(self):
+        return types.SimpleNamespace(nanoseconds=1_234_567_000)
+
+
+class OffboardHeartbeatTest(unittest.TestCase):
+    def _heartbeat(self):
+        bridge = type(
+            "Heartbeat",
+            (),
+            {"_offboard_loop": MODULE.JetsonBridge._offboard_loop},
+        )()
+        bridge._core = MODULE.BridgeCore(1, _Logger())
+        bridge._core.last_setpoint = MODULE.Setpoint(1.0, 2.0, -3.0, "move", 7)
+        bridge._recorder = None
+        bridge._ocm_msg = types.SimpleNamespace(timestamp=0, position=True)
+        bridge._tsp_msg = types.SimpleNamespace(timestamp=0, position=[0.0] * 3)
+        bridge._tsp_position = bridge._tsp_msg.position
+        bridge._tsp_msg.velocity = [float("nan")] * 3
+        bridge._tsp_msg.acceleration = [float("nan")] * 3
+        bridge._tsp_velocity = bridge._tsp_msg.velocity
+        bridge._tsp_acceleration = bridge._tsp_msg.acceleration
+        bridge._motion = None
+        bridge._motion_time_us = 0
+        bridge._advance_motion = types.MethodType(
+            MODULE.JetsonBridge._advance_motion, bridge
+        )
+        bridge._offboard_pub = _Publisher()
+        bridge._traj_pub = _Publisher()
+        bridge._offboard_publish_count = 0
+        bridge._heartbeat_monitor = MODULE.HeartbeatMonitor(MODULE.OFFBOARD_INTERVAL)
+        bridge._monotonic = time.monotonic
+        bridge._warmup_count = bridge._warmup_needed = 50
+        bridge._arm_triggered = False
+        bridge.get_clock = _Clock
+        return bridge
+
+    def test_tick_reuses_messages_and_never_takes_the_setpoint_lock(self):
+        bridge = self._heartbeat()
+        with bridge._core.setpoint_lock:
+            bridge._offboard_loop()
+            bridge._core.last_setpoint = MODULE.Setpoint(4.0, 5.0, -6.0, "move", 8)
+            bridge._offboard_loop()
+        self.assertEqual(bridge._offboard_publish_count, 2)
+        self.assertIs(bridge._traj_pub.published[0], bridge._traj_pub.published[1])
+        self.assertEqual(bridge._tsp_msg.position, [4.0, 5.0, -6.0])
+        self.assertIs(bridge._tsp_msg.position, bridge._tsp_position)
+        self.assertEqual(bridge._tsp_msg.timestamp, 1_234_567)
+
+    def test_first_publish_of_new_sequence_closes_latency_probe(self):
+        bridge = self._heartbeat()
+        now = time.monotonic()
+        bridge._core.publish_probe = (8, now, now - 0.01, time.time() - 0.5)
+        bridge._offboard_loop()
+        self.assertIsNotNone(bridge._core.publish_probe)
+        bridge._core.last_setpoint = MODULE.Setpoint(4.0, 5.0, -6.0, "move", 8)
+        bridge._offboard_loop()
+        bridge._offboard_loop()
+        self.assertIsNone(bridge._core.publish_probe)
+        hops = bridge._core.hop_latency
+        self.assertEqual(hops["applied→publish"].snapshot()["count"], 1)
+        self.assertGreaterEqual(hops["rx→publish"].snapshot()["min"], 0.01)
+        self.assertGreaterEqual(hops["issue→publish"].snapshot()["min"], 0.5)
+
+    def test_no_setpoint_publishes_nothing(self):
+        bridge = self._heartbeat()
+        bridge._core.last_setpoint = None
+        bridge._offboard_loop()
+        self.assertEqual(bridge._traj_pub.published, [])
+
+    def test_publish_intervals_are_monitored(self):
+        bridge = self._heartbeat()
+        for _ in range(3):
+            bridge._offboard_loop()
+        monitor = bridge._heartbeat_monitor
+        self.assertEqual(monitor.intervals.count, 2)
+        self.assertLess(monitor.intervals.max, 1.0)
+        # 停发后恢复，第一个间隔不计入
+        bridge._core.last_setpoint = None
+        bridge._offboard_loop()
+        self.assertIsNone(monitor.last)
+        # 预热计数由心跳清零，恢复发布后重新预热
+        self.assertEqual(bridge._warmup_count, 0)
+
+    def test_smoothing_mode_fills_feedforward(self):
+        bridge = self._heartbeat()
+        with mock.patch.object(MODULE, "SETPOINT_SMOOTHING", True):
+            bridge._offboard_loop()
+            self.assertEqual(bridge._tsp_msg.position, [1.0, 2.0, -3.0])
+            self.assertEqual(bridge._tsp_msg.velocity, [0.0, 0.0, 0.0])
+            bridge._core.last_setpoint = MODULE.Setpoint(11.0, 2.0, -3.0, "move", 8)
+            bridge._motion_time_us -= 20_000
+            bridge._offboard_loop()
+        self.assertGreater(bridge._tsp_msg.position[0], 1.0)
+        self.assertLess(bridge._tsp_msg.position[0], 1.01)
+        self.assertGreater(bridge._tsp_msg.velocity[0], 0.0)
+        self.assertAlmostEqual(bridge._tsp_msg.acceleration[0], MODULE.SETPOINT_MAX_ACCEL_MPS2)
+
+
+_ARM_SEQUENCE = (
+    MODULE.VehicleCommandStep("ARM", 400, 1.0, 0.0),
+    MODULE.VehicleCommandStep("OFFBOARD", 176, 1.0, 6.0),
+)
+
+
+class VehicleCommandSequencerTest(unittest.TestCase):
+    def _sequencer(self, **kwargs):
+        options = {"timeout_sec": 0.1, "max_attempts": 4, "backoff": 2.0, "max_timeout_sec": 0.3}
+        options.update(kwargs)
+        sequencer = MODULE.VehicleCommandSequencer(_ARM_SEQUENCE, **options)
+        sequencer.start()
+        return sequencer
+
+    def test_accepted_ack_advances_without_repeats(self):
+        sequencer = self._sequencer()
+        self.assertEqual(sequencer.poll(0.0).name, "ARM")
+        self.assertIsNone(sequencer.poll(0.02))
+        # 其他命令的 ACK 不影响当前步骤
+        self.assertIsNone(sequencer.on_ack(511, 0, 0.01))
+        step, result = sequencer.on_ack(400, 0, 0.004)
+        self.assertEqual((step.name, result), ("ARM", "ACCEPTED"))
+        self.assertEqual(sequencer.poll(0.02).name, "OFFBOARD")
+        sequencer.on_ack(176, 0, 0.03)
+        self.assertEqual(sequencer.state, "done")
+        self.assertEqual((sequencer.sent, sequencer.retries), (2, 0))
+        self.assertAlmostEqual(sequencer.ack_latency["ARM"].snapshot()["max"], 0.004)
+        self.assertAlmostEqual(sequencer.ack_latency["OFFBOARD"].snapshot()["max"], 0.01)
+
+    def test_timeouts_back_off_until_attempts_run_out(self):
+        sequencer = self._sequencer(timeout_sec=1.0, max_timeout_sec=3.0)
+        sends = [now for now in range(20) if sequencer.poll(now)]
+        # 等待 1 → 2 → 3（上限）→ 3 后放弃
+        self.assertEqual(sends, [0, 1, 3, 6])
+        self.assertEqual(sequencer.state, "failed")
+        self.assertEqual(sequencer.outcomes, {"ARM": "timeout"})
+        self.assertEqual(sequencer.retries, 3)
+
+    def test_rejections(self):
+        sequencer = self._sequencer()
+        sequencer.poll(0.0)
+        # 暂时拒绝：按原超时重发；IN_PROGRESS 把超时延长到上限
+        self.assertEqual(sequencer.on_ack(400, 1, 0.01)[1], "TEMPORARILY_REJECTED")
+        self.assertIsNotNone(sequencer.poll(0.1))
+        sequencer.on_ack(400, 5, 0.11)
+        self.assertIsNone(sequencer.poll(0.3))
+        self.assertIsNotNone(sequencer.poll(0.41))
+        self.assertEqual(sequencer.on_ack(400, 2, 0.42)[1], "DENIED")
+        self.assertEqual(sequencer.state, "failed")
+        self.assertIsNone(sequencer.poll(5.0))
+        self.assertEqual(sequencer.outcomes, {"ARM": "DENIED"})
+
+    def test_without_ack_topic_sends_fixed_bursts(self):
+        sequencer = self._sequencer(expect_ack=False, max_attempts=5)
+        sent = [sequencer.poll(tick * 0.02) for tick in range(12)]
+        self.assertEqual(
+            [step.name if step else None for step in sent],
+            ["ARM"] * 5 + ["OFFBOARD"] * 5 + [None, None],
+        )
+        self.assertEqual(sequencer.state, "done")
+        self.assertEqual(sequencer.outcomes, {"ARM": "unacknowledged", "OFFBOARD": "unacknowledged"})
+
+
+class HeartbeatMonitorTest(unittest.TestCase):
+    def test_fine_buckets_around_the_period(self):
+        monitor = MODULE.HeartbeatMonitor(0.02)
+        now = 0.0
+        for interval in [0.0199] * 97 + [0.0203, 0.045, 0.25]:
+            monitor.note(now)
+            now += interval
+        monitor.note(now)
+        snapshot = monitor.intervals.snapshot()
+        self.assertAlmostEqual(snapshot["p50"], 0.02)
+        self.assertAlmostEqual(snapshot["p99"], 0.06)
+        self.assertAlmostEqual(snapshot["max"], 0.25)
+        self.assertEqual(monitor.misses, 2)
+        self.assertIn("misses=2", monitor.summary())
+
+    def test_heartbeat_thread_ticks_and_reports_scheduling(self):
+        ticks = []
+        done = threading.Event()
+
+        def tick():
+            ticks.append(time.monotonic())
+            if len(ticks) == 5:
+                done.set()
+
+        with mock.patch.object(MODULE.os, "sched_setscheduler", side_effect=PermissionError(1, "denied")):
+            thread = MODULE.HeartbeatThread(0.005, tick, _Logger(), policy="fifo", priority=10)
+            thread.start()
+        self.assertTrue(done.wait(2.0))
+        thread.stop()
+        self.assertTrue(thread.scheduling[0].startswith("SCHED_FIFO denied (PermissionError"))
+        self.assertEqual(thread.errors, 0)
+
+    def test_cpu_list_parsing(self):
+        self.assertEqual(MODULE.parse_cpu_list("3"), (3,))
+        self.assertEqual(MODULE.parse_cpu_list("0-1, 3,1"), (0, 1, 3))
+        self.assertEqual(MODULE.parse_cpu_list(""), ())
+        for value in ("a", "3-1", "-1"):
+            with self.assertRaises(ValueError):
+                MODULE.parse_cpu_list(value)
+        config = MODULE.resolve_slot_config(2, environ={"OFFBOARD_CPUS_2": "2-3"})
+        self.assertEqual(config["offboard_cpus"], (2, 3))
+
+
+class _Socket:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, payload, addr):
+        self.sent.append((payload, addr))
+        return len(payload)
+
+
+class PoseChannelTest(unittest.TestCase):
+    @staticmethod
+    def _sample(index):
+        return MODULE.PoseSample(
+            1_000_000 + index * 10_000, (float(index), 2.0, -3.0),
+            (1.0, 0.0, 0.0, 0.0), (0.5, 0.0, 0.0),
+        )
+
+    def _bridge(self):
+        names = ("poll_pose_batch", "_record_pose_sample")
+        bridge = type(
+            "PoseBridge", (), {name: MODULE.JetsonBridge.__dict__[name] for name in names}
+        )()
+        bridge.slot = 2
+        bridge._pose_port = 8990
+        bridge._pose_next_flush = 0.0
+        bridge._pose_samples = MODULE.deque(maxlen=MODULE.POSE_BATCH_MAX_SAMPLES * 4)
+        bridge._pose_batch_seq = 0
+        bridge._pose_batches_sent = 0
+        bridge._pose_samples_sent = 0
+        bridge._pose_samples_dropped = 0
+        bridge._pose_send_errors = 0
+        bridge._core = MODULE.BridgeCore(2, _Logger())
+        bridge._backend_addr = ("192.168.30.100", 8890)
+        bridge._tel_sock = _Socket()
+        bridge.get_clock = _Clock
+        bridge.get_logger = lambda: _Logger()
+        return bridge
+
+    def test_round_trip_and_mtu_bound(self):
+        samples = [self._sample(index) for index in range(MODULE.POSE_BATCH_MAX_SAMPLES)]
+        payload = MODULE.encode_pose_batch(2, 9, 1_234_567, samples)
+        self.assertLessEqual(len(payload), 1472)
+        header, decoded = MODULE.decode_pose_batch(payload)
+        self.assertEqual(header, {"slot": 2, "flags": 0, "batch_seq": 9, "sent_at_us": 1_234_567})
+        self.assertEqual(decoded[3].timestamp_us, samples[3].timestamp_us)
+        self.assertEqual(decoded[3].position, (3.0, 2.0, -3.0))
+        with self.assertRaises(ValueError):
+            MODULE.decode_pose_batch(payload[:-1])
+        with self.assertRaises(ValueError):
+            MODULE.encode_pose_batch(2, 1, 0, samples + [self._sample(0)])
+
+    def test_flush_batches_buffered_samples_on_interval(self):
+        bridge = self._bridge()
+        local = types.SimpleNamespace(timestamp=5, vx=0.1, vy=0.2, vz=0.3)
+        for index in range(MODULE.POSE_BATCH_MAX_SAMPLES + 5):
+            bridge._record_pose_sample(local, [float(index), 0.0, -1.0])
+
+        deadline = bridge.poll_pose_batch(10.0)
+        self.assertAlmostEqual(deadline, 10.0 + MODULE.POSE_BATCH_INTERVAL_SEC)
+        self.assertEqual([addr for _, addr in bridge._tel_sock.sent], [("192.168.30.100", 8990)] * 2)
+        _, first = MODULE.decode_pose_batch(bridge._tel_sock.sent[0][0])
+        _, second = MODULE.decode_pose_batch(bridge._tel_sock.sent[1][0])
+        self.assertEqual(len(first) + len(second), MODULE.POSE_BATCH_MAX_SAMPLES + 5)
+        self.assertTrue(all(math.isnan(value) for value in first[0].q))
+
+        bridge._record_pose_sample(local, [0.0, 0.0, -1.0])
+        self.assertEqual(bridge.poll_pose_batch(10.01), deadline)
+        self.assertEqual(len(bridge._tel_sock.sent), 2)
+
+    def test_pose_port_is_opt_in_per_slot(self):
+        self.assertEqual(MODULE.resolve_slot_config(1, environ={})["pose_port"], 0)
+        configs = MODULE.resolve_bridge_configs(
+            [1, 2], environ={"ROS_TOPIC_PREFIX": "/px4_{slot}", "POSE_STREAM_2": "1"}
+        )
+        self.assertEqual([c["pose_port"] for c in configs], [0, 8990])
+        with self.assertRaises(ValueError):
+            MODULE.resolve_bridge_configs(
+                [1, 2],
+                environ={"ROS_TOPIC_PREFIX": "/px4_{slot}", "POSE_STREAM": "1",
+                         "POSE_PORT": "9000"},
+            )
+
+
+class SetpointMotionTest(unittest.TestCase):
+    DT = 0.02
+
+    def _run(self, target, max_velocity=2.0, max_acceleration=1.0, steps=2000):
+        state = MODULE.MotionState((0.0, 0.0, 0.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+        trace = [state]
+        for _ in range(steps):
+            state = MODULE.step_setpoint_motion(
+                state, target, self.DT, max_velocity, max_acceleration
+            )
+            trace.append(state)
+            if state.position == target and state.velocity == (0.0, 0.0, 0.0):
+                break
+        return trace
+
+    @staticmethod
+    def _norm(vector):
+        return sum(value * value for value in vector) ** 0.5
+
+    def test_reaches_target_and_stops(self):
+        trace = self._run((10.0, -5.0, -3.0))
+        self.assertEqual(trace[-1].position, (10.0, -5.0, -3.0))
+        self.assertEqual(trace[-1].velocity, (0.0, 0.0, 0.0))
+        # 梯形规划：10 多米的路程不可能在纯加速阶段内完成。
+        self.assertGreater(len(trace) * self.DT, self._norm((10.0, -5.0, -3.0)) / 2.0)
+
+    def test_respects_velocity_and_acceleration_limits(self):
+        trace = self._run((30.0, 0.0, 0.0), max_velocity=1.5, max_acceleration=0.8)
+        self.assertLessEqual(max(self._norm(s.velocity) for s in trace), 1.5 + 1e-9)
+        self.assertLessEqual(max(self._norm(s.acceleration) for s in trace), 0.8 + 1e-9)
+
+    def test_never_overshoots_along_the_path(self):
+        trace = self._run((4.0, 0.0, 0.0))
+        self.assertLessEqual(max(s.position[0] for s in trace), 4.0)
+
+    def test_redirect_while_moving_is_acceleration_limited(self):
+        state = MODULE.MotionState((0.0, 0.0, 0.0), (2.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+        state = MODULE.step_setpoint_motion(state, (-10.0, 0.0, 0.0), self.DT, 2.0, 1.0)
+        self.assertAlmostEqual(state.velocity[0], 2.0 - 1.0 * self.DT)
+
+
+class _UdpReceiver:
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+
+    def drain(self):
+        datagrams = []
+        while True:
+            try:
+                datagrams.append(self.sock.recv(65535))
+            except BlockingIOError:
+                return datagrams
+
+    def close(self):
+        self.sock.close()
+
+
+class TelemetryFanoutTest(unittest.TestCase):
+    def setUp(self):
+        self.receivers = [_UdpReceiver() for _ in range(3)]
+        self.fanout = MODULE.TelemetryFanout(
+            ("127.0.0.1", self.receivers[0].port),
+            [("127.0.0.1", self.receivers[1].port, 1), ("127.0.0.1", self.receivers[2].port, 3)],
+        )
+
+    def tearDown(self):
+        self.fanout.close()
+        for receiver in self.receivers:
+            receiver.close()
+
+    def test_one_payload_reaches_every_target_with_divisor(self):
+        for frame in range(6):
+            # 第 2 帧作为关键帧，降频订阅者也要收到
+            self.assertEqual(self.fanout.send(b"frame%d" % frame, keyframe=frame == 1), [])
+        primary, full, divided = (receiver.drain() for receiver in self.receivers)
+        self.assertEqual(primary, [b"frame%d" % frame for frame in range(6)])
+        self.assertEqual(full, primary)
+        self.assertEqual(divided, [b"frame1", b"frame2", b"frame5"])
+        self.assertEqual([t.sent for t in self.fanout.targets], [6, 6, 3])
+        self.assertEqual(self.fanout.targets[2].skipped, 3)
+
+    def test_divided_subscriber_gets_its_own_delta_stream(self):
+        fanout = MODULE.TelemetryFanout(
+            ("127.0.0.1", self.receivers[0].port), [("127.0.0.1", self.receivers[2].port, 4)],
+            delta_encoder=lambda: MODULE.TelemetryDeltaEncoder(True, 100.0, 3),
+        )
+        self.addCleanup(fanout.close)
+        primary = MODULE.TelemetryDeltaEncoder(True, 100.0, 3)
+        for frame in range(20):
+            data = _telemetry_sample()
+            # 电池在第 9 帧变化：主后端只在第 9-11 帧携带，共享 payload 时
+            # 每 4 帧收 1 帧的订阅者（第 4、8、12… 帧）一次也收不到
+            data["battery"] = 80 if frame >= 8 else -1
+            fields = dict(data)
+            primary.encode(data, frame * 0.1)
+            fanout.send(MODULE.encode_telemetry_yaml(data), data["keyframe"], fields, frame * 0.1)
+        divided = self.receivers[2].drain()
+        self.assertEqual(len(divided), 5)
+        self.assertEqual(
+            [b"telemetry_seq: %d\n" % seq in frame for seq, frame in enumerate(divided, 1)],
+            [True] * 5,
+        )
+        self.assertEqual(
+            [b"battery: 80\n" in frame for frame in divided], [False, False, True, True, True]
+        )
+        self.assertEqual(
+            sum(b"battery: 80\n" in frame for frame in self.receivers[0].drain()), 3
+        )
+
+    def test_primary_retarget_keeps_subscribers(self):
+        replacement = _UdpReceiver()
+        self.addCleanup(replacement.close)
+        self.fanout.send(b"before")
+        self.fanout.retarget_primary(("127.0.0.1", replacement.port))
+        self.fanout.send(b"after")
+        self.assertEqual(self.receivers[0].drain(), [b"before"])
+        self.assertEqual(replacement.drain(), [b"after"])
+        self.assertEqual(self.receivers[1].drain(), [b"before", b"after"])
+
+    def test_failures_are_counted_per_target(self):
+        class _BrokenSocket:
+            def __init__(self, *args):
+                pass
+
+            def connect(self, addr):
+                pass
+
+            def send(self, payload):
+                raise OSError("network unreachable")
+
+            def close(self):
+                pass
+
+        fanout = MODULE.TelemetryFanout(
+            ("127.0.0.1", self.receivers[0].port), [("192.0.2.1", 9000, 1)]
+        )
+        self.addCleanup(fanout.close)
+        fanout.targets[1]._socket_factory = _BrokenSocket
+        failures = fanout.send(b"x")
+        self.assertEqual([target.label for target, _ in failures], ["192.0.2.1:9000"])
+        self.assertEqual((fanout.primary.sent, fanout.targets[1].errors), (1, 1))
+
+    def test_subscriber_list_parsing(self):
+        self.assertEqual(
+            MODULE.parse_telemetry_subscribers(" 10.0.0.5:9888, 239.10.0.1:9900/5,"),
+            [("10.0.0.5", 9888, 1), ("239.10.0.1", 9900, 5)],
+        )
+        for value in ("10.0.0.5", "10.0.0.5:0", "10.0.0.5:9888/0", ":9888", "h:x"):
+            with self.assertRaises(ValueError):
+                MODULE.parse_telemetry_subscribers(value)
+        config = MODULE.resolve_slot_config(
+            2, environ={"TELEMETRY_SUBSCRIBERS_2": "10.0.0.5:99{slot}0"}
+        )
+        self.assertEqual(config["telemetry_subscribers"], [("10.0.0.5", 9920, 1)])
+        with self.assertRaises(ValueError):
+            MODULE.resolve_slot_config(1, environ={"TELEMETRY_SUBSCRIBERS": "bad"})
+
+
+class MultiSlotConfigTest(unittest.TestCase):
+    def test_single_slot_keeps_legacy_defaults(self):
+        config = MODULE.resolve_slot_config(2, environ={})
+        self.assertEqual(config["topic_prefix"], "")
+        self.assertEqual(config["mavlink_system_id"], 2)
+        self.assertEqual(config["control_port"], 8891)
+        self.assertEqual(config["telemetry_port"], 8890)
+
+    def test_slot_template_and_per_slot_overrides(self):
+        environ = {
+            "ROS_TOPIC_PREFIX": "px4_{slot}/",
+            "MAVLINK_SYSTEM_ID_3": "7",
+        }
+        configs = MODULE.resolve_bridge_configs(
+            MODULE.parse_slot_list("2,3"), environ=environ
+        )
+        self.assertEqual([c["topic_prefix"] for c in configs], ["/px4_2", "/px4_3"])
+        self.assertEqual([c["mavlink_system_id"] for c in configs], [2, 7])
+        self.assertEqual([c["control_port"] for c in configs], [8891, 8893])
+
+    def test_shared_topic_prefix_is_rejected_for_multiple_slots(self):
+        with self.assertRaises(ValueError):
+            MODULE.resolve_bridge_configs([1, 2], environ={"ROS_TOPIC_PREFIX": "/px4"})
+        with self.assertRaises(ValueError):
+            MODULE.parse_slot_list("1 1")
+
+    def test_flight_recorder_path_template_and_uniqueness(self):
+        environ = {"ROS_TOPIC_PREFIX": "/px4_{slot}", "FLIGHT_RECORDER_PATH": "/tmp/s{slot}.ring"}
+        configs = MODULE.resolve_bridge_configs([1, 2], environ=environ)
+        self.assertEqual([c["recorder_path"] for c in configs], ["/tmp/s1.ring", "/tmp/s2.ring"])
+        self.assertEqual(MODULE.resolve_slot_config(1, environ={})["recorder_path"], "")
+        environ["FLIGHT_RECORDER_PATH"] = "/tmp/shared.ring"
+        with self.assertRaises(ValueError):
+            MODULE.resolve_bridge_configs([1, 2], environ=environ)
+
+    def test_resource_sample_is_split_per_slot(self):
+        wall = iter((0.0, 2.0))
+        cpu = iter((0.0, 0.5))
+        monitor = MODULE.ProcessResourceMonitor(
+            4, clock=lambda: next(wall), cpu_clock=lambda: next(cpu)
+        )
+        sample = monitor.sample()
+        self.assertAlmostEqual(sample["cpu_percent"], 25.0)
+        self.assertAlmostEqual(sample["cpu_percent_per_slot"], 6.25)
+
+
+class ControlIngressTest(unittest.TestCase):
+    def setUp(self):
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(("127.0.0.1", 0))
+        self.receiver.setblocking(False)
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.receiver.close()
+        self.sender.close()
+
+    def _send_repeats(self, count):
+        for index in range(1, count + 1):
+            self.sender.sendto(
+                json.dumps(_message(repeat_index=index)).encode("utf-8"),
+                self.receiver.getsockname(),
+            )
+        time.sleep(0.05)
+
+    def test_drain_returns_every_queued_datagram_in_order(self):
+        self._send_repeats(5)
+        batch, error = MODULE.drain_udp_socket(self.receiver, 4097, 64)
+        self.assertIsNone(error)
+        self.assertEqual(
+            [parse_control_packet(item.data)["repeat_index"] for item in batch],
+            [1, 2, 3, 4, 5],
+        )
+        self.assertEqual(MODULE.drain_udp_socket(self.receiver, 4097, 64), ([], None))
+
+    def test_drain_stops_at_batch_cap(self):
+        self._send_repeats(5)
+        first, _ = MODULE.drain_udp_socket(self.receiver, 4097, 3)
+        rest, _ = MODULE.drain_udp_socket(self.receiver, 4097, 3)
+        self.assertEqual((len(first), len(rest)), (3, 2))
+
+    @unittest.skipUnless(MODULE._SO_TIMESTAMPNS is not None, "SO_TIMESTAMPNS is Linux-only")
+    def test_drain_reports_kernel_receive_timestamps(self):
+        self.receiver.setsockopt(socket.SOL_SOCKET, MODULE._SO_TIMESTAMPNS, 1)
+        self._send_repeats(2)
+        batch, error = MODULE.drain_udp_socket(
+            self.receiver, 4097, 64, kernel_timestamps=True
+        )
+        self.assertIsNone(error)
+        self.assertEqual(len(batch), 2)
+        for item in batch:
+            self.assertAlmostEqual(item.kernel_rx_unix, time.time(), delta=5.0)
+            # 发送后 sleep 了 50ms 才读取，内核排队时间应覆盖这段等待
+            self.assertGreaterEqual(item.kernel_delay, 0.03)
+        self.assertLessEqual(batch[0].kernel_rx_unix, batch[1].kernel_rx_unix)
+
+    def test_batch_stats_histogram(self):
+        stats = MODULE.IngressBatchStats()
+        for size in (1, 5, 5, 0):
+            stats.record(size)
+        stats.record(64, capped=True)
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot["wakeups"], 5)
+        self.assertEqual(snapshot["empty_wakeups"], 1)
+        self.assertEqual(snapshot["max_batch"], 64)
+        self.assertEqual(snapshot["capped"], 1)
+        self.assertEqual(snapshot["histogram"]["<=8"], 2)
+        self.assertAlmostEqual(snapshot["mean_batch"], 75 / 4)
+
+
+
+class ControlIngressQueueTest(unittest.TestCase):
+    SENDER = ("192.168.30.100", 50123)
+
+    def setUp(self):
+        self.now = 10.0
+        self.cache = MODULE.ControlDigestCache(16)
+        self.handled = []
+
+    def _queue(self, budget_sec=0.0, backlog_limit=64):
+        return MODULE.ControlIngressQueue(
+            self.cache, budget_sec, 0.02, backlog_limit, clock=lambda: self.now
+        )
+
+    def _datagram(self, mode, sequence, repeat_index, known=False):
+        message = _message(
+            repeat_index=repeat_index, sequence=sequence, command_id=f"{mode}-{sequence}"
+        )
+        message["mode"] = mode
+        if mode == "hold":
+            message["delivery"]["repeat_total"] = 0
+        data = json.dumps(message).encode("utf-8")
+        if known:
+            self.cache.put(self.cache.key(data), parse_control_packet(data))
+        return MODULE.ReceivedDatagram(data, self.SENDER, self.now, None, None)
+
+    def _handle(self, data, addr, rx_monotonic, kernel_rx_unix, kernel_delay, split):
+        parsed = parse_control_packet(data)
+        self.assertEqual(split[1], parsed["repeat_index"])
+        self.handled.append((parsed["mode"], parsed["sequence"], parsed["repeat_index"]))
+        self.now += 0.001
+
+    def test_new_commands_are_handled_before_repeats_and_known_holds(self):
+        queue = self._queue()
+        queue.admit([
+            self._datagram("hold", 1, 7, known=True),
+            self._datagram("move", 2, 2, known=True),
+            self._datagram("hold", 3, 1),
+            self._datagram("move", 4, 1),
+        ])
+        self.assertEqual(queue.admitted, [1, 2, 1])
+        self.assertEqual(queue.run(self._handle), 4)
+        self.assertEqual(
+            self.handled, [("move", 4, 1), ("move", 2, 2), ("hold", 3, 1), ("hold", 1, 7)]
+        )
+        self.assertEqual(queue.shed, dict.fromkeys(MODULE.ControlIngressQueue.SHED_REASONS, 0))
+
+    def test_overload_keeps_the_newest_hold_and_drops_exact_duplicates(self):
+        queue = self._queue()
+        move = self._datagram("move", 5, 1)
+        batch = [self._datagram("hold", 1, index, known=True) for index in range(1, 40)]
+        batch += [move, move]
+        queue.admit(batch, capped=True)
+        queue.run(self._handle)
+        self.assertEqual(self.handled, [("move", 5, 1), ("hold", 1, 39)])
+        self.assertEqual(queue.shed["hold"], 38)
+        self.assertEqual(queue.shed["duplicate"], 1)
+
+    def test_budget_defers_commands_and_sheds_known_holds(self):
+        queue = self._queue(budget_sec=0.0015)
+        moves = [self._datagram("move", sequence, 1) for sequence in (10, 11, 12)]
+        holds = [self._datagram("hold", 1, index, known=True) for index in (1, 2)]
+        queue.admit(moves + holds)
+        self.assertEqual(queue.run(self._handle), 2)
+        self.assertEqual(queue.exhausted_periods, 1)
+        self.assertEqual(queue.shed["budget"], 2)
+        self.assertEqual(len(queue), 1)
+        deadline = queue.next_deadline()
+        self.assertAlmostEqual(deadline, 10.02)
+
+        # 同一周期内再到达的包不会越过预算；新周期先处理积压
+        queue.admit([self._datagram("move", 13, 1)])
+        self.assertEqual(queue.run(self._handle), 0)
+        self.now = deadline
+        self.assertEqual(queue.run(self._handle), 2)
+        self.assertEqual([sequence for _, sequence, _ in self.handled], [10, 11, 12, 13])
+        self.assertEqual(queue.next_deadline(), math.inf)
+
+    def test_backlog_overflow_drops_the_lowest_priority_first(self):
+        queue = self._queue(backlog_limit=2)
+        queue.admit([
+            self._datagram("hold", 1, 1, known=True),
+            self._datagram("move", 2, 1),
+            self._datagram("hold", 3, 1),
+        ])
+        self.assertEqual(queue.shed["overflow"], 1)
+        queue.run(self._handle)
+        self.assertEqual(self.handled, [("move", 2, 1), ("hold", 3, 1)])
+
+    def test_gate_outcome_matches_direct_handling(self):
+        gate = _new_gate()
+        queue = MODULE.ControlIngressQueue(gate.digest_cache, 0.0)
+        for index in (1, 2, 3):
+            message = _message(repeat_index=index)
+            queue.admit([MODULE.ReceivedDatagram(
+                json.dumps(message).encode("utf-8"), self.SENDER, 60.0 + index, None, None
+            )])
+            queue.run(gate.handle_datagram)
+        self.assertEqual(gate.commands_applied, 1)
+        self.assertEqual(gate.digest_cache.hits, 2)
+
+def _metrics_bridge(slot=1):
+    bridge = types.SimpleNamespace(slot=slot)
+    for name in (
+        "_udp_recv_errors", "_offboard_publish_count",
+        "_command_ack_count", "_telemetry_sent", "_telemetry_send_errors",
+        "_telemetry_heartbeats", "_telemetry_last_bytes", "_pose_port",
+    ):
+        setattr(bridge, name, 0)
+    bridge._core = MODULE.BridgeCore(slot, _Logger())
+    bridge._ingress_stats = MODULE.IngressBatchStats()
+    bridge._ingress = MODULE.ControlIngressQueue(bridge._core.digest_cache)
+    bridge._telemetry_delta = MODULE.TelemetryDeltaEncoder(False, 1.0, 3)
+    bridge._telemetry_fanout = MODULE.TelemetryFanout(("192.168.30.100", 8890))
+    bridge._vehicle_commands = MODULE.VehicleCommandSequencer(_ARM_SEQUENCE)
+    bridge._heartbeat_monitor = MODULE.HeartbeatMonitor(MODULE.OFFBOARD_INTERVAL)
+    bridge._ros_rx_counts = {"odometry": 0, "local_position": 0}
+    bridge._ros_rx_rates = MODULE.CounterRates(1.0)
+    bridge._sample_latency = MODULE.LatencyHistogram()
+    bridge._recorder = None
+    bridge.collect_metrics = types.MethodType(MODULE.JetsonBridge.collect_metrics, bridge)
+    return bridge
+
+
+class MetricsExportTest(unittest.TestCase):
+    def test_histogram_lines_are_cumulative_with_escaped_labels(self):
+        histogram = MODULE.LatencyHistogram()
+        for value in (0.0003, 0.0003, 0.2, 7.0):
+            histogram.record(value)
+        out = MODULE.PrometheusText()
+        out.latency("x_seconds", "help", histogram, {"hop": 'a"b'})
+        lines = out.render().decode("utf-8").splitlines()
+        self.assertEqual(lines[:2], ["# HELP x_seconds help", "# TYPE x_seconds histogram"])
+        self.assertIn('x_seconds_bucket{hop="a\\"b",le="0.0005"} 2', lines)
+        self.assertIn('x_seconds_bucket{hop="a\\"b",le="5.0"} 3', lines)
+        self.assertIn('x_seconds_bucket{hop="a\\"b",le="+Inf"} 4', lines)
+        self.assertIn('x_seconds_count{hop="a\\"b"} 4', lines)
+
+        # 样本数不变时复用缓存的行；新样本使缓存失效
+        again = MODULE.PrometheusText()
+        again.latency("x_seconds", "help", histogram, {"hop": 'a"b'})
+        self.assertEqual(again.render().decode("utf-8").splitlines(), lines)
+        histogram.record(0.0003)
+        again = MODULE.PrometheusText()
+        again.latency("x_seconds", "help", histogram, {"hop": 'a"b'})
+        self.assertIn('x_seconds_count{hop="a\\"b"} 5', again.render().decode("utf-8"))
+
+    def test_counter_rates_use_minimum_window(self):
+        rates = MODULE.CounterRates(1.0)
+        self.assertEqual(rates.update(10.0, {"odometry": 100}), {})
+        self.assertEqual(rates.update(10.5, {"odometry": 150}), {})
+        self.assertEqual(rates.update(12.0, {"odometry": 300}), {"odometry": 100.0})
+        self.assertEqual(rates.update(12.2, {"odometry": 400}), {"odometry": 100.0})
+
+    def test_render_groups_each_metric_across_slots(self):
+        bridges = [_metrics_bridge(1), _metrics_bridge(2)]
+        for bridge in bridges:
+            bridge.collect_metrics(98.0)  # 建立速率统计的起点
+        bridges[0]._core.rx_total = 7
+        bridges[1]._ros_rx_counts["odometry"] = 50
+        bridges[1]._core.sample_monotonic["odometry"] = 99.5
+        bridges[0]._core.hop_latency["read→parse"].record(0.00002)
+        text = MODULE.render_metrics(bridges, 100.0).decode("utf-8")
+
+        self.assertIn('jetson_bridge_control_datagrams_total{slot="1"} 7', text)
+        self.assertIn('jetson_bridge_control_last_age_seconds{slot="2"} NaN', text)
+        self.assertIn(
+            'jetson_bridge_ros_message_rate_hz{slot="2",topic="odometry"} 25.0', text
+        )
+        self.assertIn(
+            'jetson_bridge_ros_message_age_seconds{slot="2",topic="odometry"} 0.5', text
+        )
+        self.assertIn(
+            'jetson_bridge_control_hop_latency_seconds_count{slot="1",hop="read→parse"} 1',
+            text,
+        )
+        self.assertEqual(text.count("# TYPE jetson_bridge_control_datagrams_total "), 1)
+        type_lines = [line for line in text.splitlines() if line.startswith("# TYPE")]
+        self.assertEqual(len(type_lines), len(set(type_lines)))
+
+    def test_server_answers_scrapes_from_the_selector_loop(self):
+        selector = selectors.DefaultSelector()
+        server = MODULE.MetricsServer("127.0.0.1", 0, lambda: b"up 1\n", selector)
+        self.addCleanup(selector.close)
+        self.addCleanup(server.close)
+
+        def scrape(path):
+            client = socket.create_connection(server.address, timeout=2.0)
+            with client:
+                client.sendall(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode("ascii"))
+                client.setblocking(False)
+                response = b""
+                for _ in range(40):
+                    for key, _ in selector.select(timeout=0.05):
+                        key.data()
+                    try:
+                        chunk = client.recv(65536)
+                    except BlockingIOError:
+                        continue
+                    if not chunk:
+                        break
+                    response += chunk
+            return response
+
+        response = scrape("/metrics")
+        self.assertTrue(response.startswith(b"HTTP/1.0 200 OK"))
+        self.assertTrue(response.endswith(b"\r\n\r\nup 1\n"))
+        self.assertTrue(scrape("/other").startswith(b"HTTP/1.0 404"))
+        self.assertEqual(server.requests, 1)
+        self.assertEqual(server._clients, {})
+
+    def test_large_response_to_a_slow_reader_never_blocks_the_loop(self):
+        selector = selectors.DefaultSelector()
+        body = b"x" * (8 << 20)
+        server = MODULE.MetricsServer("127.0.0.1", 0, lambda: body, selector)
+        self.addCleanup(selector.close)
+        self.addCleanup(server.close)
+
+        client = socket.create_connection(server.address, timeout=2.0)
+        self.addCleanup(client.close)
+        client.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+        started = time.monotonic()
+        for _ in range(3):
+            for key, _ in selector.select(timeout=0.05):
+                key.data()
+        # 客户端尚未读取：余量留在服务端，等待 EVENT_WRITE，主循环不被阻塞
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(len(server._clients), 1)
+
+        client.setblocking(False)
+        response = bytearray()
+        for _ in range(2000):
+            for key, _ in selector.select(timeout=0):
+                key.data()
+            try:
+                chunk = client.recv(1 << 20)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                break
+            response += chunk
+        self.assertTrue(response.endswith(b"\r\n\r\n" + body))
+        self.assertEqual(server._clients, {})
+
+
+class FlightRecorderTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(pathlib.Path(directory.name) / "slot1.ring")
+        self.clock = iter(range(1_000_000_000, 10**12, 1_000_000))
+
+    def _recorder(self, size_bytes=4096 + 8 * 1024, block_bytes=1024):
+        recorder = MODULE.FlightRecorder(
+            self.path, size_bytes, 1, block_bytes=block_bytes,
+            clock_ns=lambda: next(self.clock), wall_clock=lambda: 1784200000.0,
+        )
+        self.addCleanup(recorder.close)
+        return recorder
+
+    def test_records_round_trip_in_order(self):
+        recorder = self._recorder()
+        packet = json.dumps(_message()).encode("utf-8")
+        recorder.record_datagram(packet, ("192.168.30.100", 50123), 12.5, 1784200000.25)
+        recorder.record_odometry(types.SimpleNamespace(
+            timestamp=111, timestamp_sample=110, position=[1.0, 2.0, -3.0],
+            q=[1.0, 0.0, 0.0, 0.0], velocity=[0.5, 0.0, 0.0], angular_velocity=[0.0] * 3,
+        ))
+        parsed = parse_control_packet(packet)
+        recorder.record_command_applied(parsed, 3, False)
+        recorder.record_setpoint_publish(100, "move", [10.0, 20.0, -5.0], 222)
+
+        records = MODULE.read_flight_records(self.path)
+        self.assertEqual(
+            [record.kind for record in records],
+            ["clock", "control_datagram", "odometry", "command_applied", "setpoint_publish"],
+        )
+        self.assertEqual(records[0].fields["slot"], 1)
+        datagram = records[1]
+        self.assertEqual(datagram.fields["data"], packet)
+        self.assertEqual((datagram.fields["ip"], datagram.fields["port"]), ("192.168.30.100", 50123))
+        self.assertEqual(datagram.monotonic_ns, 12_500_000_000)
+        self.assertEqual(datagram.stamp_us, 1784200000250000)
+        self.assertEqual(records[2].fields["position"], [1.0, 2.0, -3.0])
+        self.assertEqual(records[2].stamp_us, 111)
+        self.assertEqual(records[3].fields["command_id"], "cmd-100")
+        self.assertEqual(records[3].fields["mode"], "move")
+        self.assertEqual(records[4].fields["sequence"], 100)
+        self.assertEqual([record.record_seq for record in records], [1, 2, 3, 4, 5])
+
+    def test_ring_keeps_only_the_newest_blocks(self):
+        recorder = self._recorder()
+        for sequence in range(1, 1001):
+            recorder.record_setpoint_publish(sequence, "hold", [0.0, 0.0, 0.0], sequence)
+        self.assertGreater(recorder.blocks, 8)
+        published = [
+            record.fields["sequence"] for record in MODULE.read_flight_records(self.path)
+            if record.kind == "setpoint_publish"
+        ]
+        self.assertEqual(published[-1], 1000)
+        self.assertEqual(published, list(range(published[0], 1001)))
+        self.assertLess(len(published), 1000)
+
+    def test_torn_record_is_ignored_and_reopen_keeps_previous_run(self):
+        recorder = self._recorder()
+        recorder.record_vehicle_command(400, 1.0, 0.0, 5)
+        # 模拟崩溃：下一条记录只写了记录体，size 还没写入
+        recorder._mm[recorder._pos + 2:recorder._pos + 40] = b"\xff" * 38
+        reopened = self._recorder()
+        reopened.record_vehicle_command(176, 1.0, 6.0, 6)
+        records = MODULE.read_flight_records(self.path)
+        self.assertEqual(
+            [record.kind for record in records],
+            ["clock", "vehicle_command", "clock", "vehicle_command"],
+        )
+        self.assertEqual(records[3].fields["command"], 176)
+
+        timed = MODULE.flight_record_unix_times(records)
+        self.assertEqual(len(timed), 4)
+        self.assertAlmostEqual(timed[1][0] - timed[0][0], 0.001, places=6)
+
+    def test_oversized_or_invalid_values_are_dropped(self):
+        recorder = self._recorder()
+        recorder.record_datagram(b"x" * 2048, ("127.0.0.1", 1), 1.0)
+        recorder.record_status(types.SimpleNamespace(timestamp=1, arming_state=999, nav_state=1))
+        self.assertEqual(recorder.dropped, 2)
+        self.assertEqual(
+            [record.kind for record in MODULE.read_flight_records(self.path)], ["clock"]
+        )
+
+
+def _telemetry_sample():
+    return {
+        "timestamp": 1784200000123456,
+        "position": [1.5, -2.25, -10.0],
+        "q": [1.0, 0.0, 0.0, 0.0],
+        "velocity": [0.1, 1e-05, float("nan")],
+        "angular_velocity": [0.0, -0.0, float("inf")],
+        "arming_state": 2,
+        "nav_state": 14,
+        "local_position": [1.5, -2.25, -10.0],
+        "local_velocity": [0.1, 0.2, 0.3],
+        "local_position_valid": True,
+        "gps_lat": 30.123456789,
+        "gps_lon": 120.5,
+        "gps_alt": 15.25,
+        "gps_fix": False,
+        "battery": -1,
+        "control_ack": {
+            "session_id": "backend-1784200000000000-1a2b3c4d",
+            "command_id": "backend-1784200000000000-1a2b3c4d-d1-s17",
+            "sequence": 17,
+            "mode": "move",
+            "confirmed_packets": 3,
+            "applied_at_unix_s": 1784200000.5,
+        },
+    }
+
+
+class TelemetryEncoderTest(unittest.TestCase):
+    GOLDEN = (
+        b"timestamp: 1784200000123456\n"
+        b"position: [1.5, -2.25, -10.0]\n"
+        b"q: [1.0, 0.0, 0.0, 0.0]\n"
+        b"velocity: [0.1, 1.0e-05, .nan]\n"
+        b"angular_velocity: [0.0, -0.0, .inf]\n"
+        b"arming_state: 2\n"
+        b"nav_state: 14\n"
+        b"local_position: [1.5, -2.25, -10.0]\n"
+        b"local_velocity: [0.1, 0.2, 0.3]\n"
+        b"local_position_valid: true\n"
+        b"gps_lat: 30.123456789\n"
+        b"gps_lon: 120.5\n"
+        b"gps_alt: 15.25\n"
+        b"gps_fix: false\n"
+        b"battery: -1\n"
+        b"control_ack: {session_id: backend-1784200000000000-1a2b3c4d, "
+        b"command_id: backend-1784200000000000-1a2b3c4d-d1-s17, sequence: 17, "
+        b"mode: move, confirmed_packets: 3, applied_at_unix_s: 1784200000.5}\n"
+    )
+
+    def test_golden_output(self):
+        self.assertEqual(MODULE.encode_telemetry_yaml(_telemetry_sample()), self.GOLDEN)
+
+    def test_position_keeps_fixed_field_order(self):
+        # 没有 odometry 时 _send_telemetry 最后才写入 position。
+        data = {"timestamp": 1, "local_position_valid": True, "position": [1.0, 2.0, 3.0]}
+        self.assertEqual(
+            MODULE.encode_telemetry_yaml(data),
+            b"timestamp: 1\nposition: [1.0, 2.0, 3.0]\nlocal_position_valid: true\n",
+        )
+
+    def test_unknown_field_is_rejected(self):
+        with self.assertRaises(ValueError):
+            MODULE.encode_telemetry_yaml({"timestamp": 1, "extra": 2})
+
+    def test_sequence_and_keyframe_fields_follow_timestamp(self):
+        data = {"timestamp": 1, "battery": 50, "telemetry_seq": 7, "keyframe": False}
+        self.assertEqual(
+            MODULE.encode_telemetry_yaml(data),
+            b"timestamp: 1\ntelemetry_seq: 7\nkeyframe: false\nbattery: 50\n",
+        )
+
+    @unittest.skipIf(yaml is None, "PyYAML is not installed")
+    def test_parses_like_pyyaml_output(self):
+        data = _telemetry_sample()
+        data["control_ack"]["session_id"] = "yes"
+        data["control_ack"]["command_id"] = "id: with 'quotes' and \u00e9"
+        encoded = yaml.safe_load(MODULE.encode_telemetry_yaml(data))
+        reference = yaml.safe_load(yaml.dump(data, sort_keys=False, default_flow_style=None))
+        self.assertEqual(repr(encoded), repr(reference))
+
+
+FAKE_ROS_PATH = pathlib.Path(__file__).with_name("fake_ros_runtime.py")
+
+
+def _load_fake_ros_runtime():
+    spec = importlib.util.spec_from_file_location("fake_ros_runtime_under_test", FAKE_ROS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class FakeRosRuntimeTest(unittest.TestCase):
+    def setUp(self):
+        self.fake = _load_fake_ros_runtime()
+        self.modules = {}
+        self.runtime = self.fake.install(
+            virtual_clock=True, start_unix_ns=1_700_000_000 * 10**9, modules=self.modules
+        )
+
+    def test_virtual_timers_fire_in_due_order_with_ros_time(self):
+        node = self.fake.Node("timers")
+        fired = []
+        clock = node.get_clock()
+        node.create_timer(0.02, lambda: fired.append(("fast", clock.now().nanoseconds)))
+        node.create_timer(0.05, lambda: fired.append(("slow", clock.now().nanoseconds)))
+
+        self.runtime.run_for(0.1)
+
+        start = 1_700_000_000 * 10**9
+        self.assertEqual(
+            [(name, (stamp - start) // 10**6) for name, stamp in fired],
+            [("fast", 20), ("fast", 40), ("slow", 50), ("fast", 60), ("fast", 80),
+             ("slow", 100), ("fast", 100)],
+        )
+
+    def test_publish_delivers_a_snapshot_to_subscribers(self):
+        px4 = self.modules["px4_msgs.msg"]
+        node = self.fake.Node("bus")
+        received = []
+        node.create_subscription(px4.TrajectorySetpoint, "/fmu/in/trajectory_setpoint",
+                                 received.append, None)
+        publisher = node.create_publisher(px4.TrajectorySetpoint, "/fmu/in/trajectory_setpoint", None)
+        msg = px4.TrajectorySetpoint()
+        msg.position[0] = 1.0
+        publisher.publish(msg)
+        msg.position[0] = 2.0  # 发布后原地改写不影响已发布的消息
+        self.runtime.run_for(0.0)
+
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0].position[0], 1.0)
+        self.assertEqual(publisher.get_subscription_count(), 1)
+
+    def test_multi_threaded_executor_isolates_callback_groups(self):
+        runtime = self.fake.install(virtual_clock=False, modules=self.modules)
+        runtime.init()
+        groups = self.modules["rclpy.callback_groups"]
+        node = self.fake.Node("groups")
+        slow_group = groups.MutuallyExclusiveCallbackGroup()
+        release = threading.Event()
+        slow_calls = []
+        fast_while_blocked = []
+
+        def slow():
+            slow_calls.append(time.monotonic())
+            release.wait(2.0)
+
+        node.create_timer(0.01, slow, callback_group=slow_group)
+        node.create_timer(
+            0.005, lambda: fast_while_blocked.append(not release.is_set()),
+            callback_group=groups.MutuallyExclusiveCallbackGroup(),
+        )
+        executor = self.modules["rclpy.executors"].MultiThreadedExecutor(num_threads=3)
+        spin = threading.Thread(target=executor.spin, daemon=True)
+        spin.start()
+        time.sleep(0.2)
+        release.set()
+        executor.shutdown()
+        runtime.shutdown()
+        spin.join(2.0)
+
+        self.assertFalse(spin.is_alive())
+        # 慢回调阻塞期间同组不会再次进入，另一组的定时器照常触发
+        self.assertEqual(len(slow_calls), 1)
+        self.assertGreaterEqual(fast_while_blocked.count(True), 10)
+
+    def _bridge(self, **clocks):
+        environ = {
+            "BACKEND_HOST": "127.0.0.1", "CONTROL_BIND_HOST": "127.0.0.1",
+            "CONTROL_AUTH_KEY": "", "FLIGHT_RECORDER_PATH": "",
+        }
+        with mock.patch.dict(sys.modules, self.modules), mock.patch.dict("os.environ", environ):
+            spec = importlib.util.spec_from_file_location("jetson_bridge_on_fake_ros", SCRIPT_PATH)
+            bridge_module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(bridge_module)
+        config = bridge_module.resolve_slot_config(1, {
+            "CONTROL_PORT": str(_free_udp_port()), "TELEMETRY_PORT": str(_free_udp_port()),
+        })
+        bridge = bridge_module.JetsonBridge(1, config, **clocks)
+        self.addCleanup(bridge.cleanup)
+        self.bridge_module = bridge_module
+        return bridge
+
+    def test_jetson_bridge_runs_unmodified(self):
+        bridge = self._bridge()
+        px4 = self.modules["px4_msgs.msg"]
+        sim = self.fake.Node("sim_px4")
+        setpoints = []
+        sim.create_subscription(px4.TrajectorySetpoint, "/fmu/in/trajectory_setpoint",
+                                setpoints.append, None)
+        local_pub = sim.create_publisher(px4.VehicleLocalPosition,
+                                         "/fmu/out/vehicle_local_position", None)
+        sim.create_timer(0.02, lambda: local_pub.publish(px4.VehicleLocalPosition(
+            x=1.0, y=2.0, z=-3.0, xy_valid=True, z_valid=True,
+        )))
+
+        self.runtime.run_for(1.0)
+
+        self.assertGreaterEqual(bridge._offboard_publish_count, 49)
+        self.assertEqual(bridge._ros_rx_counts["local_position"], 50)
+        # 心跳在首个有效本地位置之后以安全悬停点发布 setpoint
+        self.assertEqual(setpoints[-1].position, [1.0, 2.0, -3.0])
+        self.assertIs(bridge._offboard_timer.callback_group, bridge._heartbeat_group)
+        self.assertIs(bridge._diag_timer.callback_group, bridge._diagnostics_group)
+        self.assertEqual(
+            {subscription.callback_group for subscription in bridge._subscriptions},
+            {bridge._sample_group},
+        )
+
+    def test_injected_runtime_clock_drives_telemetry_and_heartbeat_statistics(self):
+        runtime = self.runtime
+        bridge = self._bridge(clock=runtime.monotonic, wall_clock=runtime.unix)
+        px4 = self.modules["px4_msgs.msg"]
+        sim = self.fake.Node("sim_px4")
+        local_pub = sim.create_publisher(px4.VehicleLocalPosition,
+                                         "/fmu/out/vehicle_local_position", None)
+        sim.create_timer(0.02, lambda: local_pub.publish(px4.VehicleLocalPosition(
+            x=1.0, y=2.0, z=-3.0, xy_valid=True, z_valid=True,
+        )))
+
+        for _ in range(100):
+            runtime.run_for(0.02)
+            bridge.poll_telemetry(runtime.monotonic())
+
+        # 2 秒模拟时间按 TELEMETRY_HZ 限速发送（每 20ms 轮询一次），与实际耗时无关
+        sends = bridge._telemetry_heartbeats + bridge._sample_latency.snapshot()["count"]
+        self.assertGreaterEqual(sends, 1.5 * MODULE.TELEMETRY_HZ)
+        self.assertLessEqual(sends, 2 * MODULE.TELEMETRY_HZ + 1)
+        intervals = bridge._heartbeat_monitor.intervals.snapshot()
+        self.assertAlmostEqual(intervals["min"], MODULE.OFFBOARD_INTERVAL, places=6)
+        self.assertAlmostEqual(intervals["max"], MODULE.OFFBOARD_INTERVAL, places=6)
+        self.assertEqual(bridge._core.wall_clock(), runtime.unix())
+        self.assertEqual(bridge._core.events.clock, runtime.monotonic)
+
+    def test_diagnostics_only_read_the_command_store_owned_by_the_main_loop(self):
+        now = [100.0]
+        bridge = self._bridge(clock=lambda: now[0])
+        core = bridge._core
+        core.last_setpoint = self.bridge_module.Setpoint(0.0, 0.0, 0.0, "hold", 0)
+        sender = ("192.168.30.100", 50123)
+        errors = []
+        stop = threading.Event()
+
+        def diagnostics():
+            while not stop.is_set():
+                try:
+                    bridge._log_diagnostics()
+                except Exception as exc:  # noqa: BLE001 - 任何异常都说明存在竞争
+                    errors.append(exc)
+                    return
+
+        # 诊断在执行器线程中与主线程的收包 / 应用 / 淘汰并发运行
+        thread = threading.Thread(target=diagnostics)
+        thread.start()
+        try:
+            for sequence in range(1, 401):
+                now[0] += 1.0
+                for index in (1, 2, 3):
+                    message = _message(index, sequence, f"cmd-{sequence}")
+                    core.handle_datagram(json.dumps(message).encode("utf-8"), sender, now[0])
+                bridge.poll_command_housekeeping(now[0])
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(core.commands_applied, 400)
+        self.assertLessEqual(len(core.commands.applied), core.commands.APPLIED_LIMIT)
+
+        # 过期的 pending 由主线程维护清除，诊断本身不修改存储
+        message = _message(1, 500, "cmd-500")
+        core.handle_datagram(json.dumps(message).encode("utf-8"), sender, now[0])
+        now[0] += 100.0
+        bridge._log_diagnostics()
+        self.assertIn("cmd-500", core.commands.pending)
+        bridge.poll_command_housekeeping(now[0])
+        self.assertNotIn("cmd-500", core.commands.pending)
+        self.assertEqual(bridge._command_snapshot[0], 0)
+
+    def test_arm_sequence_retries_until_acknowledged(self):
+        bridge = self._bridge()
+        px4 = self.modules["px4_msgs.msg"]
+        sim = self.fake.Node("sim_px4")
+        commands = []
+        ack_pub = sim.create_publisher(px4.VehicleCommandAck, "/fmu/out/vehicle_command_ack", None)
+
+        def on_command(msg):
+            commands.append(msg.command)
+            # 第一条 ARM 的 ACK 丢失，之后的命令都立即确认
+            if len(commands) > 1:
+                ack_pub.publish(px4.VehicleCommandAck(command=msg.command, result=0))
+
+        sim.create_subscription(px4.VehicleCommand, "/fmu/in/vehicle_command", on_command, None)
+        local_pub = sim.create_publisher(px4.VehicleLocalPosition,
+                                         "/fmu/out/vehicle_local_position", None)
+        sim.create_timer(0.02, lambda: local_pub.publish(px4.VehicleLocalPosition(
+            x=1.0, y=2.0, z=-3.0, xy_valid=True, z_valid=True,
+        )))
+        bridge._arm_triggered = True
+
+        self.runtime.run_for(2.0)
+
+        arm, offboard = 400, 176
+        self.assertEqual(commands, [arm, arm, offboard])
+        sequencer = bridge._vehicle_commands
+        self.assertEqual(sequencer.state, "done")
+        self.assertEqual(sequencer.retries, 1)
+        self.assertEqual(sequencer.ack_latency["OFFBOARD"].count, 1)
 
 
 if __name__ == "__main__":